@@ -0,0 +1,81 @@
+"""
+Benchmark for streaming AES encryption against the one-shot GPG.encrypt_aes() and decrypt_aes().
+
+For each size, encrypts and decrypts a file: all at once as encrypt_aes() and decrypt_aes() do, and one chunk at
+a time with yombo.utils.aesstream, writing straight to disk. Each run is in a new python process so the peak
+memory it reports is for that run only. Results are checked to match the original file. Run from the repository
+root:
+
+    python -m tests.benchmarks.bench_aes_stream
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+SIZES_MB = (1, 10, 50)
+
+MEASURE = """
+import resource
+import sys
+from time import time
+from yombo.lib.gpg import GPG
+from yombo.utils.aesstream import derive_key, encrypt_stream, decrypt_stream, write_stream
+
+mode, source, destination = sys.argv[1:4]
+gpg = GPG()
+gpg.aes_blocksize = 32
+memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+started = time()
+if mode == 'oneshot_encrypt':
+    with open(source, 'rb') as input:
+        data = gpg._encrypt_aes(derive_key('benchmark'), gpg.aes_pad(input.read()))
+    with open(destination, 'wb') as output:
+        output.write(data)
+elif mode == 'oneshot_decrypt':
+    with open(source, 'rb') as input:
+        data = gpg.aes_unpad(gpg._decrypt_aes(derive_key('benchmark'), input.read()))
+    with open(destination, 'wb') as output:
+        output.write(data)
+else:
+    stream = encrypt_stream if mode == 'stream_encrypt' else decrypt_stream
+    with open(source, 'rb') as input:
+        write_stream(stream(derive_key('benchmark'), input), destination)
+print(time() - started, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - memory)
+"""
+
+
+def measure(mode, source, destination):
+    output = subprocess.check_output([sys.executable, '-c', MEASURE, mode, source, destination],
+                                     universal_newlines=True)
+    duration, memory = output.split()[-2:]
+    return float(duration), int(memory)
+
+
+def same_file(first, second):
+    with open(first, 'rb') as one, open(second, 'rb') as two:
+        return one.read() == two.read()
+
+
+def main():
+    print("%-8s %-16s %12s %14s" % ("Size MB", "Mode", "Time ms", "Peak +KB"))
+    with tempfile.TemporaryDirectory() as directory:
+        plain = os.path.join(directory, 'plain')
+        for size in SIZES_MB:
+            with open(plain, 'wb') as output:
+                output.write(os.urandom(size * 1024 * 1024))
+            for style in ('oneshot', 'stream'):
+                encrypted = os.path.join(directory, '%s.aes' % style)
+                decrypted = os.path.join(directory, '%s.out' % style)
+                for mode, source, destination in (('%s_encrypt' % style, plain, encrypted),
+                                                  ('%s_decrypt' % style, encrypted, decrypted)):
+                    duration, memory = measure(mode, source, destination)
+                    print("%-8s %-16s %12.1f %14d" % (size, mode, duration * 1000, memory))
+                assert same_file(plain, decrypted), (size, style)
+            # Each format can be read by the other.
+            measure('stream_decrypt', os.path.join(directory, 'oneshot.aes'), decrypted)
+            assert same_file(plain, decrypted), size
+
+
+if __name__ == "__main__":
+    main()
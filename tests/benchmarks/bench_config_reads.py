@@ -0,0 +1,78 @@
+"""
+Benchmark for reading configuration values.
+
+Does 1,000,000 reads of one configuration item with Configuration.get() and with a handle from
+Configuration.handle(), and shows get() as it was when every read also called the statistics library. The
+statistics library here only counts calls, the real one does more per call, so the old times are a low estimate.
+Also checks a handle sees a new value after set(). Run from the repository root:
+
+    python -m tests.benchmarks.bench_config_reads
+"""
+from time import time
+
+from yombo.lib.configuration import Configuration
+
+READS = 1000000
+
+
+class BenchStatistics:
+    def __init__(self):
+        self.counts = {}
+
+    def increment(self, bucket_name, count=1, bucket_size=None, anon=None, lifetimes=None):
+        self.counts[bucket_name] = self.counts.get(bucket_name, 0) + count
+
+
+def make_configs():
+    configs = Configuration()
+    configs._Statistics = BenchStatistics()
+    configs.configs = {}
+    configs.handles = {}
+    configs.get_counts = {'value': 0, 'none': 0, 'empty_string': 0, 'default': 0, 'nodefault': 0}
+    configs.loading_yombo_ini = True
+    for number in range(200):
+        configs.set('section%s' % (number % 10), 'option%s' % number, number)
+    configs.set('core', 'gwid', 'x' * 20)
+    return configs
+
+
+def timed(label, call):
+    start = time()
+    call()
+    duration = time() - start
+    print("%-44s %9.1f ms total %9.3f us each" % (label, duration * 1000, duration * 1000000 / READS))
+
+
+def main():
+    configs = make_configs()
+    statistics = configs._Statistics
+    get = configs.get
+    handle = configs.handle('core', 'gwid', 'local', False)
+
+    def old_get():
+        for number in range(READS):
+            get('core', 'gwid', 'local', False)
+            statistics.increment("lib.configuration.get.value", bucket_size=15, anon=True)
+
+    def new_get():
+        for number in range(READS):
+            get('core', 'gwid', 'local', False)
+
+    def handle_read():
+        for number in range(READS):
+            handle.value
+
+    print("%s reads" % READS)
+    timed("get(), statistics call per read (old)", old_get)
+    timed("get()", new_get)
+    timed("handle.value", handle_read)
+
+    configs.send_read_counts()
+    assert configs.configs['core']['gwid']['reads'] == READS * 3
+    assert statistics.counts["lib.configuration.get.value"] == READS * 4  # including the calls made by old_get()
+    configs.set('core', 'gwid', 'y' * 20)
+    assert handle.value == 'y' * 20
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark for device status ingest.
+
+Creates device statuses for 300 devices, as received from other gateways, and times:
+
+  * creating the Device_Status instances,
+  * the status writer sending them to the LocalDB bulk queue,
+  * LocalDB saving the bulk queue to a real SQLite database.
+
+It also reports how many timers are waiting in the reactor and how many database reads were made. Before the
+status writer, each new status scheduled three timers and made one SELECT to see if it was already in the
+database. Run from the repository root:
+
+    python -m tests.benchmarks.bench_device_status
+"""
+import os
+import shutil
+import tempfile
+from time import time
+
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks
+
+from yombo.ext.twistar.registry import Registry
+from yombo.lib.devices._device_status import Device_Status, DeviceStatusWriter
+from yombo.lib.localdb import LocalDB, SQLitePool, LATEST_SCHEMA_VERSION
+from yombo.lib.statistics import Statistics
+
+STATUSES = 20000
+DEVICES = 300
+
+
+class Parent:
+    """ The parts of the Devices library used by Device_Status. """
+    def __init__(self, localdb):
+        self.gateway_id = 'gw_bench'
+        self.is_master = True
+        self._LocalDB = localdb
+        self._Commands = {}
+        self._Statistics = Statistics.__new__(Statistics)
+        self._Statistics.enabled = False
+        self.status_writer = DeviceStatusWriter(self)
+
+
+class Device:
+    def __init__(self, number):
+        self.device_id = 'device%s' % number
+        self.gateway_id = 'gw_bench'
+
+
+def status_data(number):
+    return {
+        'status_id': 'bench%010d' % number,
+        'machine_status': number % 100,
+        'human_status': str(number % 100),
+        'human_message': 'Set to %s' % (number % 100),
+        'energy_usage': 0,
+        'requested_by': {'user_id': 'bench', 'component': 'bench'},
+        'reported_by': 'bench',
+        'uploaded': 0,
+        'uploadable': 1,
+        'set_at': time(),
+    }
+
+
+@inlineCallbacks
+def timed(label, call, count):
+    start = time()
+    yield call()
+    duration = time() - start
+    print("%-40s %8.1f ms %10.0f/s" % (label, duration * 1000, count / duration))
+
+
+@inlineCallbacks
+def bench():
+    localdb = LocalDB.__new__(LocalDB)
+    localdb.dbconfig = Registry.getConfig()
+    localdb.db_bulk_queue = {}
+    localdb.db_bulk_queue_id_cols = {}
+    meta = __import__("yombo.utils.db." + str(LATEST_SCHEMA_VERSION), globals(), locals(), ['upgrade'], 0)
+    yield meta.new_db_file(Registry)
+
+    parent = Parent(localdb)
+    yield parent.status_writer.load()
+    parent.status_writer.save_loop.stop()
+    devices = [Device(number) for number in range(DEVICES)]
+    timers = len(reactor.getDelayedCalls())
+    reads = Registry.DBPOOL.counts['read']
+
+    def create():
+        for number in range(STATUSES):
+            Device_Status(parent, devices[number % DEVICES], status_data(number), source='gateway_coms')
+
+    print("%s statuses for %s devices." % (STATUSES, DEVICES))
+    yield timed("create statuses", create, STATUSES)
+    yield timed("status writer to bulk queue", parent.status_writer.save, STATUSES)
+    yield timed("bulk queue to database", localdb.save_bulk_queue, STATUSES)
+    print("timers added: %s, database reads: %s" % (len(reactor.getDelayedCalls()) - timers,
+                                                    Registry.DBPOOL.counts['read'] - reads))
+    saved = yield Registry.DBPOOL.runQuery("SELECT count(*) FROM device_status")
+    assert saved[0][0] == STATUSES, saved
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    Registry.DBPOOL = SQLitePool(os.path.join(directory, 'bench.db'))
+
+    def run():
+        d = bench()
+        d.addErrback(lambda failure: failure.printTraceback())
+        d.addBoth(lambda _: reactor.stop())
+
+    reactor.callWhenRunning(run)
+    reactor.run()
+    shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark for packing messages between gateways.
+
+Packs and unpacks typical gateway messages: a single state change, dumps of states, and a dump of devices. Each
+is done in the legacy format still sent to gateways that can't read frames, a msgpack map holding the payload as
+msgpack, and with yombo.utils.framing for each compression available. Prints the size of each message and the
+time to pack and unpack it, and checks the payload comes back the same. Run from the repository root:
+
+    python -m tests.benchmarks.bench_gateway_framing
+"""
+import random
+from time import time
+
+from yombo.lib.gateways import SYNC_FIELDS
+from yombo.utils.framing import COMPRESSIONS, pack, unpack, legacy_pack, legacy_unpack
+
+GATEWAY_ID = 'gw_%017d' % 1
+
+
+def make_state(number):
+    value = random.choice([True, False, random.randint(0, 100), 'sunny'])
+    state = dict(zip(SYNC_FIELDS, (GATEWAY_ID, value, str(value), type(value).__name__,
+                                   1500000000 + number, 1500000000 + number * 2)))
+    return 'state.%s.%s' % (random.choice(['amqp', 'weather', 'is', 'sun', 'mqtt']), number), state
+
+
+def make_device(number):
+    device_id = 'x%017d' % number
+    label = 'Device %s' % number
+    return {
+        'device_id': device_id, 'machine_label': label.lower().replace(' ', '_'), 'label': label,
+        'description': 'A device', 'device_type_id': 'y%017d' % (number % 20),
+        'location_id': 'l%017d' % (number % 8), 'area_id': 'a%017d' % (number % 12), 'gateway_id': GATEWAY_ID,
+        'status': 1, 'statistic_label': 'myhouse.%s' % label.lower(), 'pin_required': 0,
+        'energy_type': 'electric', 'energy_map': {'0.0': 0, '1.0': 60}, 'controllable': 1,
+        'allow_direct_control': 1, 'device_commands': [],
+        'status_all': {'human_status': 'On', 'human_message': 'On by user', 'machine_status': 1,
+                       'machine_status_extra': {}, 'requested_by': {'user_id': 'admin', 'component': 'webinterface'},
+                       'reported_by': 'x10api', 'uploaded': 0, 'uploadable': 1, 'set_at': 1500000000.5},
+        'meta': {},
+    }
+
+
+def make_messages():
+    random.seed(1)
+    messages = [('state change', dict([make_state(1)]), 2000)]
+    for count in (50, 500, 5000):
+        messages.append(('%s states' % count, dict(make_state(number) for number in range(count)),
+                         max(20, 20000 // count)))
+    messages.append(('200 devices', {'x%017d' % number: make_device(number) for number in range(200)}, 50))
+    return messages
+
+
+def timed(call, count):
+    start = time()
+    for number in range(count):
+        result = call()
+    return result, (time() - start) * 1000 / count
+
+
+def main():
+    print("%-14s %-10s %9s %12s %12s" % ("Message", "Format", "Bytes", "Pack ms", "Unpack ms"))
+    for name, payload, count in make_messages():
+        frame, pack_ms = timed(lambda: legacy_pack(payload, GATEWAY_ID, 'all'), count)
+        message, unpack_ms = timed(lambda: legacy_unpack(frame), count)
+        assert message['payload'] == payload, name
+        print("%-14s %-10s %9d %12.3f %12.3f" % (name, 'legacy', len(frame), pack_ms, unpack_ms))
+
+        for compression in COMPRESSIONS:
+            frame, pack_ms = timed(lambda: pack(payload, GATEWAY_ID, 'all', compression), count)
+            message, unpack_ms = timed(lambda: unpack(frame), count)
+            assert message['payload'] == payload, (name, compression)
+            print("%-14s %-10s %9d %12.3f %12.3f" % (name, compression, len(frame), pack_ms, unpack_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark for calling hooks on all libraries.
+
+Compares the per library path (Loader.library_invoke_all) to the hook implementor table used by
+global_invoke_all. Run from the repository root:
+
+    python -m tests.benchmarks.bench_hooks
+"""
+from time import time
+
+from yombo.core.library import YomboLibrary
+from yombo.lib.loader import Loader
+
+LIBRARY_COUNT = 35
+IMPLEMENTORS = 3
+CALLS = 20000
+
+
+class BenchModules:
+    """
+    Stand in for the modules library, no modules are loaded.
+    """
+    modules = {}
+    disabled_modules = {}
+
+    def module_invoke_all(self, hook, full_name=None, **kwargs):
+        from twisted.internet.defer import succeed
+        return succeed({})
+
+
+def make_library(number, implements):
+    attributes = {}
+    if implements:
+        attributes['_states_set_'] = lambda self, **kwargs: number
+    return type('BenchLibrary%s' % number, (YomboLibrary,), attributes)()
+
+
+def setup_loader():
+    loader = Loader(testing=True)
+    for number in range(LIBRARY_COUNT):
+        library = make_library(number, number < IMPLEMENTORS)
+        loader.loadedLibraries[library._Name.lower()] = library
+    loader._moduleLibrary = BenchModules()
+    loader._run_phase = 'libraries_started'
+    return loader
+
+
+def run(label, call):
+    results = []
+    start = time()
+    for i in range(CALLS):
+        call().addCallback(results.append)
+    duration = time() - start
+    assert len(results) == CALLS and len(results[0]) == IMPLEMENTORS, results[0]
+    print("%-28s %10.0f invocations/sec" % (label, CALLS / duration))
+
+
+def main():
+    loader = setup_loader()
+    print("%s libraries, %s implement the hook, %s calls." % (LIBRARY_COUNT, IMPLEMENTORS, CALLS))
+    run("library_invoke_all (before)",
+        lambda: loader.library_invoke_all('_states_set_', True, called_by=loader))
+    run("global_invoke_all (after)",
+        lambda: loader.global_invoke_all('_states_set_', called_by=loader))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark for what lazy libraries save at startup.
+
+For each library that can be lazy (marked 'lazy' in HARD_LOAD), imports and instantiates it in a new python
+process, after the modules every library uses are already imported. Prints the time and resident memory each
+one adds, which is what is saved at startup when the library is listed in lazy_libraries and never used.
+Run from the repository root:
+
+    python -m tests.benchmarks.bench_lazy_libraries
+"""
+import subprocess
+import sys
+
+from yombo.lib.loader import HARD_LOAD
+
+MEASURE = """
+import sys
+from time import time
+import twisted.internet.reactor
+import yombo.core.library
+import yombo.utils
+from yombo.lib.loader import memory_usage
+
+name = sys.argv[1]
+memory = memory_usage()
+started = time()
+module = __import__('yombo.lib.%s' % name.lower(), fromlist=[name])
+getattr(module, name)()
+print(time() - started, memory_usage() - memory)
+"""
+
+
+def measure(name):
+    output = subprocess.check_output([sys.executable, '-c', MEASURE, name], universal_newlines=True)
+    duration, memory = output.split()[-2:]
+    return float(duration), int(memory)
+
+
+def main():
+    total_duration = 0
+    total_memory = 0
+    print("%-16s %12s %12s" % ("Library", "Import ms", "Memory KB"))
+    for name, config in HARD_LOAD.items():
+        if config.get('lazy', False) is not True:
+            continue
+        duration, memory = measure(name)
+        total_duration += duration
+        total_memory += memory
+        print("%-16s %12.1f %12d" % (name, duration * 1000, memory // 1024))
+    print("%-16s %12.1f %12d" % ("Total", total_duration * 1000, total_memory // 1024))
+    print("Time for _init_ isn't included, it depends on the gateway. See Loader.lazy_report() on a running gateway.")
+
+
+if __name__ == "__main__":
+    main()
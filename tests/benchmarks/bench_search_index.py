@@ -0,0 +1,109 @@
+"""
+Benchmark for fuzzy searches over 5,000 devices.
+
+Times the lookups done by Devices.get() when the request isn't a device id: a search of device_id,
+machine_label, and label for the highest match. Each search is done by comparing every device, and by using a
+SearchIndex. Results are checked to be the same. Also times FuzzySearch, as used for voice commands, and keeping
+the index up to date as devices are edited. Run from the repository root:
+
+    python -m tests.benchmarks.bench_search_index
+"""
+import random
+from time import time
+
+from yombo.utils import do_search_instance
+from yombo.utils.fuzzysearch import FuzzySearch
+from yombo.utils.searchindex import SearchIndex
+
+DEVICES = 5000
+SEARCHES = 100
+FIELDS = ['device_id', 'machine_label', 'label']
+
+ROOMS = ['kitchen', 'living room', 'bedroom', 'garage', 'porch', 'office', 'basement', 'hallway', 'den', 'attic']
+THINGS = ['light', 'lamp', 'fan', 'outlet', 'switch', 'door', 'window sensor', 'thermostat', 'tv', 'speaker']
+
+
+class BenchDevice:
+    def __init__(self, number, label):
+        self.device_id = 'x%017d' % number
+        self.label = label
+        self.machine_label = label.replace(' ', '_')
+        self.status = 1
+
+
+def make_devices():
+    devices = {}
+    for number in range(DEVICES):
+        label = '%s %s %s' % (random.choice(ROOMS), random.choice(THINGS), number)
+        device = BenchDevice(number, label)
+        devices[device.device_id] = device
+    return devices
+
+
+def typo(text):
+    position = random.randrange(len(text))
+    return text[:position] + random.choice('abcdefghijklmnopqrstuvwxyz') + text[position + 1:]
+
+
+def attributes(value):
+    return [{'field': field, 'value': value, 'limiter': .89} for field in FIELDS]
+
+
+def search(devices, value, index=None):
+    try:
+        return do_search_instance(attributes(value), devices, FIELDS, limiter=.89, operation='highest', index=index)
+    except KeyError:
+        return None
+
+
+def timed(label, call, count):
+    start = time()
+    results = call()
+    duration = time() - start
+    print("%-44s %9.2f ms total %9.3f ms each" % (label, duration * 1000, duration * 1000 / count))
+    return results
+
+
+def main():
+    random.seed(1)
+    devices = make_devices()
+    labels = [device.label for device in devices.values()]
+    queries = {
+        'exact label': random.sample(labels, SEARCHES),
+        'one typo': [typo(label) for label in random.sample(labels, SEARCHES)],
+        'miss': ['%s %s' % (random.choice(THINGS), random.choice(ROOMS)) for number in range(SEARCHES)],
+    }
+
+    index = SearchIndex()
+    start = time()
+    for device_id, device in devices.items():
+        index.update(device_id, device)
+    for field in FIELDS:
+        index.field(field)
+    print("%s devices, index built in %.1f ms" % (DEVICES, (time() - start) * 1000))
+
+    for name, values in queries.items():
+        scanned = timed("%s, compare every device" % name,
+                        lambda: [search(devices, value) for value in values], len(values))
+        indexed = timed("%s, search index" % name,
+                        lambda: [search(devices, value, index) for value in values], len(values))
+        assert scanned == indexed, name
+
+    edited = random.sample(list(devices), SEARCHES)
+
+    def edit():
+        for device_id in edited:
+            device = devices[device_id]
+            device.label = typo(device.label)
+            device.machine_label = device.label.replace(' ', '_')
+            index.refresh(device_id)
+    timed("edit a device, refresh the index", edit, len(edited))
+
+    voice = FuzzySearch({'%s %s' % (label, verb): label for label in labels for verb in ('on', 'off')}, .80)
+    voice_queries = [typo('%s on' % label) for label in random.sample(labels, SEARCHES)]
+    timed("FuzzySearch, %s voice commands" % len(voice), lambda: [voice.search(value) for value in voice_queries],
+          len(voice_queries))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark for resampling stored statistic buckets for charts.
+
+Builds 30 days of 1 minute buckets for a counter, an average and a datapoint statistic, and times resampling
+them into 1 hour buckets:
+
+  * resample() using NumPy, if installed,
+  * resample() in pure python.
+
+Run from the repository root:
+
+    python -m tests.benchmarks.bench_statistics_resample
+"""
+from random import random, seed
+from time import time
+
+from yombo.lib.statistics.resample import HAS_NUMPY, resample
+
+DAYS = 30
+BUCKET_SIZE = 60
+RESOLUTION = 3600
+ROUNDS = 3
+
+
+def make_columns():
+    seed(1)
+    start = int(time() / RESOLUTION) * RESOLUTION - DAYS * 86400
+    times = list(range(start, start + DAYS * 86400, BUCKET_SIZE))
+    sizes = [BUCKET_SIZE] * len(times)
+    values = [int(random() * 100) for _ in times]
+    return start, times, sizes, values
+
+
+def timed(label, call):
+    best = None
+    result = None
+    for _ in range(ROUNDS):
+        start = time()
+        result = call()
+        duration = time() - start
+        best = duration if best is None else min(best, duration)
+    print("%-40s %8.1f ms" % (label, best * 1000))
+    return result
+
+
+def main():
+    start, times, sizes, values = make_columns()
+    end = start + DAYS * 86400
+    print("%s buckets of %s seconds into %s second buckets." % (len(times), BUCKET_SIZE, RESOLUTION))
+
+    for bucket_type in ('counter', 'average', 'datapoint'):
+        print(bucket_type)
+        if HAS_NUMPY:
+            fast = timed("  resample, numpy",
+                         lambda: resample(bucket_type, times, sizes, values, start, end, RESOLUTION, True))
+        slow = timed("  resample, python",
+                     lambda: resample(bucket_type, times, sizes, values, start, end, RESOLUTION, False))
+        if HAS_NUMPY:
+            assert max(abs(a - b) for a, b in zip(fast, slow)) < 1e-6
+
+
+if __name__ == "__main__":
+    main()
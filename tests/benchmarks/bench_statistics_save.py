@@ -0,0 +1,124 @@
+"""
+Benchmark for saving live statistic buckets.
+
+Fills the Statistics library with 50,000 live buckets (counters and averages, some restored from the
+database) and times Statistics._save_statistics against a real SQLite database:
+
+  * a periodic save when nothing has finished,
+  * a full save, as done when the gateway stops,
+  * a periodic save after all buckets have finished.
+
+It also times the previous way of saving restored buckets, one LocalDB.save_statistic() call each. Run from
+the repository root:
+
+    python -m tests.benchmarks.bench_statistics_save
+"""
+import os
+import shutil
+import tempfile
+from time import time
+
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks
+
+from yombo.ext.twistar.registry import Registry
+from yombo.lib.localdb import LocalDB, SQLitePool, LATEST_SCHEMA_VERSION
+from yombo.lib.statistics import Statistics
+from yombo.lib.statistics.live_buckets import BucketNames, LiveBuckets
+
+BUCKETS = 50000
+AVERAGES = 10000
+RESTORED = 5000
+BUCKET_SIZE = 60
+
+
+def setup_statistics(localdb):
+    statistics = Statistics.__new__(Statistics)
+    statistics.enabled = True
+    statistics.bucket_names = BucketNames()
+    statistics._counters = LiveBuckets('counter', statistics.bucket_names)
+    statistics._averages = LiveBuckets('average', statistics.bucket_names)
+    statistics._datapoints = {}
+    statistics._datapoint_last_value = {}
+    statistics._LocalDB = localdb
+    return statistics
+
+
+def fill(statistics, bucket_time, restored_ids):
+    counters = statistics._counters
+    averages = statistics._averages
+    for number in range(BUCKETS - AVERAGES):
+        row = counters.get_row(bucket_time, 'lib.bench.counter%s.sent' % number, BUCKET_SIZE, 180)
+        counters.values[row] = number
+    for number in range(AVERAGES):
+        row = averages.get_row(bucket_time, 'lib.bench.average%s.time' % number, BUCKET_SIZE, 180)
+        for value in range(10):
+            averages.sketches[row].add(value + number)
+    for number, db_id in enumerate(restored_ids):
+        row = counters.find_row(bucket_time, 'lib.bench.counter%s.sent' % number)
+        counters.db_ids[row] = db_id
+
+
+@inlineCallbacks
+def timed(label, call):
+    start = time()
+    yield call()
+    print("%-48s %8.1f ms" % (label, (time() - start) * 1000))
+
+
+@inlineCallbacks
+def bench():
+    localdb = LocalDB.__new__(LocalDB)
+    meta = __import__("yombo.utils.db." + str(LATEST_SCHEMA_VERSION), globals(), locals(), ['upgrade'], 0)
+    yield meta.new_db_file(Registry)
+
+    rows = [(0, BUCKET_SIZE, 180, 'counter', 'lib.bench.counter%s.sent' % number, 0, None, 0, 0, 0)
+            for number in range(RESTORED)]
+    yield localdb.save_statistics_batch(rows, [])
+    restored = yield Registry.DBPOOL.runQuery("SELECT id FROM statistics ORDER BY id")
+    restored_ids = [record[0] for record in restored]
+
+    bucket_time = int(time() / BUCKET_SIZE) * BUCKET_SIZE
+    statistics = setup_statistics(localdb)
+    fill(statistics, bucket_time, restored_ids)
+    statistics._counters.dirty.clear()
+    statistics._averages.dirty.clear()
+    print("%s live buckets, %s averages, %s restored from the database." % (BUCKETS, AVERAGES, RESTORED))
+
+    yield timed("periodic save, nothing finished", lambda: statistics._save_statistics())
+    for number in range(0, BUCKETS - AVERAGES, 100):
+        statistics.increment('lib.bench.counter%s.sent' % number, bucket_size=BUCKET_SIZE, anon=True)
+    yield timed("full save, %s changed" % len(statistics._counters.dirty),
+                lambda: statistics._save_statistics(full=True))
+
+    for buckets in (statistics._counters, statistics._averages):
+        buckets.expires = [(0, key) for end, key in buckets.expires]
+    yield timed("periodic save, all finished", lambda: statistics._save_statistics())
+    assert len(statistics._counters) == 0 and len(statistics._averages) == 0
+    saved = yield Registry.DBPOOL.runQuery("SELECT count(*) FROM statistics WHERE finished = 1")
+    assert saved[0][0] == BUCKETS, saved
+
+    @inlineCallbacks
+    def save_one_at_a_time():
+        for db_id in restored_ids:
+            yield localdb.save_statistic({'value': 1, 'anon': 0, 'type': 'counter', 'restored_db_id': db_id}, 1)
+    localdb.dbconfig = Registry.getConfig()
+    yield timed("%s restored buckets, one save_statistic each" % RESTORED, save_one_at_a_time)
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    Registry.DBPOOL = SQLitePool(os.path.join(directory, 'bench.db'))
+
+    def run():
+        d = bench()
+        d.addErrback(lambda failure: failure.printTraceback())
+        d.addBoth(lambda _: reactor.stop())
+
+    reactor.callWhenRunning(run)
+    reactor.run()
+    shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark for device status history.
+
+Loads 40 statuses for each of 2,000 devices, as done at startup, into:
+
+  * a deque of Device_Status instances (devices:compact_status_history disabled),
+  * a StatusHistory of compact records.
+
+Reports the time taken and memory used by each, and the time to read the current status of every device from
+the StatusHistory. Run from the repository root:
+
+    python -m tests.benchmarks.bench_status_history
+"""
+from collections import deque
+import gc
+from time import time
+import tracemalloc
+
+from yombo.lib.devices._device_status import Device_Status, DeviceStatusWriter, StatusHistory
+from yombo.lib.statistics import Statistics
+
+DEVICES = 2000
+HISTORY = 40
+
+
+class Parent:
+    """ The parts of the Devices library used by Device_Status. """
+    def __init__(self):
+        self.gateway_id = 'gw_bench'
+        self.is_master = True
+        self._Commands = {}
+        self._Statistics = Statistics.__new__(Statistics)
+        self._Statistics.enabled = False
+        self.status_writer = DeviceStatusWriter(self)
+
+
+class Device:
+    def __init__(self, number):
+        self.device_id = 'device%s' % number
+        self.gateway_id = 'gw_bench'
+
+
+def records(device_number):
+    return [{
+        'id': device_number * HISTORY + number,
+        'status_id': 'status%s_%s' % (device_number, number),
+        'device_id': 'device%s' % device_number,
+        'command_id': None,
+        'gateway_id': 'gw_bench',
+        'set_at': 1500000000.0 + number,
+        'energy_usage': 0,
+        'energy_type': 'electric',
+        'human_status': str(number),
+        'human_message': 'Set to %s' % number,
+        'machine_status': number,
+        'machine_status_extra': None,
+        'requested_by': {'user_id': 'bench', 'component': 'bench'},
+        'reported_by': 'bench',
+        'request_id': None,
+        'uploaded': 0,
+        'uploadable': 1,
+        '_source': 'database',
+    } for number in range(HISTORY)]
+
+
+def load_deque(parent, devices, all_records):
+    histories = []
+    for device, device_records in zip(devices, all_records):
+        history = deque({}, HISTORY)
+        for record in device_records:
+            history.appendleft(Device_Status(parent, device, record, source='database'))
+        histories.append(history)
+    return histories
+
+
+def load_compact(parent, devices, all_records):
+    histories = []
+    for device, device_records in zip(devices, all_records):
+        history = StatusHistory(parent, device, HISTORY)
+        for record in device_records:
+            history.appendleft_record(record)
+        histories.append(history)
+    return histories
+
+
+def measure(label, call):
+    gc.collect()
+    tracemalloc.start()
+    start = time()
+    result = call()
+    duration = time() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print("%-32s %8.1f ms %8.1f MB" % (label, duration * 1000, size / 1024 / 1024))
+    return result
+
+
+def main():
+    parent = Parent()
+    devices = [Device(number) for number in range(DEVICES)]
+    print("%s devices with %s statuses each." % (DEVICES, HISTORY))
+
+    # Device_Status removes status_id from the record, so each gets its own records.
+    all_records = [records(number) for number in range(DEVICES)]
+    measure("deque of Device_Status", lambda: load_deque(parent, devices, all_records))
+    all_records = [records(number) for number in range(DEVICES)]
+    histories = measure("StatusHistory", lambda: load_compact(parent, devices, all_records))
+
+    start = time()
+    for history in histories:
+        assert history[0].machine_status == HISTORY - 1
+    print("%-32s %8.1f ms" % ("current status of each device", (time() - start) * 1000))
+
+
+if __name__ == "__main__":
+    main()
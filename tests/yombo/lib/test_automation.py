@@ -0,0 +1,93 @@
+from yombo.lib.automation import CompiledRule, TriggerIndex
+from yombo.modules.automationhelpers.automationhelpers import AutomationHelpers
+
+from itertools import count
+import pytest
+
+FILTERS = [
+    ('==', 5), ('==', 5.0), ('eq', 'on'), ('==', 'off'), ('==', True), ('==', 0), ('==', 1), ('==', 'abc'),
+    ('>', 5), ('>=', 5), ('gt', 10.5), ('ge', 0), ('>', -3),
+    ('<', 5), ('<=', 5), ('lt', 10.5), ('le', 0), ('<', 100),
+    ('!=', 5), ('>', 'abc'), ('<', 'm'),
+]
+
+VALUES = [0, 1, 2, 4, 5, 5.0, 6, 10.5, 11, -3, -10, 100, 1000, True, False, 'on', 'off', 'true', 'abc', 'm', 'z',
+          '5', None, 2.5, [1, 2]]
+
+
+def run_filter(rule, portion, new_value):
+    return AutomationHelpers.basic_values_run_filter_callback(None, rule, portion, new_value)
+
+
+class Automation:
+    filters = {
+        'basic_values': {'run_filter_callback': run_filter},
+        'other': {'run_filter_callback': lambda rule, portion, new_value: new_value == 'other'},
+    }
+
+
+def compile_rule(rule_id, operator_name, value, sequence, platform='basic_values'):
+    rule = {
+        'rule_id': rule_id,
+        'trigger': {'filter': {'platform': platform, 'operator': operator_name, 'value': value}},
+    }
+    return CompiledRule(Automation(), rule, sequence)
+
+
+def passes(compiled, new_value):
+    try:
+        return compiled.check_trigger(new_value) is True
+    except Exception:
+        return False
+
+
+class TestTriggerIndex:
+
+    @pytest.fixture
+    def rules(self):
+        sequence = count()
+        rules = [compile_rule('rule%s' % number, operator_name, value, next(sequence))
+                 for number, (operator_name, value) in enumerate(FILTERS)]
+        rules.append(compile_rule('other', '==', 'x', next(sequence), 'other'))
+        return rules
+
+    @pytest.fixture
+    def index(self, rules):
+        index = TriggerIndex()
+        for compiled in reversed(rules):
+            index.add(compiled)
+        return index
+
+    def test_index_types(self, rules):
+        index_types = {compiled.index_type for compiled in rules}
+        assert index_types == {'equality', 'lower', 'upper', 'always'}
+
+    @pytest.mark.parametrize('new_value', VALUES)
+    def test_same_as_checking_every_rule(self, rules, index, new_value):
+        candidates = index.candidates(new_value)
+        assert [compiled.sequence for compiled in candidates] == sorted(compiled.sequence for compiled in candidates)
+        expected = [compiled.rule_id for compiled in rules if passes(compiled, new_value)]
+        assert [compiled.rule_id for compiled in candidates if passes(compiled, new_value)] == expected
+
+    def test_remove(self, rules, index):
+        for compiled in rules:
+            index.remove(compiled.rule_id)
+        assert len(index) == 0
+        assert index.candidates(5) == []
+        assert index.equality == {} and index.lower_thresholds == [] and index.upper_thresholds == []
+        index.remove('missing')
+
+    def test_edited_rule_replaced(self, index):
+        assert 'rule8' in [compiled.rule_id for compiled in index.candidates(6)]
+        edited = compile_rule('rule8', '>', 50, 100)
+        index.add(edited)
+        found = [compiled for compiled in index.candidates(6) if compiled.rule_id == 'rule8']
+        assert found == []
+        assert edited in index.candidates(60)
+        assert index.lower.count(edited) == 1
+        assert len(index.lower) == len(index.lower_thresholds)
+
+        edited = compile_rule('rule8', '==', 'on', 101)
+        index.add(edited)
+        assert edited not in index.lower
+        assert edited in index.candidates('on')
@@ -0,0 +1,102 @@
+from yombo.lib import configuration
+from yombo.lib.configuration import Configuration
+
+from twisted.internet.defer import succeed
+import pytest
+
+
+class CountingStatistics:
+    def increment(self, *args, **kwargs):
+        pass
+
+
+@pytest.fixture
+def configs(monkeypatch):
+    hooks = []
+
+    def global_invoke_all(hook, **kwargs):
+        hooks.append((hook, kwargs['section'], kwargs['option'], kwargs['value']))
+        return succeed({})
+    monkeypatch.setattr(configuration, 'global_invoke_all', global_invoke_all)
+    configs = Configuration()
+    configs._Statistics = CountingStatistics()
+    configs.configs = {}
+    configs.handles = {}
+    configs.get_counts = {'value': 0, 'none': 0, 'empty_string': 0, 'default': 0, 'nodefault': 0}
+    configs.configs_dirty = False
+    configs.loading_yombo_ini = False
+    configs.hooks = hooks
+    configs.set('core', 'label', 'First')
+    return configs
+
+
+class TestConfigHandles:
+
+    def test_get2_follows_set(self, configs):
+        label = configs.get2('core', 'label')
+        assert label() == 'First'
+        configs.set('core', 'label', 'Second')
+        assert label() == 'Second'
+        assert label.value == 'Second'
+        configs.set('Core', 'Label', 'Third')
+        assert label() == 'Third'
+
+    def test_handle_set(self, configs):
+        label = configs.get2('core', 'label')
+        label(set='Second')
+        assert label() == 'Second'
+        label.set('Third')
+        assert label() == 'Third'
+        assert configs.get('core', 'label') == 'Third'
+        assert ('_configuration_set_', 'core', 'label', 'Third') in configs.hooks
+
+    def test_handles_shared(self, configs):
+        assert configs.get2('core', 'label') is configs.get2('CORE', 'LABEL')
+        assert configs.handle('core', 'label', 'other') is not configs.handle('core', 'label')
+
+    def test_delete_option(self, configs):
+        label = configs.handle('core', 'label')
+        with_default = configs.handle('core', 'label', 'Default', False)
+        assert label.value == 'First'
+        assert with_default.value == 'First'
+        configs.delete('core', 'label')
+        with pytest.raises(KeyError):
+            label.value
+        assert with_default.value == 'Default'
+        assert ('_configuration_set_', 'core', 'label', None) in configs.hooks
+
+        configs.set('core', 'label', 'Again')
+        assert label.value == 'Again'
+        assert with_default.value == 'Again'
+
+    def test_delete_every_option(self, configs):
+        configs.set('core', 'gwid', 'gw1')
+        gateway_id = configs.get2('core', 'gwid', 'local', False)
+        label = configs.get2('core', 'label', 'Unlabeled', False)
+        for option in list(configs.configs['core']):
+            configs.delete('core', option)
+        assert configs.configs['core'] == {}
+        assert gateway_id() == 'local'
+        assert label() == 'Unlabeled'
+
+    def test_new_section(self, configs):
+        value = configs.get2('new_section', 'option', 'Default', False)
+        assert value() == 'Default'
+        assert 'new_section' not in configs.configs
+        configs.set('new_section', 'option', 'Set')
+        assert value() == 'Set'
+
+    def test_default_saved(self, configs):
+        name = configs.get2('core', 'name', 'Default')
+        assert name() == 'Default'
+        assert configs.get('core', 'name') == 'Default'
+        configs.set('core', 'name', 'Changed')
+        assert name() == 'Changed'
+
+    def test_reads_counted(self, configs):
+        label = configs.get2('core', 'label')
+        for _ in range(3):
+            label()
+        configs.send_read_counts()
+        assert label.reads == 0
+        assert configs.configs['core']['label']['reads'] >= 3
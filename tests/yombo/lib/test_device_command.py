@@ -0,0 +1,151 @@
+from yombo.lib.devices import _device_command
+from yombo.lib.devices._device_command import Device_Command, DeviceCommandRegistry
+
+from twisted.internet.task import Clock
+import pytest
+
+
+class Device:
+    def __init__(self, device_id, gateway_id):
+        self.device_id = device_id
+        self.gateway_id = gateway_id
+        self.device_commands = []
+        self.sent = []
+
+    def _do_command_hook(self, device_command):
+        self.sent.append(device_command.request_id)
+        device_command.status = 'sent'
+
+
+class Parent:
+    gateway_id = 'gw1'
+
+    def __init__(self):
+        self.device_commands = DeviceCommandRegistry()
+
+
+def command(parent, request_id, device, status='new', **data):
+    data.update({
+        'request_id': request_id,
+        'device': device,
+        'command': None,
+        'requested_by': {'user_id': 'test', 'component': 'test', 'gateway': 'gw1'},
+        'status': status,
+        '_source': 'database',
+    })
+    return Device_Command(data, parent, start=False)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    clock.advance(1500000000)
+    monkeypatch.setattr(_device_command, 'reactor', clock)
+    monkeypatch.setattr(_device_command, 'time', clock.seconds)
+    return clock
+
+
+class TestDeviceCommandRegistry:
+
+    @pytest.fixture
+    def parent(self):
+        return Parent()
+
+    @pytest.fixture
+    def devices(self):
+        return {'lamp': Device('lamp', 'gw2'), 'fan': Device('fan', 'gw3')}
+
+    def test_indexes(self, parent, devices):
+        registry = parent.device_commands
+        registry.add(command(parent, 'r1', devices['lamp'], 'sent', persistent_request_id='p1'))
+        registry.add(command(parent, 'r2', devices['lamp'], 'done', finished_at=1))
+        registry.add(command(parent, 'r3', devices['fan'], 'sent', persistent_request_id='p1'))
+
+        assert list(registry) == ['r3', 'r2', 'r1']
+        assert set(registry.with_status('sent')) == {'r1', 'r3'}
+        assert set(registry.with_status('sent', 'done')) == {'r1', 'r2', 'r3'}
+        assert set(registry.for_gateway('gw2')) == {'r1', 'r2'}
+        assert list(registry.for_device('lamp')) == ['r2', 'r1']
+        assert set(registry.for_persistent_id('p1')) == {'r1', 'r3'}
+        assert registry.status_counts() == {'sent': 2, 'done': 1}
+        assert registry.status_counts(in_flight=True) == {'sent': 2}
+
+        registry.remove('r1')
+        assert 'r1' not in registry
+        assert set(registry.with_status('sent')) == {'r3'}
+        assert set(registry.for_gateway('gw2')) == {'r2'}
+        assert list(registry.for_device('lamp')) == ['r2']
+        assert set(registry.for_persistent_id('p1')) == {'r3'}
+
+        registry.remove('r3')
+        assert registry.by_status == {'done': {'r2': registry['r2']}}
+        assert 'gw3' not in registry.by_gateway
+        assert 'fan' not in registry.by_device
+        assert registry.by_persistent_id == {}
+        with pytest.raises(KeyError):
+            registry.remove('r3')
+
+    def test_status_change_moves_index(self, parent, devices):
+        registry = parent.device_commands
+        device_command = command(parent, 'r1', devices['lamp'], 'sent')
+        registry.add(device_command)
+        device_command.status = 'received'
+        assert registry.with_status('sent') == {}
+        assert list(registry.with_status('received')) == ['r1']
+
+        registry.remove('r1')
+        device_command.status = 'done'
+        assert registry.by_status == {}
+
+    def test_delayed_sent_in_order(self, clock, parent, devices):
+        registry = parent.device_commands
+        lamp = devices['lamp']
+        for request_id, delay in (('late', 30), ('soon', 10), ('middle', 20), ('canceled', 15)):
+            device_command = command(parent, request_id, lamp, 'delayed', not_before_at=clock.seconds() + delay)
+            registry.add(device_command)
+            registry.schedule(device_command)
+        registry['canceled'].status = 'canceled'
+        assert len(clock.getDelayedCalls()) == 1
+
+        clock.advance(9)
+        assert lamp.sent == []
+        clock.advance(1)
+        assert lamp.sent == ['soon']
+        clock.advance(20)
+        assert lamp.sent == ['soon', 'middle', 'late']
+        assert clock.getDelayedCalls() == []
+
+    def test_removed_delayed_not_sent(self, clock, parent, devices):
+        registry = parent.device_commands
+        device_command = command(parent, 'r1', devices['lamp'], 'delayed', not_before_at=clock.seconds() + 5)
+        registry.add(device_command)
+        registry.schedule(device_command)
+        registry.remove('r1')
+        clock.advance(5)
+        assert devices['lamp'].sent == []
+
+    def test_expired_after_default_keep_time(self, clock, parent, devices):
+        registry = parent.device_commands
+        assert registry.keep_finished == 2700
+        finished_at = clock.seconds()
+        registry.add(command(parent, 'done', devices['lamp'], 'done', finished_at=finished_at))
+        registry.add(command(parent, 'running', devices['lamp'], 'sent'))
+
+        assert registry.pop_expired(finished_at + 2699) == []
+        assert [found.request_id for found in registry.pop_expired(finished_at + 2700)] == ['done']
+        assert list(registry) == ['running']
+
+        registry['running'].finished_at = finished_at + 100
+        registry['running'].status = 'failed'
+        assert [found.request_id for found in registry.pop_expired(finished_at + 2800)] == ['running']
+        assert len(registry) == 0
+
+    def test_recent_commands_kept(self, clock, parent, devices):
+        registry = parent.device_commands
+        lamp = devices['lamp']
+        registry.add(command(parent, 'r1', lamp, 'done', finished_at=clock.seconds()))
+        lamp.device_commands.append('r1')
+        assert registry.pop_expired(clock.seconds() + 2700) == []
+        lamp.device_commands.remove('r1')
+        assert registry.pop_expired(clock.seconds() + 5399) == []
+        assert len(registry.pop_expired(clock.seconds() + 5400)) == 1
@@ -0,0 +1,110 @@
+from yombo.lib.devices._device_status import Device_Status, StatusHistory, StatusRecord, RecordField
+
+import gc
+import pytest
+
+
+class StatusWriter:
+    def __init__(self):
+        self.pending = []
+
+    def __contains__(self, status_id):
+        return False
+
+    def add(self, device_status):
+        self.pending.append(device_status)
+
+    def saved(self, status_id):
+        pass
+
+
+class Command:
+    command_id = 'cmd2'
+
+
+class Parent:
+    gateway_id = 'gw1'
+
+    def __init__(self):
+        self.status_writer = StatusWriter()
+        self._Commands = {'cmd2': Command()}
+
+
+class Device:
+    device_id = 'device1'
+    gateway_id = 'gw1'
+
+
+def record(number):
+    return {
+        'status_id': 'status%s' % number,
+        'command_id': 'cmd1',
+        'set_at': 1500000000 + number,
+        'human_status': 'Status %s' % number,
+        'machine_status': number,
+    }
+
+
+class TestStatusHistory:
+
+    @pytest.fixture
+    def history(self):
+        return StatusHistory(Parent(), Device(), 3)
+
+    def test_newest_first_and_maxlen(self, history):
+        assert len(history) == 0
+        assert not history
+        for number in range(5):
+            history.appendleft_record(record(number))
+        assert len(history) == 3
+        assert [status.machine_status for status in history] == [4, 3, 2]
+        assert history[-1].machine_status == 2
+        with pytest.raises(IndexError):
+            history[3]
+
+    def test_same_instance_while_used(self, history):
+        history.appendleft_record(record(1))
+        assert history[0] is history[0]
+
+    def test_appendleft_keeps_instance(self, history):
+        status = Device_Status(history._Parent, history.device, record(1))
+        history.appendleft(status)
+        assert history[0] is status
+
+    def test_changes_kept_after_collected(self, history):
+        history.appendleft_record(record(1))
+        status = history[0]
+        status.human_status = 'Changed'
+        status['uploaded'] = 1
+        del status
+        gc.collect()
+        assert history[0].human_status == 'Changed'
+        assert history[0].uploaded == 1
+
+    def test_appended_status_changes_kept(self, history):
+        status = Device_Status(history._Parent, history.device, record(1))
+        history.appendleft(status)
+        status.update_attributes({'machine_status': 9, 'command_id': 'cmd2'})
+        del status
+        gc.collect()
+        assert history[0].machine_status == 9
+        assert history[0].command_id == 'cmd2'
+
+    def test_clear(self, history):
+        history.appendleft_record(record(1))
+        history.clear()
+        assert len(history) == 0
+        assert list(history) == []
+
+    def test_other_attributes_not_written(self, history):
+        history.appendleft_record(record(1))
+        status = history[0]
+        status._dirty = True
+        status.extra = 'value'
+        assert not hasattr(history._record(0), 'extra')
+        assert 'extra' in status
+
+
+def test_record_fields():
+    fields = {name for name, value in vars(Device_Status).items() if isinstance(value, RecordField)}
+    assert fields == StatusRecord.fields | {'command'}
@@ -0,0 +1,119 @@
+from yombo.lib.gateways import Gateways, Gateway
+from yombo.utils.framing import get_compression, is_frame
+
+import pytest
+
+
+class SyncedLibrary:
+    def __init__(self):
+        self.values = {}
+
+    def set_from_gateway_communications(self, key, values):
+        self.values[key] = values['value']
+
+
+class RemoteGateway:
+    def __init__(self):
+        self.sync_seen = {}
+
+
+def sync(epoch, since, version, **items):
+    return {
+        'epoch': epoch,
+        'since': since,
+        'version': version,
+        'items': {name: {'value': value} for name, value in items.items()},
+    }
+
+
+class TestIncomingSync:
+
+    @pytest.fixture
+    def gateways(self):
+        gateways = Gateways()
+        gateways._Atoms = SyncedLibrary()
+        gateways._States = SyncedLibrary()
+        gateways.gateways = {'gw2': RemoteGateway()}
+        gateways.sync_requested = {}
+        gateways.requested = []
+        gateways.request_sync = lambda gateway_id, component: gateways.requested.append((gateway_id, component))
+        return gateways
+
+    def test_full_then_changes(self, gateways):
+        gateways.incoming_data_sync('gw2', 'states', sync('e1', 0, 5, light=1, door=0))
+        gateways.incoming_data_sync('gw2', 'states', sync('e1', 5, 7, light=2))
+        assert gateways._States.values == {'light': 2, 'door': 0}
+        assert gateways.gateways['gw2'].sync_seen['states'] == ('e1', 7)
+        assert gateways.requested == []
+
+    def test_stale_message_ignored(self, gateways):
+        gateways.incoming_data_sync('gw2', 'states', sync('e1', 0, 5, light=1))
+        gateways.incoming_data_sync('gw2', 'states', sync('e1', 5, 8, light=3))
+        gateways.incoming_data_sync('gw2', 'states', sync('e1', 5, 7, light=2))
+        gateways.incoming_data_sync('gw2', 'states', sync('e1', 0, 6, light=2))
+        assert gateways._States.values == {'light': 3}
+        assert gateways.gateways['gw2'].sync_seen['states'] == ('e1', 8)
+
+    def test_duplicate_ignored(self, gateways):
+        gateways.incoming_data_sync('gw2', 'atoms', sync('e1', 0, 5, light=1))
+        gateways._Atoms.values.clear()
+        gateways.incoming_data_sync('gw2', 'atoms', sync('e1', 0, 5, light=1))
+        assert gateways._Atoms.values == {}
+
+    def test_gap_requests_sync(self, gateways):
+        gateways.incoming_data_sync('gw2', 'states', sync('e1', 0, 5, light=1))
+        gateways.incoming_data_sync('gw2', 'states', sync('e1', 9, 10, light=4))
+        assert gateways._States.values == {'light': 4}
+        assert gateways.requested == [('gw2', 'states')]
+        assert gateways.gateways['gw2'].sync_seen['states'] == ('e1', 5)
+
+    def test_new_epoch_accepted(self, gateways):
+        gateways.incoming_data_sync('gw2', 'states', sync('e1', 0, 50, light=1))
+        gateways.incoming_data_sync('gw2', 'states', sync('e2', 0, 3, light=5))
+        assert gateways._States.values == {'light': 5}
+        assert gateways.gateways['gw2'].sync_seen['states'] == ('e2', 3)
+
+    def test_unknown_component(self, gateways):
+        gateways.incoming_data_sync('gw2', 'devices', sync('e1', 0, 5, light=1))
+        assert gateways.gateways['gw2'].sync_seen == {}
+
+
+def peer(gateway_id, reads_frames):
+    gateway = Gateway.__new__(Gateway)
+    gateway.gateway_id = gateway_id
+    gateway.reads_frames = reads_frames
+    return gateway
+
+
+class TestFrameFormat:
+
+    @pytest.fixture
+    def gateways(self):
+        gateways = Gateways()
+        gateways.gateway_id = 'gw1'
+        gateways.compression = get_compression('zlib_dict')
+        gateways.compression_level = 3
+        gateways.frame_format = 'auto'
+        gateways.gateways = {'gw1': peer('gw1', False), 'gw2': peer('gw2', True), 'gw3': peer('gw3', False)}
+        return gateways
+
+    def test_auto(self, gateways):
+        assert is_frame(gateways.encrypt({'value': 1}, 'gw2'))
+        assert not is_frame(gateways.encrypt({'value': 1}, 'gw3'))
+        assert not is_frame(gateways.encrypt({'value': 1}, 'gw9'))
+        assert not is_frame(gateways.encrypt({'value': 1}))
+        gateways.gateways['gw3'].reads_frames = True
+        assert is_frame(gateways.encrypt({'value': 1}))
+
+    def test_configured(self, gateways):
+        gateways.frame_format = 'frame'
+        assert is_frame(gateways.encrypt({'value': 1}, 'gw3'))
+        gateways.frame_format = 'legacy'
+        assert not is_frame(gateways.encrypt({'value': 1}, 'gw2'))
+
+    def test_both_formats_decrypt(self, gateways):
+        for destination in ('gw2', 'gw3'):
+            message = gateways.decrypt(gateways.encrypt({'value': 1}, destination))
+            assert message['payload'] == {'value': 1}
+            assert message['destination_gateway_id'] == destination
+            assert message['frame_version'] == 1
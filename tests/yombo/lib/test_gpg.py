@@ -0,0 +1,218 @@
+from yombo.core.exceptions import YomboWarning
+from yombo.lib.gpg import GPG
+from yombo.utils import gpgworker
+from yombo.utils.gpgworker import GPGWorker, ResultCache
+
+from twisted.internet.defer import maybeDeferred, succeed
+from twisted.internet.task import Clock
+import pytest
+
+SIGNED = "-----BEGIN PGP SIGNED MESSAGE-----\nHash: SHA256\n\n%s\n-----BEGIN PGP SIGNATURE-----\n%s\n"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    clock.advance(1500000000)
+    monkeypatch.setattr(gpgworker, 'reactor', clock)
+    monkeypatch.setattr(gpgworker, 'time', clock.seconds)
+    # Jobs run when sent, instead of on the pool's threads.
+    monkeypatch.setattr(gpgworker, 'deferToThreadPool',
+                        lambda reactor, pool, function, *args, **kwargs: maybeDeferred(function, *args, **kwargs))
+    return clock
+
+
+class Result:
+    def __init__(self, data, valid=True, trust_level=4):
+        self.data = data
+        self.valid = valid
+        self.trust_level = trust_level
+        self.TRUST_FULLY = 3
+
+
+class FakeGnuPG:
+    """
+    Stands in for the gpg binary, counts the calls made.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def sign(self, text, keyid=None, passphrase=None, clearsign=True):
+        self.calls.append(('sign', text, keyid, clearsign))
+        return Result("signed(%s) by %s" % (text, keyid))
+
+    def decrypt(self, text, passphrase=None):
+        self.calls.append(('decrypt', text))
+        if 'untrusted' in text:
+            return Result(text, trust_level=1)
+        return Result(text.split('\n')[3], valid='bad signature' not in text)
+
+
+def results_of(d):
+    results = []
+    d.addBoth(results.append)
+    return results
+
+
+@pytest.fixture
+def gpg(clock):
+    gpg = GPG()
+    gpg.gpg = FakeGnuPG()
+    gpg.worker = GPGWorker(workers=2)
+    gpg.verify_cache = ResultCache(max_entries=10, ttl=600)
+    gpg.mykeyid = lambda: 'ABC123'
+    gpg._GPG__mypassphrase = 'secret'
+    return gpg
+
+
+class TestResultCache:
+
+    def test_get_set(self, clock):
+        cache = ResultCache(max_entries=10, ttl=600)
+        with pytest.raises(KeyError):
+            cache.get('message')
+        cache.set('message', 'result')
+        assert cache.get('message') == 'result'
+        assert cache.get(b'message') == 'result'
+        assert cache.stats == {'hits': 2, 'misses': 1}
+
+    def test_keys_never_collide(self, clock):
+        cache = ResultCache(max_entries=10, ttl=600)
+        payloads = [
+            SIGNED % ('turn on', 'signature of key one'),
+            SIGNED % ('turn on', 'signature of key two'),
+            SIGNED % ('turn off', 'signature of key one'),
+            SIGNED % ('turn on', 'signature of key one') + ' ',
+            '',
+        ]
+        for payload in payloads:
+            cache.set(payload, payload)
+        assert len(cache) == len(payloads)
+        for payload in payloads:
+            assert cache.get(payload) == payload
+
+    def test_expires(self, clock):
+        cache = ResultCache(max_entries=10, ttl=600)
+        cache.set('message', 'result')
+        clock.advance(599)
+        assert cache.get('message') == 'result'
+        clock.advance(1)
+        with pytest.raises(KeyError):
+            cache.get('message')
+        assert len(cache) == 0
+
+    def test_least_recently_used_removed(self, clock):
+        cache = ResultCache(max_entries=2, ttl=600)
+        cache.set('first', 1)
+        cache.set('second', 2)
+        cache.get('first')
+        cache.set('third', 3)
+        assert cache.get('first') == 1
+        assert cache.get('third') == 3
+        with pytest.raises(KeyError):
+            cache.get('second')
+
+
+class TestGPGWorker:
+
+    def test_batched(self, clock):
+        calls = []
+
+        def double(item):
+            calls.append(item)
+            return item * 2
+
+        worker = GPGWorker(workers=2, max_batch=2)
+        first = results_of(worker.batched('double', double, 1))
+        again = results_of(worker.batched('double', double, 1))
+        second = results_of(worker.batched('double', double, 2))
+        third = results_of(worker.batched('double', double, 3))
+        assert calls == []
+        clock.advance(0)
+        assert calls == [1, 2, 3]
+        assert (first, again, second, third) == ([2], [2], [4], [6])
+        assert worker.stats == {'jobs': 2, 'batched': 4, 'duplicates': 1}
+
+    def test_batched_error(self, clock):
+        def check(item):
+            if item == 'bad':
+                raise YomboWarning("Bad item.")
+            return item
+
+        worker = GPGWorker()
+        good = results_of(worker.batched('check', check, 'good'))
+        bad = results_of(worker.batched('check', check, 'bad'))
+        clock.advance(0)
+        assert good == ['good']
+        assert bad[0].check(YomboWarning)
+
+
+class TestSign:
+
+    def test_sign_returns_deferred(self, gpg, clock):
+        first = results_of(gpg.sign('turn on'))
+        again = results_of(gpg.sign('turn on'))
+        other = results_of(gpg.sign('turn off'))
+        assert first == []
+        clock.advance(0)
+        assert first == again == ["signed(turn on) by ABC123"]
+        assert other == ["signed(turn off) by ABC123"]
+        assert gpg.gpg.calls == [('sign', 'turn on', 'ABC123', True), ('sign', 'turn off', 'ABC123', True)]
+        assert gpg.worker.stats['jobs'] == 1
+
+    def test_sign_binary(self, gpg, clock):
+        signed = results_of(gpg.sign('turn on', asciiarmor=False))
+        clock.advance(0)
+        assert signed == ["signed(turn on) by ABC123"]
+        assert gpg.gpg.calls == [('sign', 'turn on', 'ABC123', False)]
+
+    def test_sign_not_text(self, gpg, clock):
+        assert results_of(gpg.sign(b'turn on')) == [False]
+        assert gpg.gpg.calls == []
+
+
+class TestVerify:
+
+    def test_cache_hit_skips_worker(self, gpg, clock):
+        message = SIGNED % ('turn on', 'signature')
+        first = results_of(gpg.verify_asymmetric(message))
+        clock.advance(0)
+        assert first == ['turn on']
+        assert gpg.worker.stats['batched'] == 1
+
+        second = results_of(gpg.verify_asymmetric(message))
+        assert second == ['turn on']
+        assert gpg.worker.stats['batched'] == 1
+        assert gpg.gpg.calls == [('decrypt', message)]
+        assert gpg.verify_cache.stats == {'hits': 1, 'misses': 1}
+
+    def test_verify_is_one_decrypt(self, gpg, clock):
+        message = SIGNED % ('turn on', 'signature')
+        verified = results_of(gpg.decrypt(message))
+        clock.advance(0)
+        assert verified == ['turn on']
+        assert gpg.gpg.calls == [('decrypt', message)]
+
+    def test_invalid_signature(self, gpg, clock):
+        message = SIGNED % ('turn on', 'bad signature')
+        verified = results_of(gpg.verify_asymmetric(message))
+        clock.advance(0)
+        assert verified == [False]
+
+    def test_untrusted_not_cached(self, gpg, clock):
+        message = SIGNED % ('turn on', 'untrusted signature')
+        for attempt in range(2):
+            verified = results_of(gpg.verify_asymmetric(message))
+            clock.advance(0)
+            assert verified[0].check(YomboWarning)
+        assert len(gpg.verify_cache) == 0
+        assert len(gpg.gpg.calls) == 2
+
+    def test_trust_change_clears_cache(self, gpg, clock, monkeypatch):
+        message = SIGNED % ('turn on', 'signature')
+        gpg.verify_asymmetric(message)
+        clock.advance(0)
+        assert len(gpg.verify_cache) == 1
+        monkeypatch.setattr(gpg, '_set_trust_level', lambda keyid, trust_level: b'')
+        gpg.set_trust_level('ABC123', 5)
+        assert len(gpg.verify_cache) == 0
@@ -0,0 +1,196 @@
+from yombo.core.exceptions import YomboWarning
+from yombo.lib import loader as loader_module
+from yombo.lib.loader import Loader, LazyLibrary, HARD_LOAD, memory_usage
+
+from collections import OrderedDict
+import os
+from twisted.internet.defer import Deferred, succeed
+import pytest
+
+
+class SlowLibrary:
+    _Name = 'Slow'
+
+    def __init__(self):
+        self.calls = []
+        self.level = 3
+
+    def do_work(self, value):
+        self.calls.append(value)
+        return value * 2
+
+    def fail_work(self):
+        raise ValueError("bad value")
+
+    def __contains__(self, key):
+        return key == 'known'
+
+    def __getitem__(self, key):
+        return key.upper()
+
+
+class TestLazyLibraries:
+
+    @pytest.fixture
+    def loader(self):
+        loader = Loader()
+        library = SlowLibrary()
+        loader.add_lazy_library('Slow')
+
+        def activate_library(name, reason):
+            loader._lazy_libraries['slow']['activated'] = 1
+            loader._lazy_libraries['slow']['reason'] = reason
+            return library
+        loader.activate_library = activate_library
+        loader.slow = library
+        return loader
+
+    def mark_ready(self, loader):
+        lazy_library = loader._lazy_libraries['slow']
+        lazy_library['ready'] = True
+        for d in lazy_library['waiting']:
+            d.callback(None)
+
+    def test_only_unused_libraries_are_lazy(self):
+        lazy = [name for name, config in HARD_LOAD.items() if config.get('lazy', False) is True]
+        for name in ('GPG', 'SSLCerts', 'WebInterface', 'Localize'):
+            assert name not in lazy
+
+    def test_methods_wait_until_ready(self, loader):
+        stand_in = loader.loadedLibraries['slow']
+        assert isinstance(stand_in, LazyLibrary)
+        results = []
+        stand_in.do_work(2).addCallback(results.append)
+        assert loader._lazy_libraries['slow']['reason'] == 'do_work'
+        assert loader.slow.calls == []
+        assert stand_in.level == 3
+
+        self.mark_ready(loader)
+        assert loader.slow.calls == [2]
+        assert results == [4]
+        assert stand_in.do_work(3) == 6
+
+    def test_errors_reach_the_deferred(self, loader):
+        failures = []
+        loader.loadedLibraries['slow'].fail_work().addErrback(failures.append)
+        self.mark_ready(loader)
+        assert failures[0].check(ValueError)
+
+    def test_items_need_ready_library(self, loader):
+        stand_in = loader.loadedLibraries['slow']
+        with pytest.raises(YomboWarning):
+            'known' in stand_in
+        with pytest.raises(YomboWarning):
+            stand_in['key']
+        assert loader._lazy_libraries['slow']['activated'] == 1
+
+        self.mark_ready(loader)
+        assert 'known' in stand_in
+        assert stand_in['key'] == 'KEY'
+
+    def test_library_ready(self, loader):
+        assert loader.library_is_ready('Validate') is True
+        assert loader.library_is_ready('Slow') is False
+        fired = []
+        loader.library_ready('Slow').addCallback(fired.append)
+        assert fired == []
+        self.mark_ready(loader)
+        assert fired == [None]
+        assert loader.library_ready('Slow').called is True
+
+    def test_missed_hooks_are_recorded(self, loader):
+        loader.lazy_hook_missed('_modules_created_', {'called_by': loader, 'hook_name': '_modules_created_'})
+        loader.lazy_hook_missed('_modules_created_', {'called_by': None})
+        loader.lazy_hook_missed('_load_', {'called_by': loader})
+        assert list(loader._lazy_missed_hooks.items()) == [('_modules_created_', {'called_by': loader})]
+
+    def test_missed_hooks_replayed(self, loader):
+        loader.lazy_hook_missed('_modules_created_', {'called_by': loader})
+        replayed = []
+
+        def library_invoke(name, hook, **kwargs):
+            replayed.append((name, hook, kwargs))
+            return succeed(None)
+        loader.library_invoke = library_invoke
+        loader.run_library_phase = lambda *args, **kwargs: succeed(None)
+
+        loader.run_lazy_phases('Slow')
+        assert replayed == [('Slow', '_modules_created_', {'called_by': loader})]
+        assert loader.library_is_ready('Slow') is True
+
+    def test_hooks_not_recorded_after_startup(self, loader):
+        loader._lazy_record_hooks = False
+        loader.lazy_hook_missed('_sslcerts_', {'called_by': loader})
+        assert len(loader._lazy_missed_hooks) == 0
+
+
+class TestPhaseScheduler:
+
+    @pytest.fixture
+    def loader(self, monkeypatch):
+        hard_load = OrderedDict()
+        hard_load['Core'] = {'operating_mode': 'all'}
+        hard_load['Slow'] = {'operating_mode': 'all', 'depends': ['Core']}
+        hard_load['Fast'] = {'operating_mode': 'all', 'depends': ['Core']}
+        hard_load['Waiter'] = {'operating_mode': 'all'}
+        hard_load['Child'] = {'operating_mode': 'all', 'depends': ['Slow']}
+        monkeypatch.setattr(loader_module, 'HARD_LOAD', hard_load)
+        loader = Loader()
+        loader.failures = []
+        loader.library_invoke_failure = lambda failure, name, phase: loader.failures.append((name, phase))
+        return loader
+
+    def start(self, loader):
+        running = OrderedDict()
+
+        def call(name):
+            running[name] = Deferred()
+            return running[name]
+        done = []
+        loader.invoke_libraries_phase('_load_', call).addCallback(done.append)
+        return running, done
+
+    def test_dependencies(self, loader):
+        assert loader.library_dependencies() == OrderedDict([
+            ('Core', ()), ('Slow', ('Core',)), ('Fast', ('Core',)), ('Waiter', ('Core', 'Slow', 'Fast')),
+            ('Child', ('Slow',)),
+        ])
+
+    def test_depends_starts_before_unrelated_library_finishes(self, loader):
+        running, done = self.start(loader)
+        assert list(running) == ['Core']
+        running['Core'].callback(None)
+        assert list(running) == ['Core', 'Slow', 'Fast']
+        running['Fast'].callback(None)
+        assert loader_module.HARD_LOAD['Fast']['_load_'] is True
+        assert loader_module.HARD_LOAD['Slow']['_load_'] == 'Starting'
+
+    def test_without_depends_waits_for_all_earlier(self, loader):
+        running, done = self.start(loader)
+        running['Core'].callback(None)
+        running['Fast'].callback(None)
+        assert 'Waiter' not in running
+        running['Slow'].callback(None)
+        assert list(running) == ['Core', 'Slow', 'Fast', 'Waiter', 'Child']
+        assert done == []
+        running['Waiter'].callback(None)
+        running['Child'].callback(None)
+        assert done == [None]
+
+    def test_failure_reaches_dependents(self, loader):
+        running, done = self.start(loader)
+        running['Core'].callback(None)
+        running['Fast'].callback(None)
+        running['Slow'].errback(ValueError("broken"))
+        assert loader.failures == [('Slow', '_load_')]
+        assert 'Child' in running and 'Waiter' in running
+        running['Waiter'].callback(None)
+        running['Child'].callback(None)
+        assert done == [None]
+
+
+def test_memory_usage():
+    memory = memory_usage()
+    if os.path.exists('/proc/self/statm'):
+        assert memory % os.sysconf('SC_PAGE_SIZE') == 0
+        assert memory > 0
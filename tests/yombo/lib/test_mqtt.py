@@ -0,0 +1,171 @@
+from yombo.lib import mqtt
+from yombo.lib.mqtt import MQTTClient
+
+from twisted.internet.defer import succeed
+import pytest
+
+
+class CountingStatistics:
+    def averages(self, *args, **kwargs):
+        pass
+
+    def increment(self, *args, **kwargs):
+        pass
+
+
+class MQTTLibrary:
+    client_max_queued = 5
+
+    def __init__(self):
+        self._Statistics = CountingStatistics()
+
+
+class BrokerProtocol:
+    transport = None
+
+    def __init__(self):
+        self.sent = []
+
+    def publish(self, topic, message, qos=0, retain=False):
+        self.sent.append(('publish', topic, message))
+        return succeed(None)
+
+    def subscribe(self, topic, qos):
+        self.sent.append(('subscribe', topic))
+        return succeed(None)
+
+    def unsubscribe(self, topic):
+        self.sent.append(('unsubscribe', topic))
+        return succeed(None)
+
+
+class TestMQTTClient:
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        monkeypatch.setattr(mqtt.reactor, 'connectTCP', lambda *args: None)
+        client = MQTTClient(MQTTLibrary(), 'test', 'localhost', 1883)
+        client.factory.protocol = BrokerProtocol()
+        yield client
+        if client.send_outgoing_call is not None:
+            client.send_outgoing_call.cancel()
+
+    def connect(self, client):
+        client.mqtt_connected()
+        self.flush(client)
+
+    def flush(self, client):
+        if client.send_outgoing_call is not None:
+            client.send_outgoing_call.cancel()
+        client.send_outgoing()
+
+    def test_live_publishes_all_sent(self, client):
+        self.connect(client)
+        client.publish('a/topic', 'one')
+        client.publish('a/topic', 'two')
+        self.flush(client)
+        assert client.factory.protocol.sent == [('publish', 'a/topic', 'one'), ('publish', 'a/topic', 'two')]
+        assert client.stats['dropped'] == 0
+        assert len(client.republish_queue) == 0
+
+    def test_live_republish_publishes_all_sent(self, client):
+        self.connect(client)
+        client.publish('a/status', 'one', republish=True)
+        client.publish('a/status', 'two', republish=True)
+        self.flush(client)
+        assert client.factory.protocol.sent == [('publish', 'a/status', 'one'), ('publish', 'a/status', 'two')]
+        assert client.stats['dropped'] == 0
+        assert client.republish_queue[('publish', 'a/status')]['message'] == 'two'
+
+    def test_republish_only_latest_while_disconnected(self, client):
+        first = client.publish('a/status', 'one', republish=True)
+        results = []
+        first.addCallback(results.append)
+        client.publish('a/status', 'two', republish=True)
+        assert results == [None]
+        assert client.stats['dropped'] == 1
+
+        self.connect(client)
+        assert client.factory.protocol.sent == [('publish', 'a/status', 'two')]
+
+    def test_republish_after_reconnect(self, client):
+        self.connect(client)
+        client.publish('a/status', 'one', republish=True)
+        client.publish('some/request/1234', 'reply')
+        self.flush(client)
+        client.client_connectionLost('test')
+        client.factory.protocol.sent = []
+
+        self.connect(client)
+        assert client.factory.protocol.sent == [('publish', 'a/status', 'one')]
+
+    def test_replaced_republish_dropped_on_disconnect(self, client):
+        self.connect(client)
+        client.publish('a/status', 'one', republish=True)
+        client.publish('a/status', 'two', republish=True)
+        client.client_connectionLost('test')
+        assert client.stats['dropped'] == 1
+
+        self.connect(client)
+        assert client.factory.protocol.sent == [('publish', 'a/status', 'two')]
+
+    def test_queue_limit_while_disconnected(self, client):
+        for number in range(8):
+            client.publish('some/request/%s' % number, 'reply')
+        assert len(client.outgoing) == 5
+        assert client.stats['dropped'] == 3
+        assert len(client.republish_queue) == 0
+
+    def test_unsubscribe_fires_pending_subscribe(self, client):
+        results = []
+        client.subscribe('a/#').addCallback(results.append)
+        client.unsubscribe('a/#')
+        assert results == [None]
+        assert len(client.republish_queue) == 0
+
+        self.connect(client)
+        assert client.factory.protocol.sent == [('unsubscribe', 'a/#')]
+
+    def test_subscriptions_sent_again_after_reconnect(self, client):
+        self.connect(client)
+        client.subscribe('a/#')
+        self.flush(client)
+        client.client_connectionLost('test')
+        client.factory.protocol.sent = []
+
+        self.connect(client)
+        assert client.factory.protocol.sent == [('subscribe', 'a/#')]
+
+    def test_routes(self, client):
+        received = []
+        unrouted = []
+        client.mqtt_incoming_callback = lambda *args: unrouted.append(args)
+        route_id = client.add_route('yombo/devices/+/cmd/#', lambda *args: received.append(args))
+        second_id = client.add_route('yombo/devices/+/cmd/#', lambda *args: received.append('second'))
+        self.connect(client)
+        assert client.factory.protocol.sent == [('subscribe', 'yombo/devices/+/cmd/#')]
+
+        client.mqtt_incoming('yombo/devices/porch/cmd/on', 'payload', 1, 0, False, 10)
+        client.mqtt_incoming('yombo/devices/porch/cmd/on', 'payload', 1, 1, False, 10)
+        assert received == [('yombo/devices/porch/cmd/on', 'payload', 1, False, ['porch', 'on']), 'second']
+        assert client.stats['duplicates'] == 1
+
+        client.mqtt_incoming('yombo/states/light', 'payload', 1, 0, False, 11)
+        assert unrouted == [('yombo/states/light', 'payload', 1, False)]
+
+        client.remove_route(route_id)
+        self.flush(client)
+        assert ('unsubscribe', 'yombo/devices/+/cmd/#') not in client.factory.protocol.sent
+        client.remove_route(second_id)
+        self.flush(client)
+        assert client.factory.protocol.sent[-1] == ('unsubscribe', 'yombo/devices/+/cmd/#')
+
+    def test_failed_route_does_not_stop_others(self, client):
+        received = []
+
+        def broken(*args):
+            raise ValueError('broken')
+        client.add_route('a/+', broken, subscribe=False)
+        client.add_route('a/#', lambda *args: received.append(args[4]), subscribe=False)
+        client.mqtt_incoming('a/b', 'payload', 1, 0, False, None)
+        assert received == [['b']]
@@ -0,0 +1,178 @@
+from yombo.lib.states import States, StateJournal
+from yombo.utils.keyedstore import KeyedStore
+
+from twisted.internet.defer import succeed, fail
+import pytest
+
+
+def state(value, updated_at):
+    return {
+        'gateway_id': 'gw1',
+        'value': value,
+        'value_type': 'int',
+        'live': False,
+        'created_at': 100,
+        'updated_at': updated_at,
+    }
+
+
+class TestStateJournal:
+
+    def test_take_returns_rows_and_clears(self):
+        journal = StateJournal()
+        journal.add('one', state(1, 101))
+        journal.add('two', state(2, 102))
+        rows = journal.take()
+        assert rows == [('gw1', 'one', 1, 'int', 0, 100, 101), ('gw1', 'two', 2, 'int', 0, 100, 102)]
+        assert len(journal) == 0
+        assert journal.take() == []
+
+    def test_add_copies_values(self):
+        journal = StateJournal()
+        data = state(1, 101)
+        journal.add('one', data)
+        data['value'] = 5
+        assert journal.take()[0][2] == 1
+
+    def test_coalesces_to_last_value(self):
+        journal = StateJournal()
+        for value in range(100):
+            journal.add('one', state(value, 100 + value))
+        assert len(journal) == 1
+        assert journal.take() == [('gw1', 'one', 99, 'int', 0, 100, 199)]
+        assert journal.rows_coalesced == 99
+
+    def test_max_per_key_keeps_newest(self):
+        journal = StateJournal(max_per_key=3)
+        for value in range(5):
+            journal.add('one', state(value, 100 + value))
+        assert [row[2] for row in journal.take()] == [2, 3, 4]
+
+    def test_min_interval(self):
+        journal = StateJournal(max_per_key=10, min_interval=10)
+        for updated_at in (100, 101, 102, 120):
+            journal.add('one', state(updated_at, updated_at))
+        assert [row[6] for row in journal.take()] == [100, 120]
+
+    def test_full_callback(self):
+        called = []
+        journal = StateJournal(max_pending=3, full_callback=lambda: called.append(True))
+        journal.add('one', state(1, 101))
+        journal.add('two', state(2, 102))
+        assert called == []
+        journal.add('three', state(3, 103))
+        assert called == [True]
+
+    def test_restore_puts_rows_back(self):
+        journal = StateJournal()
+        journal.add('one', state(1, 101))
+        journal.add('two', state(2, 102))
+        rows = journal.take()
+        journal.restore(rows)
+        assert len(journal) == 2
+        assert journal.take() == rows
+
+    def test_restore_keeps_newer_changes(self):
+        journal = StateJournal()
+        journal.add('one', state(1, 101))
+        journal.add('two', state(2, 102))
+        rows = journal.take()
+        journal.add('one', state(10, 110))
+        journal.restore(rows)
+        assert journal.take() == [('gw1', 'one', 10, 'int', 0, 100, 110), ('gw1', 'two', 2, 'int', 0, 100, 102)]
+
+    def test_restore_with_history(self):
+        journal = StateJournal(max_per_key=3)
+        journal.add('one', state(1, 101))
+        journal.add('one', state(2, 102))
+        rows = journal.take()
+        journal.add('one', state(3, 103))
+        journal.add('one', state(4, 104))
+        journal.restore(rows)
+        assert len(journal) == 3
+        assert [row[2] for row in journal.take()] == [2, 3, 4]
+
+
+class SavingLocalDB:
+    def __init__(self, error=None):
+        self.error = error
+        self.saved = []
+
+    def save_state_bulk(self, rows):
+        if self.error is not None:
+            return fail(self.error)
+        self.saved.extend(rows)
+        return succeed(len(rows))
+
+
+class CountingStatistics:
+    def averages(self, *args, **kwargs):
+        pass
+
+    def increment(self, *args, **kwargs):
+        pass
+
+
+class TestDBSaveStates:
+
+    @pytest.fixture
+    def states(self):
+        states = States()
+        states._Statistics = CountingStatistics()
+        states.db_save_states_journal = StateJournal()
+        states.db_save_states_running = False
+        return states
+
+    def test_save(self, states):
+        states._LocalDB = SavingLocalDB()
+        states.db_save_states_journal.add('one', state(1, 101))
+        states.db_save_states()
+        assert states._LocalDB.saved == [('gw1', 'one', 1, 'int', 0, 100, 101)]
+        assert len(states.db_save_states_journal) == 0
+        assert states.db_save_states_journal.rows_written == 1
+
+    def test_failed_save_keeps_rows(self, states):
+        states._LocalDB = SavingLocalDB(Exception("database is locked"))
+        states.db_save_states_journal.add('one', state(1, 101))
+        states.db_save_states_journal.add('two', state(2, 102))
+        states.db_save_states()
+        assert states.db_save_states_running is False
+        assert len(states.db_save_states_journal) == 2
+        assert states.db_save_states_journal.rows_written == 0
+
+        states._LocalDB = SavingLocalDB()
+        states.db_save_states()
+        assert len(states._LocalDB.saved) == 2
+        assert len(states.db_save_states_journal) == 0
+
+
+class TestGetStates:
+
+    @pytest.fixture
+    def states(self):
+        states = States()
+        states.gateway_id = 'gw1'
+        store = KeyedStore('states')
+        store.set('gw1', 'is.light', state(1, 101))
+        states._States__States = store
+        return states
+
+    def test_get_states_returns_copies(self, states):
+        copy = states.get_states()
+        assert isinstance(copy, dict)
+        assert isinstance(copy['gw1'], dict)
+        assert copy['gw1']['is.light']['value'] == 1
+        assert isinstance(states.get_states('gw1'), dict)
+        assert states.get_states('gw2') == {}
+
+        copy['gw1']['is.dark'] = state(0, 101)
+        assert 'is.dark' not in states.view_states('gw1')
+
+    def test_view_states_follows_changes(self, states):
+        view = states.view_states('gw1')
+        copy = states.get_states('gw1')
+        states._States__States.set('gw1', 'is.dark', state(0, 102))
+        assert 'is.dark' in view
+        assert 'is.dark' not in copy
+        with pytest.raises(TypeError):
+            view['is.dark'] = None
@@ -0,0 +1,184 @@
+from yombo.lib.statistics.live_buckets import AverageSketch, BucketNames, LiveBuckets
+from yombo.lib.statistics.resample import HAS_NUMPY, resample
+from yombo.utils import percentile
+
+import random
+import pytest
+
+
+def exact_average_data(values):
+    sorted_values = sorted(values)
+    percentile90 = percentile(sorted_values, 0.90)
+    values_90 = [value for value in sorted_values if value <= percentile90]
+    return {
+        'median': percentile(sorted_values, 0.50),
+        'median_90': percentile(values_90, 0.50),
+        'lower_90': values_90[-1],
+    }
+
+
+class TestAverageSketch:
+
+    def test_empty(self):
+        assert AverageSketch().average_data() is None
+
+    @pytest.mark.parametrize('count', [1, 2, 5])
+    def test_small_buckets_exact(self, count):
+        sketch = AverageSketch()
+        values = [7, 3, 9, 1, 5][:count]
+        for value in values:
+            sketch.add(value)
+        average_data = sketch.average_data()
+        for key, value in exact_average_data(values).items():
+            assert average_data[key] == value
+        assert (average_data['lower'], average_data['upper'], average_data['count']) == (min(values), max(values),
+                                                                                        count)
+
+    @pytest.mark.parametrize('distribution', ['uniform', 'normal', 'exponential', 'sorted'])
+    def test_quantiles_close_to_exact(self, distribution):
+        chooser = random.Random(3)
+        if distribution == 'uniform':
+            values = [chooser.uniform(0, 100) for _ in range(5000)]
+        elif distribution == 'normal':
+            values = [chooser.gauss(50, 10) for _ in range(5000)]
+        elif distribution == 'exponential':
+            values = [chooser.expovariate(0.1) for _ in range(5000)]
+        else:
+            values = sorted(chooser.uniform(0, 100) for _ in range(5000))
+        sketch = AverageSketch()
+        for value in values:
+            sketch.add(value)
+
+        average_data = sketch.average_data()
+        tolerance = (max(values) - min(values)) * 0.01
+        for key, value in exact_average_data(values).items():
+            assert abs(average_data[key] - value) <= tolerance, key
+        assert (average_data['lower'], average_data['upper'], average_data['count']) == (min(values), max(values),
+                                                                                        len(values))
+
+
+class TestLiveBuckets:
+
+    @pytest.fixture
+    def buckets(self):
+        return LiveBuckets('counter', BucketNames())
+
+    def test_rows(self, buckets):
+        row = buckets.get_row(600, 'lib.test', 60, 30)
+        buckets.values[row] += 2
+        assert buckets.get_row(600, 'lib.test', 60, 30) == row
+        other = buckets.get_row(660, 'lib.test', 60, 30)
+        assert other != row
+        assert buckets.find_row(600, 'lib.test') == row
+        assert buckets.find_row(600, 'lib.missing') is None
+        assert buckets.dirty == {row, other}
+        assert buckets.bucket(row) == {'time': 600, 'size': 60, 'lifetime': 30, 'type': 'counter',
+                                       'name': 'lib.test', 'value': 2, 'anon': False}
+
+        buckets.remove(row)
+        assert (600, 0) not in buckets
+        assert buckets.get_row(720, 'lib.other', 60, 30) == row
+        assert buckets.values[row] == 0
+        assert sorted(item[:2] for item in buckets.items()) == [(660, 'lib.test'), (720, 'lib.other')]
+
+    def test_pop_finished(self, buckets):
+        first = buckets.get_row(600, 'lib.test', 60, 30)
+        second = buckets.get_row(660, 'lib.test', 60, 30)
+        assert buckets.pop_finished(659) == set()
+        assert buckets.pop_finished(660) == {first}
+        assert buckets.pop_finished(660) == set()
+        buckets.remove(second)
+        assert buckets.pop_finished(1000) == set()
+
+    def test_average_rows_have_sketches(self):
+        buckets = LiveBuckets('average', BucketNames())
+        row = buckets.get_row(600, 'lib.test', 60, 30)
+        buckets.sketches[row].add(5)
+        assert buckets.sketches[row].average_data()['count'] == 1
+
+
+def stored_buckets(chooser, start, end, sizes):
+    times = []
+    bucket_sizes = []
+    values = []
+    bucket_time = start
+    while bucket_time < end:
+        size = chooser.choice(sizes)
+        times.append(bucket_time)
+        bucket_sizes.append(size)
+        values.append(chooser.randint(0, 100))
+        bucket_time += size + chooser.choice((0, 0, 0, 30))
+    order = list(range(len(times)))
+    chooser.shuffle(order)
+    return [times[i] for i in order], [bucket_sizes[i] for i in order], [values[i] for i in order]
+
+
+def simple_resample(bucket_type, times, sizes, values, start, end, resolution):
+    """
+    Aggregates each new bucket on its own, looking at every stored bucket.
+    """
+    results = []
+    current = 0.0
+    for bucket_start in range(start, end, resolution):
+        bucket_end = bucket_start + resolution
+        if bucket_type == 'datapoint':
+            points = sorted((time, value) for time, value in zip(times, values) if bucket_start <= time < bucket_end)
+            if len(points) == 0:
+                results.append(current)
+                continue
+            weighted = sum((1.0 - (time - bucket_start) / resolution) * (value - current) for time, value in points)
+            results.append(current + weighted / len(points))
+            current = points[-1][1]
+            continue
+
+        total = 0.0
+        duration = 0.0
+        for time, size, value in zip(times, sizes, values):
+            overlap = min(time + size, bucket_end) - max(time, bucket_start)
+            if overlap <= 0:
+                continue
+            if bucket_type == 'counter':
+                total += value * overlap / size
+            else:
+                total += value * overlap
+                duration += overlap
+        if bucket_type == 'counter':
+            results.append(total)
+        else:
+            results.append(total / duration if duration > 0 else 0)
+    return results
+
+
+USE_NUMPY = [False, True] if HAS_NUMPY else [False]
+
+
+class TestResample:
+
+    @pytest.mark.parametrize('use_numpy', USE_NUMPY)
+    @pytest.mark.parametrize('bucket_type', ['counter', 'average', 'datapoint'])
+    @pytest.mark.parametrize('resolution', [60, 300, 3600, 7200])
+    def test_same_as_simple_aggregation(self, use_numpy, bucket_type, resolution):
+        chooser = random.Random(resolution)
+        start = 1500000000
+        times, sizes, values = stored_buckets(chooser, start - 900, start + 86400, (60, 60, 300, 900))
+        end = start + 86400 - 1234
+        expected = simple_resample(bucket_type, times, sizes, values, start, end, resolution)
+        found = resample(bucket_type, times, sizes, values, start, end, resolution, use_numpy)
+        assert len(found) == len(expected)
+        assert max(abs(first - second) for first, second in zip(found, expected)) < 1e-6
+
+    @pytest.mark.parametrize('use_numpy', USE_NUMPY)
+    def test_counter_total_kept(self, use_numpy):
+        times, sizes, values = stored_buckets(random.Random(1), 0, 86400, (60, 900))
+        found = resample('counter', times, sizes, values, 0, 200000, 3600, use_numpy)
+        assert abs(sum(found) - sum(values)) < 1e-6
+
+    @pytest.mark.parametrize('use_numpy', USE_NUMPY)
+    def test_empty(self, use_numpy):
+        assert resample('counter', [], [], [], 0, 0, 60, use_numpy) == []
+        assert resample('average', [], [], [], 0, 120, 60, use_numpy) == [0, 0]
+        assert resample('datapoint', [], [], [], 0, 120, 60, use_numpy) == [0, 0]
+
+    def test_bad_resolution(self):
+        with pytest.raises(ValueError):
+            resample('counter', [0], [60], [1], 0, 120, 0)
@@ -0,0 +1,123 @@
+from yombo.core.exceptions import YomboWarning
+from yombo.lib.gpg import GPG
+from yombo.utils.aesstream import PAD_SIZE, derive_key, encrypt_stream, decrypt_stream, write_stream
+
+from Crypto.Cipher import AES
+import io
+import os
+import pytest
+
+KEY = derive_key('my passphrase')
+
+
+def encrypt(data, chunk_size=64):
+    return b''.join(encrypt_stream(KEY, data, chunk_size))
+
+
+def decrypt(data, key=KEY, chunk_size=64):
+    return b''.join(decrypt_stream(key, data, chunk_size))
+
+
+def encrypt_blocks(key, plain):
+    """
+    Encrypt without adding padding, to make data with any padding wanted.
+    """
+    iv = os.urandom(AES.block_size)
+    return iv + AES.new(key, AES.MODE_CBC, iv).encrypt(plain)
+
+
+class TestAESStream:
+
+    @pytest.mark.parametrize('size', [0, 1, 15, 16, 31, 32, 33, 63, 64, 65, 1000])
+    @pytest.mark.parametrize('chunk_size', [32, 64, 4096])
+    def test_round_trip(self, size, chunk_size):
+        data = os.urandom(size)
+        encrypted = encrypt(data, chunk_size)
+        assert len(encrypted) == AES.block_size + (size // PAD_SIZE + 1) * PAD_SIZE
+        assert decrypt(encrypted, chunk_size=chunk_size) == data
+
+    def test_sources(self):
+        data = os.urandom(500)
+        encrypted = encrypt(io.BytesIO(data))
+        assert decrypt(io.BytesIO(encrypted)) == data
+        pieces = [encrypted[start:start + 7] for start in range(0, len(encrypted), 7)]
+        assert decrypt(iter(pieces)) == data
+        assert decrypt(encrypt('text')) == b'text'
+
+    def test_same_format_as_encrypt_aes(self):
+        gpg = GPG()
+        gpg.aes_blocksize = 32
+        data = os.urandom(100)
+        encrypted = gpg._encrypt_aes(KEY, gpg.aes_pad(data))
+        assert decrypt(encrypted) == data
+        assert gpg.aes_unpad(gpg._decrypt_aes(KEY, encrypt(data))) == data
+
+    def test_derive_key(self):
+        assert derive_key('my passphrase') == KEY
+        assert derive_key(b'my passphrase') == KEY
+        assert len(KEY) == 32
+        assert derive_key('other') != KEY
+
+    @pytest.mark.parametrize('cut', [0, 5, 16, 20, 47])
+    def test_incomplete(self, cut):
+        encrypted = encrypt(b'x' * 40)
+        with pytest.raises(YomboWarning) as error:
+            decrypt(encrypted[:cut] if cut < 17 else encrypted[:-cut])
+        assert error.value.errorno == 400
+
+    @pytest.mark.parametrize('plain', [
+        b'a' * 31 + b'\x05',
+        b'a' * 30 + b'\x01\x02',
+        b'a' * 32,
+        b'a' * 31 + b'\x00',
+        b'a' * 31 + b'\x21',
+    ])
+    def test_bad_padding(self, plain):
+        with pytest.raises(YomboWarning) as error:
+            decrypt(encrypt_blocks(KEY, plain))
+        assert error.value.errorno == 401
+
+    def test_good_padding(self):
+        assert decrypt(encrypt_blocks(KEY, b'a' * 30 + b'\x02\x02')) == b'a' * 30
+        assert decrypt(encrypt_blocks(KEY, b'\x20' * 32)) == b''
+
+    def test_wrong_key(self):
+        encrypted = encrypt(os.urandom(100))
+        passed = 0
+        for number in range(500):
+            try:
+                decrypt(encrypted, derive_key('wrong %s' % number))
+            except YomboWarning as error:
+                assert error.errorno == 401
+            else:
+                passed += 1
+        # Only a padding of 1 is likely to look valid, about 1 in 256.
+        assert passed <= 15
+
+
+class TestWriteStream:
+
+    def test_write(self, tmp_path):
+        path = str(tmp_path / 'backup.aes')
+        data = os.urandom(300)
+        written = write_stream(encrypt_stream(KEY, data), path)
+        assert written == os.path.getsize(path)
+        with open(path, 'rb') as source:
+            assert decrypt(source) == data
+        assert os.listdir(str(tmp_path)) == ['backup.aes']
+
+    def test_failure_leaves_file(self, tmp_path):
+        path = str(tmp_path / 'backup')
+        with open(path, 'wb') as output:
+            output.write(b'original')
+        with pytest.raises(YomboWarning):
+            write_stream(decrypt_stream(KEY, encrypt_blocks(KEY, b'a' * 64)), path)
+        with open(path, 'rb') as source:
+            assert source.read() == b'original'
+        assert os.listdir(str(tmp_path)) == ['backup']
+
+    def test_failure_no_file(self, tmp_path):
+        path = str(tmp_path / 'backup')
+        with pytest.raises(YomboWarning):
+            write_stream(decrypt_stream(KEY, encrypt(b'data')[:-1]), path)
+        assert os.listdir(str(tmp_path)) == []
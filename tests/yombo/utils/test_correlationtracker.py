@@ -0,0 +1,168 @@
+from yombo.core.exceptions import YomboWarning
+from yombo.utils import correlationtracker
+from yombo.utils.correlationtracker import CorrelationTracker, LatencyHistogram
+
+from twisted.internet.defer import Deferred
+from twisted.internet.task import Clock
+import pytest
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    clock.advance(1500000000)
+    monkeypatch.setattr(correlationtracker, 'reactor', clock)
+    monkeypatch.setattr(correlationtracker, 'time', clock.seconds)
+    return clock
+
+
+def entry():
+    results = []
+    d = Deferred()
+    d.addBoth(results.append)
+    return {'deferred': d}, results
+
+
+class TestCorrelationTracker:
+
+    def test_complete(self, clock):
+        tracker = CorrelationTracker('test', timeout=60)
+        request, results = entry()
+        tracker.add('abc', request)
+        assert tracker.complete('abc', 'reply') is request
+        assert tracker.complete('abc', 'again') is request
+        assert results == ['reply']
+        assert tracker.complete('missing', 'reply') is None
+        assert tracker.stats['completed'] == 1
+
+    def test_timeout(self, clock):
+        tracker = CorrelationTracker('test', timeout=60)
+        first, first_results = entry()
+        second, second_results = entry()
+        tracker.add('first', first)
+        tracker.add('second', second, timeout=10)
+        assert clock.getDelayedCalls()[0].getTime() == clock.seconds() + 10
+        clock.advance(10)
+        assert 'second' not in tracker
+        assert isinstance(second_results[0].value, YomboWarning)
+        assert first_results == []
+        clock.advance(50)
+        assert len(tracker) == 0
+        assert isinstance(first_results[0].value, YomboWarning)
+        assert tracker.stats['expired'] == 2
+        assert clock.getDelayedCalls() == []
+
+    def test_keep_after_complete(self, clock):
+        tracker = CorrelationTracker('test', timeout=600)
+        request, results = entry()
+        tracker.add('abc', request)
+        tracker.complete('abc', 'reply', keep=60)
+        clock.advance(59)
+        assert tracker.complete('abc', 'late reply') is request
+        clock.advance(1)
+        assert 'abc' not in tracker
+        assert results == ['reply']
+        assert tracker.stats['expired'] == 0
+
+    def test_replaced_entry_fails(self, clock):
+        tracker = CorrelationTracker('test', timeout=60)
+        first, first_results = entry()
+        second, second_results = entry()
+        tracker.add('abc', first)
+        tracker.add('abc', second)
+        assert isinstance(first_results[0].value, YomboWarning)
+        assert 'replaced' in str(first_results[0].value)
+        tracker.complete('abc', 'reply')
+        assert second_results == ['reply']
+        assert len(tracker) == 1
+
+    def test_same_entry_added_again(self, clock):
+        tracker = CorrelationTracker('test', timeout=60)
+        request, results = entry()
+        tracker.add('abc', request)
+        tracker.add('abc', request)
+        tracker.add('abc', dict(request))
+        assert results == []
+
+    def test_replaced_entry_uses_new_timeout(self, clock):
+        tracker = CorrelationTracker('test', timeout=10)
+        tracker.add('abc', {})
+        tracker.add('abc', {}, timeout=100)
+        clock.advance(50)
+        assert 'abc' in tracker
+        clock.advance(50)
+        assert 'abc' not in tracker
+
+    def test_evicts_least_recently_used(self, clock):
+        tracker = CorrelationTracker('test', max_entries=2)
+        first, first_results = entry()
+        tracker.add('first', first)
+        tracker.add('second', {})
+        tracker.get('first')
+        tracker.add('third', {})
+        assert list(tracker) == ['first', 'third']
+        tracker.add('fourth', {})
+        assert list(tracker) == ['third', 'fourth']
+        assert isinstance(first_results[0].value, YomboWarning)
+        assert tracker.stats['evicted'] == 2
+
+    def test_pop_and_store(self, clock):
+        store = {}
+        tracker = CorrelationTracker('test', store=store)
+        request, results = entry()
+        tracker.add('abc', request)
+        assert store == {'abc': request}
+        assert tracker.pop('abc') is request
+        assert tracker.pop('abc', 'default') == 'default'
+        assert store == {}
+        clock.advance(1000)
+        assert results == []
+
+    def test_restored_entries(self, clock):
+        tracker = CorrelationTracker('test', timeout=60)
+        tracker.add('old', {}, created_at=clock.seconds() - 100)
+        tracker.add('new', {}, created_at=clock.seconds() - 30)
+        clock.advance(0)
+        assert list(tracker) == ['new']
+
+    def test_heap_stays_small(self, clock):
+        tracker = CorrelationTracker('test', timeout=60)
+        tracker.add('abc', {})
+        for number in range(1000):
+            tracker.expire_at('abc', clock.seconds() + number)
+        assert len(tracker._heap) <= 66
+
+    def test_stop(self, clock):
+        tracker = CorrelationTracker('test')
+        tracker.add('abc', {})
+        tracker.stop()
+        assert clock.getDelayedCalls() == []
+        assert 'abc' in tracker
+
+
+class TestLatencyHistogram:
+
+    def test_empty(self):
+        assert LatencyHistogram().asdict()['p50'] == 0
+
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        for milliseconds in [1] * 50 + [30] * 45 + [700] * 4 + [45000]:
+            histogram.add(milliseconds)
+        report = histogram.asdict()
+        assert report['count'] == 100
+        assert report['p50'] == 5
+        assert report['p95'] == 50
+        assert report['p99'] == 1000
+        assert report['max'] == 45000
+        assert report['buckets']['5'] == 50
+        assert report['buckets']['more'] == 1
+        assert histogram.percentile(100) == 45000
+
+    def test_bucket_edges(self):
+        histogram = LatencyHistogram()
+        histogram.add(5)
+        histogram.add(5.5)
+        assert histogram.counts[:2] == [1, 1]
+        assert histogram.percentile(50) == 5
+        assert histogram.percentile(100) == 5.5
@@ -0,0 +1,149 @@
+from yombo.core.exceptions import YomboWarning
+from yombo.utils.framing import (COMPRESSIONS, HEADER, MAX_PAYLOAD_SIZE, pack, unpack, is_frame, legacy_pack,
+                                 legacy_unpack, get_compression)
+
+import struct
+import zlib
+import msgpack
+import pytest
+
+PAYLOADS = [
+    {},
+    {'value': 1},
+    {'state.is.light': {'gateway_id': 'gw1', 'value': True, 'value_human': 'True', 'value_type': 'bool',
+                        'created_at': 1500000000, 'updated_at': 1500000001}},
+    {'text': 'x' * 5000, 'numbers': list(range(500)), 'nested': {'a': [1.5, None, False, b'raw']}},
+]
+
+
+def replace_size(frame, size):
+    """
+    Returns the frame with a different payload size in the header.
+    """
+    fields = list(HEADER.unpack_from(frame))
+    fields[5] = size
+    return HEADER.pack(*fields) + frame[HEADER.size:]
+
+
+class TestFraming:
+
+    @pytest.mark.parametrize('compression', sorted(COMPRESSIONS))
+    @pytest.mark.parametrize('payload', PAYLOADS)
+    def test_round_trip(self, compression, payload):
+        frame = pack(payload, 'gw_source', 'gw_destination', compression)
+        assert is_frame(frame)
+        message = unpack(frame)
+        assert message['payload'] == payload
+        assert message['source_gateway_id'] == 'gw_source'
+        assert message['destination_gateway_id'] == 'gw_destination'
+        assert message['frame_version'] == 1
+
+    def test_small_payloads_not_compressed(self):
+        assert unpack(pack({'value': 1}, 'a', 'b', 'zlib'))['content_encoding'] == 'none'
+        assert unpack(pack(PAYLOADS[3], 'a', 'b', 'zlib'))['content_encoding'] == 'zlib'
+
+    def test_unavailable_compression_falls_back(self):
+        assert get_compression('brotli').name == 'zlib'
+        assert get_compression('brotli_dict').name == 'zlib_dict'
+
+    def test_short_frame(self):
+        with pytest.raises(YomboWarning) as error:
+            unpack(b'YG\x01')
+        assert error.value.errorno == 300
+
+    @pytest.mark.parametrize('compression', sorted(COMPRESSIONS))
+    def test_truncated_frame(self, compression):
+        frame = pack(PAYLOADS[3], 'gw_source', 'gw_destination', compression)
+        for length in range(HEADER.size, len(frame)):
+            with pytest.raises(YomboWarning):
+                unpack(frame[:length])
+
+    def test_truncated_gateway_ids(self):
+        frame = pack({'value': 1}, 'gw_source', 'gw_destination', 'none')
+        for length in (HEADER.size, HEADER.size + 5, HEADER.size + 10, HEADER.size + 14):
+            with pytest.raises(YomboWarning) as error:
+                unpack(frame[:length])
+            assert error.value.errorno == 300
+
+    def test_invalid_gateway_id(self):
+        frame = bytearray(pack({'value': 1}, 'gw', 'b', 'none'))
+        frame[HEADER.size + 1] = 0xff
+        with pytest.raises(YomboWarning) as error:
+            unpack(bytes(frame))
+        assert error.value.errorno == 307
+
+    def test_unknown_version(self):
+        frame = bytearray(pack({'value': 1}, 'a', 'b'))
+        frame[2] = 9
+        with pytest.raises(YomboWarning) as error:
+            unpack(bytes(frame))
+        assert error.value.errorno == 301
+
+    def test_unknown_compression(self):
+        frame = bytearray(pack({'value': 1}, 'a', 'b'))
+        frame[3] = 99
+        with pytest.raises(YomboWarning) as error:
+            unpack(bytes(frame))
+        assert error.value.errorno == 302
+
+    @pytest.mark.parametrize('compression', ['zlib', 'zlib_dict'])
+    def test_decompression_bomb_rejected(self, compression):
+        frame = pack({'text': 'x' * 100000}, 'a', 'b', compression)
+        with pytest.raises(YomboWarning) as error:
+            unpack(replace_size(frame, 1000))
+        assert error.value.errorno == 304
+
+    @pytest.mark.parametrize('compression', ['zlib', 'zlib_dict'])
+    def test_size_larger_than_payload_rejected(self, compression):
+        frame = pack(PAYLOADS[3], 'a', 'b', compression)
+        size = HEADER.unpack_from(frame)[5]
+        with pytest.raises(YomboWarning) as error:
+            unpack(replace_size(frame, size + 10))
+        assert error.value.errorno == 304
+
+    def test_too_large_rejected(self):
+        frame = pack(PAYLOADS[3], 'a', 'b', 'zlib')
+        with pytest.raises(YomboWarning) as error:
+            unpack(replace_size(frame, MAX_PAYLOAD_SIZE + 1))
+        assert error.value.errorno == 306
+
+    def test_damaged_payload(self):
+        frame = pack(PAYLOADS[3], 'a', 'b', 'zlib')
+        with pytest.raises(YomboWarning) as error:
+            unpack(frame[:-20] + b'\x00' * 20)
+        assert error.value.errorno in (304, 305)
+
+
+class TestLegacyFormat:
+
+    @pytest.mark.parametrize('payload', [{'value': 1}, {'text': 'x' * 5000}])
+    def test_round_trip(self, payload):
+        message = legacy_pack(payload, 'gw_source', 'all')
+        assert not is_frame(message)
+        message = legacy_unpack(message)
+        assert message['payload'] == payload
+        assert message['source_gateway_id'] == 'gw_source'
+        assert message['frame_version'] == 1
+
+    def test_readable_by_old_gateways(self):
+        """
+        Old gateways unpack with msgpack defaults and read these fields.
+        """
+        message = msgpack.unpackb(legacy_pack({'text': 'x' * 5000}, 'gw_source', 'all'), raw=True)
+        assert message[b'content_encoding'] == b'zlib'
+        assert msgpack.unpackb(zlib.decompress(message[b'payload']), raw=True) == {b'text': b'x' * 5000}
+
+    def test_old_message_without_frame_version(self):
+        old = msgpack.packb({'payload': msgpack.packb({'value': 1}), 'time_sent': 1.0, 'content_encoding': 'none',
+                             'source_gateway_id': 'gw_old', 'destination_gateway_id': 'all'}, use_bin_type=False)
+        message = legacy_unpack(old)
+        assert message['payload'] == {'value': 1}
+        assert 'frame_version' not in message
+
+    def test_legacy_bomb_rejected(self):
+        data = zlib.compress(b'\x00' * (MAX_PAYLOAD_SIZE + 1000))
+        old = msgpack.packb({'payload': data, 'time_sent': 1.0, 'content_encoding': 'zlib',
+                             'source_gateway_id': 'gw_old', 'destination_gateway_id': 'all'}, use_bin_type=False)
+        with pytest.raises(YomboWarning) as error:
+            legacy_unpack(old)
+        assert error.value.errorno == 306
@@ -0,0 +1,184 @@
+from yombo.core.exceptions import YomboFuzzySearchError
+from yombo.utils import do_search_instance
+from yombo.utils.fuzzysearch import FuzzySearch
+from yombo.utils.searchindex import (SearchIndex, TextIndex, trigrams, common_subsequence, subsequence_masks,
+                                     subsequence_limit)
+
+from difflib import SequenceMatcher
+import random
+import pytest
+
+WORDS = ['porch', 'light', 'front', 'door', 'garage', 'kitchen', 'lamp', 'fan', 'back', 'yard', 'sensor', 'motion']
+QUERIES = ['porch light', 'prch ligt', 'Front door', 'garage', 'kitchen lamp 2', 'zzz', '', 'a', 'light porch',
+           'motion sensor 12']
+
+
+class Device:
+    def __init__(self, label, machine_label, status=1):
+        self.label = label
+        self.machine_label = machine_label
+        self.status = status
+
+
+def make_devices(total=300, seed=5):
+    chooser = random.Random(seed)
+    devices = {}
+    for number in range(total):
+        label = ' '.join(chooser.sample(WORDS, chooser.randint(1, 3)))
+        if chooser.random() < .3:
+            label += ' %s' % chooser.randint(1, 20)
+        devices['device%s' % number] = Device(label, label.replace(' ', '_'), chooser.randint(0, 1))
+    devices['device_empty'] = Device('', '')
+    return devices
+
+
+def lcs(first, second):
+    row = [0] * (len(second) + 1)
+    for character in first:
+        previous = 0
+        for position, other in enumerate(second):
+            current = row[position + 1]
+            row[position + 1] = previous + 1 if character == other else max(row[position + 1], row[position])
+            previous = current
+    return row[-1]
+
+
+def summary(results):
+    found, key, item, ratio, others = results
+    return found, key, ratio, [(other['key'], other['ratio']) for other in others]
+
+
+class TestHelpers:
+
+    def test_trigrams(self):
+        assert trigrams('abcab') == {'abc': 1, 'bca': 1, 'cab': 1}
+        assert trigrams('aaaa') == {'aaa': 2}
+        assert trigrams('ab') == {}
+
+    @pytest.mark.parametrize('query,text', [
+        ('', ''), ('', 'abc'), ('abc', ''), ('porch light', 'prch ligt'), ('abcabc', 'cbacba'),
+        ('kitchen lamp', 'lamp kitchen'), ('aaaa', 'aa'),
+    ])
+    def test_common_subsequence(self, query, text):
+        assert common_subsequence(subsequence_masks(query), len(query), text) == lcs(query, text)
+
+    def test_limits_are_upper_bounds(self):
+        index = TextIndex()
+        texts = [device.label for device in make_devices(200).values()]
+        for number, text in enumerate(texts):
+            index.add(number, text)
+        for query in QUERIES:
+            masks = subsequence_masks(query)
+            seen = []
+            last_limit = 1.0
+            for limit, item_id, text in index.candidates(query):
+                ratio = SequenceMatcher(None, query, text).ratio()
+                assert ratio <= limit + 1e-9
+                assert ratio <= subsequence_limit(masks, len(query), text) + 1e-9
+                assert limit <= last_limit
+                last_limit = limit
+                seen.append(item_id)
+            assert sorted(seen) == list(range(len(texts)))
+
+
+class TestTextIndex:
+
+    def test_add_replace_remove(self):
+        index = TextIndex()
+        index.add('one', 'porch light')
+        index.add('two', 'porch light')
+        assert index.exact('porch light') == {'one', 'two'}
+        position = index.positions['one']
+        index.add('one', 'front door')
+        assert index.positions['one'] == position
+        assert index.exact('porch light') == {'two'}
+        assert index.exact('front door') == {'one'}
+        index.remove('one')
+        index.remove('two')
+        assert len(index) == 0
+        assert index._grams == {} and index._lengths == {} and index._exact == {}
+        with pytest.raises(KeyError):
+            index.remove('one')
+
+    def test_candidates_exact_first(self):
+        index = TextIndex()
+        index.add('one', 'porch')
+        index.add('two', 'porch light')
+        assert list(index.candidates('porch'))[0] == (1.0, 'one', 'porch')
+
+
+class TestSearchIndex:
+
+    @pytest.fixture
+    def devices(self):
+        return make_devices()
+
+    @pytest.fixture
+    def index(self, devices):
+        index = SearchIndex()
+        for device_id, device in devices.items():
+            index.update(device_id, device)
+        return index
+
+    def search(self, devices, query, index=None, operation='any', **kwargs):
+        attributes = [
+            {'field': 'label', 'value': query, 'limiter': .6},
+            {'field': 'machine_label', 'value': query, 'limiter': .6},
+        ]
+        return do_search_instance(attributes, devices, ['label', 'machine_label'], limiter=.6, operation=operation,
+                                  index=index, **kwargs)
+
+    @pytest.mark.parametrize('query', QUERIES)
+    def test_any_same_as_full_scan(self, devices, index, query):
+        assert summary(self.search(devices, query, index)) == summary(self.search(devices, query))
+
+    @pytest.mark.parametrize('query', QUERIES)
+    def test_highest_same_as_full_scan(self, devices, index, query):
+        if query == 'zzz':
+            for search_index in (None, index):
+                with pytest.raises(KeyError):
+                    self.search(devices, query, search_index, operation='highest')
+            return
+        expected = summary(self.search(devices, query, operation='highest'))
+        found = summary(self.search(devices, query, index, operation='highest'))
+        assert found[:3] == expected[:3]
+        assert found[3] == expected[3][:len(found[3])]
+
+    def test_status_filter(self, devices, index):
+        expected = summary(self.search(devices, 'porch light', status_field='status', status_value=0))
+        assert summary(self.search(devices, 'porch light', index, status_field='status', status_value=0)) == expected
+
+    def test_kept_current(self, devices, index):
+        self.search(devices, 'porch', index)
+        devices['device1'].label = 'attic heater'
+        index.refresh('device1')
+        found, key, item, ratio, others = self.search(devices, 'attic heater', index, operation='highest')
+        assert (key, ratio) == ('device1', 1.0)
+
+        index.remove('device1')
+        del devices['device1']
+        index.remove('device1')
+        assert summary(self.search(devices, 'attic heater', index)) == summary(self.search(devices, 'attic heater'))
+
+        devices['new'] = Device('attic heater', 'attic_heater')
+        index.update('new', devices['new'])
+        assert index.get_exact('attic_heater', ['label', 'machine_label']) is devices['new']
+        assert index.get_exact('basement', ['label']) is None
+
+    def test_empty(self):
+        with pytest.raises(KeyError):
+            self.search({}, 'porch', SearchIndex(), operation='highest')
+        assert summary(self.search({}, 'porch', SearchIndex())) == (True, None, 0, [])
+
+
+class TestFuzzySearch:
+
+    def test_search(self):
+        search = FuzzySearch({'Porch Light': 1, 'Front Door': 2, 'Garage': 3}, .7)
+        assert search['porch ligt'] == 1
+        assert search['Garage'] == 3
+        with pytest.raises(YomboFuzzySearchError):
+            search['zzz']
+        del search['Garage']
+        with pytest.raises(YomboFuzzySearchError):
+            search['Garage']
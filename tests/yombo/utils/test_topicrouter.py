@@ -0,0 +1,104 @@
+from yombo.core.exceptions import YomboWarning
+from yombo.utils.topicrouter import TopicRouter, RecentIds, split_pattern
+
+import pytest
+
+
+def handler(*args):
+    pass
+
+
+def matches(router, topic):
+    return [(route.pattern, wildcards) for route, wildcards in router.match(topic)]
+
+
+class TestTopicRouter:
+
+    @pytest.fixture
+    def router(self):
+        router = TopicRouter()
+        for pattern in ('yombo/devices/+/cmd/#', 'yombo/devices/+/get', 'yombo/#', 'yombo/states/+/set',
+                        'yombo/devices/porch/get', '#', '+/+', 'ybo_gw/+'):
+            router.add(pattern, handler)
+        return router
+
+    def test_match(self, router):
+        assert matches(router, 'yombo/devices/porch/cmd/on') == [
+            ('yombo/devices/+/cmd/#', ['porch', 'on']),
+            ('yombo/#', ['devices/porch/cmd/on']),
+            ('#', ['yombo/devices/porch/cmd/on']),
+        ]
+        assert matches(router, 'yombo/devices/porch/get') == [
+            ('yombo/devices/+/get', ['porch']),
+            ('yombo/#', ['devices/porch/get']),
+            ('yombo/devices/porch/get', []),
+            ('#', ['yombo/devices/porch/get']),
+        ]
+        assert matches(router, 'ybo_gw/abc') == [('#', ['ybo_gw/abc']), ('+/+', ['ybo_gw', 'abc']),
+                                                 ('ybo_gw/+', ['abc'])]
+
+    def test_hash_matches_parent_level(self, router):
+        assert matches(router, 'yombo') == [('yombo/#', ['']), ('#', ['yombo'])]
+        assert matches(router, 'yombo/devices/porch/cmd') == [
+            ('yombo/devices/+/cmd/#', ['porch', '']),
+            ('yombo/#', ['devices/porch/cmd']),
+            ('#', ['yombo/devices/porch/cmd']),
+        ]
+
+    def test_no_match(self, router):
+        assert matches(router, 'yombo/states/light/set/extra') == [('yombo/#', ['states/light/set/extra']),
+                                                                   ('#', ['yombo/states/light/set/extra'])]
+        assert matches(TopicRouter(), 'yombo/devices') == []
+
+    def test_dollar_topics(self, router):
+        assert matches(router, '$SYS/broker') == []
+        router.add('$SYS/#', handler)
+        assert matches(router, '$SYS/broker') == [('$SYS/#', ['broker'])]
+
+    def test_empty_levels(self):
+        router = TopicRouter()
+        router.add('a/+/b', handler)
+        assert matches(router, 'a//b') == [('a/+/b', [''])]
+        assert matches(router, 'a/b') == []
+
+    def test_remove(self, router):
+        route_id = router.add('yombo/devices/+/cmd/#', handler)
+        assert len(router.routes('yombo/devices/+/cmd/#')) == 2
+        router.remove(route_id)
+        assert route_id not in router
+        assert len(router.routes('yombo/devices/+/cmd/#')) == 1
+        with pytest.raises(KeyError):
+            router.remove(route_id)
+
+    def test_remove_prunes_trie(self):
+        router = TopicRouter()
+        first = router.add('a/b/c/d', handler)
+        second = router.add('a/b/#', handler)
+        router.remove(first)
+        assert list(router._root.children['a'].children['b'].children) == []
+        router.remove(second)
+        assert router._root.empty()
+        assert len(router) == 0
+
+    @pytest.mark.parametrize('pattern,errorno', [('', 200), (None, 200), ('a/#/b', 201), ('a/b#', 202),
+                                                 ('a+/b', 202)])
+    def test_invalid_patterns(self, pattern, errorno):
+        with pytest.raises(YomboWarning) as error:
+            split_pattern(pattern)
+        assert error.value.errorno == errorno
+
+    def test_handler_must_be_callable(self):
+        with pytest.raises(YomboWarning):
+            TopicRouter().add('a/b', 'not callable')
+
+
+def test_recent_ids():
+    recent = RecentIds(3)
+    assert recent.add(1) is True
+    assert recent.add(1) is False
+    for number in range(2, 5):
+        recent.add(number)
+    assert len(recent) == 3
+    assert 1 not in recent
+    assert recent.add(1) is True
+    assert 2 not in recent
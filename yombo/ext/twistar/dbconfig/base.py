@@ -125,7 +125,7 @@ class InteractionBase(object):
         elif limit is not None:
             q += " LIMIT " + str(limit)
 
-        return self.runInteraction(self._doselect, q, args, tablename, one, cacheTableStructure)
+        return self.runReadInteraction(self._doselect, q, args, tablename, one, cacheTableStructure)
 
 
     def _doselect(self, txn, q, args, tablename, one=False, cacheable=True):
@@ -367,6 +367,16 @@ class InteractionBase(object):
         return Registry.DBPOOL.runInteraction(interaction, *args, **kwargs)
 
 
+    def runReadInteraction(self, interaction, *args, **kwargs):
+        """
+        Run an interaction that doesn't make changes. Pools with separate read connections
+        will run it on one of those.
+        """
+        if self.txn is not None or not hasattr(Registry.DBPOOL, 'runReadInteraction'):
+            return self.runInteraction(interaction, *args, **kwargs)
+        return Registry.DBPOOL.runReadInteraction(interaction, *args, **kwargs)
+
+
     def insertObj(self, obj):
         """
         Insert the given object into its table.
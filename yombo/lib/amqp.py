@@ -33,6 +33,7 @@ try:
 except ImportError:
     from hashlib import sha256
 import pika
+import re
 import sys
 import traceback
 from time import time
@@ -48,10 +49,20 @@ from yombo.core.exceptions import YomboWarning
 from yombo.core.library import YomboLibrary
 from yombo.core.log import get_logger
 from yombo.utils import random_string, unicode_to_bytes
+from yombo.utils.correlationtracker import CorrelationTracker, LatencyHistogram
 import collections
 
 logger = get_logger('library.amqp')
 
+MESSAGE_ID_REGEX = re.compile('[a-zA-Z0-9]{15,84}$')  # Allowed correlation_id and reply_to values.
+
+
+def valid_message_id(value):
+    """
+    Checks that a correlation_id or reply_to is 15 to 84 letters and numbers.
+    """
+    return isinstance(value, str) and MESSAGE_ID_REGEX.match(value) is not None
+
 
 class AMQP(YomboLibrary):
     """
@@ -75,6 +86,7 @@ class AMQP(YomboLibrary):
         self.client_connections = {}
         self.messages_processed = None  # Track incoming and outgoing messages. Meta data only.
         self.message_correlations = None  # Track various bits of information for sent correlation_ids.
+        self.latency = {}  # (exchange_name, request_type) -> LatencyHistogram, for replies to sent messages.
 
         self.init_deferred = Deferred()
         self.load_meta_data()
@@ -88,8 +100,8 @@ class AMQP(YomboLibrary):
         :param kwargs:
         :return:
         """
-        self.clean_correlation_ids_loop = LoopingCall(self.clean_correlation_ids)
-        self.clean_correlation_ids_loop.start(36)
+        self.latency_loop = LoopingCall(self.save_latency_statistics)
+        self.latency_loop.start(60, False)
 
     def _stop_(self, **kwargs):
         """
@@ -99,6 +111,9 @@ class AMQP(YomboLibrary):
         """
         if self.init_deferred is not None and self.init_deferred.called is False:
             self.init_deferred.callback(1)  # if we don't check for this, we can't stop!
+        for tracker in (self.messages_processed, self.message_correlations):
+            if tracker is not None:
+                tracker.stop()
 
     def _unload_(self, **kwargs):
         """
@@ -122,22 +137,35 @@ class AMQP(YomboLibrary):
     @inlineCallbacks
     def load_meta_data(self):
         """
-        Loads previous message data stored in SQLDict.
+        Loads previous message data stored in SQLDict, and sets up the trackers for them.
+
+        Both are limited in size by 'amqp:max_tracked', when full the least recently used entry is removed.
+        Correlations wait up to 'amqp:correlation_timeout' seconds for a reply, message meta data is kept for 5
+        minutes.
         :return:
         """
-        self.messages_processed = yield self._AMQP._SQLDict.get(
+        max_tracked = self._Configs.get('amqp', 'max_tracked', 2000, False)
+        correlation_timeout = self._Configs.get('amqp', 'correlation_timeout', 600, False)
+
+        stored = yield self._AMQP._SQLDict.get(
             self,
             "client_connections",
             max_length=400
         )
+        self.messages_processed = CorrelationTracker('AMQP messages', max_tracked, 60*5, stored)
+        for msg_id, message_meta in list(stored.items()):
+            self.messages_processed.add(msg_id, message_meta, created_at=message_meta['msg_at'])
 
-        self.message_correlations = yield self._AMQP._SQLDict.get(
+        stored = yield self._AMQP._SQLDict.get(
             self,
             "send_correlation_ids",
             serializer=self.message_correlations_serializer,
             unserializer=self.message_correlations_unserializer,
             max_length=400
         )
+        self.message_correlations = CorrelationTracker('AMQP', max_tracked, correlation_timeout, stored)
+        for correlation_id, correlation in list(stored.items()):
+            self.message_correlations.add(correlation_id, correlation, created_at=correlation['correlation_at'])
 
         self.init_deferred.callback(10)
 
@@ -152,9 +180,11 @@ class AMQP(YomboLibrary):
         if 'correlation_persistent' in correlation and correlation['correlation_persistent'] is False:
             raise YomboWarning("We don't save non-persistent items...")
         #todo: using sys or function tools to get the module name and function name to re-create a link.
-        correlation['callback'] = None
-        correlation['amqpyombo_callback'] = None
-        return correlation
+        output = correlation.copy()
+        output['callback'] = None
+        output['amqpyombo_callback'] = None
+        output['deferred'] = None
+        return output
 
     def message_correlations_unserializer(self, correlation):
         """
@@ -177,17 +207,37 @@ class AMQP(YomboLibrary):
         # print "serializer output: %s" % output
         return output
 
-    def clean_correlation_ids(self):
+    def record_latency(self, correlation_info, seconds):
         """
-        Clean up the tracking dictionaries for messages sent and messages processed.
+        Adds the time it took to get a reply to the histogram for the exchange and request type.
+
+        :param correlation_info: The correlation for the sent message.
+        :param seconds: Round trip time.
         """
-        for correlation_id in list(self.message_correlations.keys()):
-            if self.message_correlations[correlation_id]['correlation_at'] < (time() - (60*10)):
-                del self.message_correlations[correlation_id]
+        key = (correlation_info.get('exchange_name'), correlation_info.get('request_type'))
+        if key not in self.latency:
+            self.latency[key] = LatencyHistogram()
+        self.latency[key].add(seconds * 1000)
+        self._Statistics.averages("lib.amqp.latency", seconds * 1000, bucket_size=60, anon=True)
 
-        for msg_id in list(self.messages_processed.keys()):
-            if self.messages_processed[msg_id]['msg_at'] < (time() - (60*5)):
-                    del self.messages_processed[msg_id]
+    def latency_report(self):
+        """
+        Returns round trip latencies by exchange and request type, in milliseconds.
+
+        :return: Dictionary of 'exchange_name:request_type' -> histogram summary.
+        """
+        return {"%s:%s" % key: histogram.asdict() for key, histogram in sorted(self.latency.items(),
+                                                                               key=lambda item: str(item[0]))}
+
+    def save_latency_statistics(self):
+        """
+        Sends the size of the correlation tracker and it's counters to the statistics library, once a minute.
+        """
+        if self.message_correlations is None:
+            return
+        self._Statistics.datapoint("lib.amqp.correlations", len(self.message_correlations), anon=True)
+        for key, value in self.message_correlations.stats.items():
+            self._Statistics.datapoint("lib.amqp.correlations.%s" % key, value, anon=True)
 
     def _local_log(self, level, location="", msg=""):
         logit = getattr(logger, level)
@@ -484,6 +534,10 @@ class AMQPClient(object):
         :param routing_key: String (required) - A routing key is required when sending messages. For security,
           default routing is not allowed.
         :param body: Any - Any data that should be sent in the AMQP message payload.
+        :param timeout: Int - Seconds to wait for a reply, default is 'amqp:correlation_timeout'.
+        :param errback: Callable - Called with a failure if no reply is received before the timeout.
+        :return: Dict with 'message_meta' and 'correlation_info'. If a reply is expected, correlation_info['deferred']
+          fires with the reply's message meta, or errbacks if there's no reply before the timeout.
         """
         # self._local_log("debug", "AMQPClient::send_amqp_message", "Message: %s" % kwargs)
         meta = kwargs.get('meta', {})
@@ -494,6 +548,11 @@ class AMQPClient(object):
                 raise YomboWarning(
                         "AMQP Client{:%s} - If callback is set, it must be be callable." % self.client_id,
                         200, 'publish', 'AMQPClient')
+        errback = kwargs.get('errback', None)
+        if errback is not None and isinstance(errback, collections.Callable) is False:
+            raise YomboWarning(
+                    "AMQP Client{:%s} - If errback is set, it must be be callable." % self.client_id,
+                    203, 'publish', 'AMQPClient')
 
         exchange_name = kwargs.get('exchange_name', None)
         if exchange_name is None:
@@ -797,6 +856,7 @@ class PikaFactory(protocol.ReconnectingClientFactory):
             meta['msg_created_at'] = time()
 
         correlation_persistent = kwargs.get('correlation_persistent', True)
+        correlation_info = None
         if correlation_id is not None:
             correlation_info = {
                 "callback": callback,
@@ -805,14 +865,21 @@ class PikaFactory(protocol.ReconnectingClientFactory):
                 "callback_component_type_function": callback_function,  # name of the function to call
                 "correlation_id": correlation_id,
                 "correlation_persistent": correlation_persistent,
-                "correlation_at": time()
+                "correlation_at": time(),
+                "exchange_name": exchange_name,
+                "request_type": message_meta.get('request_type', None),
+                "deferred": Deferred(),  # fires with the reply's message meta, errbacks if none before timeout.
             }
-            self.AMQPClient._AMQP.message_correlations[correlation_id] = correlation_info
+            if kwargs.get('errback', None) is not None:
+                correlation_info['deferred'].addErrback(kwargs['errback'])
+            self.AMQPClient._AMQP.message_correlations.add(correlation_id, correlation_info,
+                                                           timeout=kwargs.get('timeout', None))
+            self.AMQPClient._AMQP.messages_processed.add(correlation_id, message_meta)
 
-        self.AMQPClient._AMQP.messages_processed[correlation_id] = message_meta
         kwargs['message_meta'] = message_meta
-        if 'callback' in kwargs:
-            del kwargs['callback']
+        for key in ('callback', 'errback'):
+            if key in kwargs:
+                del kwargs[key]
         self.AMQPProtocol.delivery_queue['urgent'].append({
             'type': 'message',
             'fields': kwargs,
@@ -1199,48 +1266,32 @@ class PikaProtocol(pika.adapters.twisted_connection.TwistedProtocolConnection):
         if reply_to is None and hasattr(props, 'reply_to') and props.reply_to is not None:
             reply_to = props.reply_to
 
+        messages_processed = self.factory.AMQPClient._AMQP.messages_processed
+        message_correlations = self.factory.AMQPClient._AMQP.message_correlations
         if reply_to is not None:
-            if reply_to.isalnum() is False or len(reply_to) < 15 or len(reply_to) > 84:
+            if valid_message_id(reply_to) is False:
                 if is_yombo_msg:
                     logger.warn("Discarding incoming message, invalid reply_to.")
                     return
                 else:
                     logger.warn("Message doesn't appear to have a friendly reply_to. Not long enough or contains odd characters.")
+                reply_to = None
             else:
-                if reply_to in self.factory.AMQPClient._AMQP.messages_processed:
-                    sent_message_meta = self.factory.AMQPClient._AMQP.messages_processed[reply_to]
-
-        # print("got yombo message b0 - reply_to: %s" % reply_to)
-        # print("got yombo message b3 - correlation_id: %s" % correlation_id)
-        # print("got yombo message b9 - all cors: %s" % self.factory.AMQPClient._AMQP.message_correlations)
+                sent_message_meta = messages_processed.get(reply_to)
 
         if correlation_id is not None:
-            if correlation_id.isalnum() is False or len(correlation_id) < 15 or len(correlation_id) > 84:
+            if valid_message_id(correlation_id) is False:
                 if is_yombo_msg:
                     logger.warn("Discarding incoming message, invalid correlation_id.")
                     return
                 else:
                     logger.warn("Message doesn't appear to have a friendly correlation_id. Not long enough or contains odd characters.")
             else:
-                # print("got yombo message bd1")
-                if correlation_id in self.factory.AMQPClient._AMQP.message_correlations:
-                    # print("got yombo message bd2")
-                    correlation_info = self.factory.AMQPClient._AMQP.message_correlations[correlation_id]
-                    if sent_message_meta is None:
-                        # print("got yombo message bd3")
-                        if correlation_info['correlation_id'] is not None and \
-                            correlation_info['received_correlation_id'] in self.factory.AMQPClient._AMQP.messages_processed:
-                            # print("got yombo message bd4")
-                            sent_message_meta = self.factory.AMQPClient._AMQP.messages_processed[correlation_id]
-                if reply_to in self.factory.AMQPClient._AMQP.message_correlations:
-                    # print("got yombo message be1")
-                    if correlation_info is None:
-                        correlation_info = self.factory.AMQPClient._AMQP.message_correlations[reply_to]
-                    # if sent_message_meta is None:
-                    #     print("got yombo message be2")
-                        # if reply_to in self.factory.AMQPClient._AMQP.messages_processed:
-                        #     # print("got yombo message be3")
-                        #     sent_message_meta = self.factory.AMQPClient._AMQP.messages_processed[reply_to]
+                correlation_info = message_correlations.get(correlation_id)
+                if correlation_info is not None and sent_message_meta is None:
+                    sent_message_meta = messages_processed.get(correlation_id)
+            if correlation_info is None and reply_to is not None:
+                correlation_info = message_correlations.get(reply_to)
 
         received_message_meta = {
             "msg_at": time(),
@@ -1286,6 +1337,12 @@ class PikaProtocol(pika.adapters.twisted_connection.TwistedProtocolConnection):
         if correlation_info is not None:
             received_message_meta['correlation_id'] = correlation_id
             received_message_meta['correlation_id_correlated'] = True
+            deferred = correlation_info.get('deferred', None)
+            if deferred is not None and deferred.called is False:
+                self.factory.AMQPClient._AMQP.record_latency(
+                    correlation_info, received_message_meta['msg_received_at'] - correlation_info['correlation_at'])
+                # Keep it a little longer in case of more replies, they are routed to the same callback.
+                message_correlations.complete(correlation_info['correlation_id'], received_message_meta, keep=60)
         else:
             received_message_meta['correlation_id_correlated'] = False
 
@@ -1294,7 +1351,7 @@ class PikaProtocol(pika.adapters.twisted_connection.TwistedProtocolConnection):
         # print("Ending receiving stuff.....")
 
         if correlation_id is not None and correlation_id[0:2] != 'xx_':
-            self.factory.AMQPClient._AMQP.messages_processed[correlation_id] = received_message_meta
+            messages_processed.add(correlation_id, received_message_meta)
 
         d = queue.get()  # get the queue again, so we can add another callback to get the next message.
         d.addCallback(self.receive_item, queue, queue_no_ack, subscription_callback)
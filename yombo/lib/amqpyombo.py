@@ -645,6 +645,8 @@ class AMQPYombo(YomboLibrary):
             message['properties']['correlation_id'] = message['body']['headers']['correlation_id']
         if 'reply_to' in message['body']['headers']:
             message['properties']['reply_to'] = message['body']['headers']['reply_to']
+        if 'request_type' in message['body']['headers']:
+            message['meta']['request_type'] = message['body']['headers']['request_type']
         # print("finalize message: %s" % message)
         message['body'] = msgpack.dumps(message['body'])
 
@@ -50,6 +50,7 @@ from yombo.core.exceptions import YomboWarning, YomboHookStopProcessing
 from yombo.core.library import YomboLibrary
 from yombo.core.log import get_logger
 import yombo.utils
+from yombo.utils.keyedstore import KeyedStore
 
 SUPPORTED_DISTS = platform._supported_dists + ('arch', 'mageia', 'meego', 'vmware', 'bluewhite64',
                      'slamd64', 'ovs', 'system', 'mint', 'oracle')
@@ -258,7 +259,8 @@ class Atoms(YomboLibrary):
         # self.gateway_id = 'local'
         self.gateway_id = self._Configs.get('core', 'gwid', 'local', False)
         self._loaded = False
-        self.__Atoms = {self.gateway_id: {}}
+        self.__Atoms = KeyedStore('atoms')
+        self.__Atoms.shard(self.gateway_id)
         # if 'local' not in self.__Atoms:
         #     self.__Atoms['local'] = {}
         self.os_data()
@@ -290,7 +292,7 @@ class Atoms(YomboLibrary):
         if gateway_id is None:
             gateway_id = self.gateway_id
 
-        if key in self.__Atoms[gateway_id]:
+        if gateway_id in self.__Atoms and key in self.__Atoms[gateway_id]:
             return True
         return False
 
@@ -302,24 +304,78 @@ class Atoms(YomboLibrary):
         :return: Time() of last update
         :rtype: float
         """
-        if key in self.__Atoms:
-            return self.__Atoms[key]['updated_at']
+        if key in self.__Atoms[self.gateway_id]:
+            return self.__Atoms[self.gateway_id][key]['updated_at']
         else:
             raise KeyError("Cannot get state time: %s not found" % key)
 
     def get_atoms(self, gateway_id=None):
         """
-        Shouldn't really be used. Just returns a _copy_ of all the atoms.
+        Returns a copy of the atoms.
 
-        :return: A dictionary containing all atoms.
+        :param gateway_id: If set, only atoms for the gateway. Otherwise, a dictionary of gateway_id -> atoms.
+        :return: A dictionary of atoms.
         :rtype: dict
         """
         if gateway_id is None:
-            return self.__Atoms.copy()
-        if gateway_id in self.__Atoms:
-            return self.__Atoms[gateway_id].copy()
-        else:
-            return {}
+            return {gateway_id: dict(items) for gateway_id, items in self.__Atoms.view().items()}
+        return dict(self.__Atoms.view(gateway_id))
+
+    def view_atoms(self, gateway_id=None):
+        """
+        Returns a read only view of the atoms. This isn't a copy, it changes as atoms change. Use this instead
+        of get_atoms() when only reading.
+
+        :param gateway_id: If set, only atoms for the gateway. Otherwise, a view of gateway_id -> atoms.
+        :return: A read only mapping.
+        """
+        return self.__Atoms.view(gateway_id)
+
+    def get_version(self, key, gateway_id=None):
+        """
+        Returns the version of an atom. Versions increase each time any atom changes.
+
+        :raises KeyError: Raised when request is not found.
+        :param key: Name of the atom.
+        :return: Version number.
+        :rtype: int
+        """
+        if gateway_id is None:
+            gateway_id = self.gateway_id
+        return self.__Atoms.get_version(gateway_id, key)
+
+    def changes_since(self, version, gateway_id=None):
+        """
+        Returns the atoms changed after a version. Used to send only what changed to other gateways.
+
+        :param version: Version number, 0 for all atoms.
+        :param gateway_id: Default is the local gateway.
+        :return: A dictionary of name -> (version, atom)
+        """
+        if gateway_id is None:
+            gateway_id = self.gateway_id
+        return self.__Atoms.changes_since(version, gateway_id)
+
+    def subscribe(self, pattern, callback, gateway_id=None):
+        """
+        Subscribe to atom changes. The callback receives a list of
+        :py:class:`StoreChange <yombo.utils.keyedstore.StoreChange>` instances, once per reactor tick, with only
+        the atoms matching the pattern.
+
+        :param pattern: Atom name, can include '+' to match one level or '#' to match any levels.
+        :param callback: Callable that accepts a list of changes.
+        :param gateway_id: Only changes for this gateway, default is all gateways.
+        :return: A subscription id, used for unsubscribe().
+        """
+        return self.__Atoms.subscribe(pattern, callback, gateway_id)
+
+    def unsubscribe(self, subscription_id):
+        """
+        Remove a subscription created with :py:meth:`subscribe`.
+
+        :param subscription_id: The id returned by subscribe().
+        """
+        self.__Atoms.unsubscribe(subscription_id)
 
     def get(self, atom_requested, human=None, full=None, gateway_id=None):
         """
@@ -379,8 +435,7 @@ class Atoms(YomboLibrary):
             gateway_id = self.gateway_id
         # logger.debug('atoms:set: {gateway_id}: {key} = {value}', gateway_id=gateway_id, key=key, value=value)
 
-        if gateway_id not in self.__Atoms:
-            self.__Atoms[gateway_id] = {}
+        atoms = self.__Atoms.shard(gateway_id)
 
         search_chars = ['#', '+']
         if any(s in key for s in search_chars):
@@ -397,7 +452,7 @@ class Atoms(YomboLibrary):
             self._Statistics.increment("lib.atoms.set.update", bucket_size=60, anon=True)
         else:
             is_new = True
-            self.__Atoms[gateway_id][key] = {
+            atoms[key] = {
                 'gateway_id': gateway_id,
                 'created_at': int(time()),
                 'updated_at': int(time()),
@@ -413,6 +468,7 @@ class Atoms(YomboLibrary):
             self.__Atoms[gateway_id][key]['value_human'] = human_value
         else:
             self.__Atoms[gateway_id][key]['value_human'] = self.convert_to_human(value, value_type)
+        self.__Atoms.changed(gateway_id, key)
 
         # Call any hooks
         yield yombo.utils.global_invoke_all('_atoms_set_',
@@ -436,20 +492,18 @@ class Atoms(YomboLibrary):
         gateway_id = values['gateway_id']
         if gateway_id == self.gateway_id:
             return
-        if gateway_id not in self.__Atoms:
-            self.__Atoms[gateway_id] = {}
-        self.__Atoms[values['gateway_id']][key] = {
+        self.__Atoms.set(gateway_id, key, {
             'gateway_id': values['gateway_id'],
             'value': values['value'],
             'value_human': values['value_human'],
             'value_type': values['value_type'],
             'created_at': values['created_at'],
             'updated_at': values['updated_at'],
-        }
+        })
         yield yombo.utils.global_invoke_all('_atoms_set_',
                                             called_by=self,
                                             key=key,
-                                            value=value,
+                                            value=values['value'],
                                             value_full=self.__Atoms[gateway_id][key],
                                             gateway_id=gateway_id
                                             )
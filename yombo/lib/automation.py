@@ -48,8 +48,10 @@ Developers should review the following modules for examples of implementation:
 :view-source: `View Source Code <https://yombo.net/Docs/gateway/html/current/_modules/yombo/lib/automation.html>`_
 """
 # Import python libraries
+from bisect import bisect_left, bisect_right
 from functools import reduce  # forward compatibility for Python 3
 import hjson
+from itertools import count
 import operator
 import msgpack
 from time import time
@@ -80,6 +82,11 @@ REQUIRED_FILTER_FIELDS = ['platform']
 CONDITION_TYPE_AND = 'and'
 CONDITION_TYPE_OR = 'or'
 
+# Operators of the 'basic_values' filter platform, grouped by how the trigger index can prune them.
+EQUALITY_OPERATORS = ('==', 'eq')
+LOWER_BOUND_OPERATORS = ('>', '>=', 'gt', 'ge')  # Fires when the new value is at or above the filter value.
+UPPER_BOUND_OPERATORS = ('<', '<=', 'lt', 'le')  # Fires when the new value is at or below the filter value.
+
 
 class Automation(YomboLibrary):
     """
@@ -106,7 +113,9 @@ class Automation(YomboLibrary):
         self.rules = {}   # Store processed / active rules
         self.active_triggers = {}  # Track various triggers - help find what rules to fire whena trigger matches.
 
-        self.tracker = {}  # Registered items to track, will be checked against if a trigger check fires.
+        self.tracker = {}  # tuple(tracked_keys) -> TriggerIndex. Checked against when a trigger check fires.
+        self.compiled_rules = {}  # rule_id -> CompiledRule, callbacks resolved once when the rule is added.
+        self._rule_sequence = count()  # Keeps rules firing in the order they were added.
         self.sources = {}  # List of source processors
         self.filters = {}  # List of filter processors
         self.actions = {}  # List of actionprocessors
@@ -419,6 +428,8 @@ class Automation(YomboLibrary):
                     return False
 
             # logger.debug("Passed adding rule condition check.... {rule}", rule=rule)
+            self.compiled_rules[rule_id] = CompiledRule(self, rule, next(self._rule_sequence))
+
             logger.debug("about to add triggers....")
             if 'trigger' in rule:
                 logger.debug("about to add triggers....now")
@@ -427,6 +438,9 @@ class Automation(YomboLibrary):
 
         except YomboWarning as e:
             logger.warn("Some error: {e}", e=e)
+            self.triggers_remove(rule_id)
+            if rule_id in self.compiled_rules:
+                del self.compiled_rules[rule_id]
             return False
 
         if 'trigger' in rule:
@@ -521,18 +535,18 @@ class Automation(YomboLibrary):
         and 'triggers_check' can perform this task.
 
         In devices, states, atoms, etc, when 'add_trigger_callback' is called, they all register tracked_keys with
-        this function. This function creates an entry in a dictionary and can store the values.  Now, whenever a
-        device status changes, states change, atoms change, they call triggers_check with the tracked_keys and
+        this function. The compiled rule is added to a :py:class:`TriggerIndex` for the tracked keys. Now, whenever
+        a device status changes, states change, atoms change, they call triggers_check with the tracked_keys and
         the value. If the value's changed, :py:meth:`triggers_check <triggers_check>` will fire any rules as required.
 
         *Usage**:
 
         .. code-block:: python
 
-           self._AutomationLibrary.triggers_add(rule['rule_id'], 'devices', automation_device_id)
+           self._AutomationLibrary.triggers_add(rule['rule_id'], ['devices', automation_device_id])
 
         :param rule_id: Rule ID to attach trigger to.
-        :param tracked_keys: An immutable key to monitor. Usually a dictionary key.
+        :param tracked_keys: A list of immutable keys to monitor. Usually dictionary keys.
         :return:
         """
         if isinstance(tracked_keys, list) is False:
@@ -540,16 +554,27 @@ class Automation(YomboLibrary):
             # raise YomboAutomationWarning("Tracked Keys must be a list of keys.")
             return
 
-        try:
-            root = yombo.utils.get_nested_dict(self.tracker, tracked_keys)
-        except:
-            yombo.utils.set_nested_dict(self.tracker, tracked_keys, [])
-            root = yombo.utils.get_nested_dict(self.tracker, tracked_keys)
+        if rule_id not in self.compiled_rules:
+            logger.warn("Triggers_add called for a rule that hasn't been compiled: {rule_id}", rule_id=rule_id)
+            return
+
+        tracked_keys = tuple(tracked_keys)
+        if tracked_keys not in self.tracker:
+            self.tracker[tracked_keys] = TriggerIndex()
+        self.tracker[tracked_keys].add(self.compiled_rules[rule_id])
 
-        root.append({
-            'rule_id': rule_id,
-        })
-        # print("done adding tracker: %s" % self.tracker)
+    def triggers_remove(self, rule_id):
+        """
+        Removes a rule from every trigger index it was added to.
+
+        :param rule_id: Rule ID to remove.
+        :return:
+        """
+        for tracked_keys in list(self.tracker.keys()):
+            index = self.tracker[tracked_keys]
+            index.remove(rule_id)
+            if len(index) == 0:
+                del self.tracker[tracked_keys]
 
     def triggers_check(self, tracked_keys, new_value):
         """
@@ -559,48 +584,42 @@ class Automation(YomboLibrary):
         Modules and libraries can call this to check for any triggers on a dictionary. If a trigger matches, any
         defined rules for a given trigger will fire.
 
+        Only rules whose trigger filter can match the new value are evaluated, see
+        :py:meth:`TriggerIndex.candidates`.
+
         See the :py:mod:`devices <yombo.lib.devices>` library for best example and documentation.
 
         :param tracked_keys: Defined key from triggers_add
         :param new_value: New value to track
         :return:
         """
-        # logger.warn("@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@triggers_check({platform_label}, {tracked_keys}, {new_value})",
-        #             platform_label=platform_label,
-        #             tracked_keys=tracked_keys,
-        #             new_value=new_value)
         # logger.debug("triggers_check tracked_keys: {tracked_keys}", tracked_keys=tracked_keys)
-        # logger.debug("triggers_check trackers: {tracker}", tracker=self.tracker)
         try:
-            rule_ids = yombo.utils.get_nested_dict(self.tracker, tracked_keys)
-        except Exception as e:
+            index = self.tracker[tuple(tracked_keys)]
+        except (KeyError, TypeError):
             return False
 
-        if len(rule_ids) == 0:
-            logger.warn("There should be rules, but found none!")
+        candidates = index.candidates(new_value)
+        if len(candidates) == 0:
             return False
-        logger.debug("found rule IDs {rule_ids}", rule_ids=rule_ids)
+        # logger.debug("found rule candidates {candidates}", candidates=candidates)
 
         # We now have at least one trigger. Gather a list of rule id's that have permitted conditions.
         fired_rules = {}
-        for item in range(len(rule_ids)):
-            rule_id = rule_ids[item]['rule_id']
-            rule = self.rules[rule_id]
-            if 'filter' in rule['trigger']:
-                try:
-                    trigger_filter_valid = self.automation_check_filter(rule_id, rule['trigger'], new_value)
-                except YomboAutomationWarning as e:
-                    fired_rules[rule_id] = "Trigger filter failed with error: %s" % e
-                    continue
-            else:
-                trigger_filter_valid = True
+        for compiled in candidates:
+            rule_id = compiled.rule_id
+            try:
+                trigger_filter_valid = compiled.check_trigger(new_value)
+            except YomboAutomationWarning as e:
+                fired_rules[rule_id] = "Trigger filter failed with error: %s" % e
+                continue
 
             if trigger_filter_valid is False:
                 fired_rules[rule_id] = "Trigger filter is false."
                 continue
             else:
                 try:
-                    condition_filter_valid = self.automation_check_conditions(rule_id)
+                    condition_filter_valid = compiled.check_conditions()
                 except YomboAutomationWarning as e:
                     fired_rules[rule_id] = "Condition filter failed with error: %s" % e
                     continue
@@ -611,6 +630,7 @@ class Automation(YomboLibrary):
             else:
                 try:
                     fired_rules[rule_id] = self.automation_action(rule_id)
+                    compiled.fired()
                 except YomboAutomationWarning as e:
                     fired_rules[rule_id] = "Do automation action failed with error: %s" % e
                     continue
@@ -618,6 +638,19 @@ class Automation(YomboLibrary):
         logger.debug("Fired Rules from trigger check: {rules}", rules=fired_rules)
         return fired_rules
 
+    def get_rule_stats(self, rule_id=None):
+        """
+        Returns the evaluation counters for compiled rules. Used for profiling which rules are checked and
+        fired the most.
+
+        :param rule_id: If provided, only returns the counters for the requested rule.
+        :return: A dictionary of rule_id -> counters, or just the counters if rule_id is provided.
+        :rtype: dict
+        """
+        if rule_id is not None:
+            return self.compiled_rules[rule_id].stats()
+        return {rule_id: compiled.stats() for rule_id, compiled in self.compiled_rules.items()}
+
     def get_available_items(self, **kwargs):
         platform = kwargs['platform']
         type = kwargs['type']
@@ -642,6 +675,9 @@ class Automation(YomboLibrary):
         :return:
         """
         logger.debug("doing automation_check_conditions on rule: {rule}", rule=self.rules[rule_id]['name'])
+        if rule_id in self.compiled_rules:
+            return self.compiled_rules[rule_id].check_conditions()
+
         condition_type = 'and'
 
         rule = self.rules[rule_id]
@@ -714,6 +750,266 @@ class Automation(YomboLibrary):
         return
 
 
+def is_real_number(value):
+    """
+    True if the value is an int or float, but not a bool. Used by the trigger index to decide if a value can
+    be compared against numeric filter thresholds.
+
+    :param value: Value to check.
+    :return: bool
+    """
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class CompiledRule:
+    """
+    A rule compiled once by :py:meth:`Automation.add_rule`. The trigger filter and condition callbacks are
+    resolved when the rule is added, so checking a trigger doesn't have to look up platforms each time.
+
+    :ivar rule_id: (string) The rule id.
+    :ivar rule: (dict) The rule as validated by the automation library.
+    :ivar sequence: (int) Order the rule was added in. Rules fire in this order.
+    :ivar index_type: (string) How a TriggerIndex stores this rule: always, equality, lower, or upper.
+    :ivar filter_value: The trigger filter value used by the index, None if index_type is 'always'.
+    :ivar evaluations: (int) Number of times the trigger filter was evaluated.
+    :ivar passes: (int) Number of times the trigger filter returned True.
+    :ivar fires: (int) Number of times the rule actions were performed from a trigger.
+    :ivar last_fired: (float) EPOCH time when the rule last fired from a trigger.
+    """
+
+    def __init__(self, automation, rule, sequence):
+        """
+        Resolve the filter and condition callbacks for a rule.
+
+        :param automation: Pointer to the automation library.
+        :param rule: The rule, all platforms must already be validated.
+        :type rule: dict
+        :param sequence: Order the rule was added in.
+        :type sequence: int
+        """
+        self.rule = rule
+        self.rule_id = rule['rule_id']
+        self.sequence = sequence
+        self.evaluations = 0
+        self.passes = 0
+        self.fires = 0
+        self.last_fired = None
+
+        self.trigger_filter = None
+        self.index_type = 'always'
+        self.filter_value = None
+        if 'trigger' in rule and 'filter' in rule['trigger']:
+            rule_filter = rule['trigger']['filter']
+            self.trigger_filter = automation.filters[rule_filter['platform']]['run_filter_callback']
+            self.index_type, self.filter_value = self.classify_filter(rule_filter)
+
+        self.condition_type = rule.get('condition_type', CONDITION_TYPE_AND)
+        self.conditions = []
+        for condition in rule.get('condition', []):
+            self.conditions.append((
+                condition,
+                automation.sources[condition['source']['platform']]['get_value_callback'],
+                automation.filters[condition['filter']['platform']]['run_filter_callback'],
+            ))
+
+    @staticmethod
+    def classify_filter(rule_filter):
+        """
+        Determine how a trigger filter can be indexed. Only the 'basic_values' platform can be pruned, any other
+        filter platform is always evaluated.
+
+        :param rule_filter: The 'filter' portion of a trigger.
+        :return: A tuple of index type and the value to index.
+        """
+        if rule_filter['platform'] != 'basic_values' or 'value' not in rule_filter:
+            return 'always', None
+
+        operator_name = rule_filter.get('operator', '==')
+        value = rule_filter['value']
+        if operator_name in EQUALITY_OPERATORS:
+            try:
+                hash(value)
+            except TypeError:
+                return 'always', None
+            return 'equality', value
+
+        if is_real_number(value):
+            if operator_name in LOWER_BOUND_OPERATORS:
+                return 'lower', value
+            if operator_name in UPPER_BOUND_OPERATORS:
+                return 'upper', value
+        return 'always', None
+
+    def check_trigger(self, new_value):
+        """
+        Run the trigger filter against a new value.
+
+        :param new_value: The new value of the tracked item.
+        :return: True if the trigger filter passes.
+        """
+        self.evaluations += 1
+        if self.trigger_filter is None:
+            result = True
+        else:
+            result = self.trigger_filter(self.rule, self.rule['trigger'], new_value)
+        if result:
+            self.passes += 1
+        return result
+
+    def check_conditions(self):
+        """
+        Get the value for each condition and run it through the condition's filter.
+
+        :return: True if the conditions pass.
+        """
+        if len(self.conditions) == 0:
+            return True
+
+        condition_results = []
+        for condition, get_value_callback, run_filter_callback in self.conditions:
+            value = get_value_callback(self.rule, condition)
+            result = run_filter_callback(self.rule, condition, value)
+            if self.condition_type == CONDITION_TYPE_AND and result is False:
+                return False
+            condition_results.append(result)
+        return any(condition_results)
+
+    def fired(self):
+        """
+        Called after the rule actions have been performed.
+        """
+        self.fires += 1
+        self.last_fired = time()
+
+    def stats(self):
+        """
+        Returns the counters for this rule.
+
+        :return: dict
+        """
+        return {
+            'name': self.rule['name'],
+            'index_type': self.index_type,
+            'evaluations': self.evaluations,
+            'passes': self.passes,
+            'fires': self.fires,
+            'last_fired': self.last_fired,
+        }
+
+
+class TriggerIndex:
+    """
+    Stores all compiled rules that track the same keys. Rules are indexed by their trigger filter so that
+    :py:meth:`Automation.triggers_check` only evaluates rules whose filter can match a new value.
+
+    'basic_values' equality filters are indexed by value and by their true/false meaning. Numeric range
+    filters are kept sorted by their threshold. Everything else is always evaluated.
+    """
+
+    def __init__(self):
+        self.rules = {}  # rule_id -> CompiledRule
+        self.always = []
+        self.equality = {}  # filter value -> list of CompiledRule
+        self.equality_bool = {True: [], False: []}  # is_true_false(filter value) -> list of CompiledRule
+        self.lower_thresholds = []  # sorted, fires at or above the threshold
+        self.lower = []
+        self.upper_thresholds = []  # sorted, fires at or below the threshold
+        self.upper = []
+
+    def __len__(self):
+        return len(self.rules)
+
+    def add(self, compiled):
+        """
+        Add a compiled rule to the index. If the rule is already indexed, it's replaced.
+
+        :param compiled: The compiled rule.
+        :type compiled: CompiledRule
+        """
+        self.remove(compiled.rule_id)
+        self.rules[compiled.rule_id] = compiled
+
+        index_type = compiled.index_type
+        value = compiled.filter_value
+        if index_type == 'equality':
+            if value not in self.equality:
+                self.equality[value] = []
+            self.equality[value].append(compiled)
+            bool_value = yombo.utils.is_true_false(value)
+            if bool_value is not None:
+                self.equality_bool[bool_value].append(compiled)
+        elif index_type == 'lower':
+            position = bisect_right(self.lower_thresholds, value)
+            self.lower_thresholds.insert(position, value)
+            self.lower.insert(position, compiled)
+        elif index_type == 'upper':
+            position = bisect_right(self.upper_thresholds, value)
+            self.upper_thresholds.insert(position, value)
+            self.upper.insert(position, compiled)
+        else:
+            self.always.append(compiled)
+
+    def remove(self, rule_id):
+        """
+        Remove a rule from the index.
+
+        :param rule_id: The rule id to remove.
+        """
+        if rule_id not in self.rules:
+            return
+        compiled = self.rules.pop(rule_id)
+        self.always = [item for item in self.always if item is not compiled]
+        for value in list(self.equality.keys()):
+            self.equality[value] = [item for item in self.equality[value] if item is not compiled]
+            if len(self.equality[value]) == 0:
+                del self.equality[value]
+        for bool_value in (True, False):
+            self.equality_bool[bool_value] = [item for item in self.equality_bool[bool_value]
+                                              if item is not compiled]
+        for thresholds, items in ((self.lower_thresholds, self.lower), (self.upper_thresholds, self.upper)):
+            if compiled in items:
+                position = items.index(compiled)
+                del thresholds[position]
+                del items[position]
+
+    def candidates(self, new_value):
+        """
+        Get the rules whose trigger filter can match the new value, in the order the rules were added.
+        The filters still have to be checked, this only skips rules that can't possibly match.
+
+        :param new_value: The new value of the tracked item.
+        :return: A list of CompiledRule.
+        """
+        found = {}
+        for compiled in self.always:
+            found[compiled.sequence] = compiled
+
+        bool_value = yombo.utils.is_true_false(new_value)
+        if len(self.equality) > 0:
+            try:
+                for compiled in self.equality.get(new_value, ()):
+                    found[compiled.sequence] = compiled
+            except TypeError:  # Unhashable values can only match filters in self.always
+                pass
+            if bool_value is not None:
+                for compiled in self.equality_bool[bool_value]:
+                    found[compiled.sequence] = compiled
+
+        if len(self.lower) > 0 or len(self.upper) > 0:
+            if is_real_number(new_value) and bool_value is None:
+                lower = self.lower[:bisect_right(self.lower_thresholds, new_value)]
+                upper = self.upper[bisect_left(self.upper_thresholds, new_value):]
+            else:  # Not comparable as a number, let the filter decide.
+                lower = self.lower
+                upper = self.upper
+            for compiled in lower:
+                found[compiled.sequence] = compiled
+            for compiled in upper:
+                found[compiled.sequence] = compiled
+
+        return [found[sequence] for sequence in sorted(found)]
+
+
 # class Rule:
 #     """
 #     A class to contain various aspects of a rule.
@@ -26,6 +26,7 @@ from yombo.core.exceptions import YomboWarning
 from yombo.core.library import YomboLibrary
 from yombo.core.log import get_logger
 from yombo.utils import search_instance, do_search_instance, global_invoke_all
+from yombo.utils.searchindex import SearchIndex
 from yombo.utils.fuzzysearch import FuzzySearch
 logger = get_logger('library.commands')
 
@@ -156,6 +157,7 @@ class Commands(YomboLibrary):
         """
         self.load_deferred = None  # Prevents loader from moving on past _start_ until we are done.
         self.commands = {}
+        self.command_search_index = SearchIndex()  # Kept up to date as commands are imported.
         self.__yombocommandsByVoice = FuzzySearch(None, .92)
         self.command_search_attributes = ['command_id', 'label', 'machine_label', 'description', 'always_load',
             'voice_cmd', 'cmd', 'status']
@@ -263,6 +265,8 @@ class Commands(YomboLibrary):
             except Exception as e:
                 pass
 
+        self.command_search_index.update(command_id, self.commands[command_id])
+
         if command['voice_cmd'] is not None:
             self.__yombocommandsByVoice[command['voice_cmd']] = self.commands[command_id]
 
@@ -336,13 +340,16 @@ class Commands(YomboLibrary):
             try:
                 if command_list is not None:
                     commands = command_list
+                    index = None
                 else:
                     commands = self.commands
+                    index = self.command_search_index
                 logger.debug("Get is about to call search...: %s" % command_requested)
                 found, key, item, ratio, others = do_search_instance(attrs, commands,
                                                                      self.command_search_attributes,
                                                                      limiter=limiter,
-                                                                     operation="highest")
+                                                                     operation="highest",
+                                                                     index=index)
                 logger.debug("found command by search: {command_id}", command_id=key)
                 if found:
                     return item
@@ -364,7 +371,8 @@ class Commands(YomboLibrary):
                                self.commands,
                                self.command_search_attributes,
                                _limiter,
-                               _operation)
+                               _operation,
+                               index=self.command_search_index)
 
     def get_commands_by_voice(self):
         """
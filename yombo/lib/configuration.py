@@ -32,6 +32,17 @@ new value:
    print("Latitude: %s" % latitude())  # print
    latitude(set=100)  # Save a new latitude location.
 
+For values read often, such as on every request or message, use handle(). It returns a
+:py:class:`ConfigHandle` that keeps the value until the configuration is changed by set() or delete(). Reads are
+counted by the handle and sent to the statistics library every 15 seconds, instead of on every read:
+
+*Usage**:
+
+.. code-block:: python
+
+   self.gateway_id = self._Configs.handle("core", "gwid", "local", False)
+   print("Gateway ID: %s" % self.gateway_id.value)
+
 There are also times when you a module or library should be notified of a change. They
 can simply implement the hook: _configuration_set_:
 
@@ -73,7 +84,6 @@ try:  # Prefer simplejson if installed, otherwise json will work swell.
     import simplejson as json
 except ImportError:
     import json
-from functools import partial
 
 # Import twisted libraries
 from twisted.internet.task import LoopingCall
@@ -91,6 +101,66 @@ from yombo.utils import dict_merge, global_invoke_all, is_string_bool
 logger = get_logger('library.configuration')
 
 
+class ConfigHandle(object):
+    """
+    A configuration value that is looked up once and then kept until the configuration item is changed. Returned
+    by :py:meth:`Configuration.handle`. Calling the handle works like the callable returned by get2().
+
+    :ivar section: (str) Configuration section.
+    :ivar option: (str) Configuration option.
+    :ivar default: Default value, see :py:meth:`Configuration.get`.
+    :ivar set_if_missing: (bool) If the default should be saved when the item is missing.
+    :ivar reads: (int) Reads since they were last sent to the statistics library.
+    """
+    __slots__ = ('_configs', 'section', 'option', 'default', 'set_if_missing', 'reads', '_value', '_valid')
+
+    def __init__(self, configs, section, option, default, set_if_missing):
+        self._configs = configs
+        self.section = section
+        self.option = option
+        self.default = default
+        self.set_if_missing = set_if_missing
+        self.reads = 0
+        self._value = None
+        self._valid = False
+
+    def __call__(self, set=None, **kwargs):
+        if set is not None:
+            self._configs.set(self.section, self.option, set, **kwargs)
+            return set
+        return self.value
+
+    def __repr__(self):
+        return "ConfigHandle(%s, %s)" % (self.section, self.option)
+
+    @property
+    def value(self):
+        """
+        The configuration value.
+
+        :raises KeyError: When the item is missing and there is no default.
+        """
+        if self._valid is False:
+            self._value = self._configs.get(self.section, self.option, self.default, self.set_if_missing)
+            self._valid = True
+            return self._value
+        self.reads += 1
+        return self._value
+
+    def set(self, value, **kwargs):
+        """
+        Set a new value, same as :py:meth:`Configuration.set`.
+        """
+        return self._configs.set(self.section, self.option, value, **kwargs)
+
+    def invalidate(self):
+        """
+        Forget the value, it will be looked up on the next read.
+        """
+        self._valid = False
+        self._value = None
+
+
 class Configuration(YomboLibrary):
     """
     Configuration storage module for the gateway service.
@@ -220,6 +290,9 @@ class Configuration(YomboLibrary):
         """
         self.cache_dirty = False
         self.configs = {}
+        self.handles = {}  # (section, option) -> list of ConfigHandle
+        # Results of get(), counted here and sent to the statistics library by send_read_counts().
+        self.get_counts = {'value': 0, 'none': 0, 'empty_string': 0, 'default': 0, 'nodefault': 0}
         self.automation_startup_check = []
         self._loaded = False
         self.yombo_ini_last_modified = 0
@@ -318,6 +391,8 @@ class Configuration(YomboLibrary):
                 # self.set("core", "localipaddress_network_v6", address_info['ipv6']['network'])
                 self.set("core", "localipaddresstime", int(time()))
 
+        self.periodic_send_read_counts = LoopingCall(self.send_read_counts)
+        self.periodic_send_read_counts.start(15, False)
         self.periodic_save_yombo_ini = LoopingCall(self.save)
         self.periodic_save_yombo_ini.start(randint(12600, 14400), False)  # every 3.5-4 hours
         # self.periodic_load_yombo_ini = LoopingCall(self.check_if_yombo_ini_modified)
@@ -349,6 +424,10 @@ class Configuration(YomboLibrary):
 
 
     def _stop_(self, **kwargs):
+        if self.periodic_send_read_counts is not None and self.periodic_send_read_counts.running:
+            self.periodic_send_read_counts.stop()
+        self.send_read_counts()
+
         if self.periodic_save_yombo_ini is not None and self.periodic_save_yombo_ini.running:
             self.periodic_save_yombo_ini.stop()
 
@@ -583,7 +662,7 @@ class Configuration(YomboLibrary):
         """
         Like :py:meth:`get() <get>` below, however, this returns a callable to retrieve the value instead of an actual
         value. The callable can also be used to set the value of the configuration item too. See
-        example for usage details.
+        example for usage details. The callable is a :py:class:`ConfigHandle`, see :py:meth:`handle() <handle>`.
 
         **Usage**:
 
@@ -600,25 +679,94 @@ class Configuration(YomboLibrary):
         :raises KeyError: When the requested section and option are not found.
         :param section: The configuration section to use.
         :type section: string
-        :param option: The option (key) to use. Use * to return all possible options as a dict.
+        :param option: The option (key) to use.
         :type option: string
         :param default: What to return if no result is found, default = None.
         :type default: int or string
         :param set_if_missing: If value is missing, should it be set for future reference?
         :type set_if_missing: bool
-        :return: The configuration value requested by section and option.
-        :rtype: int or string or None
+        :return: A callable that returns the configuration value requested by section and option.
+        :rtype: ConfigHandle
         """
         if set is not None:
             self.set(section, option, set, **kwargs)
             return set
 
-        self.get(section, option, default, set_if_missing, set, **kwargs)
+        handle = self.handle(section, option, default, set_if_missing)
+        handle.value
+        return handle
+
+    def handle(self, section, option, default="Jx^pG!+M3UByJc*MdJVz", set_if_missing=True):
+        """
+        Returns a :py:class:`ConfigHandle` for a configuration item. The value is looked up on the first read of
+        handle.value and kept until the item is changed with :py:meth:`set() <set>` or deleted, so reads don't
+        repeat the checks done by :py:meth:`get() <get>`. Use for items read often.
+
+        Handles for the same item and default are shared.
 
+        **Usage**:
+
+        .. code-block:: python
+
+           self.gateway_id = self._Configs.handle("core", "gwid", "local", False)
+           logger.info("Gateway ID: {id}", id=self.gateway_id.value)
+
+        :raises InvalidArgumentError: When an argument is invalid or illegal.
+        :param section: The configuration section to use.
+        :type section: string
+        :param option: The option (key) to use, can't be '*'.
+        :type option: string
+        :param default: If set and nothing found, this will be returned. Otherwise, reads raise KeyError.
+        :type default: int or string
+        :param set_if_missing: If value is missing, should it be set for future reference?
+        :type set_if_missing: bool
+        :return: The handle.
+        :rtype: ConfigHandle
+        """
+        if len(section) > self.MAX_SECTION_LENGTH:
+            raise InvalidArgumentError("section cannot be more than %d chars" % self.MAX_SECTION_LENGTH)
+        if len(option) > self.MAX_OPTION_LENGTH:
+            raise InvalidArgumentError("option cannot be more than %d chars" % self.MAX_OPTION_LENGTH)
         section = section.lower()
         option = option.lower()
+        if section == "*" or option == "*":
+            raise InvalidArgumentError("Handles can only be used for a single configuration item.")
+
+        handles = self.handles.setdefault((section, option), [])
+        for handle in handles:
+            if handle.default == default and handle.set_if_missing == set_if_missing:
+                return handle
+        handle = ConfigHandle(self, section, option, default, set_if_missing)
+        handles.append(handle)
+        return handle
+
+    def invalidate_handles(self, section, option):
+        """
+        Called when a configuration item changes, handles will look up the new value on their next read.
+        """
+        for handle in self.handles.get((section, option), ()):
+            handle.invalidate()
+
+    def send_read_counts(self):
+        """
+        Add reads counted by get() and handles to the statistics library and the configuration items. Called
+        every 15 seconds.
+        """
+        for (section, option), handles in self.handles.items():
+            reads = 0
+            for handle in handles:
+                reads += handle.reads
+                handle.reads = 0
+            if reads == 0:
+                continue
+            self.get_counts['value'] += reads
+            if section in self.configs and option in self.configs[section]:
+                self.configs[section][option]['reads'] += reads
 
-        return partial(self.get, section, option, default, set_if_missing)
+        for name, count in self.get_counts.items():
+            if count > 0:
+                self._Statistics.increment("lib.configuration.get.%s" % name, count, bucket_size=15, anon=True)
+                self.get_counts[name] = 0
 
     def get(self, section, option, default="Jx^pG!+M3UByJc*MdJVz", set_if_missing=True, set=None, **kwargs):
         """
@@ -666,10 +814,10 @@ class Configuration(YomboLibrary):
 
         if section == 'yombo':
             if option in self.yombo_vars:
-                self._Statistics.increment("lib.configuration.get.value", bucket_size=15, anon=True)
+                self.get_counts['value'] += 1
                 return self.yombo_vars[option]
             else:
-                self._Statistics.increment("lib.configuration.get.none", bucket_size=15, anon=True)
+                self.get_counts['none'] += 1
             raise KeyError("Requested configuration not found: %s : %s" % (section, option))
 
         if section == "*":  # Get all sections and options.
@@ -695,24 +843,24 @@ class Configuration(YomboLibrary):
             elif option in self.configs[section]:
                 self.configs[section][option]['reads'] += 1
 #                return self.configs[section][option]
-                self._Statistics.increment("lib.configuration.get.value", bucket_size=15, anon=True)
+                self.get_counts['value'] += 1
                 # print("cfgs: %s:%s = %s" % (section, option, self.configs[section][option]['value']))
                 return self.configs[section][option]['value']
 
         # it's not here, so, if there is a default, lets save that for future reference and return it... English much?
         if default == "":
-            self._Statistics.increment("lib.configuration.get.empty_string", bucket_size=15, anon=True)
+            self.get_counts['empty_string'] += 1
             return ""
 
         if default != "Jx^pG!+M3UByJc*MdJVz":
             if set_if_missing:
                 self.set(section, option, default)
                 self.configs[section][option]['reads'] += 1
-            self._Statistics.increment("lib.configuration.get.default", bucket_size=15, anon=True)
+            self.get_counts['default'] += 1
             # print "returning default: %s" % default
             return default
         else:
-            self._Statistics.increment("lib.configuration.get.nodefault", bucket_size=15, anon=True)
+            self.get_counts['nodefault'] += 1
             if section not in self.configs:
                 raise KeyError("Configuration section not found: %s" % section)
             else:
@@ -786,6 +934,7 @@ class Configuration(YomboLibrary):
                 'hash': sha224( str(value).encode('utf-8') ).hexdigest(),
             })
         self.configs_dirty = True
+        self.invalidate_handles(section, option)
         if self.loading_yombo_ini is False:
             self.configs[section][option]['writes'] += 1
             yield global_invoke_all('_configuration_set_',
@@ -793,7 +942,7 @@ class Configuration(YomboLibrary):
                                     section=section,
                                     option=option,
                                     value=value,
-                                    action=set,
+                                    action='set',
                                     )
 
     def get_meta(self, section, option, meta_type='time'):
@@ -816,12 +965,13 @@ class Configuration(YomboLibrary):
             if option in self.configs[section]:
                 self.configs_dirty = True
                 del self.configs[section][option]
+                self.invalidate_handles(section, option)
                 yield global_invoke_all('_configuration_set_',
                                         called_by=self,
                                         section=section,
                                         option=option,
                                         value=None,
-                                        action=delete,
+                                        action='delete',
                                         )
 
     ##############################################################################################################
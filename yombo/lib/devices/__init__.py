@@ -74,11 +74,13 @@ from twisted.internet.task import LoopingCall
 
 # Import Yombo libraries
 from ._device import Device
-from ._device_command import Device_Command
+from ._device_command import Device_Command, DeviceCommandRegistry
+from ._device_status import DeviceStatusWriter
 from yombo.core.exceptions import YomboDeviceError, YomboWarning, YomboHookStopProcessing
 from yombo.core.library import YomboLibrary
 from yombo.core.log import get_logger
 from yombo.utils import split, global_invoke_all, search_instance, do_search_instance, random_int, get_public_gw_id
+from yombo.utils.searchindex import SearchIndex
 logger = get_logger('library.devices')
 
 
@@ -216,6 +218,7 @@ class Devices(YomboLibrary):
         self.device_search_attributes = ['device_id', 'device_type_id', 'machine_label', 'label', 'description',
             'pin_required', 'pin_code', 'pin_timeout', 'voice_cmd', 'voice_cmd_order', 'statistic_label', 'status',
             'created', 'updated', 'location_id', 'area_id', 'gateway_id']
+        self.device_search_index = SearchIndex()  # Kept up to date as devices are imported, edited, and deleted.
 
         self.gateway_id = self._Configs.get("core", "gwid", "local", False)
         self.is_master = self._Configs.get("core", "is_master", "local", False)
@@ -223,7 +226,8 @@ class Devices(YomboLibrary):
 
         # used to store delayed queue for restarts. It'll be a bare, dehydrated version.
         # store the above, but after hydration.
-        self.device_commands = OrderedDict()  # tracks commands being sent to devices. Also tracks if a command is delayed
+        # tracks commands being sent to devices. Also tracks if a command is delayed
+        self.device_commands = DeviceCommandRegistry(self._Configs.get('devices', 'device_command_keep_time', 2700))
           # the automation system can always request the same command to be performed but ensure only one is
           # is n the queue between restarts.
         self.clean_device_commands_loop = None
@@ -232,6 +236,10 @@ class Devices(YomboLibrary):
         self.processing_commands = False
 
         self.mqtt = None
+        # Saves device statuses, and knows which are already in the database.
+        self.status_writer = DeviceStatusWriter(self, self._Configs.get('devices', 'status_save_interval', 1))
+        # Keep status history as compact records instead of Device_Status instances.
+        self.compact_status_history = self._Configs.get('devices', 'compact_status_history', True)
 
     # @inlineCallbacks
     def _load_(self, **kwargs):
@@ -253,11 +261,11 @@ class Devices(YomboLibrary):
         :param kwags:
         :return:
         """
+        yield self.status_writer.load()
         yield self._load_devices_from_database()
         yield self._load_device_commands()
         if self._States['loader.operating_mode'] == 'run':
-            self.mqtt = self._MQTT.new(mqtt_incoming_callback=self.mqtt_incoming, client_id='Yombo-devices-%s' %
-                                                                                            self.gateway_id)
+            self.mqtt = self._MQTT.new(client_id='Yombo-devices-%s' % self.gateway_id)
 
     def _started_(self, **kwargs):
         """
@@ -270,8 +278,10 @@ class Devices(YomboLibrary):
         self.clean_device_commands_loop.start(random_int(3600, .15))
 
         if self._States['loader.operating_mode'] == 'run':
-            self.mqtt.subscribe("yombo/devices/+/get")
-            self.mqtt.subscribe("yombo/devices/+/cmd")
+            self.mqtt.add_route("yombo/devices/+/get", self.mqtt_incoming_get)
+            self.mqtt.add_route("yombo/devices/+/get/+", self.mqtt_incoming_get)
+            self.mqtt.add_route("yombo/devices/+/cmd/+", self.mqtt_incoming_cmd)
+            self.mqtt.add_route("yombo/devices/+/cmd/+/+", self.mqtt_incoming_cmd)
 
     def _modules_started_(self, **kwargs):
         """
@@ -283,6 +293,16 @@ class Devices(YomboLibrary):
         for request_id, device_command in self.device_commands.items():
             device_command.start()
 
+    def _stop_(self, **kwargs):
+        """
+        Save any pending device statuses, before the database saves its bulk queue. Stops sending
+        delayed commands.
+
+        :return:
+        """
+        self.status_writer.stop()
+        self.device_commands.stop()
+
     def _unload_(self, **kwargs):
         """
         Save any device commands that need to be saved.
@@ -474,12 +494,15 @@ class Devices(YomboLibrary):
 
             self.devices[device_id].update_attributes(device, source)
 
-        try:
-            self._VoiceCommandsLibrary.add_by_string(device["voice_cmd"], None, device["id"],
-                                                     device["voice_cmd_order"])
-        except Exception:
-            logger.debug("Device {label} has an invalid voice_cmd {voice_cmd}", label=device["label"],
-                         voice_cmd=device["voice_cmd"])
+        if device_id in self.devices:
+            self.device_search_index.update(device_id, self.devices[device_id])
+
+        # VoiceCmds is lazy, only start it for devices that have a voice command. Until it's ready, this
+        # returns a Deferred, so errors arrive as a failure.
+        if device.get("voice_cmd"):
+            d = maybeDeferred(self._VoiceCommandsLibrary.add_by_string, device["voice_cmd"], None, device["id"],
+                              device["voice_cmd_order"])
+            d.addErrback(self.add_voice_cmd_failure, device)
 
         # logger.debug("_add_device: {device}", device=device)
         if import_state == 'update':
@@ -496,6 +519,10 @@ class Devices(YomboLibrary):
                 # if test_device:
         #            return self.devices[device_id]
 
+    def add_voice_cmd_failure(self, failure, device):
+        logger.debug("Device {label} has an invalid voice_cmd {voice_cmd}: {failure}", label=device["label"],
+                     voice_cmd=device["voice_cmd"], failure=failure.getErrorMessage())
+
     def import_device_failure(self, failure, device):
         print("ERRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRR")
         logger.error("Got failure while creating device instance for '{label}': {failure}", failure=failure,
@@ -515,28 +542,18 @@ class Devices(YomboLibrary):
         }
         device_commands = yield self._LocalDB.get_device_commands(where)
         for device_command in device_commands:
-            self.device_commands[device_command['request_id']] = Device_Command(device_command, self, start=False)
+            self.device_commands.add(Device_Command(device_command, self, start=False), newest=False)
         return None
 
     @inlineCallbacks
     def clean_device_commands(self):
         """
-        Remove old device command requests.
+        Remove device command requests that finished more than 'devices:device_command_keep_time' seconds
+        ago, unless the device still lists them as a recent command.
         :return: 
         """
-        cur_time = time()
-        for request_id in list(self.device_commands.keys()):
-            device_command = self.device_commands[request_id]
-            if device_command.finished_at is not None:
-                if device_command.finished_at > cur_time - (60*60*24):  # keep 45 minutes worth.
-                    found_dc = False
-                    for device_id, device in self.devices.items():
-                        if request_id in device.device_commands:
-                            found_dc = True
-                            break
-                    if found_dc is False:
-                        yield device_command.save_to_db()
-                        del self.device_commands[request_id]
+        for device_command in self.device_commands.pop_expired():
+            yield device_command.save_to_db()
 
         # Lets delete any device status after 60 days. Long term data should be in the statistics.
         self._LocalDB.cleanup_device_status(days=60)
@@ -548,8 +565,7 @@ class Devices(YomboLibrary):
         :param device_command:
         :return:
         """
-        self.device_commands[device_command.request_id] = device_command
-        self.device_commands.move_to_end(device_command.request_id, last=False)  # move to the front.
+        self.device_commands.add(device_command)
 
     def add_device_command(self, device_command):
         """
@@ -558,8 +574,7 @@ class Devices(YomboLibrary):
         :param device_command:
         :return:
         """
-        self.device_commands[device_command['request_id']] = Device_Command(device_command, self, start=True)
-        self.device_commands.move_to_end(device_command['request_id'], last=False)  # move to the front.
+        self.device_commands.add(Device_Command(device_command, self, start=True))
 
     def update_device_command(self, src_gateway_id, request_id, log_time, status, message):
         """
@@ -578,11 +593,8 @@ class Devices(YomboLibrary):
         :param dest_gateway_id:
         :return:
         """
-        results = []
-        for device_command_id, device_command in self.device_commands.items():
-            if device_command.device.gateway_id == dest_gateway_id:
-                results.append(device_command.asdict())
-        return results
+        return [device_command.asdict() for device_command in
+                self.device_commands.for_gateway(dest_gateway_id).values()]
 
     def get_delayed_commands(self):
         """
@@ -590,11 +602,7 @@ class Devices(YomboLibrary):
 
         :return: 
         """
-        items = {}
-        for request_id, device_command in self.device_commands.items():
-            if device_command.status == 'delayed':
-                items[request_id] = device_command
-        return items
+        return self.device_commands.with_status('delayed')
 
     def command(self, device, cmd, pin=None, request_id=None, not_before=None, delay=None, max_delay=None, requested_by=None, inputs=None, **kwargs):
         """
@@ -637,81 +645,95 @@ class Devices(YomboLibrary):
         """
         return self.get(device).command(cmd, pin, request_id, not_before, delay, max_delay, requested_by=requested_by, inputs=inputs, **kwargs)
 
-    def mqtt_incoming(self, topic, payload, qos, retain):
+    def mqtt_device(self, device_label):
+        """
+        Returns the device for an MQTT request, or None if not found. Device labels in topics can use '_'
+        in place of spaces.
+
+        :param device_label: Device level of the topic, a device id or machine label.
+        """
+        try:
+            return self.get(device_label.replace("_", " "))
+        except YomboDeviceError as e:
+            logger.info("Received MQTT request for a device that doesn't exist: %s" % device_label)
+            return None
+
+    def mqtt_payload(self, payload):
+        """
+        Decodes the payload of an incoming MQTT message: json, msgpack, or otherwise left as a string.
+        """
+        payload = payload.strip()
+        try:
+            return json.loads(payload)
+        except Exception as e:
+            try:
+                return msgpack.loads(payload)
+            except Exception as e:
+                return payload
+
+    def mqtt_publish_status(self, device, attribute=None):
+        """
+        Publish the status of a device, either all of it or a single attribute.
+        """
+        status = device.status_all
+        if attribute is None or attribute == 'all':
+            self.mqtt.publish('yombo/devices/%s/status' % device.machine_label, json.dumps(status),
+                              republish=True)
+        elif isinstance(attribute, str) and attribute in status:
+            self.mqtt.publish('yombo/devices/%s/status/%s' % (device.machine_label, attribute),
+                              str(status[attribute]), republish=True)
+
+    def mqtt_incoming_get(self, topic, payload, qos, retain, wildcards):
         """
-        Processing any incoming MQTT messages we have subscribed to. This allows IoT type connections
-        from various external sources.
+        Processing incoming MQTT get requests. This allows IoT type connections from various external sources.
 
         * yombo/devices/DEVICEID|DEVICEMACHINELABEL/get Value - Get some attribute
           * Value = state, human, machine, extra
+
+        :param topic:
+        :param payload: Optional, status attribute to return, or 'all'.
+        :param qos:
+        :param retain:
+        :param wildcards: The device, and the optional level after 'get'.
+        :return:
+        """
+        device = self.mqtt_device(wildcards[0])
+        if device is None:
+            return
+        if len(wildcards) == 2:
+            self.mqtt_publish_status(device, self.mqtt_payload(payload))
+        else:
+            self.mqtt_publish_status(device)
+
+    def mqtt_incoming_cmd(self, topic, payload, qos, retain, wildcards):
+        """
+        Processing incoming MQTT commands. This allows IoT type connections from various external sources.
+
         * yombo/devices/DEVICEID|DEVICEMACHINELABEL/cmd/CMDID|CMDMACHINELABEL Options - Send a command
           * Options - Either a string for a single variable, or json for multiple variables
 
-        Examples: /yombo/devices/get/christmas_tree/cmd/on
+        Examples: /yombo/devices/christmas_tree/cmd/on
 
         :param topic:
-        :param payload:
+        :param payload: Optional, status attribute to return after the command, or 'all'.
         :param qos:
         :param retain:
+        :param wildcards: The device, the command, and the optional level after the command.
         :return:
         """
-        #  0       1       2       3        4
-        # yombo/devices/DEVICEID/get|cmd/option
-        parts = topic.split('/', 10)
-        logger.info("Yombo Devices got this: {topic} : {parts}", topic=topic, parts=parts)
-        payload = payload.strip()
-        content_type = 'string'
+        device = self.mqtt_device(wildcards[0])
+        if device is None:
+            return
+        command = wildcards[1]
         try:
-            payload = json.loads(payload)
-            content_type = 'json'
+            device.command(cmd=command, reported_by='yombo.gateway.lib.devices.mqtt_incoming')
         except Exception as e:
-            try:
-                payload = msgpack.loads(payload)
-                content_type = 'msgpack'
-            except Exception as e:
-                pass
-
-        try:
-            device_label = self.get(parts[2].replace("_", " "))
-            device = self.get(device_label)
-        except YomboDeviceError as e:
-            logger.info("Received MQTT request for a device that doesn't exist: %s" % parts[2])
-            return
-
-        if parts[3] == 'get':
-            status = device.status_all
+            logger.warn("Device received invalid command request for command: %s  Reason: %s" % (command, e))
 
-            if len(parts) == 5:
-                if payload == 'all':
-                    self.mqtt.publish('yombo/devices/%s/status' % device.machine_label, json.dumps(device.status_all))
-                elif payload in status:
-                    self.mqtt.publish('yombo/devices/%s/status/%s' % (device.machine_label, payload), str(getattr(payload, status)))
-            else:
-                self.mqtt.publish('yombo/devices/%s/status' % device.machine_label,
-                                  json.dumps(device.status_all))
-
-        elif parts[3] == 'cmd':
-            try:
-                requested_by = {
-                    'user_id': 'Unknown',
-                    'component': 'yombo.gateway.lib.devices.mqtt_incoming',
-                    'gateway': 'Unknown'
-                }
-                device.command(cmd=parts[4], reported_by='yombo.gateway.lib.devices.mqtt_incoming')
-            except Exception as e:
-                logger.warn("Device received invalid command request for command: %s  Reason: %s" % (parts[4], e))
-
-            if len(parts) == 6:
-                status = device.status_all
-                if parts[4] == 'all':
-                    self.mqtt.publish('yombo/devices/%s/status' % device.machine_label,
-                                      json.dumps(device.status_all))
-                elif payload in status:
-                    self.mqtt.publish('yombo/devices/%s/status/%s' % (device.machine_label, payload),
-                                      str(getattr(payload, status)))
-            else:
-                self.mqtt.publish('yombo/devices/%s/status' % device.machine_label,
-                                  json.dumps(device.status_all))
+        if len(wildcards) == 3:
+            self.mqtt_publish_status(device, self.mqtt_payload(payload))
+        else:
+            self.mqtt_publish_status(device)
 
     def list_devices(self, field=None):
         """
@@ -791,6 +813,9 @@ class Devices(YomboLibrary):
                 raise KeyError("Requested device found, but has invalid status: %s" % item.status)
             return item
         else:
+            item = self.device_search_index.get_exact(device_requested, ('device_id', 'machine_label', 'label'))
+            if item is not None:
+                return item
             attrs = [
                 {
                     'field': 'device_id',
@@ -814,7 +839,8 @@ class Devices(YomboLibrary):
                                                                      self.devices,
                                                                      self.device_search_attributes,
                                                                      limiter=limiter,
-                                                                     operation="highest")
+                                                                     operation="highest",
+                                                                     index=self.device_search_index)
                 logger.debug("found ({found}) device by search: {device_id}, ratio: {ratio}",
                              found=found, device_id=key, ratio=ratio)
                 if found:
@@ -837,7 +863,8 @@ class Devices(YomboLibrary):
                                self.devices,
                                self.device_search_attributes,
                                _limiter,
-                               _operation)
+                               _operation,
+                               index=self.device_search_index)
         return others
 
     @inlineCallbacks
@@ -1056,6 +1083,7 @@ class Devices(YomboLibrary):
             pass
 
         del self.devices[device_id]
+        self.device_search_index.remove(device_id)
 
         results = {
             'status': 'success',
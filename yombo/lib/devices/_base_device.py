@@ -32,7 +32,7 @@ from yombo.core.log import get_logger
 from yombo.utils import random_string, global_invoke_all, do_search_instance
 from yombo.lib.commands import Command  # used only to determine class type
 from ._device_command import Device_Command
-from ._device_status import Device_Status
+from ._device_status import Device_Status, StatusHistory
 logger = get_logger('library.devices.device')
 
 class Base_Device(object):
@@ -106,7 +106,8 @@ class Base_Device(object):
             system to deliver commands and status update requests.
         :ivar created_at: *(int)* - When the device was created; in seconds since EPOCH.
         :ivar updated_at: *(int)* - When the device was last updated; in seconds since EPOCH.
-        :ivar status_history: *(dict)* - A dictionary of strings for current and up to the last 30 status values.
+        :ivar status_history: *(StatusHistory)* - The current and previous statuses, newest first. A deque of
+            Device_Status if devices:compact_status_history is disabled.
         :ivar device_variables_cached: *(dict)* - The device variables as defined by various modules, with
             values entered by the user.
         :ivar available_commands: *(list)* - A list of command_id's that are valid for this device.
@@ -153,10 +154,14 @@ class Base_Device(object):
         sizes = memory_sizing[self._Parent._Atoms['mem.sizing']]
         if device["gateway_id"] != _Parent.gateway_id:
             self.device_commands = deque({}, sizes['other_device_commands'])
-            self.status_history = deque({}, sizes['other_status_history'])
+            status_history_size = sizes['other_status_history']
         else:
             self.device_commands = deque({}, sizes['local_device_commands'])
-            self.status_history = deque({}, sizes['local_status_history'])
+            status_history_size = sizes['local_status_history']
+        if _Parent.compact_status_history is True:
+            self.status_history = StatusHistory(_Parent, self, status_history_size)
+        else:
+            self.status_history = deque({}, status_history_size)
 
         self.device_variables_cached = {}
         # self.device_variables = self.device_variables
@@ -229,13 +234,13 @@ class Base_Device(object):
 
     def _unload_(self, **kwargs):
         """
-        About to unload. Lets save all the device status items.
+        About to unload. Device statuses are saved by the devices library status writer, which has already
+        been stopped.
 
         :param kwargs:
         :return:
         """
-        for status in self.status_history:
-            status.save_to_db()
+        pass
 
     @inlineCallbacks
     def device_variables(self):
@@ -317,6 +322,8 @@ class Base_Device(object):
             else:
                 self.energy_map = None
 
+        self._Parent.device_search_index.refresh(self.device_id)
+
         if self.device_is_new is True:
             global_invoke_all('_device_updated_',
                               called_by=self,
@@ -344,30 +351,38 @@ class Base_Device(object):
     def commands_pending(self, criteria = None, limit = None):
         device_commands = self._Parent.device_commands
         results = OrderedDict()
+        if criteria is None:
+            for id, DC in device_commands.for_device(self.device_id).items():
+                if DC.status in ('sent', 'received', 'pending'):
+                    results[id] = DC
+                    if limit is not None and len(results) == limit:
+                        break
+            return results
+
+        if 'status' in criteria:  # Start with the status index instead of every command.
+            if isinstance(criteria['status'], list):
+                device_commands = device_commands.with_status(*criteria['status'])
+            else:
+                device_commands = device_commands.with_status(criteria['status'])
         for id, DC in device_commands.items():
             # print("DC: %s"  % DC.__dict__)
-            if criteria is None:
-                if DC.device.device_id == self.device_id:
-                    if DC.status in ('sent', 'received', 'pending'):
-                        results[id] = DC
-            else:
-                matches = True
-                for key, value in criteria.items():
-                    # print("commands_pending testing criteria: %s: %s" % (key, value))
-                    if hasattr(DC, key):
-                        test_value = getattr(DC, key)
-                        # print("test_value: %s" % test_value)
-                        if isinstance(value, list):
-                            # print("got a list.. %s" % value)
-                            if test_value not in value:
-                                matches = False
-                                break
-                        else:
-                            if test_value != value:
-                                matches = False
-                                break
-                if matches:
-                    results[id] = DC
+            matches = True
+            for key, value in criteria.items():
+                # print("commands_pending testing criteria: %s: %s" % (key, value))
+                if hasattr(DC, key):
+                    test_value = getattr(DC, key)
+                    # print("test_value: %s" % test_value)
+                    if isinstance(value, list):
+                        # print("got a list.. %s" % value)
+                        if test_value not in value:
+                            matches = False
+                            break
+                    else:
+                        if test_value != value:
+                            matches = False
+                            break
+            if matches:
+                results[id] = DC
 
             if limit is not None and len(results) == limit:
                 return results
@@ -547,8 +562,9 @@ class Base_Device(object):
         device_command['persistent_request_id'] = persistent_request_id
 
         if persistent_request_id is not None:  # cancel any previous device requests for this persistent id.
-            for search_request_id, search_device_command in self._Parent.device_commands.items():
-                if search_device_command.persistent_request_id == persistent_request_id:
+            device_commands = self._Parent.device_commands.for_persistent_id(persistent_request_id)
+            for search_request_id, search_device_command in device_commands.items():
+                if not search_device_command.is_finished():
                     search_device_command.cancel(message="This device command was superseded by a new persistent request.")
 
         if request_id is None:
@@ -573,7 +589,7 @@ class Base_Device(object):
                 # if isinstance(not_before, int) or isinstance(not_before, float):
                 if not_before < cur_time:
                     raise YomboWarning("'not_before' time should be epoch second in the future, not the past. Got: %s" % not_before)
-                device_command['not_before_time'] = not_before
+                device_command['not_before_at'] = not_before
 
             elif delay is not None:
                 if isinstance(delay, str):
@@ -584,7 +600,7 @@ class Base_Device(object):
                 # if isinstance(not_before, int) or isinstance(not_before, float):
                 if delay < 0:
                     raise YomboWarning("'not_before' time should be epoch second in the future, not the past.")
-                device_command['not_before_time'] = cur_time + delay
+                device_command['not_before_at'] = cur_time + delay
 
             # determine how late the command can be run. This happens is the gateway was turned off
             if not_after is not None:
@@ -594,9 +610,9 @@ class Base_Device(object):
                     except:
                         raise YomboWarning("'not_after' time should be epoch second in the future after not_before as an int, float, or parsable string.")
                 if isinstance(not_after, int) or isinstance(not_after, float):
-                    if not_after < device_command['not_before_time']:
+                    if not_after < device_command['not_before_at']:
                         raise YomboWarning("'not_after' must occur after 'not_before (or current time + delay)")
-                device_command['not_after_time'] = not_after
+                device_command['not_after_at'] = not_after
             elif max_delay is not None:
                 # todo: try to convert if it's not. Make a util helper for this, occurs a lot!
                 if isinstance(max_delay, str):
@@ -607,7 +623,7 @@ class Base_Device(object):
                 if isinstance(max_delay, int) or isinstance(max_delay, float):
                     if max_delay < 0:
                         raise YomboWarning("'max_delay' must be positive only.")
-                device_command['not_after_time'] = device_command['not_before_time'] + max_delay
+                device_command['not_after_at'] = device_command['not_before_at'] + max_delay
 
         device_command['params'] = kwargs.get('params', None)
         if inputs is None:
@@ -1097,7 +1113,8 @@ class Base_Device(object):
         self._Parent.check_trigger(self.device_id, new_status)
 
         if self._Parent.mqtt != None:
-            self._Parent.mqtt.publish("yombo/devices/%s/status" % self.machine_label, json.dumps(mqtt_message), 1)
+            self._Parent.mqtt.publish("yombo/devices/%s/status" % self.machine_label, json.dumps(mqtt_message), 1,
+                                      republish=True)
         return kwargs, new_status['status_id']
 
     def set_status_from_gateway_communications(self, payload):
@@ -1214,8 +1231,12 @@ class Base_Device(object):
         }
         records = yield self._Parent._Libraries['LocalDB'].get_device_status(where, limit=limit)
         if len(records) > 0:
-            for record in records:
-                self.status_history.appendleft(Device_Status(self._Parent, self, record, source='database'))
+            if isinstance(self.status_history, StatusHistory):
+                for record in records:
+                    self.status_history.appendleft_record(record)
+            else:
+                for record in records:
+                    self.status_history.appendleft(Device_Status(self._Parent, self, record, source='database'))
 
     @inlineCallbacks
     def load_device_commands_history(self, limit=40):
@@ -1236,7 +1257,7 @@ class Base_Device(object):
         if len(records) > 0:
             for record in records:
                 if record['request_id'] not in self._Parent.device_commands:
-                    self._Parent.add_device_command_by_object(Device_Command(record, self, start=False))
+                    self._Parent.add_device_command_by_object(Device_Command(record, self._Parent, start=False))
 
     def validate_command(self, command_requested):
         available_commands = self.available_commands()
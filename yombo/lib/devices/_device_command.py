@@ -15,6 +15,7 @@ The device class is responsible for managing a single device.
 """
 # Import python libraries
 from collections import OrderedDict
+from heapq import heappush, heappop
 from time import time
 
 # Import twisted libraries
@@ -38,6 +39,7 @@ class Device_Command(object):
     status_ids = {
         'unknown': 0,
         'new': 10,
+        'delayed': 15,
         'accepted': 20,
         'broadcast': 30,
         'sent': 40,
@@ -46,6 +48,7 @@ class Device_Command(object):
         'done': 100,
         'canceled': 200,
         'failed': 220,
+        'delay_expired': 230,
         'expired': 240,
     }
 
@@ -63,8 +66,8 @@ class Device_Command(object):
     def status_id(self, val):
         for key, key_id in self.status_ids.items():
             if key_id == val:
-                self._status = key
-                break
+                self.status = key
+                return
         raise Exception("Invalid status_id: %s" % val)
 
     @property
@@ -73,6 +76,12 @@ class Device_Command(object):
 
     @status.setter
     def status(self, val):
+        old_status = self._status
+        self._set_status(val)
+        if self._status != old_status and self._registered:
+            self._Parent.device_commands.status_changed(self, old_status)
+
+    def _set_status(self, val):
         try:
 #            logger.info("status setter1: {val}", val=val)
             status = val.lower()
@@ -98,6 +107,7 @@ class Device_Command(object):
         """
         # print("new device_comamnd: %s" % data)
         self._status = 0
+        self._registered = False  # Set by the devices library once the command is tracked.
         self._Parent = parent
         self.source_gateway_id = data.get('source_gateway_id', self._Parent.gateway_id)
         self.local_gateway_id = self._Parent.gateway_id
@@ -133,7 +143,6 @@ class Device_Command(object):
         self.not_before_at = data.get('not_before_at', None)
         self.not_after_at = data.get('not_after_at', None)
         self.pin = data.get('pin', None)
-        self.call_later = None
         self.created_at = data.get('created_at', time())
         self._dirty = is_true_false(data.get('dirty', True))
         self._source = data.get('_source', None)
@@ -218,8 +227,8 @@ class Device_Command(object):
                 if when < 0:
                     self.device._do_command_hook(self)
                 else:
-                    self.call_later = reactor.callLater(when, self.device._do_command_hook, self)
                     self.set_status('delayed')
+                    self._Parent.device_commands.schedule(self)
                 return True
         else:
             if self._source == 'database':  # Nothing should be loaded from the database that not a delayed command.
@@ -229,6 +238,12 @@ class Device_Command(object):
                 self.device._do_command_hook(self)
                 return True
 
+    def is_finished(self):
+        """
+        Returns True if the command is done, canceled, failed, or expired.
+        """
+        return self.status_ids.get(self._status, 0) >= 100
+
     def last_message(self):
         return self.history[-1]
 
@@ -302,11 +317,6 @@ class Device_Command(object):
         if message is None:
             message = "Finished."
         self.history.append((finished_at, self.status, message, self.local_gateway_id))
-
-        try:
-            self.call_later.cancel()
-        except:
-            pass
         self.save_to_db()
 
     def set_canceled(self, finished_at=None, message=None):
@@ -401,3 +411,232 @@ class Device_Command(object):
 
     def __repr__(self):
         return "Device command for '%s': %s" % (self.device.label, self.command.label)
+
+
+class DeviceCommandRegistry(object):
+    """
+    Tracks device commands, newest first, for the devices library. Besides the request_id lookup, commands are
+    indexed by status, by the gateway the device belongs to, by device, and by persistent request id. Indexes are
+    updated by Device_Command when its status changes.
+
+    Two heaps keep things ordered by time, so no one has to look at every command:
+
+      * Delayed commands, by when they should be sent. A single reactor call fires the next one.
+      * Finished commands, by when they can be removed from memory.
+
+    :ivar commands: (OrderedDict) request_id -> Device_Command, newest first.
+    :ivar by_status: (dict) status -> {request_id: Device_Command}
+    :ivar by_gateway: (dict) gateway_id -> {request_id: Device_Command}
+    :ivar by_device: (dict) device_id -> {request_id: Device_Command}
+    :ivar by_persistent_id: (dict) persistent_request_id -> {request_id: Device_Command}
+    :ivar keep_finished: (int) Seconds to keep finished commands in memory.
+    """
+    def __init__(self, keep_finished=2700):
+        self.commands = OrderedDict()
+        self.by_status = {}
+        self.by_gateway = {}
+        self.by_device = {}
+        self.by_persistent_id = {}
+        self.keep_finished = keep_finished
+        self._delayed = []
+        self._delayed_at = {}
+        self._delayed_call = None
+        self._expires = []
+
+    def __contains__(self, request_id):
+        return request_id in self.commands
+
+    def __getitem__(self, request_id):
+        return self.commands[request_id]
+
+    def __iter__(self):
+        return iter(self.commands)
+
+    def __len__(self):
+        return len(self.commands)
+
+    def get(self, request_id, default=None):
+        return self.commands.get(request_id, default)
+
+    def keys(self):
+        return self.commands.keys()
+
+    def values(self):
+        return self.commands.values()
+
+    def items(self):
+        return self.commands.items()
+
+    def add(self, device_command, newest=True):
+        """
+        Start tracking a device command.
+
+        :param device_command: The Device_Command instance.
+        :param newest: If True (default), the command is put first, otherwise last.
+        """
+        request_id = device_command.request_id
+        if request_id in self.commands:
+            self.remove(request_id)
+        self.commands[request_id] = device_command
+        device_command._registered = True
+        if newest:
+            self.commands.move_to_end(request_id, last=False)
+        self.by_status.setdefault(device_command.status, {})[request_id] = device_command
+        self.by_gateway.setdefault(device_command.device.gateway_id, {})[request_id] = device_command
+        self.by_device.setdefault(device_command.device.device_id, {})[request_id] = device_command
+        if device_command.persistent_request_id is not None:
+            self.by_persistent_id.setdefault(device_command.persistent_request_id, {})[request_id] = device_command
+        if device_command.is_finished():
+            self._push_expires(device_command)
+
+    def remove(self, request_id):
+        """
+        Stop tracking a device command. Entries left in the heaps are skipped when they come up.
+
+        :raises KeyError: Raised when the request_id is not found.
+        """
+        device_command = self.commands.pop(request_id)
+        device_command._registered = False
+        self._delayed_at.pop(request_id, None)
+        self._unindex(self.by_status, device_command.status, request_id)
+        self._unindex(self.by_gateway, device_command.device.gateway_id, request_id)
+        self._unindex(self.by_device, device_command.device.device_id, request_id)
+        if device_command.persistent_request_id is not None:
+            self._unindex(self.by_persistent_id, device_command.persistent_request_id, request_id)
+        return device_command
+
+    @staticmethod
+    def _unindex(index, key, request_id):
+        found = index.get(key)
+        if found is None:
+            return
+        found.pop(request_id, None)
+        if len(found) == 0:
+            del index[key]
+
+    def status_changed(self, device_command, old_status):
+        """
+        Called by Device_Command when its status changes.
+        """
+        request_id = device_command.request_id
+        if self.commands.get(request_id) is not device_command:
+            return
+        self._unindex(self.by_status, old_status, request_id)
+        self.by_status.setdefault(device_command.status, {})[request_id] = device_command
+        if device_command.is_finished():
+            self._push_expires(device_command)
+
+    def with_status(self, *statuses):
+        """
+        Returns the commands having any of the statuses provided.
+
+        :return: A dictionary of request_id -> Device_Command.
+        """
+        results = {}
+        for status in statuses:
+            results.update(self.by_status.get(status, {}))
+        return results
+
+    def for_gateway(self, gateway_id):
+        """
+        Returns the commands for devices that belong to a gateway.
+        """
+        return dict(self.by_gateway.get(gateway_id, {}))
+
+    def for_device(self, device_id):
+        """
+        Returns the commands for a device, newest first.
+        """
+        return OrderedDict(reversed(list(self.by_device.get(device_id, {}).items())))
+
+    def for_persistent_id(self, persistent_request_id):
+        """
+        Returns the commands sharing a persistent request id.
+        """
+        return dict(self.by_persistent_id.get(persistent_request_id, {}))
+
+    def status_counts(self, in_flight=False):
+        """
+        Returns the number of commands for each status.
+
+        :param in_flight: If True, only statuses of commands that haven't finished.
+        :return: A dictionary of status -> count.
+        """
+        status_ids = Device_Command.status_ids
+        return {status: len(found) for status, found in self.by_status.items()
+                if in_flight is False or status_ids.get(status, 0) < 100}
+
+    def schedule(self, device_command):
+        """
+        Sends a delayed command to the device when its not_before_at time arrives.
+        """
+        self._delayed_at[device_command.request_id] = device_command.not_before_at
+        heappush(self._delayed, (device_command.not_before_at, device_command.request_id))
+        self._schedule_next()
+
+    def _schedule_next(self):
+        if len(self._delayed) == 0:
+            return
+        when = max(self._delayed[0][0] - time(), 0)
+        if self._delayed_call is not None and self._delayed_call.active():
+            if self._delayed_call.getTime() <= reactor.seconds() + when:
+                return
+            self._delayed_call.cancel()
+        self._delayed_call = reactor.callLater(when, self.send_delayed)
+
+    def send_delayed(self):
+        """
+        Sends delayed commands that are due. Commands that were canceled or already sent are skipped.
+        """
+        self._delayed_call = None
+        cur_time = time()
+        delayed = self._delayed
+        while len(delayed) > 0 and delayed[0][0] <= cur_time:
+            not_before_at, request_id = heappop(delayed)
+            if self._delayed_at.get(request_id) != not_before_at:
+                continue
+            del self._delayed_at[request_id]
+            device_command = self.commands.get(request_id)
+            if device_command is None or device_command.status != 'delayed':
+                continue
+            device_command.device._do_command_hook(device_command)
+        self._schedule_next()
+
+    def _push_expires(self, device_command):
+        finished_at = device_command.finished_at
+        if finished_at is None:
+            finished_at = time()
+        heappush(self._expires, (finished_at + self.keep_finished, device_command.request_id))
+
+    def pop_expired(self, cur_time=None):
+        """
+        Returns the finished commands that have been kept long enough, and removes them. Commands still listed
+        in their device's recent commands are kept for another keep_finished seconds.
+
+        :return: A list of Device_Command.
+        """
+        if cur_time is None:
+            cur_time = time()
+        expired = []
+        keep = []
+        expires = self._expires
+        while len(expires) > 0 and expires[0][0] <= cur_time:
+            request_id = heappop(expires)[1]
+            device_command = self.commands.get(request_id)
+            if device_command is None or not device_command.is_finished():
+                continue
+            if request_id in device_command.device.device_commands:
+                keep.append((cur_time + self.keep_finished, request_id))
+                continue
+            expired.append(self.remove(request_id))
+        for item in keep:
+            heappush(expires, item)
+        return expired
+
+    def stop(self):
+        """
+        Cancel the call for the next delayed command.
+        """
+        if self._delayed_call is not None and self._delayed_call.active():
+            self._delayed_call.cancel()
+        self._delayed_call = None
@@ -7,7 +7,9 @@
   For development guides see: `Devices @ Module Development <https://yombo.net/docs/libraries/devices>`_
 
 
-The device status class manages a single status entry for a device.
+The device status class manages a single status entry for a device. The device status writer saves new and
+changed device statuses to the database. The status history keeps a fixed number of recent statuses for a
+device as compact records, creating device status instances only when they are asked for.
 
 .. moduleauthor:: Mitch Schwenk <mitch-gw@yombo.net>
 
@@ -17,20 +19,76 @@ The device status class manages a single status entry for a device.
 # Import python libraries
 from collections import OrderedDict
 from time import time
+import weakref
 
 # Import twisted libraries
-from twisted.internet import reactor
 from twisted.internet.defer import inlineCallbacks
+from twisted.internet.task import LoopingCall
 
 # Import Yombo libraries
 from yombo.core.log import get_logger
 from yombo.utils import random_string, data_pickle
 logger = get_logger('library.devices.device')
 
+class RecordField(object):
+    """
+    A Device_Status attribute that's also stored in a :py:class:`StatusRecord`. If the status is in a
+    :py:class:`StatusHistory`, changes are also written to it's record, so they are kept after the instance is
+    gone. Other attributes are set as usual.
+    """
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        try:
+            return instance.__dict__[self.name]
+        except KeyError:
+            raise AttributeError(self.name)
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.name] = value
+        record = instance.__dict__.get('_record')
+        if record is not None:
+            setattr(record, self.name, value)
+
+
+class CommandField(RecordField):
+    """
+    The command of a Device_Status, its record only keeps the command_id.
+    """
+    __slots__ = ()
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.name] = value
+        record = instance.__dict__.get('_record')
+        if record is not None:
+            record.command_id = None if value is None else value.command_id
+
+
 class Device_Status(object):
     """
     The device status class represents a single status data point for a device.
     """
+    # Attributes kept in a StatusRecord, see StatusRecord.fields.
+    command = CommandField('command')
+    status_id = RecordField('status_id')
+    gateway_id = RecordField('gateway_id')
+    set_at = RecordField('set_at')
+    energy_usage = RecordField('energy_usage')
+    energy_type = RecordField('energy_type')
+    human_status = RecordField('human_status')
+    human_message = RecordField('human_message')
+    machine_status = RecordField('machine_status')
+    machine_status_extra = RecordField('machine_status_extra')
+    requested_by = RecordField('requested_by')
+    reported_by = RecordField('reported_by')
+    request_id = RecordField('request_id')
+    uploaded = RecordField('uploaded')
+    uploadable = RecordField('uploadable')
 
     def __str__(self):
         """
@@ -89,28 +147,16 @@ class Device_Status(object):
         self.uploadable = None
         self.fake_data = False
 
+        # The status writer tracks which statuses are in the database, no need to look it up.
         if self._source == 'database':
-            self._dirty = False
             self._in_db = True
-        else: # includes 'gateway_coms'
-            self._dirty = True
-            self._in_db = False
-            reactor.callLater(1, self.check_if_device_status_in_database)
+            self._Parent.status_writer.saved(self.status_id)
+        else: # includes 'gateway_coms' and 'history'
+            self._in_db = self.status_id in self._Parent.status_writer
 
-        # print("device status: in db: %s, dirty: %s" % (self._in_db, self._dirty))
         self.update_attributes(data, source='self')
-        reactor.callLater(1, self.save_to_db)
-
-    @inlineCallbacks
-    def check_if_device_status_in_database(self):
-        where = {
-            'status_id': self.status_id,
-        }
-        device_status = yield self._Parent._LocalDB.get_device_status(where)
-        # print("check_if_device_status_in_database: %s" % device_status)
-        if len(device_status) > 0:
-            self._in_db = True
-            self.save_to_db()
+        if self._source in ('database', 'history'):
+            self._dirty = False
 
     def update_attributes(self, device, source=None):
         """
@@ -162,7 +208,8 @@ class Device_Status(object):
         if 'fake_data' in device:
             self.fake_data = device["fake_data"]
         self._dirty = True
-        reactor.callLater(1, self.save_to_db)
+        if self._source not in ('database', 'history') and self.fake_data is not True:
+            self._Parent.status_writer.add(self)
 
     def asdict(self):
         """
@@ -215,3 +262,198 @@ class Device_Status(object):
                 self._Parent._LocalDB.add_bulk_queue('device_status', 'insert', data, 'status_id')
             self._dirty = False
             self._in_db = True
+            self._Parent.status_writer.saved(self.status_id)
+
+
+class DeviceStatusWriter(object):
+    """
+    Saves new and changed device statuses. Instead of each device status setting timers and checking the database
+    to see if it already exists, statuses are collected and saved by a single looping call. The status ids
+    already in the database are tracked in a set, loaded once at startup.
+
+    :ivar in_db: (set) Status ids that are in the database.
+    :ivar pending: (OrderedDict) status_id -> Device_Status, statuses waiting to be saved.
+    """
+    def __init__(self, _Parent, interval=1):
+        self._Parent = _Parent
+        self.interval = interval
+        self.in_db = set()
+        self.pending = OrderedDict()
+        self.save_loop = LoopingCall(self.save)
+
+    def __contains__(self, status_id):
+        return status_id in self.in_db
+
+    def __len__(self):
+        return len(self.pending)
+
+    @inlineCallbacks
+    def load(self):
+        """
+        Loads the status ids that are in the database and starts the looping call.
+        """
+        status_ids = yield self._Parent._LocalDB.get_device_status_ids()
+        self.in_db.update(status_ids)
+        if self.save_loop.running is False:
+            self.save_loop.start(self.interval, False)
+
+    def stop(self):
+        """
+        Stops the looping call and saves anything pending.
+        """
+        if self.save_loop.running:
+            self.save_loop.stop()
+        self.save()
+
+    def add(self, device_status):
+        """
+        Queue a device status to be saved.
+        """
+        self.pending[device_status.status_id] = device_status
+
+    def saved(self, status_id):
+        """
+        Called when a status has been sent to the database.
+        """
+        self.in_db.add(status_id)
+
+    def save(self):
+        """
+        Sends all pending statuses to the database bulk queue.
+        """
+        if len(self.pending) == 0:
+            return
+        pending = self.pending
+        self.pending = OrderedDict()
+        for device_status in pending.values():
+            device_status.save_to_db()
+        self._Parent._Statistics.increment("lib.devices.status.saved", len(pending), bucket_size=60, anon=True)
+
+
+class StatusRecord(object):
+    """
+    The data of a single device status, without any references to the device or parent library. Used by
+    :py:class:`StatusHistory`.
+    """
+    __slots__ = ('status_id', 'command_id', 'gateway_id', 'set_at', 'energy_usage', 'energy_type',
+                 'human_status', 'human_message', 'machine_status', 'machine_status_extra', 'requested_by',
+                 'reported_by', 'request_id', 'uploaded', 'uploadable', 'view')
+    fields = frozenset(__slots__) - {'view', 'command_id'}  # Device_Status attributes copied to the record.
+
+    def __init__(self, data):
+        self.status_id = data['status_id']
+        self.command_id = data.get('command_id')
+        self.gateway_id = data.get('gateway_id')
+        self.set_at = data.get('set_at')
+        self.energy_usage = data.get('energy_usage')
+        self.energy_type = data.get('energy_type')
+        self.human_status = data.get('human_status')
+        self.human_message = data.get('human_message')
+        self.machine_status = data.get('machine_status')
+        self.machine_status_extra = data.get('machine_status_extra')
+        self.requested_by = data.get('requested_by')
+        self.reported_by = data.get('reported_by')
+        self.request_id = data.get('request_id')
+        self.uploaded = data.get('uploaded')
+        self.uploadable = data.get('uploadable')
+        self.view = None
+
+    def asdict(self):
+        return {
+            'status_id': self.status_id,
+            'command_id': self.command_id,
+            'gateway_id': self.gateway_id,
+            'set_at': self.set_at,
+            'energy_usage': self.energy_usage,
+            'energy_type': self.energy_type,
+            'human_status': self.human_status,
+            'human_message': self.human_message,
+            'machine_status': self.machine_status,
+            'machine_status_extra': self.machine_status_extra,
+            'requested_by': self.requested_by,
+            'reported_by': self.reported_by,
+            'request_id': self.request_id,
+            'uploaded': self.uploaded,
+            'uploadable': self.uploadable,
+        }
+
+
+class StatusHistory(object):
+    """
+    A fixed size ring buffer of device statuses, newest first. Used in place of a deque of
+    :py:class:`Device_Status` instances, and supports the same parts of the deque API: appendleft(), len(),
+    indexing, and iteration.
+
+    Statuses are stored as :py:class:`StatusRecord` instances. A Device_Status is created from a record only when
+    it's asked for, and is kept (by weak reference) while something is still using it. Changes made to it are
+    written to the record as well.
+
+    :ivar maxlen: (int) Maximum number of statuses kept.
+    """
+    def __init__(self, _Parent, device, maxlen):
+        self._Parent = _Parent
+        self.device = device
+        self.maxlen = maxlen
+        self._records = [None] * maxlen
+        self._head = 0  # position of the newest record
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def __bool__(self):
+        return self._length > 0
+
+    def __getitem__(self, index):
+        return self._view(self._record(index))
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield self._view(self._record(index))
+
+    def _record(self, index):
+        if index < 0:
+            index += self._length
+        if index < 0 or index >= self._length:
+            raise IndexError("status history index out of range")
+        return self._records[(self._head + index) % self.maxlen]
+
+    def _view(self, record):
+        if record.view is not None:
+            device_status = record.view()
+            if device_status is not None:
+                return device_status
+        device_status = Device_Status(self._Parent, self.device, record.asdict(), source='history')
+        device_status._record = record
+        record.view = weakref.ref(device_status)
+        return device_status
+
+    def _add(self, record):
+        if self.maxlen == 0:
+            return
+        self._head = (self._head - 1) % self.maxlen
+        self._records[self._head] = record
+        if self._length < self.maxlen:
+            self._length += 1
+
+    def appendleft(self, device_status):
+        """
+        Add a new status as the newest.
+
+        :param device_status: A Device_Status instance.
+        """
+        record = StatusRecord(device_status.asdict())
+        device_status._record = record
+        record.view = weakref.ref(device_status)
+        self._add(record)
+
+    def appendleft_record(self, data):
+        """
+        Add a status from a dictionary, such as a database record, without creating a Device_Status.
+        """
+        self._add(StatusRecord(data))
+
+    def clear(self):
+        self._records = [None] * self.maxlen
+        self._head = 0
+        self._length = 0
@@ -13,6 +13,12 @@ Slave gateways will connect to it's master's mqtt broker. All slave gateways wil
 atoms to the master. Scenes and automation rules can fire on any gateway, however, if status is required from
 a remote gateway, that automation rule should only fire on the master server.
 
+Atoms and states are synced using versions. On startup, a gateway sends all of it's atoms and states once, and asks
+the other gateways for theirs. After that, changes are collected for 'gateways:sync_window' seconds (default 1) and
+sent as one message. Each message includes the version it starts from, if a gateway missed a message it asks for
+the changes since the last version it has. Versions restart when a gateway restarts, so each start uses a new
+epoch, a random id sent with each message.
+
 .. moduleauthor:: Mitch Schwenk <mitch-gw@yombo.net>
 .. versionadded:: 0.14.0
 
@@ -21,11 +27,9 @@ a remote gateway, that automation rule should only fire on the master server.
 :view-source: `View Source Code <https://yombo.net/Docs/gateway/html/current/_modules/yombo/lib/gateways.html>`_
 """
 from collections import deque
-import msgpack
 from time import time
 import socket
 import traceback
-import zlib
 
 # Import twisted libraries
 from twisted.internet.defer import inlineCallbacks, maybeDeferred
@@ -35,11 +39,15 @@ from twisted.internet import reactor
 from yombo.core.exceptions import YomboWarning
 from yombo.core.library import YomboLibrary
 from yombo.core.log import get_logger
-from yombo.utils import do_search_instance, global_invoke_all, bytes_to_unicode, random_int, sleep
+from yombo.utils import do_search_instance, global_invoke_all, random_string, sleep
+from yombo.utils.framing import pack, unpack, is_frame, legacy_pack, legacy_unpack, get_compression, FRAME_VERSION
 from yombo.core.constants import VERSION
 
 logger = get_logger('library.gateways')
 
+SYNC_COMPONENTS = ('atoms', 'states')  # Sent to other gateways as versioned changes, see send_sync().
+SYNC_FIELDS = ('gateway_id', 'value', 'value_human', 'value_type', 'created_at', 'updated_at')
+
 class Gateways(YomboLibrary):
     """
     Manages information about gateways.
@@ -174,6 +182,16 @@ class Gateways(YomboLibrary):
         self.is_master = self._Configs.get('core', 'is_master', True, False)
         self.master_gateway = self._Configs.get2('core', 'master_gateway', None, False)
         self.account_mqtt_key = self._Configs.get('core', 'account_mqtt_key', 'test', False)
+        self.sync_epoch = random_string(length=12)  # New each start, tells other gateways our versions restarted.
+        self.sync_window = float(self._Configs.get('gateways', 'sync_window', 1, False))
+        self.sync_sent = {component: 0 for component in SYNC_COMPONENTS}  # Last version sent to all gateways.
+        self.sync_requested = {}  # (gateway_id, component) -> when changes were last requested from a gateway.
+        self.sync_call = None
+        self.traffic = {}  # gateway_id, or 'all' for messages to every gateway -> bytes and messages
+        self.compression = get_compression(self._Configs.get('gateways', 'compression', 'zlib_dict', False))
+        self.compression_level = int(self._Configs.get('gateways', 'compression_level', 3, False))
+        # 'auto': frames only to gateways known to read them, 'frame': always, 'legacy': never.
+        self.frame_format = self._Configs.get('gateways', 'frame_format', 'auto', False)
         # self.load_deferred = None  # Prevents loader from moving on past _load_ until we are done.
         self.gateway_search_attributes = ['gateway_id', 'gateway_id', 'label', 'machine_label', 'status']
         # self.load_deferred = Deferred()
@@ -244,20 +262,21 @@ class Gateways(YomboLibrary):
         self.library_phase = 3
         if self._States['loader.operating_mode'] != 'run':
             return
-        self.mqtt = self._MQTT.new(mqtt_incoming_callback=self.mqtt_incoming,
-                                   client_id='Yombo-gateways-%s' % self.gateway_id)
-        self.mqtt.subscribe("ybo_gw_req/+/all/#")
-        self.mqtt.subscribe("ybo_gw_req/+/%s/#" % self.gateway_id)
-        self.mqtt.subscribe("ybo_gw/+/all/#")
-        self.mqtt.subscribe("ybo_gw/+/%s/#" % self.gateway_id)
+        self.mqtt = self._MQTT.new(client_id='Yombo-gateways-%s' % self.gateway_id)
+        self.mqtt.add_route("ybo_gw_req/+/all/#", self.mqtt_gateway_request)
+        self.mqtt.add_route("ybo_gw_req/+/%s/#" % self.gateway_id, self.mqtt_gateway_request)
+        self.mqtt.add_route("ybo_gw/+/all/#", self.mqtt_gateway_data)
+        self.mqtt.add_route("ybo_gw/+/%s/#" % self.gateway_id, self.mqtt_gateway_data)
+        self._Atoms.subscribe('#', self.atoms_changed, gateway_id=self.gateway_id)
+        self._States.subscribe('#', self.states_changed, gateway_id=self.gateway_id)
 
     def _started_(self, **kwargs):
         self.library_phase = 4
         if self._States['loader.operating_mode'] != 'run':
             return
-        self.publish_data("all", "lib/gateways/online", "")
+        self.publish_data("all", "lib/gateways/online", "", republish=True)
         # print("!!!!!!!!!!!!!!!!!!gateways started!!!!!!!!!!!!!!!!1")
-        reactor.callLater(5, self.send_all_info, set_ok_to_publish_updates=True)
+        reactor.callLater(5, self.start_sync)
 
         # self.test_send()
 
@@ -292,41 +311,46 @@ class Gateways(YomboLibrary):
                     self.gateways[self.gateway_id] = value
 
     def encrypt(self, data, destination_gateway_id=None):
-        data = msgpack.packb(data)
-        if len(data) > 800:
-            # beforeZlib = len(data)
-            data = zlib.compress(data, 3)  # 3 appears to be the best speed/compression ratio
-            # afterZlib = len(data)
-            # print("compression percent: %s -> %s : %s" % (beforeZlib, afterZlib, percentage(afterZlib, beforeZlib)))
-            content_encoding = "zlib"
-        else:
-            content_encoding = "none"
-
+        """
+        Packs a message for other gateways, see :py:mod:`yombo.utils.framing`. Compression is set by
+        'gateways:compression' and 'gateways:compression_level'. Gateways that can't read frames get the
+        legacy format, see :py:meth:`send_frames`.
+        """
         if destination_gateway_id is None:
             destination_gateway_id = 'all'
-        message = {
-            'payload': data,
-            'time_sent': time(),
-            'content_encoding': content_encoding,
-            'source_gateway_id': self.gateway_id,
-            'destination_gateway_id': destination_gateway_id,
-        }
+        if self.send_frames(destination_gateway_id):
+            return pack(data, self.gateway_id, destination_gateway_id, self.compression, self.compression_level)
+        return legacy_pack(data, self.gateway_id, destination_gateway_id)
+
+    def send_frames(self, destination_gateway_id):
+        """
+        Returns True if messages to the destination can be frames. Set by 'gateways:frame_format': 'frame' to
+        always send frames, 'legacy' to never send them, or 'auto' (default) to send frames only to gateways
+        that have sent us a message showing they read them. Messages to 'all' are frames only once every other
+        gateway reads them.
 
-        return msgpack.packb(message)
+        :param destination_gateway_id: Gateway id, or 'all'.
+        """
+        if self.frame_format == 'frame':
+            return True
+        if self.frame_format == 'legacy':
+            return False
+        if destination_gateway_id == 'all':
+            peers = [gateway for gateway_id, gateway in self.gateways.items()
+                     if isinstance(gateway, Gateway) and gateway_id not in (self.gateway_id, 'local')]
+        elif destination_gateway_id in self.gateways:
+            peers = [self.gateways[destination_gateway_id]]
+        else:
+            return False
+        return len(peers) > 0 and all(peer.reads_frames for peer in peers)
         # results = yield self._GPG.encrypt_aes(self.account_mqtt_key, msgpack.packb(data))
         # return results
 
     def decrypt(self, incoming):
         # data = yield self._GPG.decrypt_aes(self.account_mqtt_key, data)
-        message = msgpack.unpackb(incoming)
-        data = message[b'payload']
-        del message[b'payload']
-        message = bytes_to_unicode(message)
-        message['time_received']: time()
-        if message['content_encoding'] == 'zlib':
-            data = zlib.decompress(data)
-        message['payload'] = msgpack.unpackb(data)
-        return bytes_to_unicode(message)
+        if is_frame(incoming):
+            return unpack(incoming)
+        return legacy_unpack(incoming)
 
     @inlineCallbacks
     def _load_gateways_from_database(self):
@@ -393,44 +417,58 @@ class Gateways(YomboLibrary):
                               gateway=self.gateways[gateway_id],
                               )
 
-    @inlineCallbacks
-    def mqtt_incoming(self, topic, raw_payload, qos, retain):
-        # ybo_gw_req/src_gwid/dest_gwid|all/lib/devices/get - payload is blank - get all device information
-        # ybo_gw_req/src_gwid/dest_gwid|all/lib/devices/get/device_id - payload is blank
-        topic_parts = topic.split('/', 10)
+    def mqtt_incoming_message(self, topic, raw_payload, source_gw_id):
+        """
+        Checks an incoming message from another gateway and decrypts it.
 
-        if len(topic_parts) < 5 == self.gateway_id:
+        :return: The topic split into levels and the message, or None if the message should be discarded.
+        """
+        topic_parts = topic.split('/', 10)
+        if len(topic_parts) < 5:
             logger.debug("Gateway COMS received too short of a topic (discarding): {topic}", topic=topic)
-            return
-        if topic_parts[1] == self.gateway_id:
+            return None
+        if source_gw_id == self.gateway_id:
             logger.debug("discarding message that I sent.")
-            return
-        if topic_parts[1] not in self.gateways:
-            logger.debug("Discarding message from gateway {gwid}, not in list of known gateways.", gwid=topic_parts[1])
-            return
-        # print("if %s == %s:" % (topic_parts[1], self.gateway_id))
-        # print("got incoming: %s" % topic)
-        self.gateways[topic_parts[1]].last_scene = time()
-        self.gateways[topic_parts[1]].last_communications.append({
+            return None
+        if source_gw_id not in self.gateways:
+            logger.debug("Discarding message from gateway {gwid}, not in list of known gateways.", gwid=source_gw_id)
+            return None
+        self.gateways[source_gw_id].last_scene = time()
+        self.gateways[source_gw_id].last_communications.append({
             'time': time(),
             'direction': 'received',
             'topic': topic,
         })
+        self.count_traffic(source_gw_id, 'received', len(raw_payload))
 
         if len(raw_payload) > 0:
             try:
                 message = self.decrypt(raw_payload)
             except Exception as e:
                 logger.warn("Gateways:MQTT received invalid data.")
-                return
+                return None
+            if message.get('frame_version', 0) >= FRAME_VERSION:
+                self.gateways[source_gw_id].reads_frames = True
         else:
             logger.warn("Empty payloads for inter gateway coms are not allowed!")
-            return
+            return None
+        return topic_parts, message
 
-        if topic_parts[0] == "ybo_gw":
-            yield self.mqtt_incomming_data(topic_parts, message)
-        else:
-            yield self.mqtt_incomming_request(topic_parts, message)
+    def mqtt_gateway_request(self, topic, raw_payload, qos, retain, wildcards):
+        """
+        Requests from other gateways: ybo_gw_req/src_gwid/dest_gwid|all/...
+        """
+        incoming = self.mqtt_incoming_message(topic, raw_payload, wildcards[0])
+        if incoming is not None:
+            return self.mqtt_incomming_request(*incoming)
+
+    def mqtt_gateway_data(self, topic, raw_payload, qos, retain, wildcards):
+        """
+        Data from other gateways: ybo_gw/src_gwid/dest_gwid|all/...
+        """
+        incoming = self.mqtt_incoming_message(topic, raw_payload, wildcards[0])
+        if incoming is not None:
+            return self.mqtt_incomming_data(*incoming)
 
     @inlineCallbacks
     def mqtt_incomming_request(self, topics, message):
@@ -510,6 +548,9 @@ class Gateways(YomboLibrary):
                         self.send_all_states(source_gw_id)
                     else:
                         self.send_all_states(source_gw_id, topics[5])
+            elif component_name == 'sync':
+                if opt1 == 'get':
+                    self.incoming_request_sync(source_gw_id, message['payload'])
 
     @inlineCallbacks
     def mqtt_incomming_data(self, topics, message):
@@ -577,11 +618,13 @@ class Gateways(YomboLibrary):
                             self._States.set_from_gateway_communications(name, value)
                     else:
                         self._States.set_from_gateway_communications(opt1, message['payload'])
+                elif component_name == 'sync':
+                    self.incoming_data_sync(source_gw_id, opt1, message['payload'])
                 elif component_name == 'gateways':
                     if opt1 == 'online':
                         # print("setting gw %s as online" % source_gw_id)
+                        # It will ask for our atoms and states, see start_sync().
                         self.gateways[source_gw_id].com_status = 'online'
-                        reactor.callLater(random_int(2, .8), self.send_all_info, destination_gw=source_gw_id)
                     elif opt1 == 'offline':
                         self.gateways[source_gw_id].com_status = 'offline'
             except Exception as e:  # catch anything here...so can display details.
@@ -661,20 +704,15 @@ class Gateways(YomboLibrary):
             return
         device.set_status_from_gateway_communications(payload)
 
-    def _atoms_set_(self, **kwargs):
+    def atoms_changed(self, changes):
         """
-        Publish a new atom, if it's from ourselves.
+        Subscribed to local atoms. Changes are sent to other gateways at the end of the sync window, see
+        :py:meth:`send_sync_changes`.
 
-        :param kwargs:
+        :param changes: List of StoreChange.
         :return:
         """
-        if self.ok_to_publish_updates is False:
-            return
-
-        if kwargs['gateway_id'] != self.gateway_id:
-            return
-
-        self.publish_data('all', "lib/atoms/" + kwargs['key'], kwargs['value_full'])
+        self.schedule_sync()
 
     def _device_command_(self, **kwargs):
         """
@@ -759,7 +797,7 @@ class Gateways(YomboLibrary):
 
         topic = "lib/device_status/" + device_id
         # print("sending _device_status_: %s -> %s" % (topic, message))
-        self.publish_data('all', topic, kwargs['event'])
+        self.publish_data('all', topic, kwargs['event'], republish=True)
 
     def _notification_add_(self, **kwargs):
         """
@@ -817,22 +855,155 @@ class Gateways(YomboLibrary):
         # print("sending _device_status_: %s -> %s" % (topic, message))
         self.publish_data('all', topic, message)
 
-    def _states_set_(self, **kwargs):
+    def states_changed(self, changes):
         """
-        Publish a new state, if it's from ourselves.
+        Subscribed to local states. Changes are sent to other gateways at the end of the sync window, see
+        :py:meth:`send_sync_changes`.
 
-        :param kwargs:
+        :param changes: List of StoreChange.
         :return:
         """
+        self.schedule_sync()
+
+    def sync_library(self, component):
+        if component == 'atoms':
+            return self._Atoms
+        return self._States
+
+    def start_sync(self):
+        """
+        Sends all our atoms and states to the other gateways, and asks each of them for theirs. After this, only
+        changes are sent.
+        """
+        self.send_all_info(set_ok_to_publish_updates=True)
+        self.publish_request('all', 'lib/sync/get', {})
+
+    def schedule_sync(self):
+        """
+        Send changes at the end of the sync window, so changes close together are sent as one message.
+        """
         if self.ok_to_publish_updates is False:
             return
+        if self.sync_call is None or not self.sync_call.active():
+            self.sync_call = reactor.callLater(self.sync_window, self.send_sync_changes)
 
-        gateway_id = kwargs['gateway_id']
-        if gateway_id != self.gateway_id:
+    def send_sync_changes(self):
+        """
+        Sends changes since the last message to all gateways.
+        """
+        self.sync_call = None
+        for component in SYNC_COMPONENTS:
+            self.send_sync('all', component, self.sync_sent[component], send_empty=False)
+
+    def send_sync(self, destination_gw, component, since=0, send_empty=True):
+        """
+        Sends atoms or states changed after a version. The message includes the version it starts from, and the
+        version it includes changes up to.
+
+        :param destination_gw: Gateway id, or 'all'.
+        :param component: 'atoms' or 'states'.
+        :param since: Version to start from, 0 for everything.
+        :param send_empty: If False, don't send anything when nothing changed.
+        """
+        changes = self.sync_library(component).changes_since(since)
+        if len(changes) == 0 and send_empty is False:
             return
+        version = since
+        items = {}
+        for name, (item_version, item) in changes.items():
+            if item_version > version:
+                version = item_version
+            items[name] = {field: item.get(field) for field in SYNC_FIELDS}
+
+        if destination_gw == 'all' and version > self.sync_sent[component]:
+            self.sync_sent[component] = version
+        self.publish_data(destination_gw, 'lib/sync/%s' % component, {
+            'epoch': self.sync_epoch,
+            'since': since,
+            'version': version,
+            'items': items,
+        })
 
-        # print("gw sending states set: %s" % kwargs['key'])
-        self.publish_data('all', "lib/states/" + kwargs['key'], kwargs['value_full'])
+    def incoming_data_sync(self, src_gateway_id, component, payload):
+        """
+        Handles atoms or states from another gateway. Messages that are no newer than the last version received
+        are ignored, they arrived late and would overwrite newer values. If the message doesn't continue from the
+        last version received, asks for the changes that were missed.
+
+        :param src_gateway_id: Gateway that sent the message.
+        :param component: 'atoms' or 'states'.
+        :param payload: Dictionary with epoch, since, version, and items.
+        """
+        if component not in SYNC_COMPONENTS:
+            return
+        gateway = self.gateways[src_gateway_id]
+        seen = gateway.sync_seen.get(component)
+        epoch = payload['epoch']
+        if seen is not None and seen[0] == epoch and payload['version'] <= seen[1]:
+            return
+
+        library = self.sync_library(component)
+        for name, values in payload['items'].items():
+            library.set_from_gateway_communications(name, values)
+
+        if payload['since'] == 0 or (seen is not None and seen[0] == epoch and payload['since'] <= seen[1]):
+            gateway.sync_seen[component] = (epoch, payload['version'])
+        else:
+            self.request_sync(src_gateway_id, component)
+
+    def request_sync(self, gateway_id, component):
+        """
+        Asks a gateway for changes since the last version received from it. Not sent more than every 10 seconds,
+        the reply brings everything up to date.
+        """
+        requested_at = self.sync_requested.get((gateway_id, component))
+        if requested_at is not None and requested_at > time() - 10:
+            return
+        self.sync_requested[(gateway_id, component)] = time()
+        seen = self.gateways[gateway_id].sync_seen.get(component)
+        self.publish_request(gateway_id, 'lib/sync/get', {gateway_id: {component: seen}})
+
+    def incoming_request_sync(self, src_gateway_id, payload):
+        """
+        Another gateway asked for our atoms and states. The payload can include the last version it has from us,
+        only changes after it are sent. If it doesn't include us, everything is sent.
+
+        :param src_gateway_id: Gateway that asked.
+        :param payload: gateway_id -> component -> [epoch, version], or empty.
+        """
+        if self.ok_to_publish_updates is False:
+            return  # We haven't sent our startup sync yet, it will include everything.
+        if self.gateway_id in payload:
+            wanted = payload[self.gateway_id]
+        else:
+            wanted = {component: None for component in SYNC_COMPONENTS}
+
+        for component, seen in wanted.items():
+            if component not in SYNC_COMPONENTS:
+                continue
+            if seen is not None and seen[0] == self.sync_epoch:
+                self.send_sync(src_gateway_id, component, seen[1])
+            else:
+                self.send_sync(src_gateway_id, component)
+
+    def count_traffic(self, gateway_id, direction, size):
+        """
+        Adds a message to the bytes and messages sent or received for a gateway.
+
+        :param gateway_id: Gateway id, or 'all' for messages sent to all gateways.
+        :param direction: 'sent' or 'received'
+        :param size: Bytes
+        """
+        if gateway_id not in self.traffic:
+            self.traffic[gateway_id] = {
+                'bytes_sent': 0,
+                'bytes_received': 0,
+                'messages_sent': 0,
+                'messages_received': 0,
+            }
+        self.traffic[gateway_id]['bytes_' + direction] += size
+        self.traffic[gateway_id]['messages_' + direction] += 1
+        self._Statistics.increment("lib.gateways.bytes_" + direction, size, bucket_size=60, anon=True)
 
     def publish_request(self, dest_gw, topic, message):
         if dest_gw != 'all' and  dest_gw not in self.gateways:
@@ -851,10 +1022,17 @@ class Gateways(YomboLibrary):
                 'direction': 'sent',
                 'topic': final_topic,
             })
-        returnable = self.encrypt(message)
+        returnable = self.encrypt(message, dest_gw)
+        self.count_traffic(dest_gw, 'sent', len(returnable))
         self.mqtt.publish("ybo_gw_req/%s/%s" % (self.gateway_id, final_topic), returnable)
 
-    def publish_data(self, destination_gw, topic, message):
+    def publish_data(self, destination_gw, topic, message, republish=False):
+        """
+        Send data to another gateway, or to 'all' gateways.
+
+        :param republish: Send again after reconnecting to the broker, see MQTTClient.publish(). Only for topics
+            where the last message is all that matters, such as the status of a device.
+        """
         if destination_gw != 'all' and destination_gw not in self.gateways:
             logger.info("Something requested gateway coms-data, but there's no gateway: {destination_gw}",
                         destination_gw=destination_gw)
@@ -872,16 +1050,19 @@ class Gateways(YomboLibrary):
                 'direction': 'sent',
                 'topic': final_topic,
             })
-        outgoing_data = self.encrypt(message)
+        outgoing_data = self.encrypt(message, destination_gw)
+        self.count_traffic(destination_gw, 'sent', len(outgoing_data))
         # print("gw sending publish data: final topic: ybo_gw/%s/%s" % (self.gateway_id, final_topic))
-        self.mqtt.publish("ybo_gw/%s/%s" % (self.gateway_id, final_topic), outgoing_data)
+        self.mqtt.publish("ybo_gw/%s/%s" % (self.gateway_id, final_topic), outgoing_data, republish=republish)
 
     def send_all_info(self, destination_gw=None, set_ok_to_publish_updates=None):
+        """
+        Sends all atoms and states, with versions. Devices are only sent when requested.
+        """
         # print("gw sending !!!!!!!!!!!!!!!!!!gateways send_all_info: %s - %s" % (destination_gw, self.ok_to_publish_updates))
-
-        self.send_all_atoms(destination_gw)
-        self.send_all_devices(destination_gw)
-        self.send_all_states(destination_gw)
+        return_gw = self.get_return_gw(destination_gw)
+        for component in SYNC_COMPONENTS:
+            self.send_sync(return_gw, component)
         if set_ok_to_publish_updates is True:
             self.ok_to_publish_updates = True
 
@@ -1333,6 +1514,8 @@ class Gateway:
 
         # communications information
         self.last_communications = deque([], 30)  # stores times and topics of the last few communications
+        self.sync_seen = {}  # component -> (epoch, version), latest atoms and states received from this gateway
+        self.reads_frames = False  # True once it sends a message showing it can read frames, see Gateways.encrypt
 
         self.update_attributes(gateway)
 
@@ -1469,6 +1652,18 @@ class Gateway:
         else:
             self._Parent.gateway_status[self.gateway_id]['com_status'] = val
 
+    @property
+    def traffic(self):
+        """
+        Bytes and messages sent to and received from this gateway. Doesn't include messages sent to all gateways.
+        """
+        return self._Parent.traffic.get(self.gateway_id, {
+            'bytes_sent': 0,
+            'bytes_received': 0,
+            'messages_sent': 0,
+            'messages_received': 0,
+        })
+
     @property
     def last_scene(self):
         if self.gateway_id == self._Parent.gateway_id:
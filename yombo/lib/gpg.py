@@ -16,6 +16,13 @@ decryption. A decrypted version of the data is stored in memory. This allows mod
 
 It's important to note that any module within the Yombo system will have access to this data, unencumbered.
 
+Calls to gpg run on a thread pool, see :py:mod:`yombo.utils.gpgworker`, with at most 'gpg:workers' (default 2)
+running at once. Verified signed messages are cached by content hash for 'gpg:verify_cache_ttl' seconds. The
+time each operation takes is sent to the statistics library as lib.gpg.<operation>.
+
+For large data, such as backups, use the streaming AES functions: :py:meth:`GPG.encrypt_aes_stream`,
+:py:meth:`GPG.encrypt_aes_file`, and the decrypt versions. These work in chunks instead of on the whole data.
+
 .. moduleauthor:: Mitch Schwenk <mitch-gw@yombo.net>
 
 :copyright: Copyright 2012-2016 by Yombo.
@@ -24,12 +31,12 @@ It's important to note that any module within the Yombo system will have access
 """
 
 # Import python libraries
+from functools import partial
 import yombo.ext.gnupg as gnupg
 import os.path
 from subprocess import Popen, PIPE
 from Crypto import Random
 from Crypto.Cipher import AES
-import hashlib
 import re
 from time import time
 
@@ -42,6 +49,8 @@ from twisted.internet.task import LoopingCall
 from yombo.core.exceptions import YomboWarning, YomboCritical
 from yombo.core.library import YomboLibrary
 from yombo.utils import random_string, bytes_to_unicode, unicode_to_bytes, read_file, save_file, random_int
+from yombo.utils.aesstream import CHUNK_SIZE, derive_key, encrypt_stream, decrypt_stream, write_stream
+from yombo.utils.gpgworker import GPGWorker, ResultCache
 
 from yombo.core.log import get_logger
 logger = get_logger('library.gpg')
@@ -94,6 +103,12 @@ class GPG(YomboLibrary):
         ]
 
         self.gpg = gnupg.GPG(gnupghome="usr/etc/gpg")
+        self.worker = GPGWorker(int(self._Configs.get('gpg', 'workers', 2, False)), on_latency=self.record_latency)
+        self.worker.start()
+        self.verify_cache = ResultCache(int(self._Configs.get('gpg', 'verify_cache_size', 1000, False)),
+                                        int(self._Configs.get('gpg', 'verify_cache_ttl', 600, False)))
+        self.worker_statistics_loop = LoopingCall(self.save_worker_statistics)
+        self.worker_statistics_loop.start(60, False)
         self.gateway_id = self._Configs.get2('core', 'gwid', 'local', False)
         self.gwuuid = self._Configs.get2('core', 'gwuuid', None, False)
         self.mykeyid = self._Configs.get2('gpg', 'keyid', None, False)
@@ -121,21 +136,46 @@ class GPG(YomboLibrary):
 
     def _stop_(self, **kwargs):
         """
-        We don't do anything, but 'pass' so we don't generate an exception.
+        Waits for any key being generated.
         """
+        if self.worker_statistics_loop is not None and self.worker_statistics_loop.running:
+            self.worker_statistics_loop.stop()
         if self._generating_key is True:
             self._generating_key_deferred = Deferred
             return self._generating_key_deferred
 
     def _unload_(self, **kwargs):
         """
-        Do nothing
+        Stop the gpg worker threads.
         """
-        pass
+        self.worker.stop()
 
     def _done_init(self):
         self.initDefer.callback(10)
 
+    def record_latency(self, operation, milliseconds):
+        """
+        Called by the gpg worker with the time each operation took.
+        """
+        self._Statistics.averages("lib.gpg.%s" % operation, milliseconds, bucket_size=60, anon=True)
+
+    def latency_report(self):
+        """
+        Returns how long gpg operations take, in milliseconds.
+
+        :return: Dictionary of operation -> histogram summary.
+        """
+        return self.worker.latency_report()
+
+    def save_worker_statistics(self):
+        """
+        Sends the gpg worker and verification cache counters to the statistics library, once a minute.
+        """
+        for key, value in self.worker.stats.items():
+            self._Statistics.datapoint("lib.gpg.worker.%s" % key, value, anon=True)
+        for key, value in self.verify_cache.stats.items():
+            self._Statistics.datapoint("lib.gpg.verify_cache.%s" % key, value, anon=True)
+
     @inlineCallbacks
     def load_passphrase(self, keyid=None):
         if keyid is None:
@@ -230,14 +270,13 @@ class GPG(YomboLibrary):
         # print("starting: send_my_gpg_key_to_keyserver")
         logger.info("Sending my public GPG key to key servers.")
         for server in self.sks_pools:
-            yield threads.deferToThread(self._send_my_gpg_key_to_keyserver,
-                                                  server,
-                                                  self.gpg_key_id)
+            yield self.worker.run('send_keys', self._send_my_gpg_key_to_keyserver, server, self.gpg_key_id)
         self._Configs.set('gpg', 'last_sent_keyserver', int(time()))
 
     def _send_my_gpg_key_to_keyserver(self, server, gpg_key_id):
         return self.gpg.send_keys("hkp://%s" % server, gpg_key_id)
 
+    @inlineCallbacks
     def get_my_gpg_key_from_keyserver(self):
         """
         Send my gpg key to the key server pool.
@@ -245,11 +284,8 @@ class GPG(YomboLibrary):
         :return:
         """
         # print("starting: get_my_gpg_key_from_keyserver")
-        yield threads.deferToThread(self._get_my_gpg_key_from_keyserver,
-                                    self.sks_pools[0],
-                                    self.gpg_key_id)
-        results = self.gpg.recv_keys('hkp://pool.sks-keyservers.net', self.gpg_key_id)
         logger.info("Asking GPG key servers for any updates.")
+        yield self.worker.run('recv_keys', self._get_my_gpg_key_from_keyserver, self.sks_pools[0], self.gpg_key_id)
 
         self._Configs.set('gpg', 'last_received_keyserver', int(time()))
 
@@ -285,7 +321,7 @@ class GPG(YomboLibrary):
                 logger.error("Not adding key ({length}) due to length being less then 2048. Key is unusable",
                              length=gpg_public_keys[keyid]['length'])
                 continue
-            data['publickey'] = self.gpg.export_keys(data['keyid'])
+            data['publickey'] = yield self.worker.run('export_keys', self.gpg.export_keys, data['keyid'])
             if data['keyid'] in gpg_private_keys:
                 data['have_private'] = 1
             else:
@@ -293,18 +329,18 @@ class GPG(YomboLibrary):
             if data['have_private'] == 1:
                 try:
                     passphrase = yield self.load_passphrase(data['keyid'])
-                    data['privatekey'] = self.gpg.export_keys(data['keyid'],
-                                                              secret=True,
-                                                              passphrase=passphrase,
-                                                              expect_passphrase=True)
+                    data['privatekey'] = yield self.worker.run('export_keys', self.gpg.export_keys, data['keyid'],
+                                                               secret=True,
+                                                               passphrase=passphrase,
+                                                               expect_passphrase=True)
                     data['passphrase'] = passphrase
                 except Exception as e:
                     data['have_private'] = 0
             else:
                 try:
-                    data['privatekey'] = self.gpg.export_keys(data['keyid'],
-                                                              secret=True,
-                                                              expect_passphrase=False)
+                    data['privatekey'] = yield self.worker.run('export_keys', self.gpg.export_keys, data['keyid'],
+                                                               secret=True,
+                                                               expect_passphrase=False)
                 except Exception as e:
                     data['have_private'] = 0
 
@@ -410,16 +446,17 @@ class GPG(YomboLibrary):
     def set_trust_level(self, keyid, trust_level = 5):
         """
         Sets the trust of a key.
-        #TODO: This function is blocking! Adjust to non-blocking. See below.
         """
-        p = yield Popen(["gpg --import-ownertrust --homedir usr/etc/gpg"], shell=True, stdin=PIPE, stdout=PIPE, close_fds=True)
-        (child_stdout, child_stdin) = (p.stdout, p.stdin)
-#        logger.info("%s:%d:\n" % (keyid, trustLevel))
-        child_stdin.write("%s:%d:\n" % (keyid, trust_level))
-        child_stdin.close()
-        result = child_stdout.read()
+        result = yield self.worker.run('set_trust', self._set_trust_level, keyid, trust_level)
+        self.verify_cache.clear()
         logger.info("GPG Trust change: {result}", result=result)
 
+    def _set_trust_level(self, keyid, trust_level):
+        p = Popen(["gpg --import-ownertrust --homedir usr/etc/gpg"], shell=True, stdin=PIPE, stdout=PIPE, close_fds=True)
+#        logger.info("%s:%d:\n" % (keyid, trustLevel))
+        result, errors = p.communicate(unicode_to_bytes("%s:%d:\n" % (keyid, trust_level)))
+        return result
+
     @inlineCallbacks
     def check_key_trust(self, keyid):
         """
@@ -436,6 +473,7 @@ class GPG(YomboLibrary):
           if keyid == key['keyid']:
               return key['ownertrust']
 
+    @inlineCallbacks
     def _add_to_keyring(self, key_to_add):
         """
         Helper function to actually add the keyring.
@@ -443,7 +481,8 @@ class GPG(YomboLibrary):
         :param key_to_add:
         :return:
         """
-        importResults = self.gpg.import_keys(key_to_add)
+        importResults = yield self.worker.run('import_keys', self.gpg.import_keys, key_to_add)
+        self.verify_cache.clear()
         results = importResults.results
 #        logger.debug("Result size: %s", len(results) )
         if (len(results) == 1):
@@ -466,7 +505,7 @@ class GPG(YomboLibrary):
         :param keys:
         :return:
         """
-        input_keys = yield self.gpg.list_keys(secret=secret, keys=keys)
+        input_keys = yield self.worker.run('list_keys', self.gpg.list_keys, secret=secret, keys=keys)
 
         output_key = {}
 
@@ -565,7 +604,7 @@ class GPG(YomboLibrary):
             passphrase=passphrase)
 
         self.key_generation_status = 'working'
-        newkey = yield threads.deferToThread(self._gen_key, input_data)
+        newkey = yield self.worker.run('gen_key', self._gen_key, input_data)
         # print("bb 3: newkey: %s" % newkey)
         # print("bb 3: newkey: %s" % newkey.__dict__)
         # print("bb 3: newkey: %s" % type(newkey))
@@ -584,7 +623,7 @@ class GPG(YomboLibrary):
             if key_data['fingerprint'] == str(newkey):
                 newkeyid = key_data['keyid']
                 break
-        asciiArmoredPublicKey = self.gpg.export_keys(newkeyid)
+        asciiArmoredPublicKey = yield self.worker.run('export_keys', self.gpg.export_keys, newkeyid)
         self._Configs.set('gpg', 'keyid', newkeyid)
         secret_file = "%s/usr/etc/gpg/%s.pass" % (self._Atoms.get('yombo.path'), newkeyid)
         # print("saveing pass to : %s" % secret_file)
@@ -681,7 +720,7 @@ class GPG(YomboLibrary):
 
         try:
             # output = self.gpg.encrypt(in_text, destination, sign=self.mykeyid())
-            output = yield threads.deferToThread(self._gpg_encrypt, in_text, destination)
+            output = yield self.worker.run('encrypt', self._gpg_encrypt, in_text, destination)
             # output = self.gpg.encrypt(in_text, destination)
             if output.status != "encryption ok":
                 raise YomboWarning("Unable to encrypt string. Error 1.")
@@ -711,7 +750,7 @@ class GPG(YomboLibrary):
             return verify
         elif in_text.startswith('-----BEGIN PGP MESSAGE-----'):
             try:
-                output = yield threads.deferToThread(self._gpg_decrypt, in_text)
+                output = yield self.worker.run('decrypt', self._gpg_decrypt, in_text)
                 return output.data
             except Exception as e:
                 raise YomboWarning("Unable to decrypt string. Reason: {e}", e)
@@ -720,41 +759,57 @@ class GPG(YomboLibrary):
     def _gpg_decrypt(self, data):
         return self.gpg.decrypt(data, passphrase=self.__mypassphrase)
 
+    @inlineCallbacks
     def sign(self, in_text, asciiarmor=True):
         """
-        Signs in_text and returns the signature.
+        Signs in_text and returns the signature. Signing requests made at the same time are sent to the gpg
+        worker pool together.
         """
         #cache the gpg/pgp key locally.
-        if type(in_text) is str or type(in_text) is str:
+        if type(in_text) is str:
+            operation = 'sign' if asciiarmor else 'sign_binary'
+            sign_function = partial(self.gpg.sign, keyid=self.mykeyid(), passphrase=self.__mypassphrase,
+                                    clearsign=asciiarmor)
             try:
-                signed = self.gpg.sign(in_text, keyid=self.mykeyid(), clearsign=asciiarmor)
+                signed = yield self.worker.batched(operation, sign_function, in_text)
                 return signed.data
             except Exception as e:
-                raise YomboWarning("Error with GPG system. Unable to sign your message: {e}", e=e)
+                raise YomboWarning("Error with GPG system. Unable to sign your message: %s" % e)
         return False
 
+    @inlineCallbacks
     def verify_asymmetric(self, in_text):
         """
-        Verifys a signature. Returns the data if valid, otherwise False.
+        Verifys a signature. Returns the data if valid, otherwise False. Results are cached by content hash,
+        verification requests made at the same time are sent to the gpg worker pool together.
         """
         if type(in_text) is str and in_text.startswith('-----BEGIN PGP SIGNED MESSAGE-----'):
             try:
-                verified = self.gpg.verify(in_text)
-                if verified.status == "signature valid":
-                    if verified.stderr.find('TRUST_ULTIMATE') > 0:
-                        pass
-                    elif verified.stderr.find('TRUST_FULLY') > 0:
-                        pass
-                    else:
-                        raise YomboWarning("Encryption not from trusted source!")
-                    out = self.gpg.decrypt(in_text)
-                    return out.data
-                else:
-                    return False
+                return self.verify_cache.get(in_text)
+            except KeyError:
+                pass
+            try:
+                verified = yield self.worker.batched('verify', self._gpg_verify, in_text)
+            except YomboWarning:
+                raise
             except Exception as e:
-                raise YomboWarning("Error with GPG system. Unable to verify signed text: {e}", e=e)
+                raise YomboWarning("Error with GPG system. Unable to verify signed text: %s" % e)
+            self.verify_cache.set(in_text, verified)
+            return verified
         return False
 
+    def _gpg_verify(self, in_text):
+        """
+        Runs on the gpg worker pool. Decrypting signed text checks the signature and returns the text with a single
+        gpg call.
+        """
+        out = self.gpg.decrypt(in_text)
+        if out.valid is not True:
+            return False
+        if out.trust_level is None or out.trust_level < out.TRUST_FULLY:
+            raise YomboWarning("Encryption not from trusted source!")
+        return out.data
+
     def verify_destination(self, destination):
         """
         Validate that we have a key for the given destination.  If not, try to
@@ -806,7 +861,7 @@ class GPG(YomboLibrary):
         :param data: Any type of data can be encrypted. Text, binary.
         :return: String containing the encrypted content.
         """
-        key = hashlib.sha256(key.encode('utf-8')).digest()
+        key = derive_key(key)
         raw = self.aes_pad(self.aes_str_to_bytes(raw))
         results = yield threads.deferToThread(self._encrypt_aes, key, raw)
         return results
@@ -819,7 +874,7 @@ class GPG(YomboLibrary):
 
     @inlineCallbacks
     def decrypt_aes(self, key, enc):
-        key = hashlib.sha256(key.encode('utf-8')).digest()
+        key = derive_key(key)
         # enc = base64.b85decode(enc)
         results = yield threads.deferToThread(self._decrypt_aes, key, enc)
         data = self.aes_unpad(results)
@@ -834,3 +889,78 @@ class GPG(YomboLibrary):
             return results
         except:
             return results
+
+    def encrypt_aes_stream(self, key, source, chunk_size=CHUNK_SIZE):
+        """
+        Encrypt using AES 256, one chunk at a time. The result is the same format as
+        :py:meth:`encrypt_aes() <encrypt_aes>`.
+
+        This runs as the returned generator is read, in the caller's thread. To encrypt to a file without blocking,
+        use :py:meth:`encrypt_aes_file() <encrypt_aes_file>`.
+
+        **Usage**:
+
+        .. code-block:: python
+
+           with open('backup.tar', 'rb') as source:
+               for chunk in self._GPG.encrypt_aes_stream('mypass', source):
+                   destination.write(chunk)
+
+        :param key: A password
+        :type key: string
+        :param source: Bytes, a string, a file-like object, or an iterable of bytes.
+        :param chunk_size: Bytes to read at a time.
+        :return: Generator of encrypted bytes.
+        """
+        return encrypt_stream(derive_key(key), source, chunk_size)
+
+    def decrypt_aes_stream(self, key, source, chunk_size=CHUNK_SIZE):
+        """
+        Decrypt data from :py:meth:`encrypt_aes() <encrypt_aes>` or
+        :py:meth:`encrypt_aes_stream() <encrypt_aes_stream>`, one chunk at a time. Unlike decrypt_aes(), the
+        results are always bytes.
+
+        :raises YomboWarning: Raised when the data is incomplete or the key is wrong.
+        :param key: A password
+        :type key: string
+        :param source: Bytes, a file-like object, or an iterable of bytes.
+        :param chunk_size: Bytes to read at a time.
+        :return: Generator of decrypted bytes.
+        """
+        return decrypt_stream(derive_key(key), source, chunk_size)
+
+    def encrypt_aes_file(self, key, source_path, destination_path, chunk_size=CHUNK_SIZE):
+        """
+        Encrypt a file to another file using AES 256, in a thread. The file is read and written one chunk at a
+        time.
+
+        :param key: A password
+        :type key: string
+        :param source_path: File to encrypt.
+        :param destination_path: File to write, replaced when done.
+        :param chunk_size: Bytes to read at a time.
+        :return: Deferred that fires with the bytes written.
+        """
+        return threads.deferToThread(self._aes_file, encrypt_stream, derive_key(key), source_path,
+                                     destination_path, chunk_size)
+
+    def decrypt_aes_file(self, key, source_path, destination_path, chunk_size=CHUNK_SIZE):
+        """
+        Decrypt a file from :py:meth:`encrypt_aes_file() <encrypt_aes_file>` to another file, in a thread.
+
+        :param key: A password
+        :type key: string
+        :param source_path: File to decrypt.
+        :param destination_path: File to write, replaced when done. Not changed if decryption raises an error.
+            There is no MAC, so a wrong key is caught by the padding check nearly always, but not every time,
+            and then garbage is written.
+        :param chunk_size: Bytes to read at a time.
+        :return: Deferred that fires with the bytes written.
+        """
+        return threads.deferToThread(self._aes_file, decrypt_stream, derive_key(key), source_path,
+                                     destination_path, chunk_size)
+
+    @staticmethod
+    def _aes_file(stream, key, source_path, destination_path, chunk_size):
+        with open(source_path, 'rb') as source:
+            return write_stream(stream(key, source, chunk_size), destination_path)
@@ -22,6 +22,20 @@ then modules startup in the same method.
 #. Call "load" for all components
 #. Call "start" for all components
 
+Within each library phase, a library starts as soon as the libraries it depends on have finished that phase.
+Dependencies are listed in HARD_LOAD with 'depends', libraries without it wait for every library listed before
+them. Each library's time in each phase is recorded, see :py:meth:`Loader.startup_waterfall`.
+
+Libraries marked 'lazy' in HARD_LOAD can be skipped at startup by listing them in yombo.ini::
+
+  [loader]
+  lazy_libraries = voicecmds
+
+Use 'all' for every library that can be lazy. Only libraries that nothing uses during startup can be lazy. A
+lazy library is imported and started the first time one of its attributes is used, or a hook is invoked for it.
+Its methods wait until it has finished starting, and it then gets the library hooks called during startup that
+it missed. See :py:meth:`Loader.lazy_report` for what was skipped.
+
 Stops components in the following phases. Modules first, then libraries.
 
 #. Call "stop" for all components
@@ -41,13 +55,20 @@ Stops components in the following phases. Modules first, then libraries.
 """
 # Import python libraries
 import asyncio
-from collections import OrderedDict, Callable
+from collections import Counter, OrderedDict
+from collections.abc import Callable
+import configparser
+import inspect
+import os
 from re import search as ReSearch
+from time import time
 import traceback
+from types import MappingProxyType
 
 # Import twisted libraries
-from twisted.internet.defer import inlineCallbacks, maybeDeferred, Deferred
+from twisted.internet.defer import inlineCallbacks, maybeDeferred, Deferred, DeferredList, succeed, fail
 from twisted.internet import reactor
+from twisted.python.failure import Failure
 from twisted.web import client
 from functools import reduce
 client._HTTP11ClientFactory.noisy = False
@@ -58,9 +79,18 @@ from yombo.utils.fuzzysearch import FuzzySearch
 from yombo.core.library import YomboLibrary
 from yombo.core.log import get_logger
 import yombo.utils
+from yombo.utils import dict_merge
 
 logger = get_logger('library.loader')
 
+# Libraries that everything else needs. These load in order, before any other library.
+CORE_LIBRARIES = ['Validate', 'Queue', 'Notifications', 'LocalDB', 'SQLDict', 'Configuration', 'Atoms', 'States',
+                  'Statistics', 'Startup']
+
+# Libraries load in this order. 'depends' lists the libraries that must finish a phase before the library
+# can start that phase. Without it, the library waits for every library listed before it. 'lazy' libraries
+# can be skipped until first used, see lazy_libraries in the module documentation. Don't mark a library lazy
+# if other libraries use it during startup.
 HARD_LOAD = OrderedDict()
 HARD_LOAD["Validate"] = {'operating_mode': 'all'}
 HARD_LOAD["Queue"] = {'operating_mode': 'all'}
@@ -72,29 +102,30 @@ HARD_LOAD["Atoms"] = {'operating_mode': 'all'}
 HARD_LOAD["States"] = {'operating_mode': 'all'}
 HARD_LOAD["Statistics"] = {'operating_mode': 'all'}
 HARD_LOAD["Startup"] = {'operating_mode': 'all'}
-HARD_LOAD["AMQP"] = {'operating_mode': 'run'}
-HARD_LOAD["YomboAPI"] = {'operating_mode': 'all'}
-HARD_LOAD["Localize"] = {'operating_mode': 'all'}
-HARD_LOAD["GPG"] = {'operating_mode': 'all'}
-HARD_LOAD["CronTab"] = {'operating_mode': 'all'}
-HARD_LOAD["DownloadModules"] = {'operating_mode': 'run'}
-HARD_LOAD["Times"] = {'operating_mode': 'all'}
-HARD_LOAD["Commands"] = {'operating_mode': 'all'}
-HARD_LOAD["DeviceTypes"] = {'operating_mode': 'all'}
-HARD_LOAD["InputTypes"] = {'operating_mode': 'all'}
-HARD_LOAD["VoiceCmds"] = {'operating_mode': 'all'}
-HARD_LOAD["Variables"] = {'operating_mode': 'all'}
+HARD_LOAD["AMQP"] = {'operating_mode': 'run', 'depends': CORE_LIBRARIES}
+HARD_LOAD["YomboAPI"] = {'operating_mode': 'all', 'depends': CORE_LIBRARIES}
+HARD_LOAD["Localize"] = {'operating_mode': 'all', 'depends': CORE_LIBRARIES}
+HARD_LOAD["GPG"] = {'operating_mode': 'all', 'depends': CORE_LIBRARIES + ['AMQP']}
+HARD_LOAD["CronTab"] = {'operating_mode': 'all', 'depends': CORE_LIBRARIES}
+HARD_LOAD["DownloadModules"] = {'operating_mode': 'run', 'depends': CORE_LIBRARIES}
+HARD_LOAD["Times"] = {'operating_mode': 'all', 'depends': CORE_LIBRARIES}
+HARD_LOAD["Commands"] = {'operating_mode': 'all', 'depends': CORE_LIBRARIES + ['YomboAPI']}
+HARD_LOAD["DeviceTypes"] = {'operating_mode': 'all', 'depends': CORE_LIBRARIES + ['YomboAPI', 'Commands']}
+HARD_LOAD["InputTypes"] = {'operating_mode': 'all',
+                           'depends': CORE_LIBRARIES + ['YomboAPI', 'Commands', 'DeviceTypes']}
+HARD_LOAD["VoiceCmds"] = {'operating_mode': 'all', 'depends': CORE_LIBRARIES + ['Commands'], 'lazy': True}
+HARD_LOAD["Variables"] = {'operating_mode': 'all', 'depends': CORE_LIBRARIES + ['YomboAPI', 'GPG']}
 HARD_LOAD["Modules"] = {'operating_mode': 'all'}
 HARD_LOAD["Devices"] = {'operating_mode': 'all'}
 HARD_LOAD["Automation"] = {'operating_mode': 'all'}
-HARD_LOAD["AMQPYombo"] = {'operating_mode': 'run'}
+HARD_LOAD["AMQPYombo"] = {'operating_mode': 'run'}  # Its handlers use Devices and any library named in configs.
 HARD_LOAD["Gateways"] = {'operating_mode': 'all'}
-HARD_LOAD["Nodes"] = {'operating_mode': 'all'}
-HARD_LOAD["Locations"] = {'operating_mode': 'all'}
-HARD_LOAD["MQTT"] = {'operating_mode': 'run'}
-HARD_LOAD["SSLCerts"] = {'operating_mode': 'all'}
-HARD_LOAD["APIAuth"] = {'operating_mode': 'all'}
-HARD_LOAD["WebSessions"] = {'operating_mode': 'all'}
+HARD_LOAD["Nodes"] = {'operating_mode': 'all', 'depends': CORE_LIBRARIES + ['YomboAPI']}
+HARD_LOAD["Locations"] = {'operating_mode': 'all', 'depends': CORE_LIBRARIES + ['YomboAPI']}
+HARD_LOAD["MQTT"] = {'operating_mode': 'run', 'depends': CORE_LIBRARIES + ['Gateways']}
+HARD_LOAD["SSLCerts"] = {'operating_mode': 'all', 'depends': CORE_LIBRARIES + ['AMQPYombo']}
+HARD_LOAD["APIAuth"] = {'operating_mode': 'all', 'depends': CORE_LIBRARIES}
+HARD_LOAD["WebSessions"] = {'operating_mode': 'all', 'depends': CORE_LIBRARIES + ['Gateways']}
 HARD_LOAD["WebInterface"] = {'operating_mode': 'all'}
 HARD_LOAD["Tasks"] = {'operating_mode': 'all'}
 
@@ -135,6 +166,10 @@ HARD_LOAD["Variables"] = {'operating_mode': 'all'}
 HARD_UNLOAD["LocalDB"] = {'operating_mode': 'all'}
 HARD_UNLOAD["Queue"] = {'operating_mode': 'all'}
 
+# Hooks called by the loader during startup and shutdown. Invoking these doesn't activate a lazy library.
+LIBRARY_PHASES = ('_init_', '_init2_', '_modules_imported_', '_load_', '_start_', '_started_', '_modules_started_',
+                  '_stop_', '_unload_')
+
 RUN_PHASE = {
     'system_init': 0,
     'libraries_import': 100,
@@ -149,6 +184,90 @@ RUN_PHASE = {
     'shutdown': 1000,
 }
 
+def memory_usage():
+    """
+    Returns the resident memory of this process in bytes, or None if it can't be found.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, IOError, IndexError, ValueError):
+        return None
+
+
+class LazyLibrary(object):
+    """
+    Stands in for a library that hasn't been imported yet. Using any attribute imports and starts the library,
+    see Loader.activate_library(), then hands the attribute over from the real library. Until the library has
+    finished starting, its methods are wrapped to wait for it, and return a Deferred.
+    """
+    __slots__ = ('_Name', '_FullName', '_Loader')
+
+    def __init__(self, name, loader):
+        object.__setattr__(self, '_Name', name)
+        object.__setattr__(self, '_FullName', "yombo.gateway.lib.%s" % name)
+        object.__setattr__(self, '_Loader', loader)
+
+    def __getattr__(self, attribute):
+        if attribute.startswith('__'):
+            raise AttributeError(attribute)
+        value = getattr(self._Loader.activate_library(self._Name, attribute), attribute)
+        if self._Loader.library_is_ready(self._Name) or not isinstance(value, Callable):
+            return value
+        return self._Loader.call_when_ready(self._Name, value)
+
+    def __setattr__(self, attribute, value):
+        setattr(self._Loader.activate_library(self._Name, attribute), attribute, value)
+
+    def _ready_library(self, reason):
+        """
+        Activates the library and returns it, if it has finished starting. These can't return a Deferred.
+
+        :raises YomboWarning: Raised when the library is still starting.
+        """
+        library = self._Loader.activate_library(self._Name, reason)
+        if self._Loader.library_is_ready(self._Name) is False:
+            raise YomboWarning("Library %s is still starting, use Loader.library_ready() to wait for it." %
+                               self._Name, 110, reason, 'loader')
+        return library
+
+    def __contains__(self, key):
+        return key in self._ready_library('__contains__')
+
+    def __getitem__(self, key):
+        return self._ready_library('__getitem__')[key]
+
+    def __setitem__(self, key, value):
+        self._ready_library('__setitem__')[key] = value
+
+    def __iter__(self):
+        return iter(self._ready_library('__iter__'))
+
+    def __str__(self):
+        return "Lazy library %s" % self._Name
+
+
+class LibraryHook(object):
+    """
+    A hook implemented by a library, in the table built by Loader.build_library_hooks().
+
+    :ivar library_name: (str) Library name, lowercase.
+    :ivar attribute: (str) Name of the method on the library.
+    :ivar method: (callable) The bound method.
+    :ivar counter: (int) Index into the loader's hook call counters.
+    :ivar returns_deferred: (bool) True if the method is wrapped by inlineCallbacks. Hooks found to return a
+        Deferred when called are also flagged in the hook profile.
+    """
+    __slots__ = ('library_name', 'attribute', 'method', 'counter', 'returns_deferred')
+
+    def __init__(self, library_name, attribute, method, counter):
+        self.library_name = library_name
+        self.attribute = attribute
+        self.method = method
+        self.counter = counter
+        self.returns_deferred = inspect.isgeneratorfunction(getattr(method, '__wrapped__', None))
+
+
 class Loader(YomboLibrary, object):
     """
     Responsible for loading libraries, and then delegating loading modules to
@@ -207,12 +326,45 @@ class Loader(YomboLibrary, object):
         self.loadedLibraries = FuzzySearch({self._Name.lower(): self}, .95)
         self.libraryNames = {}
         self._moduleLibrary = None
-        self._invoke_list_cache = {}  # Store a list of hooks that exist or not. A cache.
         self._operating_mode = None  # One of: first_run, config, run
         self.sigint = False  # will be set to true if SIGINT is received
-        self.hook_counts = OrderedDict()  # keep track of hook names, and how many times it's called.
+        self._hook_table = {}  # hook name -> tuple of implementors, see hook_implementors()
+        self._library_hooks = None  # (library name, hook name) -> LibraryHook, see build_library_hooks()
+        self._universal_hooks = None  # library name -> LibraryHook for _yombo_universal_hook_
+        self._library_names = frozenset()
+        self._library_dependencies = None  # library name -> tuple of names, see library_dependencies()
+        self.startup_times = OrderedDict()  # (library name, phase) -> (started, finished)
+        self.startup_memory = {}  # library name -> bytes of resident memory added by importing it
+        self._lazy_libraries = OrderedDict()  # library name, lowercase -> details, see lazy_report()
+        self._lazy_missed_hooks = OrderedDict()  # hook name -> kwargs, for hooks called during startup
+        self._lazy_record_hooks = True  # Record hooks lazy libraries miss until startup is done.
+        self.library_costs = None  # library name -> import and init costs, see save_library_costs()
+        self._phases_started = []  # library phases started so far, in order
+        self._hook_counter_index = OrderedDict()  # (component_type, component name, hook) -> index in _hook_call_counts
+        self._hook_call_counts = []  # How many times each hook was called, indexed by _hook_counter_index
+        self._hook_call_times = []  # Total seconds spent in each hook, indexed by _hook_counter_index
+        self._hook_deferred = set()  # Counter indexes of hooks that return Deferreds
+        self._hook_callers = Counter()  # (counter index, called_by) -> count
         reactor.addSystemEventTrigger("before", "shutdown", self.shutdown)
 
+    @property
+    def hook_counts(self):
+        """
+        How many times each library hook has been called, and by who. Used by the web interface.
+
+        :return: A dictionary of library name -> hook -> called_by -> {'count': int}
+        """
+        return self.get_hook_counts('library')
+
+    @property
+    def hook_profile(self):
+        """
+        Call counts and time spent in each library hook. Used by the web interface.
+
+        :return: A dictionary of library name -> hook -> details, see get_hook_profile()
+        """
+        return self.get_hook_profile('library')
+
     def shutdown(self):
         """
         This is called if SIGINT (ctrl-c) was caught. Very useful incase it was called during startup.
@@ -243,79 +395,49 @@ class Loader(YomboLibrary, object):
 
         self.run_phase = "modules_import"
         self.operating_mode = self.operating_mode  # so we can update the State!
+        started = time()
         yield self._moduleLibrary.import_modules()
-        for name, config in HARD_LOAD.items():
-            if self.sigint:
-                return
-            self._log_loader('debug', name, 'library', 'modules_imported', 'About to call _modules_imported_.')
-            if self.check_operating_mode(config['operating_mode']):
-                libraryName = name.lower()
-                yield self.library_invoke(libraryName, "_modules_imported_", called_by=self)
-                HARD_LOAD[name]['_modules_imported_'] = True
-            else:
-                HARD_LOAD[name]['_modules_imported_'] = False
-            self._log_loader('debug', name, 'library', 'modules_imported', 'Finished call to _modules_imported_.')
+        self.startup_timed('modules', 'import_modules', started)
+        yield self.invoke_libraries_phase('_modules_imported_')
 
+        if self.sigint:
+            return
         self.run_phase = "libraries_load"
-        for name, config in HARD_LOAD.items():
-            # print "sigint: %s" % self.sigint
-            if self.sigint:
-                return
-            # self._log_loader('debug', name, 'library', 'load', 'About to call _load_.')
-            if self.check_operating_mode(config['operating_mode']):
-                HARD_LOAD[name]['_load_'] = 'Starting'
-                libraryName = name.lower()
-                yield self.library_invoke(libraryName, "_load_", called_by=self)
-                HARD_LOAD[name]['_load_'] = True
-            else:
-                HARD_LOAD[name]['_load_'] = False
-            self._log_loader('debug', name, 'library', 'load', 'Finished call to _load_.')
+        yield self.invoke_libraries_phase('_load_')
 
         self._moduleLibrary = self.loadedLibraries['modules']
 
+        if self.sigint:
+            return
         self.run_phase = "modules_init"
+        started = time()
         yield self._moduleLibrary.init_modules()
+        self.startup_timed('modules', 'init_modules', started)
 
-#        logger.debug("!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!1Calling start function of libraries.")
+        if self.sigint:
+            return
         self.run_phase = "libraries_start"
-        for name, config in HARD_LOAD.items():
-            if self.sigint:
-                return
-            self._log_loader('debug', name, 'library', 'start', 'About to call _start_.')
-            if self.check_operating_mode(config['operating_mode']):
-                libraryName =  name.lower()
-                yield self.library_invoke(libraryName, "_start_", called_by=self)
-                HARD_LOAD[name]['_start_'] = True
-            else:
-                HARD_LOAD[name]['_start_'] = False
-            self._log_loader('debug', name, 'library', '_start_', 'Finished call to _start_.')
+        yield self.invoke_libraries_phase('_start_')
 
+        if self.sigint:
+            return
         self.run_phase = "modules_start"
+        started = time()
         yield self._moduleLibrary.load_modules()  #includes load & start
+        self.startup_timed('modules', 'load_modules', started)
         self.run_phase = "modules_started"
 
+        if self.sigint:
+            return
         self.run_phase = "libraries_started"
-        for name, config in HARD_LOAD.items():
-            if self.sigint:
-                return
-            self._log_loader('debug', name, 'library', 'started', 'About to call _started_.')
-            if self.check_operating_mode(config['operating_mode']):
-                libraryName =  name.lower()
-                yield self.library_invoke(libraryName, "_started_", called_by=self)
-                HARD_LOAD[name]['_started_'] = True
-            else:
-                HARD_LOAD[name]['_started_'] = False
-
-        for name, config in HARD_LOAD.items():
-            if self.sigint:
-                return
-            self._log_loader('debug', name, 'library', '_modules_started_', 'About to call _modules_started_.')
-            if self.check_operating_mode(config['operating_mode']):
-                libraryName =  name.lower()
-                yield self.library_invoke(libraryName, "_modules_started_", called_by=self)
-                HARD_LOAD[name]['_started_'] = True
-            else:
-                HARD_LOAD[name]['_started_'] = False
+        yield self.invoke_libraries_phase('_started_')
+        if self.sigint:
+            return
+        yield self.invoke_libraries_phase('_modules_started_')
+        if self.sigint:
+            return
+        self._lazy_record_hooks = False
+        self._lazy_missed_hooks.clear()
 
         self.loadedLibraries['notifications'].add({'title': 'System started',
             'message': 'System successfully started.', 'timeout': 300, 'source': 'Yombo Gateway System',
@@ -324,6 +446,12 @@ class Loader(YomboLibrary, object):
         })
 
         logger.info("Yombo Gateway started.")
+        logger.info("{summary}", summary=self.startup_summary())
+        yield self.save_library_costs()
+        if len(self._lazy_libraries) > 0:
+            logger.info("{summary}", summary=self.lazy_summary())
+        if self.loadedLibraries['configuration'].get('debug', 'startup_waterfall', False, False):
+            logger.info("{waterfall}", waterfall=self.startup_waterfall())
 
     @inlineCallbacks
     def unload(self):
@@ -376,97 +504,468 @@ class Loader(YomboLibrary, object):
         """
         logger.debug("Importing server libraries.")
         self._run_phase = "libraries_import"
+        lazy_libraries = self.lazy_library_names()
         for name, config in HARD_LOAD.items():
             if self.sigint:
                 return
+            if name in lazy_libraries:
+                self.add_lazy_library(name)
+                HARD_LOAD[name]['__init__'] = 'Lazy'
+                continue
             HARD_LOAD[name]['__init__'] = 'Starting'
             pathName = "yombo.lib.%s" % name
+            started = time()
+            memory = memory_usage()
             self.import_component(pathName, name, 'library')
+            self.startup_timed(name, 'import', started)
+            if memory is not None:
+                self.startup_memory[name] = memory_usage() - memory
             HARD_LOAD[name]['__init__'] = True
 
         logger.debug("Calling init functions of libraries.")
         self._run_phase = "libraries_init"
+        yield self.invoke_libraries_phase('_init_', self.init_library)
+
+        self.build_library_hooks()
+
+    def library_dependencies(self):
+        """
+        Returns the libraries each library waits on during a phase. Uses 'depends' from HARD_LOAD, libraries
+        without it wait on every library listed before them.
+
+        :return: An ordered dictionary of library name -> tuple of library names.
+        """
+        if self._library_dependencies is not None:
+            return self._library_dependencies
+
+        dependencies = OrderedDict()
         for name, config in HARD_LOAD.items():
-            if self.sigint:
+            if 'depends' not in config:
+                dependencies[name] = tuple(dependencies)
+                continue
+            for depends in config['depends']:
+                if depends not in dependencies:
+                    raise YomboCritical("Library %s depends on %s, which must be listed before it in HARD_LOAD." %
+                                        (name, depends))
+            dependencies[name] = tuple(config['depends'])
+        self._library_dependencies = dependencies
+        return dependencies
+
+    @inlineCallbacks
+    def invoke_libraries_phase(self, phase, call=None):
+        """
+        Runs a phase for all libraries. Each library starts the phase as soon as the libraries it depends on
+        have finished it, so libraries that don't depend on each other run at the same time. Returns once
+        every library has finished the phase.
+
+        :param phase: The hook to call, such as '_load_' or '_start_'.
+        :param call: Callable that accepts a library name and returns a Deferred, default is to invoke the hook.
+        """
+        phase_started = time()
+        self._phases_started.append(phase)
+        finished = OrderedDict()
+        for name, depends in self.library_dependencies().items():
+            waiting = [finished[depend] for depend in depends]
+            if len(waiting) == 0:
+                d = succeed(None)
+            else:
+                d = DeferredList(waiting)
+            d.addCallback(lambda ignored, library_name: self.run_library_phase(library_name, phase, call), name)
+            d.addErrback(self.library_invoke_failure, name, phase)  # Libraries depending on it still run.
+            finished[name] = d
+        yield DeferredList(list(finished.values()))
+        self.startup_timed('phase', phase, phase_started)
+
+    @inlineCallbacks
+    def run_library_phase(self, name, phase, call=None, lazy=False):
+        """
+        Runs one phase for one library, once the libraries it depends on have finished. Records how long it
+        took. Errors are logged, they don't stop other libraries.
+
+        Lazy libraries are skipped until they are activated. Once activated, the phases they missed are run by
+        run_lazy_phases(), with lazy set to True.
+        """
+        if self.sigint:
+            return
+        lazy_library = self._lazy_libraries.get(name.lower())
+        if lazy_library is not None and lazy is False:
+            if lazy_library['activated'] is None:
+                HARD_LOAD[name][phase] = 'Lazy'
+                return
+            yield self.library_ready(name)
+            if HARD_LOAD[name].get(phase) is True:
+                return
+        if self.check_operating_mode(HARD_LOAD[name]['operating_mode']) is False:
+            HARD_LOAD[name][phase] = False
+            return
+        HARD_LOAD[name][phase] = 'Starting'
+        self._log_loader('debug', name, 'library', phase, 'About to call %s.' % phase)
+        started = time()
+        try:
+            if call is None:
+                yield self.library_invoke(name, phase, called_by=self)
+            else:
+                yield call(name)
+        except Exception:
+            self.library_invoke_failure(Failure(), name, phase)
+        self.startup_timed(name, phase, started)
+        HARD_LOAD[name][phase] = True
+        self._log_loader('debug', name, 'library', phase, 'Finished call to %s.' % phase)
+
+    def lazy_library_names(self):
+        """
+        Returns the names of libraries to skip at startup, from lazy_libraries in the loader section of
+        yombo.ini. This is read before the configuration library is loaded.
+
+        :return: A set of library names, as listed in HARD_LOAD.
+        """
+        config_parser = configparser.ConfigParser(interpolation=None)
+        try:
+            config_parser.read('yombo.ini')
+            value = config_parser.get('loader', 'lazy_libraries', fallback='')
+        except configparser.Error as e:
+            logger.warn("Unable to read lazy_libraries from yombo.ini: {error}", error=e)
+            return set()
+
+        requested = set(item.strip().lower() for item in value.split(',') if item.strip() != '')
+        names = set()
+        for name, config in HARD_LOAD.items():
+            if config.get('lazy', False) is True and ('all' in requested or name.lower() in requested):
+                names.add(name)
+                requested.discard(name.lower())
+        requested.discard('all')
+        if len(requested) > 0:
+            logger.warn("These libraries can't be lazy, loading normally: {names}", names=", ".join(sorted(requested)))
+        return names
+
+    def add_lazy_library(self, name):
+        """
+        Puts a LazyLibrary in place of a library, it's imported on first use.
+
+        :param name: Library name, as listed in HARD_LOAD.
+        """
+        library = LazyLibrary(name, self)
+        self.loadedComponents["yombo.gateway.lib." + name.lower()] = library
+        self.loadedLibraries[name.lower()] = library
+        self.libraryNames[name] = library
+        self._lazy_libraries[name.lower()] = {
+            'name': name,
+            'activated': None,
+            'reason': None,
+            'import_time': None,
+            'memory': None,
+            'ready': False,
+            'waiting': [],
+        }
+
+    def activate_library(self, name, reason):
+        """
+        Imports a lazy library and starts running the startup phases it missed. Returns the library right
+        away, the phases continue in the background. Use library_ready() to wait for them.
+
+        :param name: Library name.
+        :param reason: What it was first used for, such as an attribute or hook name. Shown in lazy_report().
+        :return: The library.
+        """
+        lazy_library = self._lazy_libraries[name.lower()]
+        library = self.loadedLibraries[name.lower()]
+        if lazy_library['activated'] is not None:
+            return library
+
+        name = lazy_library['name']
+        logger.info("Starting lazy library {name}, first used for: {reason}", name=name, reason=reason)
+        started = time()
+        memory = memory_usage()
+        self.import_component("yombo.lib.%s" % name, name, 'library')
+        self.startup_timed(name, 'import', started)
+        lazy_library['activated'] = started
+        lazy_library['reason'] = reason
+        lazy_library['import_time'] = time() - started
+        if memory is not None:
+            lazy_library['memory'] = memory_usage() - memory
+        HARD_LOAD[name]['__init__'] = True
+        self.hook_table_invalidate()
+        self.run_lazy_phases(name)
+        return self.loadedLibraries[name.lower()]
+
+    @inlineCallbacks
+    def run_lazy_phases(self, name):
+        """
+        Runs init, and then every library phase that has already started, for a library that was just
+        activated. Then calls the hooks it missed during startup, and marks it ready.
+        """
+        lazy_library = self._lazy_libraries[name.lower()]
+        try:
+            yield self.run_library_phase(name, '_init_', self.init_library, lazy=True)
+            for phase in list(self._phases_started):
+                if phase != '_init_':
+                    yield self.run_library_phase(name, phase, lazy=True)
+            for hook, kwargs in list(self._lazy_missed_hooks.items()):
+                try:
+                    yield self.library_invoke(name, hook, **kwargs)
+                except Exception:
+                    self.library_invoke_failure(Failure(), name, hook)
+        finally:
+            lazy_library['ready'] = True
+            waiting = lazy_library['waiting']
+            lazy_library['waiting'] = []
+            for d in waiting:
+                d.callback(None)
+
+    def lazy_hook_missed(self, hook, kwargs):
+        """
+        Records a hook called during startup while lazy libraries haven't been activated. Once activated, a
+        lazy library gets the hook as well, see run_lazy_phases(). Only the first call of each hook is kept.
+
+        :param hook: The hook name.
+        :param kwargs: The kwargs it was called with.
+        """
+        if self._lazy_record_hooks is False or hook in LIBRARY_PHASES or hook in self._lazy_missed_hooks:
+            return
+        for lazy_library in self._lazy_libraries.values():
+            if lazy_library['activated'] is None:
+                kwargs = dict(kwargs)
+                kwargs.pop('hook_name', None)
+                self._lazy_missed_hooks[hook] = kwargs
                 return
-            if self.check_operating_mode(config['operating_mode']) is False:
-                HARD_LOAD[name]['_init_'] = False
+
+    def library_is_ready(self, name):
+        """
+        Returns True if a library has finished starting. Libraries that aren't lazy always are.
+
+        :param name: Library name.
+        """
+        lazy_library = self._lazy_libraries.get(name.lower())
+        return lazy_library is None or lazy_library['ready'] is True
+
+    def library_ready(self, name):
+        """
+        Returns a Deferred that fires once a lazy library has been activated and has finished starting.
+
+        :param name: Library name.
+        :return: A Deferred.
+        """
+        if self.library_is_ready(name):
+            return succeed(None)
+        d = Deferred()
+        self._lazy_libraries[name.lower()]['waiting'].append(d)
+        return d
+
+    def call_when_ready(self, name, method):
+        """
+        Wraps a method of a lazy library that's still starting. The wrapper waits for the library, then calls
+        the method.
+
+        :param name: Library name.
+        :param method: The method.
+        :return: A callable that returns a Deferred.
+        """
+        def call(*args, **kwargs):
+            d = self.library_ready(name)
+            d.addCallback(lambda ignored: method(*args, **kwargs))
+            return d
+        return call
+
+    def lazy_report(self):
+        """
+        Lists the lazy libraries: which were skipped, and which were started because something used them.
+
+        The time and memory a skipped library saves are the amounts measured the last time it was loaded, either
+        at startup or when it was activated.
+
+        :return: A list of dictionaries, one per lazy library.
+        """
+        report = []
+        for key, lazy_library in self._lazy_libraries.items():
+            name = lazy_library['name']
+            costs = self.library_costs.get(name, {}) if self.library_costs is not None else {}
+            item = {
+                'name': name,
+                'skipped': lazy_library['activated'] is None,
+                'reason': lazy_library['reason'],
+                'import_time': lazy_library['import_time'],
+                'init_time': None,
+                'memory': lazy_library['memory'],
+                'saved_time': None,
+                'saved_memory': None,
+            }
+            if (name, '_init_') in self.startup_times:
+                started, finished = self.startup_times[(name, '_init_')]
+                item['init_time'] = finished - started
+            if item['skipped']:
+                if 'import_time' in costs:
+                    item['saved_time'] = costs['import_time'] + costs.get('init_time', 0)
+                item['saved_memory'] = costs.get('memory', None)
+            report.append(item)
+        return report
+
+    def lazy_summary(self):
+        """
+        Returns one line describing the lazy libraries, see lazy_report().
+        """
+        parts = []
+        for item in self.lazy_report():
+            if item['skipped'] is False:
+                parts.append("%s started for %s" % (item['name'], item['reason']))
+            elif item['saved_time'] is None:
+                parts.append("%s skipped" % item['name'])
+            else:
+                parts.append("%s skipped, saved %.3fs and %s KB" % (item['name'], item['saved_time'],
+                             "?" if item['saved_memory'] is None else item['saved_memory'] // 1024))
+        return "Lazy libraries: %s" % ", ".join(parts)
+
+    @inlineCallbacks
+    def save_library_costs(self):
+        """
+        Saves how long each library took to import and init, and how much memory importing it used. Used by
+        lazy_report() to show what skipped libraries save.
+        """
+        self.library_costs = yield self.loadedLibraries['sqldict'].get(self, 'library_costs')
+        for name in HARD_LOAD:
+            lazy_library = self._lazy_libraries.get(name.lower())
+            if lazy_library is not None and lazy_library['activated'] is None:
                 continue
-            HARD_LOAD[name]['_init_'] = 'Starting'
-            # self._log_loader('debug', name, 'library', 'init', 'About to call _init_.')
-
-            component = name.lower()
-            library = self.loadedLibraries[component]
-            library._event_loop = self.event_loop
-            library._AMQP = self.loadedLibraries['amqp']
-            library._AMQPYombo = self.loadedLibraries['amqpyombo']
-            library._APIAuth = self.loadedLibraries['apiauth']
-            library._Atoms = self.loadedLibraries['atoms']
-            library._Automation = self.loadedLibraries['automation']
-            library._Commands = self.loadedLibraries['commands']
-            library._Configs = self.loadedLibraries['configuration']
-            library._Devices = self.loadedLibraries['devices']
-            library._Locations = self.loadedLibraries['locations']
-            library._DeviceTypes = self.loadedLibraries['devicetypes']
-            library._Gateways = self.loadedLibraries['gateways']
-            library._GPG = self.loadedLibraries['gpg']
-            library._InputTypes = self.loadedLibraries['inputtypes']
-            library._Libraries = self.loadedLibraries
-            library._Loader = self
-            library._LocalDB = self.loadedLibraries['localdb']
-            library._Modules = self._moduleLibrary
-            library._Nodes = self.loadedLibraries['nodes']
-            library._Notifications = self.loadedLibraries['notifications']
-            library._Localize = self.loadedLibraries['localize']
-            library._MQTT = self.loadedLibraries['mqtt']
-            library._Queue = self.loadedLibraries['queue']
-            library._SQLDict = self.loadedLibraries['sqldict']
-            library._SSLCerts = self.loadedLibraries['sslcerts']
-            library._States = self.loadedLibraries['states']
-            library._Statistics = self.loadedLibraries['statistics']
-            library._Tasks = self.loadedLibraries['tasks']
-            library._Times = self.loadedLibraries['times']
-            library._YomboAPI = self.loadedLibraries['yomboapi']
-            library._Variables = self.loadedLibraries['variables']
-            library._Validate = self.loadedLibraries['validate']
-            library._WebSessions = self.loadedLibraries['websessions']
-            if hasattr(library, '_init_') and isinstance(library._init_, Callable) \
-                    and yombo.utils.get_method_definition_level(library._init_) != 'yombo.core.module.YomboModule':
-                d = Deferred()
-                d.addCallback(lambda ignored: self._log_loader('debug', name, 'library', 'init', 'About to call _init_.'))
-                d.addCallback(lambda ignored: maybeDeferred(library._init_))
-                d.addErrback(self.import_libraries_failure)
-                # d.addCallback(lambda ignored: self._log_loader('debug', name, 'library', 'init', 'Done with call _init_.'))
-                d.callback(1)
-                yield d
-                # d.addCallback(maybeDeferred, library._init_)
-                # self._log_loader('debug', name, 'library', 'init', 'Finished to call _init_.')
-                # try:
-                #     d = yield maybeDeferred(library._init_, self)
-                # except YomboCritical, e:
-                #     logger.error("---==(Critical Server Error in init function for library: {name})==----", name=name)
-                #     logger.error("--------------------------------------------------------")
-                #     logger.error("Error message: {e}", e=e)
-                #     logger.error("--------------------------------------------------------")
-                #     e.exit()
-                # except:
-                #     logger.error("-------==(Error in init function for library: {name})==---------", name=name)
-                #     logger.error("1:: {e}", e=sys.exc_info())
-                #     logger.error("---------------==(Traceback)==--------------------------")
-                #     logger.error("{e}", e=traceback.print_exc(file=sys.stdout))
-                #     logger.error("--------------------------------------------------------")
-                HARD_LOAD[name]['_init_'] = True
+            costs = {}
+            if lazy_library is not None:
+                costs['import_time'] = lazy_library['import_time']
+                costs['memory'] = lazy_library['memory']
             else:
-                logger.error("----==(Library doesn't have init function: {name})==-----", name=name)
-            if hasattr(library, '_init2_') and isinstance(library._init2_, Callable) \
-                    and yombo.utils.get_method_definition_level(library._init2_) != 'yombo.core.module.YomboModule':
-                d = Deferred()
-                d.addCallback(lambda ignored: self._log_loader('debug', name, 'library', 'init', 'About to call _init2_.'))
-                d.addCallback(lambda ignored: maybeDeferred(library._init2_))
-                d.addErrback(self.import_libraries_failure)
-                # d.addCallback(lambda ignored: self._log_loader('debug', name, 'library', 'init', 'Done with call _init2_.'))
-                d.callback(1)
-                yield d
+                if (name, 'import') in self.startup_times:
+                    started, finished = self.startup_times[(name, 'import')]
+                    costs['import_time'] = finished - started
+                costs['memory'] = self.startup_memory.get(name, None)
+            if (name, '_init_') in self.startup_times:
+                started, finished = self.startup_times[(name, '_init_')]
+                costs['init_time'] = finished - started
+            if 'import_time' in costs:
+                self.library_costs[name] = costs
+
+    def startup_timed(self, name, phase, started):
+        """
+        Records how long something took during startup, for startup_waterfall().
+
+        :param name: Library name, or 'modules' or 'phase'.
+        :param phase: Phase or step name.
+        :param started: Time it started.
+        """
+        self.startup_times[(name, phase)] = (started, time())
+
+    def startup_summary(self, count=5):
+        """
+        Returns one line with how long startup took and the slowest library phases.
+
+        :param count: How many of the slowest library phases to include.
+        """
+        if len(self.startup_times) == 0:
+            return "Startup times: nothing recorded."
+        first = min(started for started, finished in self.startup_times.values())
+        last = max(finished for started, finished in self.startup_times.values())
+        slowest = sorted(((finished - started, name, phase)
+                          for (name, phase), (started, finished) in self.startup_times.items()
+                          if name not in ('phase', 'modules')), reverse=True)[:count]
+        return "Startup took %.3f seconds. Slowest: %s" % (
+            last - first, ", ".join("%s %s %.3fs" % (name, phase, duration) for duration, name, phase in slowest))
+
+    def startup_waterfall(self, width=40):
+        """
+        Returns a text chart of when each library started and finished each startup phase.
+
+        :param width: Width of the bars, in characters.
+        :return: A string, one line per library per phase.
+        """
+        if len(self.startup_times) == 0:
+            return "Startup waterfall: nothing recorded."
+        first = min(started for started, finished in self.startup_times.values())
+        last = max(finished for started, finished in self.startup_times.values())
+        total = max(last - first, 0.001)
+        lines = ["Startup waterfall, %.3f seconds:" % (last - first)]
+        times = sorted(self.startup_times.items(), key=lambda item: (item[1][0], item[0][0] != 'phase'))
+        for (name, phase), (started, finished) in times:
+            offset = int((started - first) / total * width)
+            length = max(int(round((finished - started) / total * width)), 1)
+            bar = (" " * offset + "#" * length)[:width]
+            lines.append("  %-18s %-18s %8.3f %8.3f |%-*s|" %
+                         (phase, name, started - first, finished - started, width, bar))
+        return "\n".join(lines)
+
+    @inlineCallbacks
+    def init_library(self, name):
+        """
+        Sets up references to other libraries, then calls "init" and "init2" for a library.
+
+        :param name: Library name, as listed in HARD_LOAD.
+        """
+        component = name.lower()
+        library = self.loadedLibraries[component]
+        library._event_loop = self.event_loop
+        library._AMQP = self.loadedLibraries['amqp']
+        library._AMQPYombo = self.loadedLibraries['amqpyombo']
+        library._APIAuth = self.loadedLibraries['apiauth']
+        library._Atoms = self.loadedLibraries['atoms']
+        library._Automation = self.loadedLibraries['automation']
+        library._Commands = self.loadedLibraries['commands']
+        library._Configs = self.loadedLibraries['configuration']
+        library._Devices = self.loadedLibraries['devices']
+        library._Locations = self.loadedLibraries['locations']
+        library._DeviceTypes = self.loadedLibraries['devicetypes']
+        library._Gateways = self.loadedLibraries['gateways']
+        library._GPG = self.loadedLibraries['gpg']
+        library._InputTypes = self.loadedLibraries['inputtypes']
+        library._Libraries = self.loadedLibraries
+        library._Loader = self
+        library._LocalDB = self.loadedLibraries['localdb']
+        library._Modules = self._moduleLibrary
+        library._Nodes = self.loadedLibraries['nodes']
+        library._Notifications = self.loadedLibraries['notifications']
+        library._Localize = self.loadedLibraries['localize']
+        library._MQTT = self.loadedLibraries['mqtt']
+        library._Queue = self.loadedLibraries['queue']
+        library._SQLDict = self.loadedLibraries['sqldict']
+        library._SSLCerts = self.loadedLibraries['sslcerts']
+        library._States = self.loadedLibraries['states']
+        library._Statistics = self.loadedLibraries['statistics']
+        library._Tasks = self.loadedLibraries['tasks']
+        library._Times = self.loadedLibraries['times']
+        library._YomboAPI = self.loadedLibraries['yomboapi']
+        library._Variables = self.loadedLibraries['variables']
+        library._Validate = self.loadedLibraries['validate']
+        library._WebSessions = self.loadedLibraries['websessions']
+        if hasattr(library, '_init_') and isinstance(library._init_, Callable) \
+                and yombo.utils.get_method_definition_level(library._init_) != 'yombo.core.module.YomboModule':
+            d = Deferred()
+            d.addCallback(lambda ignored: self._log_loader('debug', name, 'library', 'init', 'About to call _init_.'))
+            d.addCallback(lambda ignored: maybeDeferred(library._init_))
+            d.addErrback(self.import_libraries_failure)
+            # d.addCallback(lambda ignored: self._log_loader('debug', name, 'library', 'init', 'Done with call _init_.'))
+            d.callback(1)
+            yield d
+            # d.addCallback(maybeDeferred, library._init_)
+            # self._log_loader('debug', name, 'library', 'init', 'Finished to call _init_.')
+            # try:
+            #     d = yield maybeDeferred(library._init_, self)
+            # except YomboCritical, e:
+            #     logger.error("---==(Critical Server Error in init function for library: {name})==----", name=name)
+            #     logger.error("--------------------------------------------------------")
+            #     logger.error("Error message: {e}", e=e)
+            #     logger.error("--------------------------------------------------------")
+            #     e.exit()
+            # except:
+            #     logger.error("-------==(Error in init function for library: {name})==---------", name=name)
+            #     logger.error("1:: {e}", e=sys.exc_info())
+            #     logger.error("---------------==(Traceback)==--------------------------")
+            #     logger.error("{e}", e=traceback.print_exc(file=sys.stdout))
+            #     logger.error("--------------------------------------------------------")
+        else:
+            logger.error("----==(Library doesn't have init function: {name})==-----", name=name)
+        if hasattr(library, '_init2_') and isinstance(library._init2_, Callable) \
+                and yombo.utils.get_method_definition_level(library._init2_) != 'yombo.core.module.YomboModule':
+            d = Deferred()
+            d.addCallback(lambda ignored: self._log_loader('debug', name, 'library', 'init', 'About to call _init2_.'))
+            d.addCallback(lambda ignored: maybeDeferred(library._init2_))
+            d.addErrback(self.import_libraries_failure)
+            # d.addCallback(lambda ignored: self._log_loader('debug', name, 'library', 'init', 'Done with call _init2_.'))
+            d.callback(1)
+            yield d
 
     def check_operating_mode(self, allowed):
         """
@@ -499,71 +998,368 @@ class Loader(YomboLibrary, object):
                      hook_name=hook_name,
                      failure=failure)
 
-    @inlineCallbacks
+    def build_library_hooks(self):
+        """
+        Builds the table used by library_invoke(): (library name, hook name) -> LibraryHook for every hook a
+        library implements. Called once libraries are imported and initialized, and again after
+        hook_table_invalidate().
+        """
+        hooks = {}
+        universal_hooks = {}
+        for library_name, library in self.loadedLibraries.items():
+            if isinstance(library, LazyLibrary):
+                continue
+            prefix = library._Name.lower() + "_"
+            for attribute in dir(library):
+                if attribute.startswith("__"):
+                    continue
+                if attribute.startswith("_") and attribute.endswith("_"):
+                    hook_name = attribute
+                elif attribute.startswith(prefix):
+                    hook_name = attribute[len(prefix):]
+                else:
+                    continue
+                method = getattr(library, attribute, None)
+                if method is None or not isinstance(method, Callable) or inspect.isclass(method):
+                    continue
+                hook = LibraryHook(library_name, attribute, method,
+                                   self.hook_counter('library', library._Name, attribute))
+                if hook.returns_deferred:
+                    self._hook_deferred.add(hook.counter)
+                if hook_name == '_yombo_universal_hook_':
+                    universal_hooks[library_name] = hook
+                else:
+                    hooks[(library_name, hook_name)] = hook
+
+        self._library_hooks = MappingProxyType(hooks)
+        self._universal_hooks = MappingProxyType(universal_hooks)
+        self._library_names = frozenset(self.loadedLibraries.keys())
+
     def library_invoke(self, requested_library, hook_name, **kwargs):
         """
         Invokes a hook for a a given library. Passes kwargs in, returns the results to caller.
+
+        :return: A Deferred that fires with the results of the hook, or None if the library doesn't implement it.
         """
+        if 'called_by' not in kwargs:
+            return fail(YomboWarning("Unable to call hook '%s:%s', missing 'called_by' named argument." %
+                                     (requested_library, hook_name)))
         requested_library = requested_library.lower()
-        if requested_library not in self.loadedLibraries:
-            raise YomboWarning('Requested library is missing: %s' % requested_library)
+        if self._library_hooks is None:
+            self.build_library_hooks()
+
+        hook = self._library_hooks.get((requested_library, hook_name))
+        universal = self._universal_hooks.get(requested_library)
+        if hook is None and universal is None:
+            if requested_library not in self._library_names:
+                return fail(YomboWarning('Requested library is missing: %s' % requested_library))
+            if hook_name not in LIBRARY_PHASES and requested_library in self._lazy_libraries and \
+                    self._lazy_libraries[requested_library]['activated'] is None:
+                self.activate_library(requested_library, hook_name)
+                d = self.library_ready(requested_library)
+                d.addCallback(lambda ignored: self.library_invoke(requested_library, hook_name, **kwargs))
+                return d
+            return succeed(None)
+
+        kwargs['hook_name'] = hook_name
+        result = None
+        if hook is not None:
+            result = self.call_library_hook(hook, kwargs)
+        if universal is not None:
+            if isinstance(result, Deferred):
+                result.addCallback(self.call_universal_hook, universal, kwargs)
+            else:
+                result = self.call_universal_hook(result, universal, kwargs)
+        if isinstance(result, Deferred):
+            return result
+        return succeed(result)
+
+    def call_library_hook(self, hook, kwargs):
+        """
+        Calls a LibraryHook, counting the call and the time spent. Failures are logged, not raised.
+
+        :return: The result of the hook, which may be a Deferred.
+        """
+        counter = hook.counter
+        self._hook_call_counts[counter] += 1
+        self._hook_callers[(counter, kwargs['called_by'])] += 1
+        started = time()
+        try:
+            result = hook.method(**kwargs)
+        except Exception:
+            self._hook_call_times[counter] += time() - started
+            self.library_invoke_failure(Failure(), hook.library_name, hook.attribute)
+            return None
+
+        if isinstance(result, Deferred):
+            self._hook_deferred.add(counter)
+            result.addErrback(self.library_invoke_failure, hook.library_name, hook.attribute)
+            result.addBoth(self.hook_timed, counter, started)
+        else:
+            self._hook_call_times[counter] += time() - started
+        return result
+
+    def call_universal_hook(self, result, universal, kwargs):
+        """
+        Calls a library's _yombo_universal_hook_ after the requested hook, keeping the requested hook's result.
+        """
+        universal_result = self.call_library_hook(universal, kwargs)
+        if isinstance(universal_result, Deferred):
+            return universal_result.addCallback(lambda ignored: result)
+        return result
+
+    def hook_timed(self, result, counter, started):
+        """
+        Adds the time a hook's Deferred took to fire to the hook's total time.
+        """
+        self._hook_call_times[counter] += time() - started
+        return result
+
+    def hook_counter(self, component_type, component_name, hook):
+        """
+        Get the index into the hook call counters for a component's hook, adding a new counter if needed.
+
+        :param component_type: Either 'library' or 'module'.
+        :param component_name: The component's _Name.
+        :param hook: The hook name, as found on the component.
+        :return: int
+        """
+        key = (component_type, component_name, hook)
+        if key not in self._hook_counter_index:
+            self._hook_counter_index[key] = len(self._hook_call_counts)
+            self._hook_call_counts.append(0)
+            self._hook_call_times.append(0.0)
+        return self._hook_counter_index[key]
+
+    def count_hook_call(self, counter, called_by):
+        """
+        Increment a hook call counter returned from hook_counter().
+
+        :param counter: Index from hook_counter().
+        :param called_by: The component that called the hook.
+        """
+        self._hook_call_counts[counter] += 1
+        self._hook_callers[(counter, called_by)] += 1
+
+    def get_hook_counts(self, component_type):
+        """
+        Builds a dictionary of hook call counts for either libraries or modules.
+
+        :param component_type: Either 'library' or 'module'.
+        :return: A dictionary of component name -> hook -> called_by -> {'count': int}
+        """
+        counts = OrderedDict()
+        callers = {}
+        for (counter, called_by), count in self._hook_callers.items():
+            if counter not in callers:
+                callers[counter] = {}
+            callers[counter][called_by] = {'count': count}
+
+        for (counter_type, component_name, hook), counter in self._hook_counter_index.items():
+            if counter_type != component_type:
+                continue
+            if component_name not in counts:
+                counts[component_name] = OrderedDict()
+            counts[component_name][hook] = {'Total Count': {'count': self._hook_call_counts[counter]}}
+            if counter in callers:
+                counts[component_name][hook].update(callers[counter])
+        return counts
+
+    def get_hook_profile(self, component_type):
+        """
+        Builds a dictionary of how many times each hook was called, and the time spent in it. For hooks that
+        return a Deferred, the time is until the Deferred fires.
+
+        :param component_type: Either 'library' or 'module'.
+        :return: A dictionary of component name -> hook -> {'calls': int, 'time': float (seconds),
+            'average': float (seconds), 'returns_deferred': bool}
+        """
+        profile = OrderedDict()
+        for (counter_type, component_name, hook), counter in self._hook_counter_index.items():
+            if counter_type != component_type:
+                continue
+            calls = self._hook_call_counts[counter]
+            total = self._hook_call_times[counter]
+            if component_name not in profile:
+                profile[component_name] = OrderedDict()
+            profile[component_name][hook] = {
+                'calls': calls,
+                'time': total,
+                'average': total / calls if calls > 0 else 0,
+                'returns_deferred': counter in self._hook_deferred,
+            }
+        return profile
+
+    def hook_table_invalidate(self):
+        """
+        Clears the tables of hook implementors. Called when modules are added, removed, or unloaded.
+        """
+        self._hook_table.clear()
+        self._library_hooks = None
+        self._universal_hooks = None
+
+    def hook_implementors(self, hook):
+        """
+        Returns a tuple of the callables that implement a hook, in the order they are to be called: libraries
+        first, then modules. Once the gateway has started, the result is kept until hook_table_invalidate() is
+        called so invoking a hook doesn't have to search every library and module again.
+
+        Each item is a tuple of: component type, component, result label, method, hook_name argument,
+        counter index, and if it's the universal hook.
+
+        :param hook: The hook name, such as '_states_set_'.
+        :return: tuple
+        """
+        if hook in self._hook_table:
+            return self._hook_table[hook]
+
+        implementors = []
+        hooks = [(hook, False), ('_yombo_universal_hook_', True)]
+        for library_name, library in self.loadedLibraries.items():
+            if isinstance(library, LazyLibrary):
+                continue
+            for library_hook, universal in hooks:
+                if not (library_hook.startswith("_") and library_hook.endswith("_")):
+                    library_hook = library._Name.lower() + "_" + library_hook
+                method = getattr(library, library_hook, None)
+                if method is None or not isinstance(method, Callable):
+                    continue
+                implementors.append(('library', library, library._FullName, method, hook,
+                                     self.hook_counter('library', library._Name, library_hook), universal))
+
+        if self._moduleLibrary is not None:
+            for module_id, module in self._moduleLibrary.modules.items():
+                if module._Name == 'yombo.core.module.YomboModule':
+                    continue
+                module_hook = hook
+                if not (module_hook.startswith("_") and module_hook.endswith("_")):
+                    module_hook = module._Name.lower() + "_" + module_hook
+                method = getattr(module, module_hook, None)
+                if method is None or not isinstance(method, Callable):
+                    continue
+                implementors.append(('module', module, module._FullName.lower(), method, module_hook,
+                                     self.hook_counter('module', module._Name, module_hook), False))
 
+        implementors = tuple(implementors)
+        if RUN_PHASE[self._run_phase] >= RUN_PHASE['modules_started']:
+            self._hook_table[hook] = implementors
+        return implementors
+
+    def global_invoke_all(self, hook, **kwargs):
+        """
+        Calls a hook on all libraries and modules. Used by :py:func:`yombo.utils.global_invoke_all`.
+
+        Implementors that return a result directly are called without creating a Deferred for each one. Any
+        implementors that return Deferreds run concurrently and are collected with a DeferredList.
+
+        :param hook: The hook name to call.
+        :param kwargs: kwargs to send to the hooks. Must include 'called_by'.
+        :return: A Deferred that fires with a dictionary of results, keyed by component full name.
+        """
         if 'called_by' not in kwargs:
-            raise YomboWarning("Unable to call hook '%s:%s', missing 'called_by' named argument." % (requested_library, hook_name))
-        calling_component = kwargs['called_by']
-        final_results = None
-
-        for hook in [hook_name, '_yombo_universal_hook_']:
-            cache_key = requested_library + hook
-            if cache_key in self._invoke_list_cache:
-                if self._invoke_list_cache[cache_key] is False:
-                    # logger.warn("Cache hook ({cache_key})...SKIPPED", cache_key=cache_key)
-                    continue  # skip. We already know function doesn't exist.
-            library = self.loadedLibraries[requested_library]
-            if requested_library == 'Loader':
-                return
-            if not (hook.startswith("_") and hook.endswith("_")):
-                hook = library._Name.lower() + "_" + hook
-            kwargs['hook_name'] = hook_name
-            # print("lib hook: %s -> %s" % (hook, hook_name))
-
-            if hasattr(library, hook):
-                method = getattr(library, hook)
-                if isinstance(method, Callable):
-                    if library._Name not in self.hook_counts:
-                        self.hook_counts[library._Name] = {}
-                    if hook not in self.hook_counts:
-                        self.hook_counts[library._Name][hook] = {'Total Count': {'count': 0}}
-                    # print "hook counts: %s" % self.hook_counts
-                    # print "hook counts: %s" % self.hook_counts[library._Name][hook]
-                    if calling_component not in self.hook_counts[library._Name][hook]:
-                        self.hook_counts[library._Name][hook][calling_component] = {'count': 0}
-                    self.hook_counts[library._Name][hook][calling_component]['count'] = self.hook_counts[library._Name][hook][calling_component]['count'] + 1
-                    self.hook_counts[library._Name][hook]['Total Count']['count'] = self.hook_counts[library._Name][hook]['Total Count']['count'] + 1
-                    self._invoke_list_cache[cache_key] = True
-
-                    try:
-                        d = Deferred()
-                        d.addCallback(lambda ignored: self._log_loader('debug', library._Name, 'library', hook,
-                                                                       'About to call %s' % hook))
-                        # print("calling %s:%s" % (library._Name, hook))
-                        d.addCallback(lambda ignored: maybeDeferred(method, **kwargs))
-                        d.addErrback(self.library_invoke_failure, requested_library, hook)
-                        d.callback(1)
-                        if hook == '_yombo_universal_hook_':
-                            yield d
-                        else:
-                            final_results = yield d
-                    except RuntimeWarning as e:
-                        pass
-                else:
-                    logger.debug("Cache library hook ({library}:{hook})...setting false", library=library._FullName, hook=hook)
-                    logger.debug("----==(Library {library} doesn't have a callable function: {function})==-----", library=library._FullName, function=hook)
-                    raise YomboWarning("Hook is not callable: %s" % hook)
+            logger.warn("Unable to call hook '{hook}', missing 'called_by' named argument.", hook=hook)
+            return succeed({})
+        called_by = kwargs['called_by']
+        if 'stoponerror' not in kwargs:
+            kwargs['stoponerror'] = False
+        stoponerror = kwargs['stoponerror']
+        if 'allow_disable' not in kwargs:
+            kwargs['allow_disable'] = None
+        allow_disable = kwargs['allow_disable'] is True
+        kwargs.pop('hook_name', None)
+        if len(self._lazy_libraries) > 0:
+            self.lazy_hook_missed(hook, kwargs)
+
+        lib_results = {}
+        modules_results = {}
+        waiting = []
+        stopped = []
+        for implementor in self.hook_implementors(hook):
+            component_type, component, label, method, hook_name, counter, universal = implementor
+            if component_type == 'module':
+                if component._module_id in self._moduleLibrary.disabled_modules or int(component._status) != 1:
+                    continue
+                results = modules_results
+            else:
+                results = lib_results
+
+            self._hook_call_counts[counter] += 1
+            self._hook_callers[(counter, called_by)] += 1
+            started = time()
+            try:
+                result = method(hook_name=hook_name, **kwargs)
+            except YomboHookStopProcessing as e:
+                self._hook_call_times[counter] += time() - started
+                if stoponerror is True:
+                    e.collected = dict_merge(modules_results, lib_results)
+                    e.by_who = label
+                    raise
+                self.global_invoke_failure(Failure(), implementor, None, allow_disable)
+                continue
+            except Exception:
+                self._hook_call_times[counter] += time() - started
+                self.global_invoke_failure(Failure(), implementor, None, allow_disable)
+                continue
+
+            if isinstance(result, Deferred):
+                self._hook_deferred.add(counter)
+                result.addBoth(self.hook_timed, counter, started)
+                result.addCallbacks(self.global_invoke_result, self.global_invoke_failure,
+                                    callbackArgs=(results, implementor, called_by),
+                                    errbackArgs=(implementor, stopped if stoponerror is True else None,
+                                                 allow_disable))
+                waiting.append(result)
             else:
-    #            logger.debug("Cache hook ({library}:{hook})...setting false", library=library._FullName, hook=hook)
-                self._invoke_list_cache[cache_key] = False
-        return final_results
+                self._hook_call_times[counter] += time() - started
+                self.global_invoke_result(result, results, implementor, called_by)
+
+        if len(waiting) == 0:
+            return succeed(dict_merge(modules_results, lib_results))
+
+        def collected(ignored):
+            if len(stopped) > 0:
+                stopped[0].collected = dict_merge(modules_results, lib_results)
+                raise stopped[0]
+            return dict_merge(modules_results, lib_results)
+
+        return DeferredList(waiting).addCallback(collected)
+
+    def global_invoke_result(self, result, results, implementor, called_by):
+        """
+        Saves the results of a hook. For modules, also records the call in Modules.hooks_called, as
+        module_invoke() does. Called by global_invoke_all.
+        """
+        component_type, component, label, method, hook_name, counter, universal = implementor
+        if result is not None and universal is False:
+            results[label] = result
+        if component_type == 'module':
+            self._moduleLibrary._log_hook_called(result, component._Name + ":" + hook_name, component, hook_name,
+                                                 called_by)
+        return result
+
+    def global_invoke_failure(self, failure, implementor, stopped, allow_disable=False):
+        """
+        Logs a hook failure. If the hook raised YomboHookStopProcessing and the caller asked to stop on error,
+        the exception is saved so global_invoke_all can raise it once all hooks are done. If the caller passed
+        allow_disable=True, a module that fails is disabled, as module_invoke() does.
+        """
+        component_type, component, label, method, hook_name, counter, universal = implementor
+        if stopped is not None and failure.check(YomboHookStopProcessing):
+            failure.value.by_who = label
+            stopped.append(failure.value)
+            return None
+        if component_type == 'library':
+            self.library_invoke_failure(failure, component._Name.lower(), hook_name)
+        else:
+            logger.warn("---==(failure during module invoke for hook ({module_name}::{hook_name})==----",
+                        module_name=component._Name, hook_name=hook_name)
+            logger.warn("{failure}", failure=failure)
+            if allow_disable is True:
+                logger.warn("Disabling module '{module}' due to exception from hook ({hook}): {e}",
+                            module=component._Name, hook=hook_name, e=failure.getErrorMessage())
+                self._moduleLibrary.disabled_modules[component._module_id] = \
+                    "Caught exception during call '%s': %s" % (failure.getErrorMessage(), hook_name)
+        return None
 
     @inlineCallbacks
     def library_invoke_all(self, hook, fullName=False, **kwargs):
@@ -584,8 +1380,12 @@ class Loader(YomboLibrary, object):
         else:
             kwargs['stoponerror'] = False
             stoponerror = False
+        if len(self._lazy_libraries) > 0:
+            self.lazy_hook_missed(hook, kwargs)
 
         for library_name, library in self.loadedLibraries.items():
+            if isinstance(library, LazyLibrary):
+                continue
             # logger.debug("invoke all:{libraryName} -> {hook}", libraryName=library_name, hook=hook )
             try:
                 result = yield self.library_invoke(library_name, hook, **kwargs)
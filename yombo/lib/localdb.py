@@ -25,6 +25,7 @@ A database API to SQLite3.
 :view-source: `View Source Code <https://yombo.net/Docs/gateway/html/current/_modules/yombo/lib/localdb.html>`_
 """
 # Import python libraries
+from array import array
 from collections import OrderedDict
 
 import decimal
@@ -52,7 +53,11 @@ from yombo.utils.datatypes import coerce_value
 
 logger = get_logger('lib.localdb')
 
-LATEST_SCHEMA_VERSION = 1
+LATEST_SCHEMA_VERSION = 3
+
+# Columns returned by LocalDB.statistic_get_range(). Minimal requests get the first 7.
+STATISTIC_COLUMNS = ('id', 'bucket_time', 'bucket_size', 'bucket_lifetime', 'bucket_type', 'bucket_name',
+                     'bucket_value', 'bucket_average_data', 'anon', 'uploaded', 'finished', 'updated_at')
 
 
 #### Various SQLite tables within the database. ####
@@ -270,12 +275,11 @@ class LocalDB(YomboLibrary):
         self.db_bulk_queue = {}
         self.db_bulk_queue_id_cols = {}
         self.save_bulk_queue_loop = None
-        def show_connected(connection):
-            connection.execute("PRAGMA foreign_keys = ON")
+        self.slow_query_time = 0.25
         self.db_model = {}  # store generated database model here.
-        # Connect to the DB
-        Registry.DBPOOL = adbapi.ConnectionPool('sqlite3', "usr/etc/yombo.db", check_same_thread=False,
-                                                cp_min=1, cp_max=1, cp_openfun=show_connected)
+        # Connect to the DB. Configs isn't available yet, the read pool is resized in _load_.
+        self.db_pool = SQLitePool("usr/etc/yombo.db", read_connections=3)
+        Registry.DBPOOL = self.db_pool
         self.dbconfig = Registry.getConfig()
 
         self.schema_version = 0
@@ -317,6 +321,10 @@ class LocalDB(YomboLibrary):
 
     def _load_(self, **kwargs):
         self.gateway_id = self._Configs.get('core', 'gwid', 'local', False)
+        self.db_pool.set_read_connections(self._Configs.get('localdb', 'read_connections', 3))
+        self.slow_query_time = self._Configs.get('localdb', 'slow_query_ms', 250) / 1000
+        self.statistics_anonymous = self._Configs.handle('statistics', 'anonymous', True)
+        self.db_pool.add_query_hook(self.db_query_timed)
         self.save_bulk_queue_loop = LoopingCall(self.save_bulk_queue)
         self.save_bulk_queue_loop.start(61.1, False)
 
@@ -326,6 +334,22 @@ class LocalDB(YomboLibrary):
         if self.save_bulk_queue_loop is not None and self.save_bulk_queue_loop.running:
             self.save_bulk_queue_loop.stop()
 
+    def db_query_timed(self, route, query, duration):
+        """
+        Called by the database pool after every query or interaction completes. Slow queries are logged,
+        and all query times are sent to statistics.
+
+        :param route: Either 'read' or 'write'.
+        :param query: The SQL statement, or name of the interaction function.
+        :param duration: How many seconds the database took to run it.
+        """
+        if duration >= self.slow_query_time:
+            logger.warn("Slow database {route} ({duration}ms): {query}",
+                        route=route, duration=round(duration * 1000, 2), query=query)
+            self._Statistics.increment("lib.localdb.query.%s.slow" % route, bucket_size=60, anon=True)
+        self._Statistics.averages("lib.localdb.query.%s.duration" % route, round(duration * 1000, 2),
+                                  bucket_size=60, anon=True)
+
     def get_model_class(self, class_name):
         return globals()[class_name]()
 
@@ -565,6 +589,17 @@ class LocalDB(YomboLibrary):
             results.append(record.__dict__)  # we need a dictionary, not an object
         return results
 
+    @inlineCallbacks
+    def get_device_status_ids(self):
+        """
+        Get the status_id of every device status in the database. Used to know if a device status needs to be
+        inserted or updated without looking it up each time.
+
+        :return: A set of status ids.
+        """
+        records = yield Registry.DBPOOL.runQuery("SELECT status_id FROM device_status")
+        return set(record[0] for record in records)
+
     @inlineCallbacks
     def get_device_status(self, where, **kwargs):
         limit = self._get_limit(**kwargs)
@@ -1199,23 +1234,23 @@ class LocalDB(YomboLibrary):
     @inlineCallbacks
     def get_states(self, name=None):
         """
-        Gets the last version of a state. Note: Only returns states that were set within the last 60 days.
+        Gets the last version of a state. Note: Only returns states that were updated within the last 60 days.
+
+        The latest value of each state is kept in the states_current table by save_state_bulk, so this doesn't
+        have to search the states history.
 
         :param name:
         :return:
         """
+        sql = """SELECT name, gateway_id, value, value_type, live, created_at, updated_at
+FROM states_current
+WHERE updated_at > ?"""
+        args = [int(time()) - 60 * 60 * 24 * 60]
         if name is not None:
-            extra_where = "AND name = %s" % name
-        else:
-            extra_where = ''
+            sql += " AND name = ?"
+            args.append(name)
 
-        sql = """SELECT name, gateway_id, value, value_type, live, created_at, updated_at
-FROM states s1
-WHERE created_at = (SELECT MAX(created_at) from states s2 where s1.id = s2.id)
-%s
-AND created_at > %s
-GROUP BY name""" % (extra_where, str(int(time()) - 60 * 60 * 24 * 60))
-        states = yield Registry.DBPOOL.runQuery(sql)
+        states = yield Registry.DBPOOL.runQuery(sql, args)
         results = []
         for state in states:
             results.append({
@@ -1253,6 +1288,7 @@ GROUP BY name""" % (extra_where, str(int(time()) - 60 * 60 * 24 * 60))
         if gateway_id is None:
             gateway_id = self.gateway_id
         count = yield self.dbconfig.delete('states', where=['name = ? and gateway_id = ?', name, gateway_id])
+        yield self.dbconfig.delete('states_current', where=['name = ? and gateway_id = ?', name, gateway_id])
         return count
 
     @inlineCallbacks
@@ -1307,10 +1343,22 @@ GROUP BY name""" % (extra_where, str(int(time()) - 60 * 60 * 24 * 60))
             updated_at=values['updated_at'],
         ).save()
 
-    @inlineCallbacks
     def save_state_bulk(self, states):
-        results = yield self.dbconfig.insertMany('states', states)
-        return results
+        """
+        Save many state values in a single transaction. The states history gets every row, and states_current
+        is updated with the latest value of each state.
+
+        :param states: A list of tuples, oldest first: gateway_id, name, value, value_type, live, created_at,
+          updated_at
+        :return: A deferred.
+        """
+        def do_save(txn):
+            txn.executemany("INSERT INTO states (gateway_id, name, value, value_type, live, created_at, updated_at) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?)", states)
+            txn.executemany("INSERT OR REPLACE INTO states_current "
+                            "(gateway_id, name, value, value_type, live, created_at, updated_at) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?)", states)
+        return Registry.DBPOOL.runInteraction(do_save)
 
     @inlineCallbacks
     def clean_states_table(self, name=None):
@@ -1323,6 +1371,8 @@ GROUP BY name""" % (extra_where, str(int(time()) - 60 * 60 * 24 * 60))
         """
         sql = "DELETE FROM states WHERE created_at < %s" % str(int(time()) - 60 * 60 * 24 * 60)
         yield Registry.DBPOOL.runQuery(sql)
+        sql = "DELETE FROM states_current WHERE updated_at < %s" % str(int(time()) - 60 * 60 * 24 * 60)
+        yield Registry.DBPOOL.runQuery(sql)
         sql = """DELETE FROM states WHERE id IN
               (SELECT id
                FROM states AS s
@@ -1420,45 +1470,88 @@ GROUP BY name""" % (extra_where, str(int(time()) - 60 * 60 * 24 * 60))
         if isinstance(stop, int) is False and isinstance(stop, float) is False:
             # print("stop is typE: %s" % type(stop))
             raise YomboWarning("statistic_get_range: stop argument expects an int or float, got: %s" % stop)
+        if len(names) == 0:
+            return []
 
-        # names_str = ", ".join(map(str, names))
-        names_str = ', '.join('"{0}"'.format(w) for w in names)
-        sql = """SELECT id, bucket_time, bucket_size, bucket_lifetime, bucket_type, bucket_name,
- bucket_value, bucket_average_data, anon, uploaded, finished, updated_at 
- FROM  statistics WHERE bucket_name in (%s) AND bucket_time >= %s
-        AND bucket_time <= %s
-        ORDER BY bucket_time""" % (names_str, start, stop)
-        # print("statistic_get_range: %s" % sql)
-        records = yield Registry.DBPOOL.runQuery(sql)
-        results = []
-        for record in records:
-            if minimal in (None, False):
-                results.append({
-                    'id': record[0],
-                    'bucket_time': record[1],
-                    'bucket_size': record[2],
-                    'bucket_lifetime': record[3],
-                    'bucket_type': record[4],
-                    'bucket_name': record[5],
-                    'bucket_value': record[6],
-                    'bucket_average_data': record[7],
-                    'anon': record[8],
-                    'uploaded': record[9],
-                    'finished': record[10],
-                    'updated_at': record[11],
-                })
-            else:
-                results.append({
-                    'id': record[0],
-                    'bucket_time': record[1],
-                    'bucket_size': record[2],
-                    'bucket_lifetime': record[3],
-                    'bucket_type': record[4],
-                    'bucket_name': record[5],
-                    'bucket_value': record[6],
-                })
+        if minimal in (None, False):
+            columns = STATISTIC_COLUMNS
+        else:
+            columns = STATISTIC_COLUMNS[:7]
+        sql = "SELECT %s FROM statistics WHERE bucket_name IN (%s) AND bucket_time >= ? AND bucket_time <= ? " \
+              "ORDER BY bucket_time" % (", ".join(columns), ", ".join("?" * len(names)))
+        records = yield Registry.DBPOOL.runQuery(sql, list(names) + [start, stop])
+        return [dict(zip(columns, record)) for record in records]
+
+    def statistic_query(self, names, start, stop, bucket_type=None, resolution=None, columnar=None):
+        """
+        Get statistics for one or more bucket names within a time range. Uses bound parameters and the
+        statistics_name_time_idx index, so only the index is read.
+
+        If resolution is set, the buckets are downsampled within the database: buckets are grouped into
+        time slots of resolution seconds. Counters are summed, averages and datapoints are averaged. The
+        time of each row is the start of its slot.
+
+        Rows are returned as a list of tuples: (bucket_name, bucket_time, bucket_type, bucket_value, bucket_size).
+        If columnar is True, a dictionary of columns is returned instead, with bucket_time, bucket_value and
+        bucket_size stored in array.array's, which is much smaller when drawing large ranges.
+
+        :param names: A list of bucket names.
+        :param start: Time (seconds since epoch) to start from.
+        :param stop: Time (seconds since epoch) to end at.
+        :param bucket_type: Only return buckets of this type: counter, average, or datapoint.
+        :param resolution: Downsample into slots of this many seconds.
+        :param columnar: If True, return a dictionary of columns instead of a list of rows.
+        :return: A deferred.
+        """
+        if isinstance(names, str):
+            names = [names]
+        if len(names) == 0:
+            raise YomboWarning("statistic_query: names cannot be empty.")
+        if resolution is not None:
+            resolution = int(resolution)
+            if resolution < 1:
+                raise YomboWarning("statistic_query: resolution must be greater than 0.")
+
+        args = list(names) + [start, stop]
+        where = "bucket_name IN (%s) AND bucket_time >= ? AND bucket_time <= ?" % ", ".join("?" * len(names))
+        if bucket_type is not None:
+            where += " AND bucket_type = ?"
+            args.append(bucket_type)
 
-        return results
+        if resolution is None:
+            sql = "SELECT bucket_name, bucket_time, bucket_type, bucket_value, bucket_size FROM statistics " \
+                  "WHERE %s ORDER BY bucket_time" % where
+        else:
+            sql = "SELECT bucket_name, CAST(bucket_time / ? AS INTEGER) * ? AS slot, bucket_type, " \
+                  "CASE WHEN bucket_type = 'counter' THEN SUM(bucket_value) ELSE AVG(bucket_value) END, " \
+                  "? FROM statistics WHERE %s GROUP BY bucket_name, bucket_type, slot ORDER BY slot" % where
+            args = [resolution, resolution, resolution] + args
+
+        def do_query(txn):
+            txn.execute(sql, args)
+            if columnar is not True:
+                return txn.fetchall()
+            results = OrderedDict([
+                ('bucket_name', []),
+                ('bucket_time', array('q')),
+                ('bucket_type', []),
+                ('bucket_value', array('d')),
+                ('bucket_size', array('l')),
+            ])
+            bucket_name = results['bucket_name'].append
+            bucket_time = results['bucket_time'].append
+            bucket_type = results['bucket_type'].append
+            bucket_value = results['bucket_value'].append
+            bucket_size = results['bucket_size'].append
+            for row in txn.fetchall():
+                bucket_name(row[0])
+                bucket_time(int(row[1]))
+                bucket_type(row[2])
+                bucket_value(row[3] or 0)
+                bucket_size(row[4] or 0)
+            return results
+
+        return Registry.DBPOOL.runReadInteraction(do_query)
 
     @inlineCallbacks
     def get_stat_last_datapoints(self):
@@ -1485,6 +1578,26 @@ ORDER BY id desc"""
         results = yield self.dbconfig.insertMany('statistics', buckets)
         return results
 
+    def save_statistics_batch(self, inserts, updates):
+        """
+        Save many statistic buckets in a single transaction.
+
+        :param inserts: List of tuples for new buckets: bucket_time, bucket_size, bucket_lifetime, bucket_type,
+          bucket_name, bucket_value, bucket_average_data, updated_at, anon, finished
+        :param updates: List of tuples for buckets already in the database: bucket_value, bucket_average_data,
+          updated_at, anon, finished, id
+        :return: A deferred.
+        """
+        def do_save(txn):
+            if len(inserts) > 0:
+                txn.executemany("INSERT OR REPLACE INTO statistics (bucket_time, bucket_size, bucket_lifetime, "
+                                "bucket_type, bucket_name, bucket_value, bucket_average_data, updated_at, anon, "
+                                "finished) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", inserts)
+            if len(updates) > 0:
+                txn.executemany("UPDATE statistics SET bucket_value = ?, bucket_average_data = ?, updated_at = ?, "
+                                "anon = ?, finished = ? WHERE id = ?", updates)
+        return Registry.DBPOOL.runInteraction(do_save)
+
     @inlineCallbacks
     def save_statistic(self, bucket, finished=None):
         # print("save_statistic was called directly... sup?!")
@@ -1502,7 +1615,7 @@ ORDER BY id desc"""
             args['finished'] = 0
 
         if bucket['type'] == 'average':
-            args['bucket_average_data'] = data_pickle(bucket['average_data'], separators=(',',':'))
+            args['bucket_average_data'] = data_pickle(bucket['average_data'], 'json')
 
         if 'restored_db_id' in bucket:
             results = yield self.dbconfig.update('statistics',
@@ -1519,6 +1632,63 @@ ORDER BY id desc"""
 
         return results
 
+    @inlineCallbacks
+    def get_statistics_to_consolidate(self, bucket_name, bucket_type, before, bucket_size, uploaded=None,
+                                      anonymous_allowed=None):
+        """
+        Get finished buckets for a statistic that started before a given time and are no larger than bucket_size.
+
+        :param bucket_name: Name of the statistic.
+        :param bucket_type: Either counter or average.
+        :param before: Only buckets with a bucket_time before this.
+        :param bucket_size: Only buckets this size or smaller.
+        :param uploaded: If True, skip buckets that are still waiting to be uploaded.
+        :param anonymous_allowed: If False, anonymous buckets are never uploaded, so they don't wait.
+        :return: A list of dictionaries.
+        """
+        sql = "SELECT id, bucket_time, bucket_size, bucket_lifetime, bucket_value, bucket_average_data, anon, " \
+              "uploaded FROM statistics WHERE bucket_name = ? AND bucket_type = ? AND bucket_time < ? AND " \
+              "bucket_size <= ? AND finished = 1"
+        args = [bucket_name, bucket_type, before, bucket_size]
+        if uploaded is True:
+            if anonymous_allowed is False:
+                sql += " AND (uploaded != 0 OR anon = 1)"
+            else:
+                sql += " AND uploaded != 0"
+        sql += " ORDER BY bucket_time"
+        records = yield Registry.DBPOOL.runQuery(sql, args)
+        results = []
+        for record in records:
+            results.append({
+                'id': record[0],
+                'bucket_time': record[1],
+                'bucket_size': record[2],
+                'bucket_lifetime': record[3],
+                'bucket_value': record[4],
+                'bucket_average_data': record[5],
+                'anon': record[6],
+                'uploaded': record[7],
+                'bucket_type': bucket_type,
+            })
+        self._unpickle_stats(results)
+        return results
+
+    def replace_statistics(self, delete_ids, inserts):
+        """
+        Delete statistic buckets and insert their replacements in a single transaction.
+
+        :param delete_ids: List of statistic ids to delete.
+        :param inserts: List of tuples: bucket_time, bucket_size, bucket_lifetime, bucket_type, bucket_name,
+          bucket_value, bucket_average_data, updated_at, anon, uploaded
+        :return: A deferred.
+        """
+        def do_replace(txn):
+            txn.executemany("DELETE FROM statistics WHERE id = ?", [(stat_id,) for stat_id in delete_ids])
+            txn.executemany("INSERT OR REPLACE INTO statistics (bucket_time, bucket_size, bucket_lifetime, "
+                            "bucket_type, bucket_name, bucket_value, bucket_average_data, updated_at, anon, "
+                            "uploaded, finished) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)", inserts)
+        return Registry.DBPOOL.runInteraction(do_replace)
+
     @inlineCallbacks
     def get_unfinished_statistics(self):
         records = yield self.dbconfig.select(
@@ -1530,7 +1700,7 @@ ORDER BY id desc"""
 
     @inlineCallbacks
     def get_uploadable_statistics(self, uploaded_type = 0):
-        anonymous_allowed = self._Configs.get('statistics', 'anonymous', True)
+        anonymous_allowed = self.statistics_anonymous.value
         if anonymous_allowed:
             records = yield self.dbconfig.select('statistics',
                  select='id as stat_id, bucket_time, bucket_size, bucket_type, bucket_name, bucket_value, bucket_average_data, bucket_time',
@@ -1557,43 +1727,34 @@ ORDER BY id desc"""
         if isinstance(stats, list):
             for s in stats:
                 if s[type_name] == 'average':
-                    s[averagedata_name] = data_unpickle(s[averagedata_name])
+                    s[averagedata_name] = data_unpickle(s[averagedata_name], 'json')
         else:
-            stats[averagedata_name] = data_unpickle(stats[averagedata_name])
+            stats[averagedata_name] = data_unpickle(stats[averagedata_name], 'json')
 
     @inlineCallbacks
     def get_stats_sums(self, bucket_name, bucket_type=None, bucket_size=None, time_start=None, time_end=None):
+        """
+        Get a statistic downsampled into buckets of bucket_size seconds. Counters are summed, averages and
+        datapoints are averaged. See statistic_query() to get columns instead of dictionaries.
+        """
         if bucket_size is None:
             bucket_size = 3600
+        if time_start is None:
+            time_start = 0
+        if time_end is None:
+            time_end = time()
 
-        wheres = []
-        values = []
-
-        wheres.append("(bucket_name like ?)")
-        values.append(bucket_name)
-
-        if bucket_type is not None:
-            wheres.append("(bucket_type > ?)")
-            values.append(time_start)
-
-        if time_start is not None:
-            wheres.append("(bucket > ?)")
-            values.append(time_start)
-
-        if time_end is not None:
-            wheres.append("(bucket < ?)")
-            values.append(time_end)
-        where_final = [(" AND ").join(wheres)] + values
-
-        # records = yield self.dbconfig.select('statistics',
-        #             select='sum(value), bucket_name, bucket_type, round(bucket / 3600) * 3600 AS bucket',
-        select_fields = 'sum(bucket_value) as value, bucket_name, bucket_type, round(bucket_time / %s) * %s AS bucket' % (
-        bucket_size, bucket_size)
-        records = yield self.dbconfig.select('statistics',
-                                             select=select_fields,
-                                             where=where_final,
-                                             group='bucket')
-        return records
+        records = yield self.statistic_query([bucket_name], time_start, time_end, bucket_type=bucket_type,
+                                             resolution=bucket_size)
+        results = []
+        for record in records:
+            results.append({
+                'value': record[3],
+                'bucket_name': record[0],
+                'bucket_type': record[2],
+                'bucket': record[1],
+            })
+        return results
 
     #########################
     ###    Tasks        #####
@@ -2051,17 +2212,25 @@ ORDER BY id desc"""
         """
         yield self.dbconfig.drop(table)
 
-    @inlineCallbacks
     def insert_many(self, table, vals):
         """
-        Insert a list of records into a table
+        Insert a list of records into a table. Records with the same columns are inserted with a single
+        executemany, all within one transaction.
 
         :param table:
-        :param vals:
-        :return:
+        :param vals: List of dictionaries.
+        :return: A deferred.
         """
-        # print("insert_many: (%s) %s" % (table, vals))
-        yield self.dbconfig.insertMany(table, vals)
+        groups = self._group_by_columns(vals)
+
+        def do_insert(txn):
+            for columns, rows in groups.items():
+                txn.executemany("INSERT INTO `%s` (%s) VALUES (%s)" % (
+                                    table,
+                                    ", ".join("`%s`" % column for column in columns),
+                                    ", ".join("?" * len(columns))),
+                                rows)
+        return Registry.DBPOOL.runInteraction(do_insert)
 
     @inlineCallbacks
     def insert(self, table, val):
@@ -2079,16 +2248,42 @@ ORDER BY id desc"""
         records = yield self.dbconfig.select(table, select=select_cols)
         return records
 
-    @inlineCallbacks
     def update_many(self, table, vals, where_column):
         """
-        Update a bunch of records in a transaction.
+        Update a bunch of records in a transaction. Records with the same columns are updated with a single
+        executemany.
 
         :param table:
-        :param vals:
-        :return:
+        :param vals: List of dictionaries, each must include where_column.
+        :param where_column: Column used to find the record to update.
+        :return: A deferred.
+        """
+        groups = self._group_by_columns(vals, where_column)
+
+        def do_update(txn):
+            for columns, rows in groups.items():
+                txn.executemany("UPDATE `%s` SET %s WHERE `%s` = ?" % (
+                                    table,
+                                    ", ".join("`%s` = ?" % column for column in columns),
+                                    where_column),
+                                rows)
+        return Registry.DBPOOL.runInteraction(do_update)
+
+    def _group_by_columns(self, vals, where_column=None):
         """
-        yield self.dbconfig.updateMany(table, vals, where_column)
+        Groups records by their columns for executemany. If where_column is set, it's moved to the end of each
+        row, for use in the WHERE clause of an update.
+
+        :return: A dictionary of column tuple -> list of value tuples.
+        """
+        groups = {}
+        for val in vals:
+            columns = tuple(column for column in val.keys() if column != where_column)
+            row = [val[column] for column in columns]
+            if where_column is not None:
+                row.append(val[where_column])
+            groups.setdefault(columns, []).append(row)
+        return groups
 
     @inlineCallbacks
     def truncate(self, table):
@@ -2112,3 +2307,122 @@ ORDER BY id desc"""
             return limit
         else:
             return (limit, offset)
+
+
+class SQLitePool(object):
+    """
+    Drop-in replacement for adbapi.ConnectionPool that opens the database in WAL mode. All changes are sent
+    to a single writer connection, which serializes writes. SELECT statements and read interactions are sent
+    to a pool of read-only connections so they don't wait behind bulk saves.
+
+    Every query and interaction is timed inside the database thread. The time is sent to any callbacks
+    added with add_query_hook().
+
+    :ivar writer: (adbapi.ConnectionPool) Pool with one connection, used for all changes.
+    :ivar readers: (adbapi.ConnectionPool) Pool of read-only connections.
+    :ivar dbapi: The DB-API module, used by twistar.
+    :ivar query_hooks: (list) Callables to call with route, query, and duration after each query.
+    :ivar counts: (dict) Number of queries run, by route.
+    """
+    def __init__(self, filename, read_connections=3):
+        self.filename = filename
+        self.writer = adbapi.ConnectionPool('sqlite3', filename, check_same_thread=False,
+                                            cp_min=1, cp_max=1, cp_openfun=self._open_writer)
+        self.readers = adbapi.ConnectionPool('sqlite3', filename, check_same_thread=False,
+                                             cp_min=1, cp_max=max(int(read_connections), 1),
+                                             cp_openfun=self._open_reader)
+        self.dbapi = self.writer.dbapi
+        self.query_hooks = []
+        self.counts = {'read': 0, 'write': 0}
+
+    @staticmethod
+    def _open_writer(connection):
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.execute("PRAGMA foreign_keys = ON")
+
+    @staticmethod
+    def _open_reader(connection):
+        connection.execute("PRAGMA foreign_keys = ON")
+        connection.execute("PRAGMA query_only = ON")
+
+    def set_read_connections(self, count):
+        """
+        Change the maximum number of read-only connections.
+
+        :param count: Number of connections, at least 1.
+        """
+        count = max(int(count), 1)
+        self.readers.max = count
+        self.readers.threadpool.adjustPoolsize(self.readers.min, count)
+
+    def add_query_hook(self, callback):
+        """
+        Add a callback to be called after each query completes: callback(route, query, duration).
+
+        :param callback: A callable.
+        """
+        if callback not in self.query_hooks:
+            self.query_hooks.append(callback)
+
+    def remove_query_hook(self, callback):
+        if callback in self.query_hooks:
+            self.query_hooks.remove(callback)
+
+    @staticmethod
+    def is_read_query(query):
+        """
+        Returns True if the SQL statement only reads.
+        """
+        return query.lstrip()[:6].upper() == 'SELECT'
+
+    def runQuery(self, query, *args, **kwargs):
+        if self.is_read_query(query):
+            return self._run(self.readers, 'read', query, self._run_query, query, *args, **kwargs)
+        return self._run(self.writer, 'write', query, self._run_query, query, *args, **kwargs)
+
+    def runOperation(self, query, *args, **kwargs):
+        return self._run(self.writer, 'write', query, self._run_operation, query, *args, **kwargs)
+
+    def runInteraction(self, interaction, *args, **kwargs):
+        return self._run(self.writer, 'write', interaction.__name__, interaction, *args, **kwargs)
+
+    def runReadInteraction(self, interaction, *args, **kwargs):
+        """
+        Like runInteraction, but runs on a read-only connection. The interaction must not make changes.
+        """
+        return self._run(self.readers, 'read', interaction.__name__, interaction, *args, **kwargs)
+
+    def close(self):
+        self.readers.close()
+        self.writer.close()
+
+    def _run(self, pool, route, label, interaction, *args, **kwargs):
+        self.counts[route] += 1
+        d = pool.runInteraction(self._timed, interaction, *args, **kwargs)
+        d.addCallback(self._report, route, label)
+        return d
+
+    @staticmethod
+    def _timed(txn, interaction, *args, **kwargs):
+        start = time()
+        results = interaction(txn, *args, **kwargs)
+        return results, time() - start
+
+    def _report(self, timed_results, route, label):
+        results, duration = timed_results
+        for hook in self.query_hooks:
+            try:
+                hook(route, label, duration)
+            except Exception as e:
+                logger.warn("Error in database query hook: {e}", e=e)
+        return results
+
+    @staticmethod
+    def _run_query(txn, *args, **kwargs):
+        txn.execute(*args, **kwargs)
+        return txn.fetchall()
+
+    @staticmethod
+    def _run_operation(txn, *args, **kwargs):
+        txn.execute(*args, **kwargs)
@@ -190,13 +190,30 @@ class Modules(YomboLibrary):
     def values(self):
         return list(self.modules.values())
 
+    @property
+    def hook_counts(self):
+        """
+        How many times each module hook has been called, and by who. Used by the web interface.
+
+        :return: A dictionary of module name -> hook -> called_by -> {'count': int}
+        """
+        return self._Loader.get_hook_counts('module')
+
+    @property
+    def hook_profile(self):
+        """
+        Call counts and time spent in each module hook. Used by the web interface.
+
+        :return: A dictionary of module name -> hook -> details, see Loader.get_hook_profile()
+        """
+        return self._Loader.get_hook_profile('module')
+
     def _init_(self, **kwargs):
         """
         Init doesn't do much. Just setup a few variables. Things really happen in start.
         """
         self.gateway_id = self._Configs.get('core', 'gwid', 'local', False)
         self._invoke_list_cache = {}  # Store a list of hooks that exist or not. A cache.
-        self.hook_counts = {}  # keep track of hook names, and how many times it's called.
         self.hooks_called = MaxDict(200, {})
         self.module_search_attributes = ['_module_id', '_module_type', '_label', '_machine_label', '_description',
             'short_description', 'description_formatting', '_public', '_status']
@@ -282,6 +299,7 @@ class Modules(YomboLibrary):
         yield self._Loader.library_invoke_all("_modules_stopped_", called_by=self)
 
         yield self._Loader.library_invoke_all("_modules_unload_", called_by=self)
+        self._Loader.hook_table_invalidate()
         for module_id in self.modules.keys():
             module = self.modules[module_id]
             if int(module._status) != 1:
@@ -717,14 +735,8 @@ class Modules(YomboLibrary):
             if hasattr(module, hook):
                 method = getattr(module, hook)
                 if isinstance(method, collections.Callable):
-                    if module._Name not in self.hook_counts:
-                        self.hook_counts[module._Name] = {}
-                    if hook not in self.hook_counts[module._Name]:
-                        self.hook_counts[module._Name][hook] = {'Total Count': {'count': 0}}
-                    if calling_component not in self.hook_counts[module._Name][hook]:
-                        self.hook_counts[module._Name][hook][calling_component] = {'count': 0}
-                    self.hook_counts[module._Name][hook][calling_component]['count'] = self.hook_counts[module._Name][hook][calling_component]['count'] + 1
-                    self.hook_counts[module._Name][hook]['Total Count']['count'] = self.hook_counts[module._Name][hook]['Total Count']['count'] + 1
+                    self._Loader.count_hook_call(self._Loader.hook_counter('module', module._Name, hook),
+                                                 calling_component)
 
                     try:
                         # self.modules_invoke_log('debug', module._label, 'module', hook, 'About to call %s.' % hook)
@@ -831,10 +843,12 @@ class Modules(YomboLibrary):
     def add_imported_module(self, module_id, module_label, module_instance):
         logger.debug("adding module: {module_id}:{module_label}", module_id=module_id, module_label=module_label)
         self.modules[module_id] = module_instance
+        self._Loader.hook_table_invalidate()
 
     def del_imported_module(self, module_id, module_label):
         logger.debug("deleting module_id: {module_id} from this list: {list}", module_id=module_id, list=self.modules)
         del self.modules[module_id]
+        self._Loader.hook_table_invalidate()
 
     def get(self, module_requested, limiter=None, status=None):
         """
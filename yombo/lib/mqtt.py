@@ -29,6 +29,18 @@ Implements MQTT. It does 2 things:
        print("topic: %s" % topic)
        print("message: %s" % message)
 
+Instead of a single callback for everything, handlers can be added for topic patterns. The client subscribes to
+the pattern and only matching messages are sent to the handler, along with the values matched by the wildcards:
+
+.. code-block:: python
+
+   def _start_(self):
+       self.my_mqtt = self._MQTT.new(client_id='my_client_name')
+       self.my_mqtt.add_route('foo/+/status', self.mqtt_status)
+
+   def mqtt_status(self, topic, payload, qos, retain, wildcards):
+       print("status of %s: %s" % (wildcards[0], payload))
+
 
 .. moduleauthor:: Mitch Schwenk <mitch-gw@yombo.net>
 .. versionadded:: 0.11.0
@@ -40,12 +52,14 @@ Implements MQTT. It does 2 things:
 # Import python libraries
 
 import base64
-from collections import deque, Callable, OrderedDict
+from collections import deque, OrderedDict
+from collections.abc import Callable
 from datetime import datetime
 import hashlib
 import random
 import string
 from subprocess import call
+from time import time
 try:  # Prefer simplejson if installed, otherwise json will work swell.
     import simplejson as json
 except ImportError:
@@ -55,7 +69,7 @@ except ImportError:
 from twisted.internet.ssl import ClientContextFactory
 from twisted.internet import protocol
 from twisted.internet import reactor
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, Deferred, maybeDeferred
 from twisted.internet.task import LoopingCall
 from twisted.internet.utils import getProcessOutput
 
@@ -71,6 +85,7 @@ from yombo.core.library import YomboLibrary
 from yombo.core.log import get_logger
 from yombo.lib.webinterface.auth import require_auth
 from yombo.utils import random_string, unicode_to_bytes, bytes_to_unicode, sleep
+from yombo.utils.topicrouter import TopicRouter, RecentIds
 
 logger = get_logger('library.mqtt')
 
@@ -119,6 +134,7 @@ class MQTT(YomboLibrary):
         self.server_enabled = self._Configs.get('mqtt', 'server_enabled', True)
         self.server_max_connections = self._Configs.get('mqtt', 'server_max_connections', 1000)
         self.server_timeout_disconnect_delay = self._Configs.get('mqtt', 'server_timeout_disconnect_delay', 2)
+        self.client_max_queued = self._Configs.get('mqtt', 'client_max_queued', 1000)
         self.is_master = self._Configs.get('core', 'is_master', True, False)
         if self.is_master is True:
             self.master_gateway = self.gateway_id
@@ -608,6 +624,13 @@ class MQTTClient(object):
 
        self.my_mqtt = self._MQTT.new(mqtt_incoming_callback=self.mqtt_incoming, client_id='my_client_name')
        self.mqtt.subscribe("yombo/devices/+/get")  # subscribe to a topic. + is a wilcard for a single section.
+
+    Or, send each topic pattern to its own handler, see :py:meth:`add_route`:
+
+    .. code-block:: python
+
+       self.my_mqtt = self._MQTT.new(client_id='my_client_name')
+       self.mqtt.add_route("yombo/devices/+/get", self.device_get)
     """
     def __init__(self, mqtt_library, client_id, server_hostname, server_port, username=None, password=None,
                  password2=None, ssl=False, mqtt_incoming_callback=None, mqtt_connected_callback=None,
@@ -647,7 +670,8 @@ class MQTTClient(object):
         self._Parent = mqtt_library
         self.client_id = client_id
 
-        self.incoming_duplicates = deque([], 150)
+        self.incoming_duplicates = RecentIds(150)
+        self.router = TopicRouter()
 
         self.mqtt_incoming_callback = mqtt_incoming_callback
         self.mqtt_connected_callback = mqtt_connected_callback
@@ -669,11 +693,19 @@ class MQTTClient(object):
         self.factory.will_retain = will_retain
         self.factory.version = version
         self.factory.keepalive = keepalive
-        self.queue = self._Parent._Queue.new('library.mqtt.%s' % client_id, self.process_queue)  # test calls to things that don't return deferred
-        self.queue.pause()  # pause this, and will resume it when we are connected.
-        self.republish_queue = OrderedDict({})  # for items that are marked 'retain', this these will be replayed on reconnect.
-        self.topics_subscribed = {}  # a list of topics this client subscribes too.
-        self.processing_republish_queue = False
+        self.republish_queue = OrderedDict()  # (type, topic) -> job. Replayed on reconnect, latest per topic.
+        self.topics_subscribed = {}  # topic -> key in republish_queue
+        self.outgoing = []  # jobs waiting to be sent, see send_outgoing()
+        self.send_outgoing_call = None
+        self.stats = {
+            'sent': 0,  # jobs handed to the broker connection
+            'batches': 0,  # times send_outgoing() sent at least one job
+            'dropped': 0,  # jobs never sent: replaced while disconnected, queue full, or subscribe cancelled
+            'max_depth': 0,  # most jobs waiting at once
+            'received': 0,  # messages from the broker
+            'duplicates': 0,  # messages from the broker dropped, already received
+            'unrouted': 0,  # messages from the broker that didn't match a route, sent to mqtt_incoming_callback
+        }
         try:
             if ssl:
                 self.my_reactor = reactor.connectSSL(server_hostname, server_port, self.factory,
@@ -685,72 +717,147 @@ class MQTTClient(object):
 
     def publish(self, topic, message, qos=0, priority=10, retain=False, republish=None):
         """
-        Publish a message.
+        Publish a message. Messages are sent in batches, once per reactor tick, lowest priority number first.
+
+        Set republish to True for topics where only the last value matters, such as status broadcasts. The
+        latest message for the topic is kept and sent again after reconnecting. While disconnected, a newer
+        message replaces an older one that was never sent, and the older one is dropped. While connected, every
+        message is sent.
 
         :param topic: 'yombo/devices/bedroom_light/command'
         :param message: string - Like 'on'
         :param qos: 0, 1, or 2. Default is 0.
-        :return:
+        :param priority: Lower numbers are sent first. Default is 10.
+        :param retain: Set the MQTT retain flag.
+        :param republish: Send the latest message for the topic again after reconnecting. Default is False.
+        :return: A deferred that fires once the message is sent, or with None if it was dropped.
         """
-        job = {
-            'type': 'publish',
-            'topic': topic,
-            'message': message,
-            'qos': qos,
-            'retain': retain,
-            'priority': priority,
-            'published': False,
-        }
-        if republish is None or republish is True:
-            self.republish_queue[random_string()] = job
-            self.dispatch_job_queue()
+        job = self.new_job('publish', topic, qos, priority, message=message, retain=retain)
+        if republish is True:
+            self.add_republish(('publish', topic), job)
         else:
-            self.queue.put(job, priority=priority)
+            self.add_outgoing(job)
+        return job['deferred']
 
-    # @inlineCallbacks
     def subscribe(self, topic, qos=1, priority=-2, republish=None):
         """
         Subscribe to a topic. Inlucde the topic like 'yombo/myfunky/something'
         :param topic: string or list of strings to subscribe to.
-        :param callback: a point to a function to be called when data arrives.
         :param qos: See MQTT doco for information. We handle duplicates, no need for qos 2.
-        :return:
+        :param republish: Subscribe again after reconnecting. Default is True.
+        :return: A deferred that fires once the subscribe request is sent.
         """
-        job = {
-            'type': 'subscribe',
-            'topic': topic,
-            'qos': qos,
-            'priority': priority,
-            'published': False,
-        }
+        job = self.new_job('subscribe', topic, qos, priority)
         if republish is None or republish is True:
-            job_id = random_string()
-            self.topics_subscribed[topic] = job_id
-            self.republish_queue[job_id] = job
-            self.dispatch_job_queue()
+            self.topics_subscribed[topic] = ('subscribe', topic)
+            self.add_republish(('subscribe', topic), job)
         else:
-            self.queue.put(job, priority=priority)
+            self.add_outgoing(job)
+        return job['deferred']
 
     def unsubscribe(self, topic, qos=1, priority=-1):
         """
         Unsubscribe from a topic.
         :param topic:
-        :return:
+        :return: A deferred that fires once the unsubscribe request is sent.
         """
         if topic in self.topics_subscribed:
-            del self.republish_queue[self.topics_subscribed[topic]]
+            subscribe_job = self.republish_queue.pop(self.topics_subscribed[topic])
             del self.topics_subscribed[topic]
+            if subscribe_job['sent'] is False:
+                self.drop_job(subscribe_job)
+
+        job = self.new_job('unsubscribe', topic, qos, priority)
+        self.add_outgoing(job)
+        return job['deferred']
+
+    def add_route(self, pattern, handler, qos=1, subscribe=True):
+        """
+        Send messages for a topic pattern to a handler. The handler is called with: topic, payload, qos, retain,
+        and wildcards. Wildcards is a list of the levels matched by each '+' in the pattern, followed by the rest
+        of the topic if the pattern ends with '#'.
+
+        A message that matches several routes is sent to each, in the order the routes were added. Messages that
+        don't match any route are sent to the mqtt_incoming_callback, if one was set.
+
+        :param pattern: Topic pattern, like 'yombo/devices/+/cmd/#'.
+        :param handler: Callable for matching messages.
+        :param qos: QOS for the subscription.
+        :param subscribe: If True (default), also subscribe to the pattern.
+        :return: A route id, for :py:meth:`remove_route`.
+        """
+        route_id = self.router.add(pattern, handler)
+        if subscribe is True and pattern not in self.topics_subscribed:
+            self.subscribe(pattern, qos)
+        return route_id
 
+    def remove_route(self, route_id, unsubscribe=True):
+        """
+        Remove a route added with :py:meth:`add_route`.
+
+        :param route_id: Id returned by add_route.
+        :param unsubscribe: If True (default), unsubscribe when no other routes use the same pattern.
+        """
+        pattern = self.router.remove(route_id).pattern
+        if unsubscribe is True and pattern in self.topics_subscribed and len(self.router.routes(pattern)) == 0:
+            self.unsubscribe(pattern)
+
+    def new_job(self, job_type, topic, qos, priority, **kwargs):
+        """
+        Returns a job for the outgoing queue.
+        """
         job = {
-            'type': 'unsubscribe',
+            'type': job_type,
             'topic': topic,
             'qos': qos,
             'priority': priority,
-            'published': False,
+            'created_at': time(),
+            'sent': False,
+            'deferred': Deferred(),
         }
-        self.queue.put(job, priority=priority)
+        job.update(kwargs)
+        return job
+
+    def add_republish(self, key, job):
+        """
+        Keeps a job to be sent again after reconnecting, replacing any job for the same topic. Sends it now if
+        connected. An older job that was never sent is dropped only while disconnected, when connected it's
+        still sent.
+        """
+        old_job = self.republish_queue.pop(key, None)
+        if old_job is not None and old_job['sent'] is False and self.connected is False:
+            self.drop_job(old_job)
+        job['republish'] = True
+        self.republish_queue[key] = job
+        if self.connected is True:
+            self.add_outgoing(job)
+
+    def add_outgoing(self, job):
+        """
+        Adds a job to be sent on the next reactor tick. While disconnected, jobs that won't be republished wait
+        here too, up to client_max_queued, the oldest are dropped after that.
+        """
+        self.outgoing.append(job)
+        if self.connected is False:
+            limit = self._Parent.client_max_queued
+            while len(self.outgoing) > limit:
+                self.drop_job(self.outgoing.pop(0))
+        depth = len(self.outgoing)
+        if depth > self.stats['max_depth']:
+            self.stats['max_depth'] = depth
+        if self.connected is True and self.send_outgoing_call is None:
+            self.send_outgoing_call = reactor.callLater(0, self.send_outgoing)
+
+    def drop_job(self, job):
+        """
+        A job won't be sent. Counts it, and fires its deferred with None.
+        """
+        job['sent'] = None
+        self.stats['dropped'] += 1
+        self._Parent._Statistics.increment("lib.mqtt.client.dropped", bucket_size=60, anon=True)
+        if job['deferred'].called is False:
+            job['deferred'].callback(None)
 
-    # @inlineCallbacks
     def mqtt_connected(self):
         """
         Call when mqtt client is connected. Subscribes, unsubscribes, and publises any queued messages. Afterwards,
@@ -759,30 +866,87 @@ class MQTTClient(object):
         """
         logger.debug("client ID connected: {client_id}", client_id=self.client_id)
         self.connected = True
-        self.dispatch_job_queue()
-        self.queue.resume()
+        for key, job in self.republish_queue.items():
+            job['sent'] = False
+            self.add_outgoing(job)
+        if len(self.outgoing) > 0 and self.send_outgoing_call is None:
+            self.send_outgoing_call = reactor.callLater(0, self.send_outgoing)
         if self.mqtt_connected_callback:
             self.mqtt_connected_callback()
 
-    def dispatch_job_queue(self):
-        if self.connected is True:
-            for job_id, job_info in self.republish_queue.items():
-                if self.republish_queue[job_id]['published'] is False:
-                    self.republish_queue[job_id]['published'] = True
-                    if self.queue.stopped is False:
-                        self.queue.put(job_info, priority=job_info['priority'])
+    def send_outgoing(self):
+        """
+        Sends all waiting jobs, lowest priority number first. The MQTT packets are held and written to the
+        connection together.
+        """
+        self.send_outgoing_call = None
+        if self.connected is False or len(self.outgoing) == 0:
+            return
 
-    @inlineCallbacks
-    def process_queue(self, job):
-        logger.debug("process_queue. job: {job}", job=job)
+        jobs = self.outgoing
+        self.outgoing = []
+        jobs.sort(key=lambda job: job['priority'])
+        depth = len(jobs)
+        protocol = self.factory.protocol
+        writes = protocol.transport if isinstance(protocol.transport, HeldWrites) else None
+        if writes is not None:
+            writes.hold()
+        now = time()
+        sent = 0
+        latency = 0
+        try:
+            for job in jobs:
+                if job['sent'] is not False:  # Already sent, or dropped.
+                    continue
+                job['sent'] = True
+                self.send_job(protocol, job)
+                sent += 1
+                latency += now - job['created_at']
+        finally:
+            if writes is not None:
+                writes.release()
+
+        if sent == 0:
+            return
+        self.stats['sent'] += sent
+        self.stats['batches'] += 1
+        statistics = self._Parent._Statistics
+        statistics.increment("lib.mqtt.client.sent", sent, bucket_size=60, anon=True)
+        statistics.averages("lib.mqtt.client.queue_depth", depth, bucket_size=60, anon=True)
+        statistics.averages("lib.mqtt.client.latency", round(latency / sent * 1000, 2), bucket_size=60, anon=True)
+
+    def send_job(self, protocol, job):
+        """
+        Sends one job to the broker.
+        """
+        logger.debug("send_job. job: {job}", job=job)
         if job['type'] == 'subscribe':
-            yield self.factory.protocol.subscribe(job['topic'], job['qos'])
+            d = protocol.subscribe(job['topic'], job['qos'])
         elif job['type'] == 'unsubscribe':
-            yield self.factory.protocol.unsubscribe(job['topic'])
+            d = protocol.unsubscribe(job['topic'])
         elif job['type'] == 'publish':
-            yield self.factory.protocol.publish(job['topic'], job['message'], qos=job['qos'], retain=job['retain'])
+            d = protocol.publish(job['topic'], job['message'], qos=job['qos'], retain=job['retain'])
+            if job['qos'] > 0:
+                d.addCallback(self.publish_acknowledged, time())
         else:
-            logger.warn("process_queue received unknown job request: %s" % job)
+            logger.warn("send_job received unknown job request: %s" % job)
+            return
+        d.addErrback(self.send_job_failed, job)
+        if job['deferred'].called is False:
+            d.chainDeferred(job['deferred'])
+
+    def publish_acknowledged(self, result, sent_at):
+        """
+        The broker acknowledged a publish with qos 1 or 2.
+        """
+        self._Parent._Statistics.averages("lib.mqtt.client.ack_latency", round((time() - sent_at) * 1000, 2),
+                                          bucket_size=60, anon=True)
+        return result
+
+    def send_job_failed(self, failure, job):
+        logger.warn("MQTT client {client_id} unable to {type} '{topic}': {failure}", client_id=self.client_id,
+                    type=job['type'], topic=job['topic'], failure=failure.getErrorMessage())
+        self._Parent._Statistics.increment("lib.mqtt.client.failed", bucket_size=60, anon=True)
 
     def mqtt_incoming(self, topic, payload, qos, dup, retain, mqtt_msg_id):
         """
@@ -796,41 +960,99 @@ class MQTTClient(object):
         :param mqtt_msg_id: MQTT Msg ID. Used to detect duplicates.
         :return:
         """
-        # print("mqtt_incoming - topic:%s, payload:%s, qos:%s, dup:%s, retain:%s, mqtt_msg_id:%s" % (topic, payload, qos, dup, retain, mqtt_msg_id))
+        self.stats['received'] += 1
+        #  check if we already received this msg_id. This is why we don't need qos=2 for incoming, qos 1 is enough.
+        if mqtt_msg_id is not None and self.incoming_duplicates.add(mqtt_msg_id) is False:
+            self.stats['duplicates'] += 1
+            return
+
+        routes = self.router.match(topic)
+        for route, wildcards in routes:
+            d = maybeDeferred(route.handler, topic, payload, qos, retain, wildcards)
+            d.addErrback(self.route_failed, route, topic)
+        if len(routes) > 0:
+            return
+
+        self.stats['unrouted'] += 1
         if self.mqtt_incoming_callback:
-            #  check if we already received this msg_id. This is why we don't need qos=2 for incoming, qos 1 is enough.
-            if mqtt_msg_id is not None:
-                if mqtt_msg_id not in self.incoming_duplicates:
-                    self.incoming_duplicates.append(mqtt_msg_id)
-                else:
- #                   print("dropping duplicate message: %s" % mqtt_msg_id)
-                    return
             self.mqtt_incoming_callback(topic, payload, qos, retain)
         else:
             raise YomboWarning("Recieved MQTT message, but no callback defined, no where to send.", 'direct_incoming',
                                'mqtt')
 
+    def route_failed(self, failure, route, topic):
+        logger.warn("MQTT client {client_id} handler for '{pattern}' failed on topic '{topic}': {failure}",
+                    client_id=self.client_id, pattern=route.pattern, topic=topic,
+                    failure=failure.getErrorMessage())
+
     def client_connectionLost(self, reason):
         """
         Called when the connection to the broker is lost. Calls a client connection lost callbacks if defined.
         :param reason:
         :return:
         """
-        self.queue.pause()
         logger.info("Lost connection to MQTT Broker: {reason}", reason=str(reason))
         self.connected = False
-        for job_id, job in self.republish_queue.items():
-            self.republish_queue[job_id]['published'] = False
+        if self.send_outgoing_call is not None and self.send_outgoing_call.active():
+            self.send_outgoing_call.cancel()
+        self.send_outgoing_call = None
+        # Republished jobs are sent again on reconnect, don't hold them twice. Ones already replaced by a newer
+        # job for the same topic are dropped.
+        outgoing = []
+        for job in self.outgoing:
+            if job['sent'] is not False:
+                continue
+            if job.get('republish', False) is True:
+                if self.republish_queue.get((job['type'], job['topic'])) is not job:
+                    self.drop_job(job)
+                continue
+            outgoing.append(job)
+        self.outgoing = outgoing
 
         if self.mqtt_connection_lost_callback:
             self.mqtt_connection_lost_callback()
 
 
+class HeldWrites(object):
+    """
+    Wraps a transport. While held, writes are collected and then sent together with one writeSequence() when
+    released. Everything else is passed to the transport.
+    """
+    def __init__(self, transport):
+        self.transport = transport
+        self.held = None
+
+    def hold(self):
+        self.held = []
+
+    def release(self):
+        held = self.held
+        self.held = None
+        if held:
+            self.transport.writeSequence(held)
+
+    def write(self, data):
+        if self.held is None:
+            self.transport.write(data)
+        else:
+            self.held.append(data)
+
+    def writeSequence(self, data):
+        if self.held is None:
+            self.transport.writeSequence(data)
+        else:
+            self.held.extend(data)
+
+    def __getattr__(self, name):
+        return getattr(self.transport, name)
+
+
 class MQTTYomboProtocol(MQTTProtocol):
     """
     Makes minor tweaks to the MQTTProtocol for use with Yombo.
     """
     def connectionMade(self):  # Empty through stack of twisted and MQTT library
+        self.transport = HeldWrites(self.transport)
         self.onMqttConnectionMade = self.factory.mqtt_client.mqtt_connected
         self.onDisconnection = self.factory.mqtt_client.client_connectionLost
         # print("connection mqtt client: %s -> %s" % (self.factory.mqtt_client.username,
@@ -65,6 +65,7 @@ from functools import partial
 # Import twisted libraries
 from twisted.internet.defer import inlineCallbacks, Deferred
 from twisted.internet.task import LoopingCall
+from twisted.internet import reactor
 
 # Import Yombo libraries
 from yombo.core.exceptions import YomboWarning, YomboHookStopProcessing
@@ -73,6 +74,7 @@ from yombo.core.library import YomboLibrary
 from yombo.utils import global_invoke_all, pattern_search, is_true_false, epoch_to_string, random_string,\
     random_int, set_nested_dict
 from yombo.utils.datatypes import coerce_value
+from yombo.utils.keyedstore import KeyedStore
 
 logger = get_logger("library.states")
 
@@ -209,11 +211,19 @@ class States(YomboLibrary, object):
     def _init_(self, **kwargs):
         self.library_phase = 1
         self.gateway_id = self._Configs.get('core', 'gwid', 'local', False)
-        self.__States = {self.gateway_id: {}}
+        self.__States = KeyedStore('states')
+        self.__States.shard(self.gateway_id)
         self.automation_startup_check = {}
-        self.db_save_states_data = deque()
+        self.db_save_states_journal = StateJournal(
+            max_per_key=self._Configs.get('states', 'db_save_history_per_key', 1),
+            min_interval=self._Configs.get('states', 'db_save_min_interval', 0),
+            max_pending=self._Configs.get('states', 'db_save_max_pending', 5000),
+            full_callback=self.db_save_states_soon,
+        )
+        self.db_save_states_running = False
+        self.db_save_states_soon_call = None
         self.db_save_states_loop = LoopingCall(self.db_save_states)
-        self.db_save_states_loop.start(random_int(60, .10), False)  # clean the database every 6 hours.
+        self.db_save_states_loop.start(random_int(60, .10), False)  # save states to the database every minute.
         self.init_deferred = Deferred()
         self.load_states()
         return self.init_deferred
@@ -227,12 +237,11 @@ class States(YomboLibrary, object):
         self.clean_states_loop.start(random_int(60*60*6, .10))  # clean the database every 6 hours.
 
         if self._States['loader.operating_mode'] == 'run':
-            self.mqtt = self._MQTT.new(mqtt_incoming_callback=self.mqtt_incoming, client_id='Yombo-states-%s' %
-                                                                                            self.gateway_id)
-            self.mqtt.subscribe("yombo/states/+/get")
-            self.mqtt.subscribe("yombo/states/+/get/+")
-            self.mqtt.subscribe("yombo/states/+/set")
-            self.mqtt.subscribe("yombo/states/+/set/+")
+            self.mqtt = self._MQTT.new(client_id='Yombo-states-%s' % self.gateway_id)
+            self.mqtt.add_route("yombo/states/+/get", self.mqtt_incoming_get)
+            self.mqtt.add_route("yombo/states/+/get/+", self.mqtt_incoming_get)
+            self.mqtt.add_route("yombo/states/+/set", self.mqtt_incoming_set)
+            self.mqtt.add_route("yombo/states/+/set/+", self.mqtt_incoming_set)
 
     def _started_(self, **kwargs):
         self.library_phase = 4
@@ -252,7 +261,7 @@ class States(YomboLibrary, object):
 
         for state in states:
             if state['name'] not in self.__States[self.gateway_id]:
-                self.__States[self.gateway_id][state['name']] = {
+                self.__States.set(self.gateway_id, state['name'], {
                     'gateway_id': state['gateway_id'],
                     'value': coerce_value(state['value'], state['value_type']),
                     'value_human': self.convert_to_human(state['value'], state['value_type']),
@@ -260,7 +269,7 @@ class States(YomboLibrary, object):
                     'live': state['live'],
                     'created_at': state['created_at'],
                     'updated_at': state['updated_at'],
-                }
+                })
         self.init_deferred.callback(10)
 
     def clean_states_table(self):
@@ -292,7 +301,7 @@ class States(YomboLibrary, object):
         if gateway_id is None:
             gateway_id = self.gateway_id
 
-        if key in self.__States[gateway_id]:
+        if gateway_id in self.__States and key in self.__States[gateway_id]:
             return True
         return False
 
@@ -387,19 +396,73 @@ class States(YomboLibrary, object):
 
     def get_states(self, gateway_id=None):
         """
-        Returns a copy of the active states.
+        Returns a copy of the states.
 
-        :param key: Name of state to check.
-        :return: Value of state
+        :param gateway_id: If set, only states for the gateway. Otherwise, a dictionary of gateway_id -> states.
+        :return: A dictionary of states.
+        :rtype: dict
         """
         if gateway_id is None:
-            return self.__States.copy()
+            return {gateway_id: dict(items) for gateway_id, items in self.__States.view().items()}
+        return dict(self.__States.view(gateway_id))
+
+    def view_states(self, gateway_id=None):
+        """
+        Returns a read only view of the states. This isn't a copy, it changes as states change. Use this instead
+        of get_states() when only reading.
+
+        :param gateway_id: If set, only states for the gateway. Otherwise, a view of gateway_id -> states.
+        :return: A read only mapping.
+        """
+        return self.__States.view(gateway_id)
+
+    def get_version(self, key, gateway_id=None):
+        """
+        Returns the version of a state. Versions increase each time any state changes.
+
+        :raises KeyError: Raised when request is not found.
+        :param key: Name of the state.
+        :return: Version number.
+        :rtype: int
+        """
         if gateway_id is None:
             gateway_id = self.gateway_id
-        if gateway_id in self.__States:
-            return self.__States[gateway_id].copy()
-        else:
-            return {}
+        return self.__States.get_version(gateway_id, key)
+
+    def changes_since(self, version, gateway_id=None):
+        """
+        Returns the states changed after a version. Used to send only what changed to other gateways.
+
+        :param version: Version number, 0 for all states.
+        :param gateway_id: Default is the local gateway.
+        :return: A dictionary of name -> (version, state)
+        """
+        if gateway_id is None:
+            gateway_id = self.gateway_id
+        return self.__States.changes_since(version, gateway_id)
+
+    def subscribe(self, pattern, callback, gateway_id=None):
+        """
+        Subscribe to state changes. The callback receives a list of
+        :py:class:`StoreChange <yombo.utils.keyedstore.StoreChange>` instances, once per reactor tick, with only
+        the states matching the pattern.
+
+            >>> subscription_id = self._States.subscribe('is.+', self.is_changed, gateway_id=self.gateway_id)
+
+        :param pattern: State name, can include '+' to match one level or '#' to match any levels.
+        :param callback: Callable that accepts a list of changes.
+        :param gateway_id: Only changes for this gateway, default is all gateways.
+        :return: A subscription id, used for unsubscribe().
+        """
+        return self.__States.subscribe(pattern, callback, gateway_id)
+
+    def unsubscribe(self, subscription_id):
+        """
+        Remove a subscription created with :py:meth:`subscribe`.
+
+        :param subscription_id: The id returned by subscribe().
+        """
+        self.__States.unsubscribe(subscription_id)
 
     @inlineCallbacks
     def set(self, key, value, value_type=None, function=None, arguments=None, gateway_id=None):
@@ -426,9 +489,8 @@ class States(YomboLibrary, object):
         if any(s in key for s in search_chars):
             raise YomboWarning("state keys cannot have # or + in them, reserved for searching.")
 
-        if gateway_id not in self.__States:
-            self.__States[gateway_id] = {}
-        if key in self.__States[gateway_id]:
+        states = self.__States.shard(gateway_id)
+        if key in states:
             is_new = False
             # If state is already set to value, we don't do anything.
             # print("stats key exists for gateway... %s" % key)
@@ -443,7 +505,7 @@ class States(YomboLibrary, object):
             # print("New state: %s=%s" % (key, value))
             # logger.debug("Saving state: {key} = {value}", key=key, value=value)
             is_new = True
-            self.__States[gateway_id][key] = {
+            states[key] = {
                 'gateway_id': gateway_id,
                 'created_at': int(time()),
                 'updated_at': int(time()),
@@ -477,6 +539,7 @@ class States(YomboLibrary, object):
                 self.__States[gateway_id][key]['live'] = True
 
         self.__States[gateway_id][key]['value_human'] = self.convert_to_human(value, value_type)
+        self.__States.changed(gateway_id, key)
 
         # Call any hooks
         yield global_invoke_all('_states_set_',
@@ -488,40 +551,47 @@ class States(YomboLibrary, object):
                                 )
 
         if gateway_id == self.gateway_id:
-            self.db_save_states_data.append((key, self.__States[gateway_id][key]))
+            self.db_save_states_journal.add(key, self.__States[gateway_id][key])
 
         self.check_trigger(gateway_id, key, value)  # Check if any automation items need to fire!
 
     @inlineCallbacks
     def db_save_states(self):
         """
-        Called periodically and on exit to save states to database.
+        Called periodically and on exit to save states to database. Only the states that changed since the last
+        save are written, see :py:class:`StateJournal`.
 
         :return:
         """
-        to_save = deque()
+        if self.db_save_states_running is True:
+            return
+        rows = self.db_save_states_journal.take()
+        if len(rows) == 0:
+            return
 
-        while True:
-            try:
-                key, data = self.db_save_states_data.popleft()
-                if data['live'] is True:
-                    live = 1
-                else:
-                    live = 0
-
-                od = OrderedDict()
-                od['gateway_id'] = data['gateway_id']
-                od['name'] = key
-                od['value'] = data['value']
-                od['value_type'] = data['value_type']
-                od['live'] = live
-                od['created_at'] = data['created_at']
-                od['updated_at'] = data['updated_at']
-                to_save.append(od)
-            except IndexError:
-                break
-        if len(to_save) > 0:
-            yield self._LocalDB.save_state_bulk(to_save)
+        self.db_save_states_running = True
+        start = time()
+        try:
+            yield self._LocalDB.save_state_bulk(rows)
+        except Exception as e:
+            logger.warn("Unable to save states, will retry on next save: {e}", e=e)
+            self.db_save_states_journal.restore(rows)
+            return
+        finally:
+            self.db_save_states_running = False
+        duration = time() - start
+        self.db_save_states_journal.flushed(len(rows), duration)
+        self._Statistics.averages("lib.states.db_save.duration", round(duration * 1000, 2), bucket_size=60, anon=True)
+        self._Statistics.increment("lib.states.db_save.rows", len(rows), bucket_size=60, anon=True)
+
+    def db_save_states_soon(self):
+        """
+        Called by the state journal when too many rows are waiting to be saved. Saves them on the next reactor
+        tick instead of waiting for the loop.
+        """
+        if self.db_save_states_soon_call is not None and self.db_save_states_soon_call.active():
+            return
+        self.db_save_states_soon_call = reactor.callLater(0, self.db_save_states)
 
     @inlineCallbacks
     def set_from_gateway_communications(self, key, values):
@@ -534,9 +604,7 @@ class States(YomboLibrary, object):
         gateway_id = values['gateway_id']
         if gateway_id == self.gateway_id:
             return
-        if gateway_id not in self.__States:
-            self.__States[gateway_id] = {}
-        self.__States[values['gateway_id']][key] = {
+        self.__States.set(gateway_id, key, {
             'gateway_id': values['gateway_id'],
             'value': values['value'],
             'value_human': values['value_human'],
@@ -544,7 +612,7 @@ class States(YomboLibrary, object):
             'live': False,
             'created_at': values['created_at'],
             'updated_at': values['updated_at'],
-        }
+        })
 
         # Call any hooks
         yield global_invoke_all('_states_set_',
@@ -616,15 +684,28 @@ class States(YomboLibrary, object):
         if gateway_id is None:
             gateway_id = self.gateway_id
 
-        if key in self.__States:
-            del self.__States[gateway_id][key]
+        if gateway_id in self.__States and key in self.__States[gateway_id]:
+            self.__States.delete(gateway_id, key)
         else:
             raise KeyError("Cannot delete state: %s not found" % key)
         return None
 
-    def mqtt_incoming(self, topic, payload, qos, retain):
+    def mqtt_state(self, state_label):
         """
-        Processes incoming MQTT requests. See `MQTT @ Module Development <https://yombo.net/docs/libraries/mqtt>`_
+        Returns the state for an MQTT request, or None after sending an error response. State labels in topics
+        use '$' in place of '.'.
+
+        :param state_label: State level of the topic.
+        """
+        requested_state = state_label.replace("$", ".")
+        if requested_state not in self.__States[self.gateway_id]:
+            self.mqtt.publish('yombo/states/%s/get_response' % state_label, str('MQTT Error: state not found'))
+            return None
+        return self.__States[self.gateway_id][requested_state]
+
+    def mqtt_incoming_get(self, topic, payload, qos, retain, wildcards):
+        """
+        Processes incoming MQTT get requests. See `MQTT @ Module Development <https://yombo.net/docs/libraries/mqtt>`_
 
         Examples:
 
@@ -634,126 +715,108 @@ class States(YomboLibrary, object):
         * /yombo/states/statename/get/value - returns a string
         * /yombo/states/statename/get/value_type - returns a string
         * /yombo/states/statename/get/value_human - returns a string
-        * /yombo/states/statesname/set {"value":"working","value_type":"string"}
 
-        :param topic:
-        :param payload:
+        :param topic: yombo/states/statename/get, optionally followed by one more level.
+        :param payload: Optional, one of: value (default), value_type, value_human, all (response in json)
         :param qos:
         :param retain:
+        :param wildcards: The state name, and the optional level after 'get'.
         :return:
         """
-        #getting
-        #  0       1       2      3      optional payload, one of:
-        # yombo/states/statename/get {value (default), value_type, value_human, all (response in json)}
-
-        #setting
-        #  0       1       2      3       payload
-        # yombo/states/statename/set    new value
         payload = str(payload)
-
-        parts = topic.split('/', 10)
-        # print("Yombo States got this: %s / %s" % (topic, parts))
-        # requested_state = urllib.unquote(parts[2])
-        requested_state = parts[2].replace("$", ".")
-        # requested_state = decoded_state.replace("_", " ")
-        if len(parts) <= 3 or len(parts) > 5:
-            logger.warn("States received an invalid MQTT topic, discarding. Too long or too short. '%s'" % topic)
+        state_label = wildcards[0]
+        state = self.mqtt_state(state_label)
+        if state is None:
             return
 
-        if  parts[3] not in ('get', 'set'):
-            # logger.warn("States received an invalid MQTT topic, discarding. Must have either 'set' or 'get'. '%s'" % topic)
+        request_id = random_string(length=30)
+        if len(payload) > 0:
+            try:
+                payload = json.loads(payload)
+                if 'request_id' in payload:
+                    if len(payload['request_id']) > 100:
+                        self.mqtt.publish('yombo/states/%s/get_response' % state_label,
+                                          str('MQTT Error: request id too long'))
+                        return
+            except Exception:
+                pass
+
+        if len(wildcards) == 1 or payload == 'all':
+            response = {
+                'value': state['value'],
+                'value_type': state['value_type'],
+                'value_human': state['value_human'],
+                'request_id': request_id,
+            }
+            output = json.dumps(response, separators=(',', ':'))
+            self.mqtt.publish('yombo/states/%s/get_response' % state_label, str(output))
             return
 
-
-        if requested_state not in self.__States:
-            self.mqtt.publish('yombo/states/%s/get_response' % parts[2], str('MQTT Error: state not found'))
+        if payload == '':
+            payload = 'value'
+        if payload not in ('value', 'value_type', 'value_human'):
+            logger.warn("States received an invalid MQTT get request, invalid request type: '%s'" % payload)
             return
 
-        state = self.__States[self.gateway_id][requested_state]
-
-        if parts[3] == 'get':
-            request_id = random_string(length=30)
-
-            if len(payload) > 0:
-                try:
-                    payload = json.loads(payload)
-                    if 'request_id' in payload:
-                        if len(payload['request_id']) > 100:
-                            self.mqtt.publish('yombo/states/%s/get_response' % parts[2],
-                                              str('MQTT Error: request id too long'))
-                            return
-                except Exception:
-                    pass
-
-            if len(parts) == 4 or (len(parts) == 5 and payload == 'all'):
-                response = {
-                    'value': state['value'],
-                    'value_type': state['value_type'],
-                    'value_human': state['value_human'],
-                    'request_id': request_id,
-                }
-                output = json.dumps(response, separators=(',', ':'))
-                self.mqtt.publish('yombo/states/%s/get_response' % parts[2],
-                                  str(output))
-                return
-            elif len(parts) == 5:
-
-                if payload == '':
-                    payload = 'value'
-                if payload not in ('value', 'value_type', 'value_human'):
-                    logger.warn(
-                        "States received an invalid MQTT get request, invalid request type: '%s'" % payload)
-                    return
-
-                output = ""
-                if payload == 'value':
-                    if isinstance(state['value'], dict) or isinstance(state['value'], list):
-                        output = json.dumps(state['value'], separators=(',', ':'))
-                    else:
-                        output = state['value']
-                elif payload == 'value_type':
-                    output = state['value_type']
-                elif payload == 'value_human':
-                    output = state['value_human']
-
-                    self.mqtt.publish('yombo/states/%s/get_response/%s' % (parts[2], payload), str(output))
-                return
-
-
-        elif parts[3] == 'set':
-            request_id = random_string(length=30)
+        if payload == 'value':
+            if isinstance(state['value'], dict) or isinstance(state['value'], list):
+                output = json.dumps(state['value'], separators=(',', ':'))
+            else:
+                output = state['value']
+        elif payload == 'value_type':
+            output = state['value_type']
+        else:
+            output = state['value_human']
+        self.mqtt.publish('yombo/states/%s/get_response/%s' % (state_label, payload), str(output))
 
-            try:
-                data = json.loads(payload)
-                if 'request_id' in data:
-                    request_id = data['request_id']
+    def mqtt_incoming_set(self, topic, payload, qos, retain, wildcards):
+        """
+        Processes incoming MQTT set requests.
 
-                if 'value' not in data:
-                    self.mqtt.publish('yombo/states/%s/set_response' % parts[2],
-                                      str(
-                                          'invalid (%s): Payload must contain json with these: value, value_type, and request_id' % request_id)
-                                      )
+        * /yombo/states/statesname/set {"value":"working","value_type":"string"}
 
-                for key in list(data.keys()):
-                    if key not in ('value', 'value_type', 'request_id'):
-                        self.mqtt.publish('yombo/states/%s/set_response' % parts[2],
-                                          str(
-                                              'invalid (%s): json contents can only contain value, value_type and request_id' %
-                                              request_id)
-                                          )
+        :param topic: yombo/states/statename/set, optionally followed by one more level.
+        :param payload: Json with the new value, and optionally value_type and request_id.
+        :param qos:
+        :param retain:
+        :param wildcards: The state name, and the optional level after 'set'.
+        :return:
+        """
+        payload = str(payload)
+        state_label = wildcards[0]
+        if self.mqtt_state(state_label) is None:
+            return
 
-                if 'value_type' not in data:
-                    data['value_type'] = None
+        request_id = random_string(length=30)
+        try:
+            data = json.loads(payload)
+            if 'request_id' in data:
+                request_id = data['request_id']
 
-                self.set(requested_state, data['value'], value_type=data['value_type'], function=None, arguments=None)
-                return
-            except Exception:
-                self.mqtt.publish('yombo/states/%s/set_response' % parts[2],
+            if 'value' not in data:
+                self.mqtt.publish('yombo/states/%s/set_response' % state_label,
                                   str(
                                       'invalid (%s): Payload must contain json with these: value, value_type, and request_id' % request_id)
                                   )
-                return
 
+            for key in list(data.keys()):
+                if key not in ('value', 'value_type', 'request_id'):
+                    self.mqtt.publish('yombo/states/%s/set_response' % state_label,
+                                      str(
+                                          'invalid (%s): json contents can only contain value, value_type and request_id' %
+                                          request_id)
+                                      )
+
+            if 'value_type' not in data:
+                data['value_type'] = None
+
+            self.set(state_label.replace("$", "."), data['value'], value_type=data['value_type'], function=None,
+                     arguments=None)
+        except Exception:
+            self.mqtt.publish('yombo/states/%s/set_response' % state_label,
+                              str(
+                                  'invalid (%s): Payload must contain json with these: value, value_type, and request_id' % request_id)
+                              )
 
     ##############################################################################################################
     # The remaining functions implement automation hooks. These should not be called by anything other than the  #
@@ -931,3 +994,148 @@ class States(YomboLibrary, object):
             gateway_id = results[0]
             name = results[1]
         return self.set(name, action['value'], gateway_id=gateway_id)
+
+
+class StateJournal:
+    """
+    Collects state changes between database saves. Changes to the same state are coalesced, so a state that
+    changes 100 times between saves writes 1 row, not 100.
+
+    By default, only the last value of a state is kept. Set max_per_key to keep up to the last N values, and
+    min_interval to only keep a value if it's at least that many seconds after the previous kept value.
+
+    If more than max_pending rows are waiting, full_callback is called to save them early, and new values
+    replace the last pending value of a state until the pending rows are taken.
+
+    :ivar flushes: (int) How many times rows were saved.
+    :ivar rows_written: (int) Total rows saved.
+    :ivar rows_coalesced: (int) Total changes that were replaced by a later change instead of being saved.
+    :ivar last_flush_duration: (float) Seconds the last save took.
+    :ivar max_flush_duration: (float) Longest time a save took, in seconds.
+    """
+    def __init__(self, max_per_key=1, min_interval=0, max_pending=5000, full_callback=None):
+        self.max_per_key = max(int(max_per_key), 1)
+        self.min_interval = min_interval
+        self.max_pending = max_pending
+        self.full_callback = full_callback
+        self.pending = OrderedDict()  # state name -> list of row tuples.
+        self.pending_count = 0
+
+        self.flushes = 0
+        self.rows_written = 0
+        self.rows_coalesced = 0
+        self.last_flush_duration = None
+        self.max_flush_duration = 0
+
+    def __len__(self):
+        return self.pending_count
+
+    def add(self, name, data):
+        """
+        Add a state change. A copy of the values is saved, later changes to data won't alter the row.
+
+        :param name: The state name.
+        :param data: The state dictionary.
+        """
+        row = (
+            data['gateway_id'],
+            name,
+            data['value'],
+            data['value_type'],
+            1 if data['live'] is True else 0,
+            data['created_at'],
+            data['updated_at'],
+        )
+
+        if name not in self.pending:
+            self.pending[name] = [row]
+            self.pending_count += 1
+        else:
+            rows = self.pending[name]
+            if self.pending_count >= self.max_pending or self.max_per_key == 1:
+                rows[-1] = row
+                self.rows_coalesced += 1
+            elif len(rows) > 1 and rows[-1][6] - rows[-2][6] < self.min_interval:
+                # The last row is too close to the previous one to keep as a sample, replace it.
+                rows[-1] = row
+                self.rows_coalesced += 1
+            else:
+                rows.append(row)
+                self.pending_count += 1
+                if len(rows) > self.max_per_key:
+                    del rows[0]
+                    self.pending_count -= 1
+                    self.rows_coalesced += 1
+
+        if self.pending_count >= self.max_pending and self.full_callback is not None:
+            self.full_callback()
+
+    def take(self):
+        """
+        Get all pending rows, oldest first for each state, and clear the journal.
+
+        :return: A list of tuples: gateway_id, name, value, value_type, live, created_at, updated_at
+        """
+        rows = []
+        for name_rows in self.pending.values():
+            rows.extend(name_rows)
+        self.pending = OrderedDict()
+        self.pending_count = 0
+        return rows
+
+    def restore(self, rows):
+        """
+        Put back rows from :py:meth:`take` that couldn't be saved. Changes added since then are newer, so they
+        are kept after the restored rows, and the oldest rows of a state are dropped if it now has more than
+        max_per_key.
+
+        :param rows: The list of rows returned by take().
+        """
+        pending = OrderedDict()
+        for row in rows:
+            if row[1] not in pending:
+                pending[row[1]] = []
+            pending[row[1]].append(row)
+        for name, name_rows in self.pending.items():
+            if name in pending:
+                pending[name].extend(name_rows)
+            else:
+                pending[name] = name_rows
+
+        pending_count = 0
+        for name_rows in pending.values():
+            extra = len(name_rows) - self.max_per_key
+            if extra > 0:
+                del name_rows[:extra]
+                self.rows_coalesced += extra
+            pending_count += len(name_rows)
+        self.pending = pending
+        self.pending_count = pending_count
+
+    def flushed(self, row_count, duration):
+        """
+        Record that rows were saved.
+
+        :param row_count: How many rows were saved.
+        :param duration: How many seconds the save took.
+        """
+        self.flushes += 1
+        self.rows_written += row_count
+        self.last_flush_duration = duration
+        if duration > self.max_flush_duration:
+            self.max_flush_duration = duration
+
+    def stats(self):
+        """
+        Returns the journal counters.
+
+        :return: dict
+        """
+        return {
+            'pending': self.pending_count,
+            'flushes': self.flushes,
+            'rows_written': self.rows_written,
+            'rows_coalesced': self.rows_coalesced,
+            'last_flush_duration': self.last_flush_duration,
+            'max_flush_duration': self.max_flush_duration,
+        }
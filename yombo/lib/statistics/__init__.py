@@ -88,7 +88,6 @@ the benefits of better averages, but mitigate loss of data. This is at a cost of
 """
 # Import python libraries
 
-from collections import OrderedDict
 try:  # Prefer simplejson if installed, otherwise json will work swell.
     import simplejson as json
 except ImportError:
@@ -105,11 +104,13 @@ from twisted.internet import reactor
 # Import Yombo libraries
 from yombo.core.exceptions import YomboWarning
 from yombo.core.library import YomboLibrary
-from yombo.utils import percentile, global_invoke_all, pattern_search
+from yombo.utils import global_invoke_all, pattern_search
 from yombo.utils.decorators import memoize_ttl
 from yombo.core.log import get_logger
 
 from yombo.lib.statistics.buckets_manager import BucketsManager
+from yombo.lib.statistics.live_buckets import BucketNames, LiveBuckets
+from yombo.lib.statistics.resample import resample
 logger = get_logger('library.statistics')
 
 
@@ -123,12 +124,11 @@ class Statistics(YomboLibrary):
     enabled = True  # set to True to start, will be updated when configurations is loaded.
     count_bucket_duration = 5  # How many minutes
     averages_bucket_duration = 5
-    _counters = {}  # stores counter information before it's saved to database
-    _averages = {}  # stores averages type information
     _datapoints = {}  # stores datapoint data
     _datapoint_last_value = {}  # Used to track duplicates. Duplicate values are removed as it adds no value!
 
     bucket_lifetimes_default = {'size': 300, 'lifetime': 360}  # 300 seconds, saved for 180 days.
+    consolidate_size_default = 3600  # After the lifetime, buckets are consolidated into this many seconds.
     bucket_lifetimes = {
         '#': {'size': 300, 'lifetime': 360},
         'lib.#': {'size': 300, 'lifetime': 180},
@@ -158,6 +158,11 @@ class Statistics(YomboLibrary):
         self.upload_allowed = self._Configs.get('statistics', 'upload', True)
         self.anonymous_allowed = self._Configs.get('statistics', 'anonymous', True)
 
+        # stores counter and averages information before it's saved to database
+        self.bucket_names = BucketNames()
+        self._counters = LiveBuckets('counter', self.bucket_names)
+        self._averages = LiveBuckets('average', self.bucket_names)
+
         # defines bucket time span, default is 5 minutes for all buckets
         self.count_bucket_duration = self._Configs.get('statistics', 'count_bucket_duration', 300)  # 5 minutes for count buckets
         self.averages_bucket_duration = self._Configs.get('statistics', 'averages_bucket_duration', 300)  # 5 minutes for averages buckets
@@ -170,6 +175,7 @@ class Statistics(YomboLibrary):
         self.saveDataLoop.start(self.time_between_saves, False)
 
         self._upload_statistics_loop = LoopingCall(self._upload_statistics)
+        self._consolidate_statistics_loop = LoopingCall(self.consolidate_statistics)
 
         self.unload_deferred = None
 
@@ -181,8 +187,11 @@ class Statistics(YomboLibrary):
         return self.init_deferred
 
     def _start_(self, **kwargs):
+        if self.enabled is not True:
+            return
         # self._upload_statistics_loop.start(5, False) # for testing...
         self._upload_statistics_loop.start(603.1, False) # about every 10 minutes
+        self._consolidate_statistics_loop.start(3607.3, False)  # about every hour
 
     def _stop_(self, **kwargs):
         """
@@ -195,6 +204,8 @@ class Statistics(YomboLibrary):
             self.init_deferred.callback(1)  # if we don't check for this, we can't stop!
 
         if self.enabled is True:
+            if self._consolidate_statistics_loop.running:
+                self._consolidate_statistics_loop.stop()
             # todo: test more. Changed Oct 28, 2016. Previous method worked, just unclean.
             self.unload_deferred = Deferred()
             self._save_statistics(True, True)
@@ -219,36 +230,21 @@ class Statistics(YomboLibrary):
         self._datapoint_last_value = yield self._LocalDB.get_stat_last_datapoints()
         unfinished = yield self._LocalDB.get_unfinished_statistics()
         for stat in unfinished:
-            bucket_time = stat['bucket_time']
             bucket_name = stat['bucket_name']
             if stat['bucket_type'] == 'counter':
-                if bucket_time not in self._counters:
-                    self._counters[bucket_time] = {}
-                self._counters[bucket_time][bucket_name] = {
-                    'time': stat['bucket_time'],
-                    'size': stat['bucket_size'],
-                    'type': stat['bucket_type'],
-                    'name': stat['bucket_name'],
-                    'value': stat['bucket_value'],
-                    'anon': stat['anon'],
-                    'restored_from_db': True,
-                    'restored_db_id': stat['id'],
-                }
+                buckets = self._counters
             elif stat['bucket_type'] == 'average':
-                if bucket_time not in self._averages:
-                    self._averages[bucket_time] = {}
-                self._averages[bucket_time][bucket_name] = {
-                    'time': stat['bucket_time'],
-                    'size': stat['bucket_size'],
-                    'type': stat['bucket_type'],
-                    'name': stat['bucket_name'],
-                    'average_data': stat['bucket_average_data'],
-                    'value': stat['bucket_value'],
-                    'values': [],
-                    'anon': stat['anon'],
-                    'restored_from_db': stat['bucket_average_data'],
-                    'restored_db_id': stat['id'],
-                }
+                buckets = self._averages
+            else:
+                continue
+            bucket_size, bucket_lifetime = self.find_bucket_time(bucket_name)
+            row = buckets.get_row(stat['bucket_time'], bucket_name, stat['bucket_size'], bucket_lifetime)
+            buckets.values[row] = stat['bucket_value']
+            buckets.anon[row] = 1 if stat['anon'] else 0
+            buckets.db_ids[row] = stat['id']
+            buckets.dirty.discard(row)
+            if stat['bucket_type'] == 'average' and isinstance(stat['bucket_average_data'], dict):
+                buckets.restored_average_data[row] = stat['bucket_average_data']
         self.init_deferred.callback(10)
 
     @inlineCallbacks
@@ -287,7 +283,9 @@ class Statistics(YomboLibrary):
         """
 
         :param bucket_name: bucket_name of bucket
-        :param lifetimes: dictionary: size, lifetime
+        :param lifetimes: dictionary: size, lifetime (days), and optionally consolidate_size (seconds). Once
+          a bucket is older than lifetime days, it's consolidated into buckets of consolidate_size, default
+          is 3600. A lifetime of 0 keeps buckets forever.
         :return:
         """
         if isinstance(values, dict) is False:
@@ -430,30 +428,9 @@ class Statistics(YomboLibrary):
             self.add_bucket_lifetime(bucket_name, lifetimes)
 
         bucket = self._get_bucket_time('count', bucket_size=bucket_size, bucket_name=bucket_name)
-
-        if bucket['time'] not in self._counters:
-            self._counters[bucket['time']] = {}
-
-        if bucket_name not in self._counters[bucket['time']]:
-            self._counters[bucket['time']][bucket_name] = {
-                'time': bucket['time'],
-                'size': bucket['size'],
-                'lifetime': bucket['lifetime'],
-                'type': 'counter',
-                'name': bucket_name,
-                'anon': False,
-                'restored_from_db': False,
-            }
-
-        self._counters[bucket['time']][bucket_name]['value'] = value
-
-        if anon is None:
-            if 'anon' not in self._counters[bucket['time']][bucket_name]['anon']:
-                self._counters[bucket['time']][bucket_name]['anon'] = False
-        elif anon is True:
-            self._counters[bucket['time']][bucket_name]['anon'] = True
-        elif anon is False:
-            self._counters[bucket['time']][bucket_name]['anon'] = False
+        row = self._counters.get_row(bucket['time'], bucket_name, bucket['size'], bucket['lifetime'])
+        self._counters.values[row] = value
+        self._set_anon(self._counters, row, anon)
 
     def increment(self, bucket_name, count=1, bucket_size=None, anon=None, lifetimes=None):
         """
@@ -483,31 +460,9 @@ class Statistics(YomboLibrary):
             self.add_bucket_lifetime(bucket_name, lifetimes)
 
         bucket = self._get_bucket_time('count', bucket_size=bucket_size, bucket_name=bucket_name)
-
-        if bucket['time'] not in self._counters:
-            self._counters[bucket['time']] = {}
-
-        if bucket_name not in self._counters[bucket['time']]:
-            self._counters[bucket['time']][bucket_name] = {
-                'time': bucket['time'],
-                'size': bucket['size'],
-                'lifetime': bucket['lifetime'],
-                'type': 'counter',
-                'name': bucket_name,
-                'anon': False,
-                'restored_from_db': False,
-                'value': count,
-            }
-        else:
-            self._counters[bucket['time']][bucket_name]['value'] += count
-
-        if anon is None:
-            if 'anon' not in self._counters[bucket['time']][bucket_name]['anon']:
-                self._counters[bucket['time']][bucket_name]['anon'] = False
-        elif anon is True:
-            self._counters[bucket['time']][bucket_name]['anon'] = True
-        elif anon is False:
-            self._counters[bucket['time']][bucket_name]['anon'] = False
+        row = self._counters.get_row(bucket['time'], bucket_name, bucket['size'], bucket['lifetime'])
+        self._counters.values[row] += count
+        self._set_anon(self._counters, row, anon)
 
     def decrement(self, bucket_name, count=1, bucket_size=None, anon=None, lifetimes=None):
         """
@@ -537,32 +492,9 @@ class Statistics(YomboLibrary):
             self.add_bucket_lifetime(bucket_name, lifetimes)
 
         bucket = self._get_bucket_time('count', bucket_size=bucket_size, bucket_name=bucket_name)
-
-        if bucket['time'] not in self._counters:
-            self._counters[bucket['time']] = {}
-
-        if bucket_name not in self._counters[bucket['time']]:
-            self._counters[bucket['time']][bucket_name] = {
-                'time': bucket['time'],
-                'size': bucket['size'],
-                'lifetime': bucket['lifetime'],
-                'type': 'counter',
-                'name': bucket_name,
-                'anon': False,
-                'restored_from_db': False,
-                'value': count,
-            }
-        else:
-            self._counters[bucket['time']][bucket_name]['value'] += count
-
-        if anon is None:
-            if 'anon' not in self._counters[bucket['time']][bucket_name]['anon']:
-                self._counters[bucket['time']][bucket_name]['anon'] = False
-        elif anon is True:
-            self._counters[bucket['time']][bucket_name]['anon'] = True
-        elif anon is False:
-            self._counters[bucket['time']][bucket_name]['anon'] = False
-
+        row = self._counters.get_row(bucket['time'], bucket_name, bucket['size'], bucket['lifetime'])
+        self._counters.values[row] -= count
+        self._set_anon(self._counters, row, anon)
 
     def averages(self, bucket_name, value, bucket_size=None, anon=None, lifetimes=None):
         """
@@ -593,62 +525,49 @@ class Statistics(YomboLibrary):
             self.add_bucket_lifetime(bucket_name, lifetimes)
 
         bucket = self._get_bucket_time('averages', bucket_size=bucket_size, bucket_name=bucket_name)
+        row = self._averages.get_row(bucket['time'], bucket_name, bucket['size'], bucket['lifetime'])
+        self._averages.sketches[row].add(value)
+        self._set_anon(self._averages, row, anon)
 
-        if bucket['time'] not in self._averages:
-            self._averages[bucket['time']] = {}
-
-        if bucket_name not in self._averages[bucket['time']]:
-            self._averages[bucket['time']][bucket_name] = {
-                'time': bucket['time'],
-                'lifetime': bucket['lifetime'],
-                'values': [value],
-                'restored_from_db': False,
-                'anon': False,
-                'size': bucket['size'],
-                'type': 'average',
-                'name': bucket_name,
-                'average_data': None
-            }
-        else:
-            self._averages[bucket['time']][bucket_name]['values'].append(value)
-
-        if anon is None:
-            if 'anon' not in self._averages[bucket['time']][bucket_name]['anon']:
-                self._averages[bucket['time']][bucket_name]['anon'] = False
-        elif anon is True:
-            self._averages[bucket['time']][bucket_name]['anon'] = True
+    def _set_anon(self, buckets, row, anon):
+        """
+        Update the anonymous flag of a bucket. If anon is None, the flag is left as is.
+        """
+        if anon is True:
+            buckets.anon[row] = 1
         elif anon is False:
-            self._averages[bucket['time']][bucket_name]['anon'] = False
+            buckets.anon[row] = 0
 
     def get_stat(self, bucket_name, bucket_type=None):
         results = []
         # sum(value) as value, bucket_name, type, round(bucket / %s) * %s AS bucket
         find_name = bucket_name.replace('%', '#')
-        if bucket_type is None or bucket_type is 'counter':
-            for bucket in self._counters:
-                for stat in pattern_search(find_name, self._counters[bucket]):
-                    too_add = self._counters[bucket][stat]
-                    new_result = {
+        matched = set(pattern_search(find_name, self.bucket_names.names))
+        if bucket_type is None or bucket_type == 'counter':
+            for bucket, stat, row in self._counters.items():
+                if stat in matched:
+                    results.append({
                         'name': stat,
-                        'value': too_add['value'],
+                        'value': self._counters.values[row],
                         'type': 'counter',
                         'bucket': bucket,
-                    }
-                    results.append(new_result)
+                    })
 
-        if bucket_type is None or bucket_type is 'average':
-            for bucket in self._averages:
-                for stat in pattern_search(find_name, self._averages[bucket]):
-                    too_add = self._averages[bucket][stat]
-                    new_result = {
+        if bucket_type is None or bucket_type == 'average':
+            for bucket, stat, row in self._averages.items():
+                if stat in matched:
+                    try:
+                        value = self.calc_averages(row)['median_90']
+                    except YomboWarning:
+                        value = self._averages.values[row]
+                    results.append({
                         'name': stat,
-                        'value': too_add['value'],
+                        'value': value,
                         'type': 'average',
                         'bucket': bucket,
-                    }
-                    results.append(new_result)
+                    })
 
-        if bucket_type is None or bucket_type is 'datapoint':
+        if bucket_type is None or bucket_type == 'datapoint':
             for bucket in self._datapoints:
                 for stat in pattern_search(find_name, self._datapoints[bucket]):
                     too_add = self._datapoints[bucket][stat]
@@ -696,11 +615,10 @@ class Statistics(YomboLibrary):
         if not (isinstance(names, (list, tuple)) and all(isinstance(name, str) for name in names)):
             raise ValueError("names must be a string or list/tuple of strings")
 
-        data = yield self._LocalDB.statistic_get_range(names, start, end, minimal=True)
-        # print("stats get: data: %s" % data)
+        data = yield self._LocalDB.statistic_query(list(names), start, end, columnar=True)
         bm = BucketsManager()
         bm.process(data)
-        stat = bm.get_stats(resolution, start, end)
+        stat = bm.get_stats(int(resolution), int(start), int(end))
         return stat
 
     @inlineCallbacks
@@ -708,101 +626,56 @@ class Statistics(YomboLibrary):
         """
         Internal function to save the statistics information to database. This is performed regularly while the gateway
         is running and during shutdown. For perfomance reasons, it's not saved instantly.
+
+        Only buckets that have finished are saved, unless full is True, then buckets changed since the last save
+        are saved as well. New buckets are inserted and buckets restored from the database are updated, all within
+        one transaction.
         """
         if self.enabled is not True:
             return
 
-        to_save = []
-        for bucket_time in list(self._counters.keys()):
-            # print "starting save _counters"
-            for bucket_name in list(self._counters[bucket_time].keys()):
-                current_bucket = self._counters[bucket_time][bucket_name]
-                current_bucket_time = self._get_bucket_time('count', bucket_name=bucket_name)
-                if full or bucket_time < (current_bucket_time['time']):
-                    # print "int(bucket_time (%s) < (current_bucket_time (%s)) = %s" % (bucket_time, current_bucket_time['time'], (int(bucket_time < (current_bucket_time['time']))))
-                    if 'restored_db_id' in current_bucket and current_bucket['restored_db_id'] is not False:
-                        yield self._LocalDB.save_statistic(current_bucket, int(bucket_time < (current_bucket_time['time'])))
-                    else:
-                        od = OrderedDict()
-                        od['bucket_time'] = current_bucket['time']
-                        od['bucket_size'] = current_bucket_time['size']
-                        od['bucket_lifetime'] = current_bucket['lifetime']
-                        od['bucket_type'] = current_bucket['type']
-                        od['bucket_name'] = current_bucket['name']
-                        od['bucket_value'] = current_bucket['value']
-                        od['updated_at'] = int(time())
-                        od['anon'] = current_bucket['anon']
-                        od['finished'] = int(bucket_time < (current_bucket_time['time']))
-                        to_save.append(od)
-
-                if bucket_time < (current_bucket_time['time']):
-                    del self._counters[bucket_time][bucket_name]
-            if len(self._counters[bucket_time]) == 0:
-                del self._counters[bucket_time]
-
-
-        for bucket_time in list(self._averages.keys()):
-            for bucket_name in list(self._averages[bucket_time].keys()):
-                current_bucket = self._averages[bucket_time][bucket_name]
-                current_bucket_time = self._get_bucket_time('average', bucket_name=bucket_name)
-                if full or bucket_time < (current_bucket_time['time']):
-
+        now = time()
+        updated_at = int(now)
+        inserts = []
+        updates = []
+        for buckets in (self._counters, self._averages):
+            finished = buckets.pop_finished(now)
+            if full:
+                to_save = finished | buckets.dirty
+            else:
+                to_save = finished
+            bucket_type = buckets.bucket_type
+            for row in to_save:
+                average_data = None
+                if bucket_type == 'average':
                     try:
-                        # print " "
-                        # print "Before calc averages: %s" % current_bucket
-                        self.calc_averages(bucket_time, bucket_name)
-                        # print "After calc averages: %s" % current_bucket
-                        # print " "
-                    except Exception as e:
+                        average_data = json.dumps(self.calc_averages(row), separators=(',',':'))
+                    except YomboWarning as e:
                         logger.warn("Not saving average bucket_time (no values): {bucket_time}:{bucket_name}  Error: {e}",
-                                    bucket_time=bucket_time, bucket_name=bucket_name, e=e)
+                                    bucket_time=buckets.times[row], bucket_name=buckets.name(row), e=e)
                         continue
-                    else:
-                        if 'restored_db_id' in current_bucket and current_bucket['restored_db_id'] is not False:
-                            yield self._LocalDB.save_statistic(current_bucket,
-                                                                    int(bucket_time < (current_bucket_time['time'])))
-                        else:
-                            od = OrderedDict()
-                            od['bucket_time'] = current_bucket['time']
-                            od['bucket_size'] = current_bucket_time['size']
-                            od['bucket_lifetime'] = current_bucket['lifetime']
-                            od['bucket_type'] = current_bucket['type']
-                            od['bucket_name'] = current_bucket['name']
-                            od['bucket_value'] = current_bucket['value']
-                            od['bucket_average_data'] = json.dumps(current_bucket['average_data'], separators=(',',':'))
-                            od['updated_at'] = int(time())
-                            od['anon'] = current_bucket['anon']
-                            od['finished'] = int(bucket_time < (current_bucket_time['time']))
-                            to_save.append(od)
-
-                if bucket_time < (current_bucket_time['time']):
-                    del self._averages[bucket_time][bucket_name]
-            if len(self._averages[bucket_time]) == 0:
-                del self._averages[bucket_time]
+                if buckets.db_ids[row] != 0:
+                    updates.append((buckets.values[row], average_data, updated_at, buckets.anon[row],
+                                    int(row in finished), buckets.db_ids[row]))
+                else:
+                    inserts.append((buckets.times[row], buckets.sizes[row], buckets.lifetimes[row], bucket_type,
+                                    buckets.name(row), buckets.values[row], average_data, updated_at,
+                                    buckets.anon[row], int(row in finished)))
+
+            buckets.dirty.difference_update(to_save)
+            for row in finished:
+                buckets.remove(row)
 
         for bucket_time in list(self._datapoints.keys()):
-            for bucket_name in list(self._datapoints[bucket_time].keys()):
-                current_bucket = self._datapoints[bucket_time][bucket_name]
-                od = OrderedDict()
-                od['bucket_time'] = current_bucket['time']
-                od['bucket_size'] = 0
-                od['bucket_lifetime'] = current_bucket['lifetime']
-                od['bucket_type'] = current_bucket['type']
-                od['bucket_name'] = current_bucket['name']
-                od['bucket_value'] = current_bucket['value']
-                od['updated_at'] = int(time())
-                od['anon'] = current_bucket['anon']
-                od['finished'] = 1
-                to_save.append(od)
-
-                del self._datapoints[bucket_time][bucket_name]
-            if len(self._datapoints[bucket_time]) == 0:
-                del self._datapoints[bucket_time]
+            for bucket_name, current_bucket in self._datapoints[bucket_time].items():
+                inserts.append((current_bucket['time'], 0, current_bucket['lifetime'], current_bucket['type'],
+                                current_bucket['name'], current_bucket['value'], None, updated_at,
+                                int(current_bucket['anon']), 1))
+            del self._datapoints[bucket_time]
 
         try:
-            if len(to_save) > 0:
-                yield self._LocalDB.save_statistic_bulk(to_save)
-            to_save = []
+            if len(inserts) > 0 or len(updates) > 0:
+                yield self._LocalDB.save_statistics_batch(inserts, updates)
         except Exception as error:
             logger.warn("Error while trying to bulk save: {error}", error=error)
 
@@ -811,72 +684,47 @@ class Statistics(YomboLibrary):
         # else:
         #     self.consolidate_db()  # for testing
 
-    def calc_averages(self, bucket_time, bucket_name):
-        values = self._averages[bucket_time][bucket_name]['values']
-        if len(values) > 0:
-            sorted_values = sorted(values)
+    def calc_averages(self, row):
+        """
+        Calculate the average data for an average bucket from its sketch. If the bucket was restored from the
+        database, the restored average data is merged in, weighted by count. The bucket value is set to median_90.
 
-            median = percentile(list(sorted_values), 0.50)
-            percentile90 = percentile(sorted_values, 0.90)
-            values_90 = []
+        :param row: Row of the bucket within self._averages.
+        :return: Dictionary of average data.
+        """
+        average_data = self._averages.sketches[row].average_data()
+        restored_averages = self._averages.restored_average_data.get(row)
 
-            for val in sorted_values:
-                if val <= percentile90:
-                    values_90.append(val)
-                else:
-                    break
+        if average_data is None:
+            if restored_averages is None:
+                raise YomboWarning("Calc_averages must have a list of ints or floats.")
+            return restored_averages
 
-            median_90 = percentile(values_90, 0.50)
-
-            # print "sorted_values: %s" % sorted_values
-            # print "valpercentile90es_90: %s" % percentile90
-            # print "values_90: %s" % values_90
-            average_data = {
-                'count': len(sorted_values),
-                'median': median,
-                'upper': sorted_values[-1],
-                'lower': sorted_values[0],
-                'upper_90': values_90[0],
-                'lower_90': values_90[-1],
-                'median_90': median_90,
-            }
+        if restored_averages is not None:
+            counts = [restored_averages['count'], average_data['count']]
+            total = sum(counts)
+            # found this weighted averaging method here:
+            # http://stackoverflow.com/questions/29330792/python-weighted-averaging-a-list
+            for key in ('median', 'upper', 'lower', 'upper_90', 'lower_90', 'median_90'):
+                values = [restored_averages[key], average_data[key]]
+                average_data[key] = sum(x * y for x, y in zip(values, counts)) / total
+            average_data['count'] = total
 
-            restored_averages = self._averages[bucket_time][bucket_name]['restored_from_db']
-
-            if restored_averages is not False:
-                counts = [restored_averages['count'], average_data['count']]
-                medians = [restored_averages['median'], average_data['median']]
-                uppers = [restored_averages['upper'], average_data['upper']]
-                lowers = [restored_averages['lower'], average_data['lower']]
-                upper_90s = [restored_averages['upper_90'], average_data['upper_90']]
-                lower_90s = [restored_averages['lower_90'], average_data['lower_90']]
-                median_90s = [restored_averages['median_90'], average_data['median_90']]
-
-                # found this weighted averaging method here:
-                # http://stackoverflow.com/questions/29330792/python-weighted-averaging-a-list
-                # new_average_data = {}
-                average_data['count'] = restored_averages['count'] + average_data['count']
-                average_data['median'] = sum(x * y for x, y in zip(medians, counts)) / sum(counts)
-                average_data['upper'] = sum(x * y for x, y in zip(uppers, counts)) / sum(counts)
-                average_data['lower'] = sum(x * y for x, y in zip(lowers, counts)) / sum(counts)
-                average_data['upper_90'] = sum(x * y for x, y in zip(upper_90s, counts)) / sum(counts)
-                average_data['lower_90'] = sum(x * y for x, y in zip(lower_90s, counts)) / sum(counts)
-                average_data['median_90'] = sum(x * y for x, y in zip(median_90s, counts)) / sum(counts)
-
-                # self._averages[bucket_time][bucket_name]['restored_from_db'] = True
-            self._averages[bucket_time][bucket_name]['value'] = average_data['median_90']
-            self._averages[bucket_time][bucket_name]['average_data'] = average_data
-
-            return average_data
-        elif self._averages[bucket_time][bucket_name]['restored_from_db'] is not False:
-            self._averages[bucket_time][bucket_name]['average_data'] = \
-                self._averages[bucket_time][bucket_name]['restored_from_db']
-        else:
-            raise YomboWarning("Calc_averages must have a list of ints or floats.")
+        self._averages.values[row] = average_data['median_90']
+        return average_data
 
     def find_bucket_time(self, bucket_name):
         """
-        :return:
+        :return: A tuple of the bucket size and lifetime for a bucket name.
+        """
+        lifetime = self.find_bucket_lifetime(bucket_name)
+        return lifetime['size'], lifetime['lifetime']
+
+    def find_bucket_lifetime(self, bucket_name):
+        """
+        Find the bucket lifetime rule that best matches a bucket name. See add_bucket_lifetime().
+
+        :return: Dictionary with size, lifetime, and optionally consolidate_size.
         """
 
         # #        1) Generate full list of bucket_names.
@@ -930,11 +778,98 @@ class Statistics(YomboLibrary):
 
         # now lets strip this down
         # print "got filters: %s" % filters
-        if len('filters') > 0:
-            bucket_time = select_closest(regexs, bucket_name)
-            return self.bucket_lifetimes[bucket_time]['size'], self.bucket_lifetimes[bucket_time]['lifetime']
+        if len(filters) > 0:
+            bucket_time = select_closest(filters, bucket_name)
+            return self.bucket_lifetimes[bucket_time]
         else:
-            return self.bucket_lifetimes_default['size'], self.bucket_lifetimes_default['lifetime']
+            return self.bucket_lifetimes_default
+
+    @inlineCallbacks
+    def consolidate_statistics(self):
+        """
+        Consolidates old statistics into larger buckets, based on the bucket lifetimes. For example, 60 second
+        buckets older than 180 days are combined into 3600 second buckets. Counters are summed, averages are
+        weighted by time, and their average data is weighted by count.
+
+        When uploading is enabled, buckets are only consolidated once they have been uploaded.
+        """
+        if self.enabled is not True:
+            return
+
+        now = time()
+        records = yield self._LocalDB.get_distinct_stat_names()
+        for record in records:
+            bucket_name = record['bucket_name']
+            bucket_type = record['bucket_type']
+            if bucket_type not in ('counter', 'average'):
+                continue
+            lifetime = self.find_bucket_lifetime(bucket_name)
+            if lifetime['lifetime'] == 0:
+                continue
+            size = int(lifetime.get('consolidate_size', self.consolidate_size_default))
+            before = int((now - lifetime['lifetime'] * 86400) / size) * size
+            if record['bucket_time_min'] >= before:
+                continue
+
+            buckets = yield self._LocalDB.get_statistics_to_consolidate(bucket_name, bucket_type, before, size,
+                                                                        self.upload_allowed,
+                                                                        self.anonymous_allowed)
+            delete_ids, inserts = self._consolidate_buckets(bucket_name, bucket_type, buckets, size, int(now))
+            if len(inserts) > 0:
+                yield self._LocalDB.replace_statistics(delete_ids, inserts)
+                logger.debug("Consolidated {count} buckets into {new} for: {bucket_name}",
+                             count=len(delete_ids), new=len(inserts), bucket_name=bucket_name)
+
+    def _consolidate_buckets(self, bucket_name, bucket_type, buckets, size, updated_at):
+        """
+        Groups stored buckets into slots of size seconds. Slots that are already a single bucket of that size
+        are left alone.
+
+        :return: A tuple: list of ids to delete, list of bucket tuples to insert for LocalDB.replace_statistics().
+        """
+        slots = {}
+        for bucket in buckets:
+            slots.setdefault(int(bucket['bucket_time'] / size) * size, []).append(bucket)
+
+        delete_ids = []
+        inserts = []
+        for slot, slot_buckets in sorted(slots.items()):
+            if len(slot_buckets) == 1 and slot_buckets[0]['bucket_size'] == size:
+                continue
+            value = resample(bucket_type,
+                             [bucket['bucket_time'] for bucket in slot_buckets],
+                             [bucket['bucket_size'] for bucket in slot_buckets],
+                             [bucket['bucket_value'] for bucket in slot_buckets],
+                             slot, slot + size, size)[0]
+            average_data = None
+            if bucket_type == 'average':
+                average_data = self._merge_average_data(
+                    [bucket['bucket_average_data'] for bucket in slot_buckets])
+                if average_data is not None:
+                    average_data = json.dumps(average_data, separators=(',',':'))
+            delete_ids.extend(bucket['id'] for bucket in slot_buckets)
+            inserts.append((slot, size, slot_buckets[0]['bucket_lifetime'], bucket_type, bucket_name, value,
+                            average_data, updated_at, max(bucket['anon'] for bucket in slot_buckets),
+                            max(bucket['uploaded'] for bucket in slot_buckets)))
+        return delete_ids, inserts
+
+    def _merge_average_data(self, all_average_data):
+        """
+        Merge the average data of several buckets, weighted by count.
+        """
+        all_average_data = [data for data in all_average_data if isinstance(data, dict) and data.get('count')]
+        if len(all_average_data) == 0:
+            return None
+        total = sum(data['count'] for data in all_average_data)
+        results = {
+            'count': total,
+            'upper': max(data['upper'] for data in all_average_data),
+            'lower': min(data['lower'] for data in all_average_data),
+            'upper_90': min(data['upper_90'] for data in all_average_data),
+        }
+        for key in ('median', 'lower_90', 'median_90'):
+            results[key] = sum(data[key] * data['count'] for data in all_average_data) / total
+        return results
 
 
     @inlineCallbacks
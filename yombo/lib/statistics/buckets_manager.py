@@ -14,52 +14,68 @@
 :license: LICENSE for details.
 """
 
-from collections import defaultdict
-
-from yombo.lib.statistics.aggregator import AggregatorFactory
-from yombo.lib.statistics.bucket_timeline_handler import BucketTimelineHandler
+from yombo.lib.statistics.resample import resample
 
 
 class BucketsManager:
+    """
+    Collects stored statistic buckets by name as columns and resamples them into buckets of a given size.
+    See :py:mod:`yombo.lib.statistics.resample`.
+    """
     def __init__(self):
-        self._handlers = {}
+        self._buckets = {}
+
+    def _get_columns(self, bucket_name, bucket_type):
+        if bucket_name not in self._buckets:
+            self._buckets[bucket_name] = {
+                'type': bucket_type,
+                'times': [],
+                'sizes': [],
+                'values': [],
+            }
+        return self._buckets[bucket_name]
 
     def process(self, data):
-        # print("bm process data: %s" % data)
-#        flatten_inputs = sum(data, [])
-        bucket_dict = defaultdict(lambda: [])
+        """
+        Add stored buckets. Accepts either a list of dictionaries (LocalDB.statistic_get_range), or a dictionary
+        of columns (LocalDB.statistic_query with columnar=True).
+        """
+        if isinstance(data, dict):
+            return self.process_columns(data)
 
         for values in data:
-            bucket_dict[values['bucket_name']].append(values)
-
-        for bucket_name, values in bucket_dict.items():
-            bucket_type = values[0]['bucket_type']
-            self._handlers[bucket_name] = BucketTimelineHandler(bucket_name=bucket_name,
-                                                                bucket_type=bucket_type,
-                                                                db_values=values,
-                                                                aggregator=AggregatorFactory.get_aggregator(
-                                                                    bucket_type))
-
-        # for dbvalue in map(DBValue.from_db_string, flatten_inputs):
-        #     bucket_dict[dbvalue.bucket_name].append(dbvalue)
-        #
-        # for bucket_name, db_values in bucket_dict.items():
-        #     bucket_type = db_values[0].bucket_type
-        #     self._handlers[bucket_name] = BucketTimelineHandler(bucket_name=bucket_name,
-        #                                                         bucket_type=bucket_type,
-        #                                                         db_values=db_values,
-        #                                                         aggregator=AggregatorFactory.get_aggregator(
-        #                                                             bucket_type))
+            columns = self._get_columns(values['bucket_name'], values['bucket_type'])
+            columns['times'].append(values['bucket_time'])
+            columns['sizes'].append(values['bucket_size'])
+            columns['values'].append(values['bucket_value'])
+
+    def process_columns(self, data):
+        names = data['bucket_name']
+        types = data['bucket_type']
+        times = data['bucket_time']
+        sizes = data['bucket_size']
+        values = data['bucket_value']
+        for index in range(len(names)):
+            columns = self._get_columns(names[index], types[index])
+            columns['times'].append(times[index])
+            columns['sizes'].append(sizes[index])
+            columns['values'].append(values[index])
 
     def stat_bucket(self, bucket_name, bucket_size, start=None, end=None):
-        return self._handlers[bucket_name].stat(bucket_size, start, end)
+        columns = self._buckets[bucket_name]
+        if start is None:
+            start = min(columns['times'])
+        if end is None:
+            end = max(time + size for time, size in zip(columns['times'], columns['sizes']))
+        return resample(columns['type'], columns['times'], columns['sizes'], columns['values'],
+                        start, end, bucket_size)
 
     def get_stats(self, bucket_size, start, end):
         granulated = list(range(start, end, bucket_size))
         result = {'buckets': granulated, 'values': {}}
-        for bucket_name in self._handlers.keys():
+        for bucket_name in self._buckets.keys():
             result['values'][bucket_name] = self.stat_bucket(bucket_name, bucket_size, start, end)
         return result
 
     def bucket_names(self):
-        return list(sorted(self._handlers.keys()))
+        return list(sorted(self._buckets.keys()))
@@ -0,0 +1,300 @@
+# This file was created by Yombo for use with Yombo Python gateway automation
+# software.  Details can be found at https://yombo.net
+"""
+
+.. note::
+
+  For more information see: `Statistics @ Module Development <https://yombo.net/docs/libraries/statistics>`_
+
+Compact storage for statistic buckets that are still being collected, before they are saved to the database.
+
+Bucket names are interned once and referenced by an integer id. Each bucket is a row within a set of typed
+arrays (time, name id, size, lifetime, value, anon, database id), found by (bucket_time, name_id). Buckets
+changed since the last save are tracked in a dirty set, and a heap ordered by bucket end time finds the buckets
+that have finished without looking at every bucket. Average
+buckets don't keep their samples, instead they keep an AverageSketch, which estimates the quantiles using
+the P² algorithm. This keeps the memory used by a bucket the same no matter how many values it receives.
+
+.. moduleauthor:: Mitch Schwenk <mitch-gw@yombo.net>
+.. versionadded:: 0.14.0
+
+:copyright: Copyright 2017 by Yombo.
+:license: LICENSE for details.
+"""
+from array import array
+from heapq import heappush, heappop
+
+from yombo.utils import percentile
+
+
+class BucketNames:
+    """
+    Interns bucket names, giving each an integer id. Ids are never reused.
+
+    :ivar ids: (dict) bucket_name -> id
+    :ivar names: (list) id -> bucket_name
+    """
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+
+    def get_id(self, bucket_name):
+        try:
+            return self.ids[bucket_name]
+        except KeyError:
+            name_id = len(self.names)
+            self.ids[bucket_name] = name_id
+            self.names.append(bucket_name)
+            return name_id
+
+    def __len__(self):
+        return len(self.names)
+
+
+class LiveBuckets:
+    """
+    Holds the live buckets for one bucket type (counter or average). Each bucket is a row in the column arrays,
+    rows of removed buckets are reused.
+
+    :ivar bucket_type: (str) Either 'counter' or 'average'.
+    :ivar names: (BucketNames) Shared bucket name ids.
+    :ivar rows: (dict) (bucket_time, name_id) -> row
+    :ivar times: (array) Bucket time of each row.
+    :ivar name_ids: (array) Bucket name id of each row.
+    :ivar sizes: (array) Bucket size, in seconds.
+    :ivar lifetimes: (array) Bucket lifetime, in days.
+    :ivar values: (array) Counter value, or the last calculated average.
+    :ivar anon: (array) 1 if the bucket is anonymous.
+    :ivar db_ids: (array) Database id if the bucket was restored from the database, otherwise 0.
+    :ivar sketches: (list) AverageSketch for each row of an average bucket.
+    :ivar restored_average_data: (dict) row -> average_data for average buckets restored from the database.
+    :ivar dirty: (set) Rows changed since the last save.
+    :ivar expires: (list) Heap of (bucket end time, (bucket_time, name_id)).
+    """
+    def __init__(self, bucket_type, names):
+        self.bucket_type = bucket_type
+        self.names = names
+        self.rows = {}
+        self.free_rows = []
+        self.times = array('q')
+        self.name_ids = array('l')
+        self.sizes = array('l')
+        self.lifetimes = array('l')
+        self.values = array('d')
+        self.anon = array('b')
+        self.db_ids = array('q')
+        self.sketches = []
+        self.restored_average_data = {}
+        self.dirty = set()
+        self.expires = []
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def get_row(self, bucket_time, bucket_name, bucket_size, bucket_lifetime):
+        """
+        Get the row for a bucket to be updated, creating it if needed. The bucket is marked as dirty.
+
+        :return: The row number.
+        """
+        key = (bucket_time, self.names.get_id(bucket_name))
+        try:
+            row = self.rows[key]
+            self.dirty.add(row)
+            return row
+        except KeyError:
+            pass
+
+        sketch = AverageSketch() if self.bucket_type == 'average' else None
+        if len(self.free_rows) > 0:
+            row = self.free_rows.pop()
+            self.times[row] = bucket_time
+            self.name_ids[row] = key[1]
+            self.sizes[row] = int(bucket_size)
+            self.lifetimes[row] = int(bucket_lifetime)
+            self.values[row] = 0
+            self.anon[row] = 0
+            self.db_ids[row] = 0
+            self.sketches[row] = sketch
+        else:
+            row = len(self.times)
+            self.times.append(bucket_time)
+            self.name_ids.append(key[1])
+            self.sizes.append(int(bucket_size))
+            self.lifetimes.append(int(bucket_lifetime))
+            self.values.append(0)
+            self.anon.append(0)
+            self.db_ids.append(0)
+            self.sketches.append(sketch)
+        self.rows[key] = row
+        self.dirty.add(row)
+        heappush(self.expires, (bucket_time + int(bucket_size), key))
+        return row
+
+    def find_row(self, bucket_time, bucket_name):
+        """
+        Get the row for a bucket, or None if it doesn't exist.
+        """
+        name_id = self.names.ids.get(bucket_name)
+        if name_id is None:
+            return None
+        return self.rows.get((bucket_time, name_id))
+
+    def remove(self, row):
+        """
+        Remove a bucket, its row will be reused.
+        """
+        del self.rows[(self.times[row], self.name_ids[row])]
+        self.sketches[row] = None
+        self.restored_average_data.pop(row, None)
+        self.dirty.discard(row)
+        self.free_rows.append(row)
+
+    def pop_finished(self, now):
+        """
+        Returns the set of rows for buckets whose time span ended at or before now. Each bucket is only
+        returned once.
+        """
+        finished = set()
+        expires = self.expires
+        rows = self.rows
+        while len(expires) > 0 and expires[0][0] <= now:
+            row = rows.get(heappop(expires)[1])
+            if row is not None:
+                finished.add(row)
+        return finished
+
+    def name(self, row):
+        return self.names.names[self.name_ids[row]]
+
+    def items(self):
+        """
+        Returns a list of (bucket_time, bucket_name, row) for all buckets. A list is returned so buckets can be
+        removed while looping.
+        """
+        names = self.names.names
+        return [(key[0], names[key[1]], row) for key, row in self.rows.items()]
+
+    def bucket(self, row):
+        """
+        Returns a bucket as a dictionary, in the form used by LocalDB.save_statistic().
+        """
+        results = {
+            'time': self.times[row],
+            'size': self.sizes[row],
+            'lifetime': self.lifetimes[row],
+            'type': self.bucket_type,
+            'name': self.name(row),
+            'value': self.values[row],
+            'anon': bool(self.anon[row]),
+        }
+        if self.db_ids[row] != 0:
+            results['restored_db_id'] = self.db_ids[row]
+        return results
+
+
+class AverageSketch:
+    """
+    Streaming estimate of the values added to an average bucket. Keeps the count, lowest and highest values, and
+    estimates the 45th, 50th and 90th percentiles using the P² algorithm (Jain & Chlamtac), which keeps 5 markers
+    per percentile. The 45th percentile estimates the median of values below the 90th percentile.
+
+    The first 5 values are kept as is, so small buckets are calculated exactly.
+    """
+    __slots__ = ('count', 'lower', 'upper', 'heights', 'positions', 'desired')
+
+    QUANTILES = (0.45, 0.50, 0.90)
+    INCREMENTS = tuple(inc for p in QUANTILES for inc in (0, p / 2, p, (1 + p) / 2, 1))
+
+    def __init__(self):
+        self.count = 0
+        self.lower = None
+        self.upper = None
+        self.heights = array('d')
+        self.positions = array('d', (1, 2, 3, 4, 5) * len(self.QUANTILES))
+        self.desired = array('d', (d for p in self.QUANTILES for d in (1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5)))
+
+    def add(self, value):
+        self.count += 1
+        if self.count == 1:
+            self.lower = self.upper = value
+        elif value < self.lower:
+            self.lower = value
+        elif value > self.upper:
+            self.upper = value
+
+        heights = self.heights
+        if self.count <= 5:
+            heights.append(value)
+            if self.count == 5:
+                self.heights = array('d', sorted(heights) * len(self.QUANTILES))
+            return
+
+        for base in range(0, len(heights), 5):
+            self._add_marker(base, value)
+
+    def _add_marker(self, base, value):
+        q = self.heights
+        n = self.positions
+        d = self.desired
+        if value < q[base]:
+            q[base] = value
+            k = 0
+        elif value >= q[base + 4]:
+            q[base + 4] = value
+            k = 3
+        else:
+            k = 0
+            while value >= q[base + k + 1]:
+                k += 1
+
+        for i in range(base + k + 1, base + 5):
+            n[i] += 1
+        increments = self.INCREMENTS
+        for i in range(base, base + 5):
+            d[i] += increments[i]
+
+        for i in range(base + 1, base + 4):
+            delta = d[i] - n[i]
+            if (delta >= 1 and n[i + 1] - n[i] > 1) or (delta <= -1 and n[i - 1] - n[i] < -1):
+                s = 1 if delta > 0 else -1
+                height = q[i] + s / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + s) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                    (n[i + 1] - n[i] - s) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + s * (q[i + s] - q[i]) / (n[i + s] - n[i])
+                q[i] = height
+                n[i] += s
+
+    def average_data(self):
+        """
+        Returns the average_data dictionary saved with an average bucket, or None if no values were added.
+        """
+        if self.count == 0:
+            return None
+
+        if self.count <= 5:
+            sorted_values = sorted(self.heights[0:self.count])
+            percentile90 = percentile(sorted_values, 0.90)
+            values_90 = [val for val in sorted_values if val <= percentile90]
+            median = percentile(sorted_values, 0.50)
+            median_90 = percentile(values_90, 0.50)
+            lower_90 = values_90[-1]
+        else:
+            median_90 = self.heights[2]
+            median = self.heights[7]
+            lower_90 = self.heights[12]
+
+        # upper_90 and lower_90 keep the meaning of the original sorted list implementation.
+        return {
+            'count': self.count,
+            'median': median,
+            'upper': self.upper,
+            'lower': self.lower,
+            'upper_90': self.lower,
+            'lower_90': lower_90,
+            'median_90': median_90,
+        }
@@ -0,0 +1,198 @@
+# This file was created by Yombo for use with Yombo Python gateway automation
+# software.  Details can be found at https://yombo.net
+"""
+
+.. note::
+
+  For more information see: `Statistics @ Module Development <https://yombo.net/docs/libraries/statistics>`_
+
+Resamples stored statistic buckets into buckets of a new size, for charts and for consolidating old statistics.
+Works on columns (bucket times, sizes and values) instead of an object per bucket.
+
+Counter and average buckets cover a time span: [bucket_time, bucket_time + bucket_size). A stored bucket that
+overlaps several new buckets is split between them by how much of its time span falls within each one:
+
+  * Counters are summed.
+  * Averages are weighted by the overlapping time.
+  * Datapoints are points in time, each new bucket gets the average of its points, with points weighted by how
+    early they are in the bucket against the value of the previous bucket.
+
+If NumPy is installed, each type is calculated in a few vectorized passes. Otherwise, the same calculations
+are done in pure python using bisect.
+
+.. moduleauthor:: Mitch Schwenk <mitch-gw@yombo.net>
+.. versionadded:: 0.14.0
+
+:copyright: Copyright 2017 by Yombo.
+:license: LICENSE for details.
+"""
+from bisect import bisect_right
+from itertools import accumulate
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    np = None
+    HAS_NUMPY = False
+
+
+def resample(bucket_type, times, sizes, values, start, end, resolution, use_numpy=None):
+    """
+    Resample stored buckets into new buckets of resolution seconds, starting at start and ending before end.
+
+    :param bucket_type: One of: counter, average, datapoint. Anything else is averaged.
+    :param times: Sequence of bucket times.
+    :param sizes: Sequence of bucket sizes, in seconds. Not used for datapoints.
+    :param values: Sequence of bucket values.
+    :param start: Time of the first new bucket.
+    :param end: The new buckets end before this time.
+    :param resolution: Size of the new buckets, in seconds.
+    :param use_numpy: Force using (or not using) NumPy, default is to use it if installed.
+    :return: A list of values, one for each new bucket.
+    """
+    start = int(start)
+    end = int(end)
+    resolution = int(resolution)
+    if resolution < 1:
+        raise ValueError("Resolution must be greater than 0.")
+    count = len(range(start, end, resolution))
+    if count == 0:
+        return []
+    if use_numpy is None:
+        use_numpy = HAS_NUMPY
+    elif use_numpy is True and HAS_NUMPY is False:
+        raise ImportError("NumPy is not installed.")
+
+    if bucket_type == 'datapoint':
+        if use_numpy:
+            return _points_numpy(times, values, start, resolution, count)
+        return _points_python(times, values, start, resolution, count)
+
+    edges = [start + resolution * number for number in range(count + 1)]
+    if use_numpy:
+        integrate = _integrate_numpy
+    else:
+        integrate = _integrate_python
+
+    if bucket_type == 'counter':
+        rates = [value / size if size > 0 else 0 for value, size in zip(values, sizes)]
+        return integrate(times, sizes, rates, edges, start)
+
+    totals = integrate(times, sizes, values, edges, start)
+    durations = integrate(times, sizes, [1] * len(times), edges, start)
+    return [total / duration if duration > 0 else 0 for total, duration in zip(totals, durations)]
+
+
+def _integrate_numpy(times, sizes, rates, edges, origin):
+    """
+    For each span between edges, returns the sum of rate * overlapping seconds of every stored bucket. Times
+    are moved to start at origin to keep the floating point sums small.
+    """
+    starts = np.asarray(times, dtype=np.float64) - origin
+    ends = starts + np.asarray(sizes, dtype=np.float64)
+    rates = np.asarray(rates, dtype=np.float64)
+    edges = np.asarray(edges, dtype=np.float64) - origin
+
+    cumulative = _cumulative_numpy(starts, rates, edges) - _cumulative_numpy(ends, rates, edges)
+    return np.diff(cumulative).tolist()
+
+
+def _cumulative_numpy(points, rates, edges):
+    """
+    Returns, for each edge, the sum of rate * (edge - point) for all points at or before the edge.
+    """
+    order = np.argsort(points, kind='mergesort')
+    points = points[order]
+    rates = rates[order]
+    rate_sums = np.concatenate(([0.0], np.cumsum(rates)))
+    moment_sums = np.concatenate(([0.0], np.cumsum(rates * points)))
+    found = np.searchsorted(points, edges, side='right')
+    return edges * rate_sums[found] - moment_sums[found]
+
+
+def _integrate_python(times, sizes, rates, edges, origin):
+    """
+    Pure python version of _integrate_numpy().
+    """
+    starts = [time - origin for time in times]
+    ends = [time + size for time, size in zip(starts, sizes)]
+    edges = [edge - origin for edge in edges]
+
+    cumulative = [first - second for first, second in zip(_cumulative_python(starts, rates, edges),
+                                                            _cumulative_python(ends, rates, edges))]
+    return [cumulative[number + 1] - cumulative[number] for number in range(len(edges) - 1)]
+
+
+def _cumulative_python(points, rates, edges):
+    ordered = sorted(zip(points, rates))
+    points = [item[0] for item in ordered]
+    rate_sums = [0] + list(accumulate(item[1] for item in ordered))
+    moment_sums = [0] + list(accumulate(item[0] * item[1] for item in ordered))
+    results = []
+    for edge in edges:
+        found = bisect_right(points, edge)
+        results.append(edge * rate_sums[found] - moment_sums[found])
+    return results
+
+
+def _points_numpy(times, values, start, resolution, count):
+    """
+    Datapoint buckets. Each point is weighted by how early it is within the bucket, against the last value of the
+    previous bucket that had points. Buckets without points carry the previous value.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    order = np.argsort(times, kind='mergesort')
+    times = times[order]
+    values = values[order]
+
+    offsets = times - start
+    keep = (offsets >= 0) & (offsets < resolution * count)
+    offsets = offsets[keep]
+    values = values[keep]
+    results = np.zeros(count, dtype=np.float64)
+    if len(values) == 0:
+        return results.tolist()
+
+    bucket_ids = (offsets // resolution).astype(np.int64)
+    used, first_index = np.unique(bucket_ids, return_index=True)
+    last_index = np.concatenate((first_index[1:], [len(values)])) - 1
+    previous = np.concatenate(([0.0], values[last_index][:-1]))
+    previous_per_point = np.repeat(previous, np.diff(np.concatenate((first_index, [len(values)]))))
+
+    alphas = 1.0 - (offsets - bucket_ids * resolution) / resolution
+    weighted = np.bincount(bucket_ids, weights=alphas * (values - previous_per_point), minlength=count)
+    points = np.bincount(bucket_ids, minlength=count)
+    results[used] = previous + weighted[used] / points[used]
+
+    # Empty buckets carry the last value of the most recent bucket with points.
+    carried = np.zeros(count, dtype=np.float64)
+    carried[used] = values[last_index]
+    latest = np.where(points > 0, np.arange(count), -1)
+    latest = np.maximum.accumulate(latest)
+    has_previous = (points == 0) & (latest >= 0)
+    results[has_previous] = carried[latest[has_previous]]
+    return results.tolist()
+
+
+def _points_python(times, values, start, resolution, count):
+    """
+    Pure python version of _points_numpy().
+    """
+    buckets = [[] for number in range(count)]
+    for time, value in sorted(zip(times, values), key=lambda item: item[0]):
+        offset = time - start
+        if 0 <= offset < resolution * count:
+            buckets[int(offset // resolution)].append((offset % resolution, value))
+
+    results = []
+    current = 0.0
+    for points in buckets:
+        if len(points) == 0:
+            results.append(current)
+            continue
+        weighted = sum((1.0 - offset / resolution) * (value - current) for offset, value in points)
+        results.append(current + weighted / len(points))
+        current = points[-1][1]
+    return results
@@ -127,33 +127,30 @@ def route_api_v1_statistics(webapp):
                         try:
                             bucket_size[idx] = int(bucket_size[idx])
                         except Exception as e:
-                            return return_error(request, "'bucket_size' must be an int and must be greater than 0")
+                            return return_error(request, "'bucket_size' must be an int and must be greater than 0",
+                                                400)
 
-                        if bucket_size[idx] < 0:
-                            return return_error(request, "'bucket_size' must be an int and must be greater than 0")
-                        if bucket_size[idx] < 0:
-                            return return_error(request, "'bucket_size' must be an int and must be greater than 0.")
+                        if bucket_size[idx] <= 0:
+                            return return_error(request, "'bucket_size' must be an int and must be greater than 0",
+                                                400)
                         my_bucket_size = int(bucket_size[idx])
                     else:
                         my_bucket_size = 900
                 except Exception as e:
                     my_bucket_size = 900
 
-                records = yield webinterface._Libraries['localdb'].get_stats_sums(my_stat_name,
-                                                                                  bucket_size=my_bucket_size,
-                                                                                  bucket_type=my_stat_type,
-                                                                                  time_start=my_time_start,
-                                                                                  time_end=my_time_end,
-                                                                                  )
+                records = yield webinterface._Libraries['localdb'].statistic_query([my_stat_name],
+                                                                                   my_time_start,
+                                                                                   my_time_end,
+                                                                                   bucket_type=my_stat_type,
+                                                                                   resolution=my_bucket_size,
+                                                                                   columnar=True,
+                                                                                   )
 
-                labels = []
-                data = []
+                labels = [epoch_to_string(bucket, '%Y/%-m/%-d %H:%M') for bucket in records['bucket_time']]
+                data = records['bucket_value'].tolist()
                 live_stats = webinterface._Statistics.get_stat(my_stat_name, my_stat_type)
 
-                for record in records:
-                    labels.append(epoch_to_string(record['bucket'], '%Y/%-m/%-d %H:%M'))
-                    data.append(record['value'])
-
                 for record in live_stats:
                     labels.append(epoch_to_string(record['bucket'], '%Y/%-m/%-d %H:%M'))
                     data.append(record['value'])
@@ -248,6 +248,7 @@ def route_devices(webapp):
             webinterface.add_breadcrumb(request, "/devices/delayed_commands", "Device Commands")
             return page.render(alerts=webinterface.get_alerts(),
                                device_commands=webinterface._Devices.device_commands,
+                               command_counts=webinterface._Devices.device_commands.status_counts(in_flight=True),
                                )
 
         @webapp.route('/device_commands/<string:device_command_id>/details')
@@ -71,7 +71,8 @@ def route_devtools_debug(webapp):
         def page_devtools_debug_hooks_called_libraries(webinterface, request, session):
             page = webinterface.get_template(request, webinterface._dir + 'pages/devtools/debug/hooks_called_libraries.html')
             return page.render(alerts=webinterface.get_alerts(),
-                               hooks_called=webinterface._Loader.hook_counts
+                               hooks_called=webinterface._Loader.hook_counts,
+                               hook_profile=webinterface._Loader.hook_profile,
                                )
 
         @webapp.route('/hooks_called_modules')
@@ -79,7 +80,8 @@ def route_devtools_debug(webapp):
         def page_devtools_debug_hooks_called_modules(webinterface, request, session):
             page = webinterface.get_template(request, webinterface._dir + 'pages/devtools/debug/hooks_called_modules.html')
             return page.render(alerts=webinterface.get_alerts(),
-                               hooks_called=webinterface._Modules.hook_counts
+                               hooks_called=webinterface._Modules.hook_counts,
+                               hook_profile=webinterface._Modules.hook_profile,
                                )
 
         @webapp.route('/nodes')
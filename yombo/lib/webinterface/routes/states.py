@@ -20,7 +20,7 @@ def route_states(webapp):
             webinterface.add_breadcrumb(request, "/info", "Info")
             webinterface.add_breadcrumb(request, "/states/index", "States")
             return page.render(alerts=webinterface.get_alerts(),
-                               states=webinterface._States.get_states(),
+                               states=webinterface._States.view_states(),
                                gateways=webinterface._Gateways.get_gateways(),
                                )
 
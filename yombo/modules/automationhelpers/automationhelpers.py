@@ -191,7 +191,7 @@ class AutomationHelpers(YomboModule):
         if not all( required in portion['filter'] for required in ['platform', 'value']):
             raise YomboWarning("Required fields (platform, value) are missing from 'basic_values' filter.")
         if 'operator' in portion['filter']:
-            if 'operator' not in ops:
+            if portion['filter']['operator'] not in ops:
                 raise YomboWarning("Supplied filter operator is invalid: %s" % portion['filter']['operator'])
         return portion
 
@@ -224,10 +224,15 @@ class AutomationHelpers(YomboModule):
             if new_value == filter_value:
                 return True
             else:
+                # Only compare as bools if both values have a true/false meaning, otherwise any two
+                # unrelated values would match as None == None.
+                new_bool = is_true_false(new_value)
+                filter_bool = is_true_false(filter_value)
+                if new_bool is None or filter_bool is None:
+                    return False
                 try:
                     logger.debug("basic_values_run_filter_callback - checking if values match as a bool")
-                    logger.debug("basic_values_run_filter_callback as bool: {result}", result=op_func(is_true_false(new_value), is_true_false(filter_value)))
-                    return op_func(is_true_false(new_value), is_true_false(filter_value))
+                    return op_func(new_bool, filter_bool)
                 except:
                     return False
         return False
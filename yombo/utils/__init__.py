@@ -724,7 +724,7 @@ def percentile(data_list, percent, key=lambda x:x):
 
 
 
-def search_instance(arguments, haystack, allowed_keys, limiter, operation):
+def search_instance(arguments, haystack, allowed_keys, limiter, operation, index=None):
     if limiter is None:
         limiter = .89
 
@@ -748,10 +748,12 @@ def search_instance(arguments, haystack, allowed_keys, limiter, operation):
                               haystack,
                               allowed_keys,
                               limiter=limiter,
-                              operation=operation)
+                              operation=operation,
+                              index=index)
 
 
-def do_search_instance(attributes, haystack, allowed_keys, limiter=None, operation=None, status_field=None, status_value=None):
+def do_search_instance(attributes, haystack, allowed_keys, limiter=None, operation=None, status_field=None,
+                       status_value=None, index=None):
     """        
     Does the actual search of the devices. It scans through each item in haystack, and searches for any
     supplied attributes.
@@ -762,6 +764,8 @@ def do_search_instance(attributes, haystack, allowed_keys, limiter=None, operati
     :param attributes: A list of dictionaries containing: field, value, limiter
     :type attributes: list of dictionaries
     :param operation: Set weather to all matching, or highest matching. Either "any" or "highest".
+    :param index: A :py:class:`~yombo.utils.searchindex.SearchIndex` kept up to date with haystack. If set, it's
+        used instead of comparing every item in haystack. Results are the same.
     """
     # logger.info("in do_search_instance...attributes: {attributes}", attributes=attributes)
     # logger.info("in do_search_instance...haystack: {haystack}", haystack=haystack)
@@ -792,6 +796,9 @@ def do_search_instance(attributes, haystack, allowed_keys, limiter=None, operati
         status_field = None
         status_value = None
 
+    if index is not None:
+        return index.search(attributes, limiter, operation, status_field, status_value)
+
     # Prepare the minion
     stringDiff = SequenceMatcher()
 
@@ -1215,19 +1222,16 @@ def generate_uuid(**kwargs):
     tempit = uuid + subtype + maintype
     return tempit
 
-@inlineCallbacks
 def global_invoke_all(hook, **kwargs):
     """
-    Call all hooks in libraries and modules. Basically a shortcut for calling module_invoke_all and libraries_invoke_all
-    methods.
+    Call all hooks in libraries and modules. Uses the loader's table of hook implementors, so only libraries and
+    modules that implement the hook are called.
 
     :param hook: The hook name to call.
     :param kwargs: kwargs to send to the function.
-    :return: a dictionary of results.
+    :return: A deferred that fires with a dictionary of results.
     """
-    lib_results = yield get_component('yombo.gateway.lib.loader').library_invoke_all(hook, True, **kwargs)
-    modules_results = yield get_component('yombo.gateway.lib.modules').module_invoke_all(hook, True, **kwargs)
-    return dict_merge(modules_results, lib_results)
+    return get_component('yombo.gateway.lib.loader').global_invoke_all(hook, **kwargs)
 
 @inlineCallbacks
 def global_invoke_libraries(hook, **kwargs):
@@ -0,0 +1,189 @@
+#This file was created by Yombo for use with Yombo Python Gateway automation
+#software.  Details can be found at https://yombo.net
+"""
+Encrypts and decrypts with AES 256 in chunks, used by the :doc:`GPG </lib/gpg>` library for large payloads such
+as backups and module downloads.
+
+The output is the same as GPG.encrypt_aes(): a random IV followed by the AES CBC encrypted data, padded to a
+multiple of 32 bytes. Data encrypted one way can be decrypted the other. Input is read and processed one chunk at
+a time, so memory use depends on the chunk size, not on the size of the data.
+
+There is no MAC. A wrong key or damaged data is usually caught by the padding check at the end, but not always,
+in which case the output is garbage. Callers that must know the data is intact need to check it themselves,
+such as with a checksum or signature.
+
+Input can be bytes, a string, a file-like object with read(), or any iterable of bytes. Output is a generator of
+bytes.
+
+**Usage**:
+
+.. code-block:: python
+
+   from yombo.utils.aesstream import derive_key, encrypt_stream, decrypt_stream, write_stream
+
+   key = derive_key('my passphrase')
+   with open('backup.tar', 'rb') as source:
+       write_stream(encrypt_stream(key, source), 'backup.tar.aes')
+   with open('backup.tar.aes', 'rb') as source:
+       for chunk in decrypt_stream(key, source):
+           process(chunk)
+
+.. moduleauthor:: Mitch Schwenk <mitch-gw@yombo.net>
+
+:copyright: Copyright 2017 by Yombo.
+:license: LICENSE for details.
+"""
+# Import python libraries
+import hashlib
+import os
+
+from Crypto import Random
+from Crypto.Cipher import AES
+
+# Import Yombo libraries
+from yombo.core.exceptions import YomboWarning
+from yombo.utils import unicode_to_bytes
+
+# Data is padded to a multiple of this, same as GPG.aes_blocksize.
+PAD_SIZE = 32
+# Bytes read at a time, must be a multiple of PAD_SIZE.
+CHUNK_SIZE = 65536
+
+
+def derive_key(passphrase):
+    """
+    Returns the AES key for a passphrase. Not cached, so passphrases are not kept in memory.
+
+    :param passphrase: A password, string or bytes.
+    :return: 32 byte key.
+    """
+    return hashlib.sha256(unicode_to_bytes(passphrase)).digest()
+
+
+def iter_chunks(source, chunk_size=CHUNK_SIZE):
+    """
+    Returns the source in chunks. Bytes are returned as memoryview slices, without copies.
+
+    :param source: Bytes, a string, a file-like object with read(), or an iterable of bytes.
+    :param chunk_size: Bytes per chunk, except for iterables which are returned as is.
+    """
+    if isinstance(source, str):
+        source = source.encode('utf-8')
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+    elif hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield unicode_to_bytes(chunk)
+    else:
+        for chunk in source:
+            yield unicode_to_bytes(chunk)
+
+
+def encrypt_stream(key, source, chunk_size=CHUNK_SIZE):
+    """
+    Encrypt a source, one chunk at a time.
+
+    :param key: 32 byte key, from :py:func:`derive_key`.
+    :param source: Data to encrypt, see :py:func:`iter_chunks`.
+    :param chunk_size: Bytes to read at a time.
+    :return: Generator of encrypted bytes, the IV first.
+    """
+    iv = Random.new().read(AES.block_size)
+    cipher = AES.new(key, AES.MODE_CBC, iv)
+    yield iv
+
+    pending = b''  # less than PAD_SIZE bytes left over from the last chunk
+    for chunk in iter_chunks(source, chunk_size):
+        if pending:
+            chunk = pending + chunk
+        usable = len(chunk) - len(chunk) % PAD_SIZE
+        pending = bytes(chunk[usable:])
+        if usable > 0:
+            yield cipher.encrypt(chunk[:usable])
+
+    padding = PAD_SIZE - len(pending)
+    yield cipher.encrypt(pending + bytes((padding,)) * padding)
+
+
+def decrypt_stream(key, source, chunk_size=CHUNK_SIZE):
+    """
+    Decrypt a source, one chunk at a time.
+
+    There is no MAC, so a wrong key or damaged data is only caught by the padding check at the end. This
+    catches nearly all, but not every, wrong key. Chunks are returned before the check, so callers should discard
+    anything already read when this raises.
+
+    :raises YomboWarning: Raised when the data is incomplete or the padding is wrong, usually a wrong key.
+    :param key: 32 byte key, from :py:func:`derive_key`.
+    :param source: Data from :py:func:`encrypt_stream` or GPG.encrypt_aes(), see :py:func:`iter_chunks`.
+    :param chunk_size: Bytes to read at a time.
+    :return: Generator of decrypted bytes.
+    """
+    cipher = None
+    iv = b''
+    pending = b''  # less than a block left over from the last chunk
+    held = b''  # the last PAD_SIZE bytes decrypted, they may be padding
+    for chunk in iter_chunks(source, chunk_size):
+        if cipher is None:
+            needed = AES.block_size - len(iv)
+            iv += bytes(chunk[:needed])
+            chunk = chunk[needed:]
+            if len(iv) < AES.block_size:
+                continue
+            cipher = AES.new(key, AES.MODE_CBC, iv)
+        if pending:
+            chunk = pending + chunk
+        usable = len(chunk) - len(chunk) % AES.block_size
+        pending = bytes(chunk[usable:])
+        if usable == 0:
+            continue
+
+        data = cipher.decrypt(chunk[:usable])
+        if len(data) >= PAD_SIZE:
+            if held:
+                yield held
+            if len(data) > PAD_SIZE:
+                yield data[:-PAD_SIZE]
+            held = data[-PAD_SIZE:]
+        else:
+            data = held + data
+            if len(data) > PAD_SIZE:
+                yield data[:-PAD_SIZE]
+            held = data[-PAD_SIZE:]
+
+    if cipher is None or pending or len(held) == 0:
+        raise YomboWarning("Encrypted data is incomplete.", 400, 'decrypt_stream', 'aesstream')
+    padding = held[-1]
+    if padding < 1 or padding > PAD_SIZE or padding > len(held) or held[-padding:] != bytes((padding,)) * padding:
+        raise YomboWarning("Unable to decrypt, wrong key or damaged data.", 401, 'decrypt_stream', 'aesstream')
+    if padding < len(held):
+        yield held[:-padding]
+
+
+def write_stream(chunks, path):
+    """
+    Write chunks to a file. Written to a temporary file first, which is renamed when done, so the file is never
+    left partly written.
+
+    :param chunks: Iterable of bytes, such as from :py:func:`encrypt_stream`.
+    :param path: File to write.
+    :return: Bytes written.
+    """
+    temp_path = "%s.tmp" % path
+    written = 0
+    try:
+        with open(temp_path, 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return written
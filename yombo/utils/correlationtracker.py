@@ -0,0 +1,288 @@
+#This file was created by Yombo for use with Yombo Python Gateway automation
+#software.  Details can be found at https://yombo.net
+"""
+Tracks requests waiting for replies, used by the :doc:`AMQP </lib/amqp>` library to track correlation ids.
+
+Each entry has its own timeout. Timeouts are kept in a heap and a single reactor call is scheduled for the
+earliest one, so nothing needs to scan all the entries. The number of entries is capped, when full the least
+recently used entry is removed.
+
+Entries are dictionaries. If an entry has a 'deferred', it's fired with the reply by :py:meth:`CorrelationTracker.complete`,
+or errbacks with a YomboWarning if the entry times out, is replaced, or is removed to make room before a reply
+arrives.
+
+Also includes :py:class:`LatencyHistogram`, to track how long replies take.
+
+**Usage**:
+
+.. code-block:: python
+
+   from yombo.utils.correlationtracker import CorrelationTracker
+
+   tracker = CorrelationTracker('requests', max_entries=1000, timeout=60)
+   d = Deferred()
+   tracker.add('abc123', {'deferred': d, 'request_type': 'config'}, timeout=30)
+   tracker.complete('abc123', reply)  # d fires with reply. If never called, d errbacks after 30 seconds.
+
+.. moduleauthor:: Mitch Schwenk <mitch-gw@yombo.net>
+
+:copyright: Copyright 2017 by Yombo.
+:license: LICENSE for details.
+"""
+# Import python libraries
+from bisect import bisect_left
+from collections import OrderedDict
+from heapq import heappush, heappop, heapify
+from itertools import count
+from time import time
+
+# Import twisted libraries
+from twisted.internet import reactor
+from twisted.python.failure import Failure
+
+# Import Yombo libraries
+from yombo.core.exceptions import YomboWarning
+from yombo.core.log import get_logger
+
+logger = get_logger("utils.correlationtracker")
+
+# Upper bound of each histogram bucket, in milliseconds. Anything slower goes in a last, open ended bucket.
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class LatencyHistogram:
+    """
+    Counts of latencies by bucket, see LATENCY_BUCKETS.
+
+    :ivar counts: (list) Count for each bucket, plus one more for anything slower than the last bucket.
+    :ivar count: (int) Latencies added.
+    :ivar total: (float) Sum of all latencies, in milliseconds.
+    :ivar maximum: (float) Slowest latency, in milliseconds.
+    """
+    __slots__ = ('counts', 'count', 'total', 'maximum')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, milliseconds):
+        self.counts[bisect_left(LATENCY_BUCKETS, milliseconds)] += 1
+        self.count += 1
+        self.total += milliseconds
+        if milliseconds > self.maximum:
+            self.maximum = milliseconds
+
+    def percentile(self, percent):
+        """
+        Returns the upper bound of the bucket that includes the given percentile, or the maximum if it's in
+        the last bucket.
+
+        :param percent: 0 - 100
+        """
+        if self.count == 0:
+            return 0
+        wanted = self.count * percent / 100.0
+        seen = 0
+        for position, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= wanted and bucket_count > 0:
+                if position == len(LATENCY_BUCKETS):
+                    return self.maximum
+                return min(LATENCY_BUCKETS[position], self.maximum)
+        return self.maximum
+
+    def asdict(self):
+        return {
+            'count': self.count,
+            'average': self.total / self.count if self.count else 0,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.maximum,
+            'buckets': OrderedDict(zip([str(bucket) for bucket in LATENCY_BUCKETS] + ['more'], self.counts)),
+        }
+
+
+class CorrelationTracker:
+    """
+    Entries waiting for replies, with timeouts and a maximum size.
+
+    :ivar name: (str) Name of the tracker, used for logging.
+    :ivar max_entries: (int) Most entries kept, the least recently used are removed first.
+    :ivar timeout: (int) Default seconds an entry is kept.
+    :ivar stats: (dict) Counts of entries added, completed, expired, and evicted.
+    """
+    def __init__(self, name, max_entries=2000, timeout=600, store=None):
+        """
+        :param name: Name of the tracker.
+        :param max_entries: Most entries to keep.
+        :param timeout: Default seconds to keep an entry.
+        :param store: Optional dictionary to keep in sync with the tracker, such as a SQLDict so entries are saved.
+        """
+        self.name = name
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.stats = {
+            'added': 0,
+            'completed': 0,  # replies received while waiting
+            'expired': 0,  # timed out before a reply
+            'evicted': 0,  # removed to make room
+        }
+        self._entries = OrderedDict()  # key -> entry, least recently used first
+        self._expires = {}  # key -> time the entry expires
+        self._heap = []  # (expires, sequence, key), may include stale items, checked against _expires
+        self._sequence = count()
+        self._store = store
+        self._expire_call = None
+        self._expire_call_at = None
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __getitem__(self, key):
+        entry = self._entries[key]
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key, default=None):
+        """
+        Returns an entry and marks it as recently used.
+        """
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self):
+        return self._entries.items()
+
+    def add(self, key, entry, timeout=None, created_at=None):
+        """
+        Add or replace an entry.
+
+        :param key: Correlation id.
+        :param entry: A dictionary. If it has a 'deferred', it's fired when the entry completes or errbacks if
+            the entry is removed or replaced first.
+        :param timeout: Seconds to keep the entry, default is the tracker timeout.
+        :param created_at: When the entry was created, for entries restored after a restart. Default is now.
+        :return: The entry.
+        """
+        if key in self._entries:
+            old_entry = self._entries[key]
+            if old_entry is not entry and not (isinstance(entry, dict) and isinstance(old_entry, dict) and
+                                               old_entry.get('deferred') is entry.get('deferred')):
+                self._fail_entry(old_entry, "%s request was replaced before a reply was received." % self.name)
+            self._entries.move_to_end(key)
+        self._entries[key] = entry
+        if self._store is not None:
+            self._store[key] = entry
+        if created_at is None:
+            created_at = time()
+        self.stats['added'] += 1
+        self.expire_at(key, created_at + (self.timeout if timeout is None else timeout))
+
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self.stats['evicted'] += 1
+            self._remove(oldest, "%s tracker is full, removed before a reply was received." % self.name)
+        return entry
+
+    def expire_at(self, key, expires):
+        """
+        Change when an entry expires.
+        """
+        self._expires[key] = expires
+        heappush(self._heap, (expires, next(self._sequence), key))
+        if len(self._heap) > len(self._expires) * 2 + 64:
+            self._heap = [(expires_at, sequence, heap_key) for expires_at, sequence, heap_key in self._heap
+                          if self._expires.get(heap_key) == expires_at]
+            heapify(self._heap)
+        self._schedule()
+
+    def complete(self, key, result, keep=None):
+        """
+        A reply was received. Fires the entry's deferred the first time only, later replies for the same key
+        just return the entry.
+
+        :param key: Correlation id.
+        :param result: Sent to the entry's deferred.
+        :param keep: If set, seconds to keep the entry from now, for any further replies.
+        :return: The entry, or None if not found.
+        """
+        entry = self.get(key)
+        if entry is None:
+            return None
+        deferred = entry.get('deferred') if isinstance(entry, dict) else None
+        if deferred is not None and deferred.called is False:
+            self.stats['completed'] += 1
+            if keep is not None:
+                self.expire_at(key, time() + keep)
+            deferred.callback(result)
+        return entry
+
+    def pop(self, key, default=None):
+        """
+        Remove an entry without firing it's deferred.
+        """
+        if key not in self._entries:
+            return default
+        del self._expires[key]
+        if self._store is not None:
+            self._store.pop(key, None)
+        return self._entries.pop(key)
+
+    def _remove(self, key, reason):
+        self._fail_entry(self.pop(key), reason)
+
+    @staticmethod
+    def _fail_entry(entry, reason):
+        deferred = entry.get('deferred') if isinstance(entry, dict) else None
+        if deferred is not None and deferred.called is False:
+            deferred.errback(Failure(YomboWarning(reason, 300, 'remove', 'correlationtracker')))
+            deferred.addErrback(lambda failure: None)  # Handled by any errbacks already added, don't log it.
+
+    def expire(self):
+        """
+        Remove entries that have timed out. Normally called by the reactor, when the next entry expires.
+        """
+        self._expire_call = None
+        self._expire_call_at = None
+        now = time()
+        while self._heap and self._heap[0][0] <= now:
+            expires, sequence, key = heappop(self._heap)
+            if self._expires.get(key) != expires:
+                continue
+            entry = self._entries[key]
+            deferred = entry.get('deferred') if isinstance(entry, dict) else None
+            if deferred is not None and deferred.called is False:
+                self.stats['expired'] += 1
+            self._remove(key, "%s request timed out, no reply received." % self.name)
+        self._schedule()
+
+    def _schedule(self):
+        if len(self._heap) == 0:
+            return
+        expires = self._heap[0][0]
+        if self._expire_call_at is not None and self._expire_call_at <= expires:
+            return
+        if self._expire_call is not None and self._expire_call.active():
+            self._expire_call.cancel()
+        self._expire_call_at = expires
+        self._expire_call = reactor.callLater(max(expires - time(), 0), self.expire)
+
+    def stop(self):
+        """
+        Cancel the pending expire call, for shutdown. Entries are kept.
+        """
+        if self._expire_call is not None and self._expire_call.active():
+            self._expire_call.cancel()
+        self._expire_call = None
+        self._expire_call_at = None
@@ -0,0 +1,63 @@
+"""
+Database update file verion: 2
+
+Details:
+Adds the states_current table, which holds the latest value of each state. This allows states to be restored at
+startup without searching the entire states history. Also adds an index for searching states history by name and
+time.
+
+.. moduleauthor:: Mitch Schwenk <mitch-gw@yombo.net>
+:copyright: Copyright 2017 by Yombo.
+:license: LICENSE for details.
+"""
+# Import twisted libraries
+from twisted.internet.defer import inlineCallbacks
+
+version_1 = __import__("yombo.utils.db.1", globals(), locals(), ['upgrade'], 0)
+
+# The tables from version 1 are unchanged. Make them available here so the latest meta file can still
+# create any table, such as when LocalDB truncates a table.
+for name in dir(version_1):
+    if name.startswith('create_'):
+        globals()[name] = getattr(version_1, name)
+
+
+@inlineCallbacks
+def new_db_file(Registry, **kwargs):
+    yield version_1.new_db_file(Registry)
+    yield create_table_states_current(Registry)
+    yield create_index_states_name_created_at(Registry)
+
+
+@inlineCallbacks
+def upgrade(Registry, **kwargs):
+    yield create_table_states_current(Registry)
+    yield create_index_states_name_created_at(Registry)
+    yield Registry.DBPOOL.runQuery("""INSERT OR REPLACE INTO states_current
+        (gateway_id, name, value_type, value, live, created_at, updated_at)
+        SELECT gateway_id, name, value_type, value, live, created_at, updated_at FROM states ORDER BY id""")
+
+
+def downgrade(Registry, **kwargs):
+    pass
+
+
+@inlineCallbacks
+def create_table_states_current(Registry, **kwargs):
+    """ The latest value for each state, maintained when states are saved. """
+    table = """CREATE TABLE `states_current` (
+        `gateway_id`  TEXT NOT NULL,
+        `name`        TEXT NOT NULL,
+        `value_type`  TEXT,
+        `value`       INTEGER,
+        `live`        INTEGER NOT NULL,
+        `created_at`  INTEGER NOT NULL,
+        `updated_at`  INTEGER NOT NULL,
+        PRIMARY KEY(gateway_id, name));"""
+    yield Registry.DBPOOL.runQuery(table)
+
+
+@inlineCallbacks
+def create_index_states_name_created_at(Registry, **kwargs):
+    """ Used when searching states history for a given state by time. """
+    yield Registry.DBPOOL.runQuery("CREATE INDEX IF NOT EXISTS states_name_created_at_idx ON states (name, created_at)")
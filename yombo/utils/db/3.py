@@ -0,0 +1,43 @@
+"""
+Database update file verion: 3
+
+Details:
+Adds a covering index on statistics for searching by bucket name and time range. Used for graphing and
+downsampling statistics.
+
+.. moduleauthor:: Mitch Schwenk <mitch-gw@yombo.net>
+:copyright: Copyright 2017 by Yombo.
+:license: LICENSE for details.
+"""
+# Import twisted libraries
+from twisted.internet.defer import inlineCallbacks
+
+version_2 = __import__("yombo.utils.db.2", globals(), locals(), ['upgrade'], 0)
+
+# The tables from version 2 are unchanged. Make them available here so the latest meta file can still
+# create any table, such as when LocalDB truncates a table.
+for name in dir(version_2):
+    if name.startswith('create_'):
+        globals()[name] = getattr(version_2, name)
+
+
+@inlineCallbacks
+def new_db_file(Registry, **kwargs):
+    yield version_2.new_db_file(Registry)
+    yield create_index_statistics_name_time(Registry)
+
+
+@inlineCallbacks
+def upgrade(Registry, **kwargs):
+    yield create_index_statistics_name_time(Registry)
+
+
+def downgrade(Registry, **kwargs):
+    pass
+
+
+@inlineCallbacks
+def create_index_statistics_name_time(Registry, **kwargs):
+    """ Covers range and downsample queries on statistics without reading the table rows. """
+    yield Registry.DBPOOL.runQuery("CREATE INDEX IF NOT EXISTS statistics_name_time_idx ON statistics "
+                                   "(bucket_name, bucket_time, bucket_type, bucket_value)")
@@ -0,0 +1,353 @@
+#This file was created by Yombo for use with Yombo Python Gateway automation
+#software.  Details can be found at https://yombo.net
+"""
+Packs and unpacks messages between gateways, used by the :doc:`Gateways </lib/gateways>` library.
+
+A frame is a fixed binary header, the source and destination gateway ids, and the payload as msgpack. The payload
+can be compressed. Unpacking is a single msgpack decode with strings returned as str, there's no second pass to
+convert bytes.
+
+Header, network byte order:
+
+* 2 bytes - b'YG'
+* 1 byte - Frame version, currently 1.
+* 1 byte - Compression id, see COMPRESSIONS.
+* 1 byte - Shared dictionary id, 0 if none.
+* 1 byte - Reserved.
+* 4 bytes - Payload size before compression.
+* 8 bytes - Time sent, as a double.
+* 1 byte + id - Source gateway id, prefixed by it's length.
+* 1 byte + id - Destination gateway id, prefixed by it's length.
+
+Compression can be 'none', 'zlib', 'zlib_dict', 'lz4', 'zstd', or 'zstd_dict'. lz4 and zstd are used only if their
+python packages are installed, otherwise zlib is used. The '_dict' versions use a dictionary of the field names
+and values found in most messages, which helps a lot for small messages. The dictionary is part of this file and
+must be the same on all gateways, changing it requires a new dictionary id. Payloads are never decompressed past
+the size in the header.
+
+Gateways that haven't been upgraded can't read frames. :py:func:`legacy_pack` makes the older format, a msgpack
+map, which also tells the receiver that the sender reads frames.
+
+**Usage**:
+
+.. code-block:: python
+
+   from yombo.utils.framing import pack, unpack
+
+   frame = pack({'value': 1}, 'gw_source', 'all', compression='zlib_dict')
+   message = unpack(frame)  # {'payload': {'value': 1}, 'source_gateway_id': 'gw_source', ...}
+
+.. moduleauthor:: Mitch Schwenk <mitch-gw@yombo.net>
+
+:copyright: Copyright 2017 by Yombo.
+:license: LICENSE for details.
+"""
+# Import python libraries
+import struct
+from time import time
+import zlib
+
+import msgpack
+
+try:
+    import lz4.frame
+    HAS_LZ4 = True
+except ImportError:
+    HAS_LZ4 = False
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+# Import Yombo libraries
+from yombo.core.exceptions import YomboWarning
+from yombo.core.log import get_logger
+from yombo.utils import bytes_to_unicode
+
+logger = get_logger("utils.framing")
+
+MAGIC = b'YG'
+FRAME_VERSION = 1
+HEADER = struct.Struct('!2sBBBBId')
+
+# Payloads smaller than this aren't compressed, unless using a dictionary.
+MIN_COMPRESS_SIZE = 200
+# Largest payload accepted, after decompressing.
+MAX_PAYLOAD_SIZE = 16 * 1024 * 1024
+
+if msgpack.version >= (1, 0, 0):
+    UNPACK_OPTIONS = {'raw': False, 'strict_map_key': False}
+    LEGACY_UNPACK_OPTIONS = {'raw': True, 'strict_map_key': False}
+else:
+    UNPACK_OPTIONS = {'raw': False}
+    LEGACY_UNPACK_OPTIONS = {'raw': True}
+
+
+def build_dictionary():
+    """
+    Returns the shared compression dictionary: msgpack of the field names and values common in gateway messages.
+    Compressors use the end of the dictionary most, so the most common items are last.
+    """
+    sample = [
+        {'device_id': '', 'machine_label': '', 'label': '', 'description': '', 'device_type_id': '',
+         'location_id': '', 'area_id': '', 'gateway_id': '', 'status': 1, 'statistic_label': '',
+         'pin_required': 0, 'energy_type': 'electric', 'energy_map': {}, 'controllable': 1,
+         'allow_direct_control': 1, 'device_commands': [], 'status_all': {}, 'meta': {}},
+        {'request_id': '', 'command_id': '', 'log_time': 0.0, 'message': '', 'requested_by': {},
+         'device_command': {}, 'human_status': '', 'human_message': '', 'machine_status': 0,
+         'machine_status_extra': {}, 'reported_by': '', 'uploaded': 0, 'uploadable': 1, 'set_at': 0.0},
+        {'gateway_id': '', 'value': '', 'value_human': '', 'value_type': None, 'created_at': 0, 'updated_at': 0},
+        {'gateway_id': '', 'value': True, 'value_human': 'True', 'value_type': 'bool', 'created_at': 0,
+         'updated_at': 0},
+    ]
+    return msgpack.packb(sample, use_bin_type=True)
+
+DICTIONARY_ID = 1
+DICTIONARY = build_dictionary()
+
+
+class Compression:
+    """
+    A compression type.
+
+    :ivar name: (str) Name, used in configs.
+    :ivar compression_id: (int) Id stored in the frame header.
+    :ivar uses_dictionary: (bool) True if compressed with the shared dictionary.
+    """
+    def __init__(self, name, compression_id, compress, decompress, uses_dictionary=False):
+        self.name = name
+        self.compression_id = compression_id
+        self.compress = compress  # compress(data, level) -> bytes
+        self.decompress = decompress  # decompress(data, size) -> bytes
+        self.uses_dictionary = uses_dictionary
+
+
+def decompressed_size_error():
+    return YomboWarning("Compressed payload doesn't match it's size.", 304, 'unpack', 'framing')
+
+
+def zlib_dict_compress(data, level):
+    compressor = zlib.compressobj(level, zdict=DICTIONARY)
+    return compressor.compress(data) + compressor.flush()
+
+
+def zlib_decompress(data, size, dictionary=None):
+    """
+    Decompress at most size bytes. Raises YomboWarning if there's more, or less.
+    """
+    if dictionary is None:
+        decompressor = zlib.decompressobj()
+    else:
+        decompressor = zlib.decompressobj(zdict=dictionary)
+    try:
+        data = decompressor.decompress(data, size)
+    except zlib.error:
+        raise YomboWarning("Unable to decompress payload.", 305, 'unpack', 'framing')
+    if decompressor.unconsumed_tail or decompressor.eof is False or len(data) != size:
+        raise decompressed_size_error()
+    return data
+
+
+COMPRESSIONS = {
+    'none': Compression('none', 0, lambda data, level: data, lambda data, size: data),
+    'zlib': Compression('zlib', 1, lambda data, level: zlib.compress(data, level), zlib_decompress),
+    'zlib_dict': Compression('zlib_dict', 2, zlib_dict_compress,
+                             lambda data, size: zlib_decompress(data, size, DICTIONARY), True),
+}
+
+if HAS_LZ4:
+    def lz4_decompress(data, size):
+        decompressor = lz4.frame.LZ4FrameDecompressor()
+        data = decompressor.decompress(data, max_length=size)
+        if decompressor.eof is False or len(data) != size:
+            raise decompressed_size_error()
+        return data
+
+    COMPRESSIONS['lz4'] = Compression('lz4', 3,
+                                      lambda data, level: lz4.frame.compress(data, compression_level=level),
+                                      lz4_decompress)
+
+if HAS_ZSTD:
+    ZSTD_DICTIONARY = zstandard.ZstdCompressionDict(DICTIONARY, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+
+    def zstd_compress(data, level, dictionary=None):
+        return zstandard.ZstdCompressor(level=level, dict_data=dictionary).compress(data)
+
+    def zstd_decompress(data, size, dictionary=None):
+        return zstandard.ZstdDecompressor(dict_data=dictionary).decompress(data, max_output_size=size)
+
+    COMPRESSIONS['zstd'] = Compression('zstd', 4, zstd_compress, zstd_decompress)
+    COMPRESSIONS['zstd_dict'] = Compression(
+        'zstd_dict', 5,
+        lambda data, level: zstd_compress(data, level, ZSTD_DICTIONARY),
+        lambda data, size: zstd_decompress(data, size, ZSTD_DICTIONARY),
+        True)
+
+COMPRESSION_IDS = {compression.compression_id: compression for compression in COMPRESSIONS.values()}
+
+
+def get_compression(name):
+    """
+    Returns a compression by name. If it's not available, such as lz4 or zstd when the package isn't installed,
+    returns the closest zlib version.
+
+    :param name: Name of the compression.
+    :return: A Compression instance.
+    """
+    if name in COMPRESSIONS:
+        return COMPRESSIONS[name]
+    fallback = 'zlib_dict' if name.endswith('_dict') else 'zlib'
+    logger.info("Compression '{name}' not available, using '{fallback}'.", name=name, fallback=fallback)
+    return COMPRESSIONS[fallback]
+
+
+def is_frame(data):
+    """
+    Returns True if the data starts like a frame. Older gateways send a msgpack map instead.
+    """
+    return data[:2] == MAGIC
+
+
+def pack(payload, source_gateway_id, destination_gateway_id, compression='zlib', level=3):
+    """
+    Pack a payload into a frame.
+
+    :param payload: Anything msgpack can encode.
+    :param source_gateway_id: Sending gateway id.
+    :param destination_gateway_id: Receiving gateway id, or 'all'.
+    :param compression: Compression name, or a Compression instance.
+    :param level: Compression level.
+    :return: The frame, bytes.
+    """
+    if isinstance(compression, str):
+        compression = get_compression(compression)
+    body = msgpack.packb(payload, use_bin_type=True)
+    size = len(body)
+    if compression.compression_id != 0 and (size >= MIN_COMPRESS_SIZE or compression.uses_dictionary):
+        compressed = compression.compress(body, level)
+        if len(compressed) < size:
+            body = compressed
+        else:
+            compression = COMPRESSIONS['none']
+    else:
+        compression = COMPRESSIONS['none']
+    source = source_gateway_id.encode('utf-8')
+    destination = destination_gateway_id.encode('utf-8')
+    return b''.join((
+        HEADER.pack(MAGIC, FRAME_VERSION, compression.compression_id,
+                    DICTIONARY_ID if compression.uses_dictionary else 0, 0, size, time()),
+        bytes((len(source),)), source,
+        bytes((len(destination),)), destination,
+        body,
+    ))
+
+
+def read_gateway_id(frame, position):
+    """
+    Read a gateway id from a frame: one byte length, then the id.
+
+    :raises YomboWarning: Raised when the frame ends too soon.
+    :return: A tuple of the gateway id and the position after it.
+    """
+    if position >= len(frame):
+        raise YomboWarning("Frame too short.", 300, 'unpack', 'framing')
+    end = position + 1 + frame[position]
+    if end > len(frame):
+        raise YomboWarning("Frame too short.", 300, 'unpack', 'framing')
+    try:
+        return bytes(frame[position + 1:end]).decode('utf-8'), end
+    except UnicodeDecodeError:
+        raise YomboWarning("Frame has an invalid gateway id.", 307, 'unpack', 'framing')
+
+
+def unpack(frame):
+    """
+    Unpack a frame.
+
+    :raises YomboWarning: Raised when the frame is invalid, or uses a compression that isn't available.
+    :param frame: Bytes from :py:func:`pack`.
+    :return: Dictionary with payload, frame_version, time_sent, time_received, content_encoding,
+        source_gateway_id, and destination_gateway_id.
+    """
+    try:
+        magic, version, compression_id, dictionary_id, reserved, size, time_sent = HEADER.unpack_from(frame)
+    except struct.error:
+        raise YomboWarning("Frame too short.", 300, 'unpack', 'framing')
+    if magic != MAGIC or version != FRAME_VERSION:
+        raise YomboWarning("Unknown frame version.", 301, 'unpack', 'framing')
+    if compression_id not in COMPRESSION_IDS:
+        raise YomboWarning("Frame uses compression %s, which isn't available." % compression_id,
+                           302, 'unpack', 'framing')
+    if dictionary_id not in (0, DICTIONARY_ID):
+        raise YomboWarning("Frame uses an unknown compression dictionary.", 303, 'unpack', 'framing')
+    if size > MAX_PAYLOAD_SIZE:
+        raise YomboWarning("Frame payload is too large.", 306, 'unpack', 'framing')
+    compression = COMPRESSION_IDS[compression_id]
+
+    source, position = read_gateway_id(frame, HEADER.size)
+    destination, position = read_gateway_id(frame, position)
+
+    body = frame[position:]
+    if compression_id != 0:
+        body = compression.decompress(body, size)
+        if len(body) != size:
+            raise decompressed_size_error()
+    elif len(body) != size:
+        raise YomboWarning("Frame payload doesn't match it's size.", 300, 'unpack', 'framing')
+    return {
+        'payload': msgpack.unpackb(body, **UNPACK_OPTIONS),
+        'frame_version': version,
+        'time_sent': time_sent,
+        'time_received': time(),
+        'content_encoding': compression.name,
+        'source_gateway_id': source,
+        'destination_gateway_id': destination,
+    }
+
+
+def legacy_pack(payload, source_gateway_id, destination_gateway_id):
+    """
+    Pack a payload for gateways that can't read frames: a msgpack map with the payload as msgpack, zlib
+    compressed if large. Includes frame_version, which older gateways ignore, so gateways that read frames know
+    they can send them to us.
+
+    :param payload: Anything msgpack can encode.
+    :param source_gateway_id: Sending gateway id.
+    :param destination_gateway_id: Receiving gateway id, or 'all'.
+    :return: The message, bytes.
+    """
+    data = msgpack.packb(payload, use_bin_type=False)
+    if len(data) > 800:
+        data = zlib.compress(data, 3)
+        content_encoding = 'zlib'
+    else:
+        content_encoding = 'none'
+    return msgpack.packb({
+        'payload': data,
+        'time_sent': time(),
+        'content_encoding': content_encoding,
+        'source_gateway_id': source_gateway_id,
+        'destination_gateway_id': destination_gateway_id,
+        'frame_version': FRAME_VERSION,
+    }, use_bin_type=False)
+
+
+def legacy_unpack(incoming):
+    """
+    Unpack a message from a gateway that doesn't send frames: a msgpack map with the payload as msgpack,
+    possibly zlib compressed. If the message includes frame_version, the gateway can read frames.
+    """
+    message = msgpack.unpackb(incoming, **LEGACY_UNPACK_OPTIONS)
+    data = message[b'payload']
+    del message[b'payload']
+    message = bytes_to_unicode(message)
+    message['time_received'] = time()
+    if message['content_encoding'] == 'zlib':
+        decompressor = zlib.decompressobj()
+        data = decompressor.decompress(data, MAX_PAYLOAD_SIZE)
+        if decompressor.unconsumed_tail:
+            raise YomboWarning("Message payload is too large.", 306, 'legacy_unpack', 'framing')
+    message['payload'] = msgpack.unpackb(data, **LEGACY_UNPACK_OPTIONS)
+    return bytes_to_unicode(message)
@@ -27,6 +27,9 @@ exactness can be fine tuned using a percent value from .99 - .10, the default 75
    momName = items.search('mum', .50)
    Search, but only require 50% match.
 
+Keys are indexed with a :py:class:`~yombo.utils.searchindex.TextIndex`, so a search only compares keys that
+could be among the best matches.
+
 .. moduleauthor:: Mitch Schwenk <mitch-gw@yombo.net>
 
 :copyright: Copyright 2012-2016 by Yombo.
@@ -34,11 +37,12 @@ exactness can be fine tuned using a percent value from .99 - .10, the default 75
 """
 # Import python libraries
 from difflib import SequenceMatcher
-import operator
+from heapq import heappush, heapreplace
 from itertools import islice
 
 # Import Yombo libraries
 from yombo.core.exceptions import YomboFuzzySearchError
+from yombo.utils.searchindex import TextIndex, subsequence_masks, subsequence_limit
 
 
 class FuzzySearch(dict):
@@ -66,6 +70,7 @@ class FuzzySearch(dict):
             limiter = .10
     
         self.limiter = limiter
+        self._index = TextIndex()
 
         if seed:
             self.update(seed)
@@ -77,6 +82,40 @@ class FuzzySearch(dict):
         self._dict_getitem = lambda key: \
             super(FuzzySearch, self).__getitem__(key)
 
+    def __setitem__(self, key, value):
+        super(FuzzySearch, self).__setitem__(key, value)
+        if isinstance(key, str) and key not in self._index:
+            self._index.add(key, key.lower())
+
+    def __delitem__(self, key):
+        super(FuzzySearch, self).__delitem__(key)
+        if key in self._index:
+            self._index.remove(key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if not self._dict_contains(key):
+            self[key] = default
+        return self._dict_getitem(key)
+
+    def pop(self, key, *args):
+        if key in self._index:
+            self._index.remove(key)
+        return super(FuzzySearch, self).pop(key, *args)
+
+    def popitem(self):
+        key, value = super(FuzzySearch, self).popitem()
+        if key in self._index:
+            self._index.remove(key)
+        return key, value
+
+    def clear(self):
+        super(FuzzySearch, self).clear()
+        self._index = TextIndex()
+
     def __contains__(self, searchFor):
         """
         Overides python dict __contains__ - Return true if searchFor is
@@ -179,38 +218,59 @@ class FuzzySearch(dict):
             return True, searchFor, self._dict_getitem(searchFor), 1, {}
 
         # otherwise, we will fuzzy search it. Prepare the minions.
+        search_text = searchFor.lower()
         stringDiffLib = SequenceMatcher()
-        stringDiffLib.set_seq1(searchFor.lower())
+        stringDiffLib.set_seq1(search_text)
 
-        # examine each key in the dict
+        # Keys are compared from the highest possible ratio down, until the remaining keys can't make the top 5.
         best_ratio = 0
         best_match = None
         best_key = None
-        
-        key_list = {}
-        sorted_list = None
-        for key in self:
-            # key must be a string, otherwise it is skipped!
-            try:
-                stringDiffLib.set_seq2(key.lower())
-            except TypeError:
-                continue                # might get here, even though it's not a string. Catch it!
-
-            try:
-                # get the match ratio
-                curRatio = stringDiffLib.ratio()
-            except TypeError:
+        best_position = None
+
+        key_list = {}  # ratio -> (position, key), the last key (in dict order) for each ratio.
+        top_ratios = []  # the 5 highest ratios, lowest first.
+        positions = self._index.positions
+        masks = subsequence_masks(search_text)
+        search_length = len(search_text)
+        for limit, key, key_text in self._index.candidates(search_text):
+            if len(top_ratios) == 5 and limit < top_ratios[0]:
                 break
+            if key_text == search_text:
+                curRatio = 1.0
+            else:
+                if len(top_ratios) == 5 and subsequence_limit(masks, search_length, key_text) < top_ratios[0]:
+                    continue
+                stringDiffLib.set_seq2(key_text)
+                curRatio = stringDiffLib.ratio()
+            position = positions[key]
 
             # if this is the best ratio so far - save it and the value
-            if curRatio > best_ratio:
+            if curRatio > best_ratio or (curRatio == best_ratio and best_key is not None and
+                                         position < best_position):
                 best_ratio = curRatio
                 best_key = key
-                best_match = self._dict_getitem(key)
-            
-            # return a list of the top 5 key matches on failure.
-            key_list[curRatio] = {'key': key, 'value': self._dict_getitem(key), 'ratio': curRatio}
-            sorted_list = self.take(5, sorted(iter(key_list.items()), key=operator.itemgetter(0), reverse=True))
+                best_position = position
+
+            if curRatio in key_list:
+                if position > key_list[curRatio][0]:
+                    key_list[curRatio] = (position, key)
+            else:
+                key_list[curRatio] = (position, key)
+                if len(top_ratios) < 5:
+                    heappush(top_ratios, curRatio)
+                elif curRatio > top_ratios[0]:
+                    heapreplace(top_ratios, curRatio)
+
+        if best_key is not None:
+            best_match = self._dict_getitem(best_key)
+
+        # return a list of the top 5 key matches on failure.
+        sorted_list = None
+        if len(self._index) > 0:
+            sorted_list = [(ratio, {'key': key_list[ratio][1], 'value': self._dict_getitem(key_list[ratio][1]),
+                                    'ratio': ratio})
+                           for ratio in sorted(key_list, reverse=True)[:5]]
 
         limiter = None
         if limiter_override is not None:
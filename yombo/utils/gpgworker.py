@@ -0,0 +1,235 @@
+#This file was created by Yombo for use with Yombo Python Gateway automation
+#software.  Details can be found at https://yombo.net
+"""
+Runs gpg operations for the :doc:`GPG </lib/gpg>` library.
+
+Every call to the gpg binary starts a new process and waits for it, so calls are never made on the reactor
+thread. They run on a thread pool of their own, which limits how many gpg processes run at once and keeps gpg
+from using up the reactor's thread pool.
+
+Calls for the same operation made during one reactor tick, such as signing or verifying many messages while
+processing a config download, are sent to the pool as one job. Identical items in the same batch are only
+processed once.
+
+Also includes :py:class:`ResultCache`, used to keep verification results by content hash so the same signed
+message isn't verified twice.
+
+**Usage**:
+
+.. code-block:: python
+
+   from yombo.utils.gpgworker import GPGWorker
+
+   worker = GPGWorker(workers=2)
+   worker.start()
+   result = yield worker.run('encrypt', gpg.encrypt, data, destination)
+   signed = yield worker.batched('sign', sign_function, text)  # sign_function(text) is called on the pool.
+   worker.stop()
+
+.. moduleauthor:: Mitch Schwenk <mitch-gw@yombo.net>
+
+:copyright: Copyright 2017 by Yombo.
+:license: LICENSE for details.
+"""
+# Import python libraries
+from collections import OrderedDict
+import hashlib
+from time import time
+
+# Import twisted libraries
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.failure import Failure
+from twisted.python.threadpool import ThreadPool
+
+# Import Yombo libraries
+from yombo.core.log import get_logger
+from yombo.utils import unicode_to_bytes
+from yombo.utils.correlationtracker import LatencyHistogram
+
+logger = get_logger("utils.gpgworker")
+
+
+class GPGWorker:
+    """
+    A thread pool for gpg calls, with batching and latency tracking.
+
+    :ivar workers: (int) Most gpg calls running at once.
+    :ivar max_batch: (int) Most items sent to the pool in one job.
+    :ivar latency: (dict) Operation -> LatencyHistogram, time from the call until the result, in milliseconds.
+    :ivar stats: (dict) Counts of jobs, items batched, and duplicate items skipped.
+    """
+    def __init__(self, workers=2, max_batch=50, on_latency=None):
+        """
+        :param workers: Most gpg calls running at once.
+        :param max_batch: Most items sent to the pool in one job.
+        :param on_latency: Optional callable, called with the operation name and milliseconds for every call.
+        """
+        self.workers = workers
+        self.max_batch = max_batch
+        self.on_latency = on_latency
+        self.latency = {}
+        self.stats = {
+            'jobs': 0,  # jobs sent to the pool
+            'batched': 0,  # items sent with batched()
+            'duplicates': 0,  # batched items already in the same batch
+        }
+        self.pool = ThreadPool(minthreads=1, maxthreads=workers, name='gpgworker')
+        self._batches = {}  # operation -> (function, OrderedDict of item -> list of deferreds)
+
+    def start(self):
+        self.pool.start()
+        reactor.addSystemEventTrigger('during', 'shutdown', self.stop)
+
+    def stop(self):
+        if self.pool.started:
+            self.pool.stop()
+
+    def record_latency(self, operation, milliseconds):
+        if operation not in self.latency:
+            self.latency[operation] = LatencyHistogram()
+        self.latency[operation].add(milliseconds)
+        if self.on_latency is not None:
+            self.on_latency(operation, milliseconds)
+
+    def run(self, operation, function, *args, **kwargs):
+        """
+        Call a function on the pool.
+
+        :param operation: Name of the operation, for latency tracking.
+        :param function: Function to call, it's free to block.
+        :return: Deferred that fires with the result of the function.
+        """
+        started = time()
+        self.stats['jobs'] += 1
+
+        def done(result):
+            self.record_latency(operation, (time() - started) * 1000)
+            return result
+
+        d = deferToThreadPool(reactor, self.pool, function, *args, **kwargs)
+        d.addBoth(done)
+        return d
+
+    def batched(self, operation, function, item):
+        """
+        Call function(item) on the pool, together with any other items for the same operation received during
+        this reactor tick. All calls for an operation must use the same function.
+
+        :param operation: Name of the operation, for latency tracking.
+        :param function: Function to call with each item, it's free to block.
+        :param item: The item, must be hashable. Items equal to one already in the batch share it's result.
+        :return: Deferred that fires with the result for the item.
+        """
+        d = Deferred()
+        self.stats['batched'] += 1
+        if operation not in self._batches:
+            self._batches[operation] = (function, OrderedDict())
+            reactor.callLater(0, self._send_batch, operation)
+        items = self._batches[operation][1]
+        if item in items:
+            self.stats['duplicates'] += 1
+            items[item].append(d)
+        else:
+            items[item] = [d]
+        return d
+
+    def _send_batch(self, operation):
+        function, items = self._batches.pop(operation)
+        items = list(items.items())
+        for start in range(0, len(items), self.max_batch):
+            batch = items[start:start + self.max_batch]
+            d = self.run(operation, self._run_batch, function, [item for item, waiting in batch])
+            d.addCallbacks(self._batch_done, self._batch_failed,
+                           callbackArgs=(batch,), errbackArgs=(batch,))
+
+    @staticmethod
+    def _run_batch(function, items):
+        """
+        Runs on the pool, returns a list of (success, result or Failure) for each item.
+        """
+        results = []
+        for item in items:
+            try:
+                results.append((True, function(item)))
+            except Exception:
+                results.append((False, Failure()))
+        return results
+
+    @staticmethod
+    def _batch_done(results, batch):
+        for (success, result), (item, waiting) in zip(results, batch):
+            for d in waiting:
+                if success:
+                    d.callback(result)
+                else:
+                    d.errback(result)
+
+    @staticmethod
+    def _batch_failed(failure, batch):
+        for item, waiting in batch:
+            for d in waiting:
+                d.errback(failure)
+
+    def latency_report(self):
+        """
+        Returns latencies by operation, in milliseconds.
+
+        :return: Dictionary of operation -> histogram summary.
+        """
+        return {operation: histogram.asdict() for operation, histogram in sorted(self.latency.items())}
+
+
+class ResultCache:
+    """
+    Results kept by the hash of the content they're for, for a limited time and up to a maximum count. When full,
+    the least recently used result is removed.
+
+    :ivar max_entries: (int) Most results kept.
+    :ivar ttl: (int) Seconds a result is kept.
+    :ivar stats: (dict) Counts of hits and misses.
+    """
+    def __init__(self, max_entries=1000, ttl=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+        }
+        self._results = OrderedDict()  # hash -> (expires, result), least recently used first
+
+    def __len__(self):
+        return len(self._results)
+
+    @staticmethod
+    def content_hash(content):
+        return hashlib.sha256(unicode_to_bytes(content)).digest()
+
+    def get(self, content):
+        """
+        Returns the result for the content.
+
+        :raises KeyError: Raised when there's no result, or it expired.
+        """
+        key = self.content_hash(content)
+        if key in self._results:
+            expires, result = self._results[key]
+            if expires > time():
+                self._results.move_to_end(key)
+                self.stats['hits'] += 1
+                return result
+            del self._results[key]
+        self.stats['misses'] += 1
+        raise KeyError("No result for content.")
+
+    def set(self, content, result):
+        key = self.content_hash(content)
+        if key in self._results:
+            self._results.move_to_end(key)
+        self._results[key] = (time() + self.ttl, result)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    def clear(self):
+        self._results.clear()
@@ -0,0 +1,299 @@
+#This file was created by Yombo for use with Yombo Python Gateway automation
+#software.  Details can be found at https://yombo.net
+"""
+A keyed store, sharded by gateway id, used by the :doc:`States </lib/states>` and :doc:`Atoms </lib/atoms>`
+libraries.
+
+Each entry is a dictionary, and each change to an entry gives it a new version number from a counter shared by
+the whole store. Readers get read only views of the shards instead of copies.
+
+Subscribers register a pattern and receive changes in batches, once per reactor tick. Patterns match against
+the key, split on periods: '+' matches one level and '#' matches any number of levels. Changes to the same key
+within a batch are combined, the subscriber only gets the latest.
+
+**Usage**:
+
+.. code-block:: python
+
+   from yombo.utils.keyedstore import KeyedStore
+
+   store = KeyedStore('states')
+   subscription_id = store.subscribe('is.+', some_callback, gateway_id='local')
+   store.set('local', 'is.light', {'value': True})
+   # On the next reactor tick: some_callback([StoreChange('local', 'is.light', {...}, 1, False)])
+
+.. moduleauthor:: Mitch Schwenk <mitch-gw@yombo.net>
+
+:copyright: Copyright 2017 by Yombo.
+:license: LICENSE for details.
+"""
+# Import python libraries
+from collections import OrderedDict
+import re
+from types import MappingProxyType
+
+# Import twisted libraries
+from twisted.internet import reactor
+
+# Import Yombo libraries
+from yombo.core.log import get_logger
+from yombo.utils import random_string
+
+logger = get_logger("utils.keyedstore")
+
+
+class StoreChange:
+    """
+    A change delivered to subscribers.
+
+    :ivar gateway_id: (str) Gateway id of the shard.
+    :ivar key: (str) Key that changed.
+    :ivar entry: (dict) The entry after the change, or the last entry if it was deleted.
+    :ivar version: (int) Store version of the change.
+    :ivar deleted: (bool) True if the key was deleted.
+    """
+    __slots__ = ('gateway_id', 'key', 'entry', 'version', 'deleted')
+
+    def __init__(self, gateway_id, key, entry, version, deleted=False):
+        self.gateway_id = gateway_id
+        self.key = key
+        self.entry = entry
+        self.version = version
+        self.deleted = deleted
+
+    def __repr__(self):
+        return "StoreChange(%r, %r, %r, %r, %r)" % (self.gateway_id, self.key, self.entry, self.version,
+                                                   self.deleted)
+
+
+class Subscription:
+    """
+    A subscriber to a store.
+
+    :ivar subscription_id: (str) Id used to unsubscribe.
+    :ivar pattern: (str) Key pattern, can include '+' and '#'.
+    :ivar callback: (callable) Called with a list of StoreChange.
+    :ivar gateway_id: (str) Only changes for this gateway, or None for all gateways.
+    :ivar regex: Compiled pattern, or None if the pattern has no wildcards.
+    """
+    def __init__(self, subscription_id, pattern, callback, gateway_id=None):
+        self.subscription_id = subscription_id
+        self.pattern = pattern
+        self.callback = callback
+        self.gateway_id = gateway_id
+        self.regex = compile_pattern(pattern)
+
+    def matches(self, gateway_id, key):
+        if self.gateway_id is not None and self.gateway_id != gateway_id:
+            return False
+        if self.regex is None:
+            return self.pattern == key
+        return self.regex.match(key) is not None
+
+
+def compile_pattern(pattern):
+    """
+    Compile a subscription pattern into a regex. Returns None if the pattern doesn't have any wildcards.
+
+    :param pattern: A key pattern, such as 'is.+' or 'yombo.#'.
+    """
+    if '#' not in pattern and '+' not in pattern:
+        return None
+    regex = re.escape(pattern).replace('\\#', '.*').replace('\\+', '[^.]+')
+    return re.compile(regex + '$')
+
+
+class KeyedStore:
+    """
+    Entries sharded by gateway id, with versions and subscriptions.
+
+    :ivar name: (str) Name of the store, used for logging.
+    :ivar version: (int) Version of the latest change.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.version = 0
+        self._shards = {}
+        self._views = {}
+        self._all_view = MappingProxyType(self._views)
+        self._versions = {}
+        self._subscriptions = OrderedDict()
+        self._exact_subscriptions = {}
+        self._pattern_subscriptions = []
+        self._matched = {}
+        self._pending = OrderedDict()
+        self._deliver_call = None
+
+    def __contains__(self, gateway_id):
+        return gateway_id in self._shards
+
+    def __getitem__(self, gateway_id):
+        """
+        Returns the shard for a gateway. This is the actual dictionary, callers that change entries must
+        call :py:meth:`changed` afterward.
+        """
+        return self._shards[gateway_id]
+
+    def __iter__(self):
+        return iter(self._shards)
+
+    def __len__(self):
+        return len(self._shards)
+
+    def shard(self, gateway_id):
+        """
+        Returns the shard for a gateway, creating it if needed.
+        """
+        try:
+            return self._shards[gateway_id]
+        except KeyError:
+            shard = self._shards[gateway_id] = {}
+            self._views[gateway_id] = MappingProxyType(shard)
+            self._versions[gateway_id] = {}
+            return shard
+
+    def view(self, gateway_id=None):
+        """
+        Returns a read only view. It's not a copy, it changes as the store changes.
+
+        :param gateway_id: If set, a view of entries for the gateway, otherwise a view of gateway_id -> views.
+        :return: A mapping proxy.
+        """
+        if gateway_id is None:
+            return self._all_view
+        if gateway_id in self._views:
+            return self._views[gateway_id]
+        return MappingProxyType({})
+
+    def get_version(self, gateway_id, key):
+        """
+        Returns the version of an entry.
+
+        :raises KeyError: Raised when the entry is not found.
+        """
+        return self._versions[gateway_id][key]
+
+    def set(self, gateway_id, key, entry):
+        """
+        Set an entry and notify subscribers.
+
+        :return: The new version.
+        """
+        self.shard(gateway_id)[key] = entry
+        return self.changed(gateway_id, key)
+
+    def changed(self, gateway_id, key):
+        """
+        Call after an entry has been updated in place, gives it a new version and notifies subscribers.
+
+        :return: The new version.
+        """
+        self.version += 1
+        self._versions[gateway_id][key] = self.version
+        self._queue(gateway_id, key, self._shards[gateway_id][key], False)
+        return self.version
+
+    def delete(self, gateway_id, key):
+        """
+        Delete an entry and notify subscribers.
+
+        :raises KeyError: Raised when the entry is not found.
+        """
+        entry = self._shards[gateway_id].pop(key)
+        del self._versions[gateway_id][key]
+        self.version += 1
+        self._queue(gateway_id, key, entry, True)
+
+    def changes_since(self, version, gateway_id):
+        """
+        Returns entries for a gateway with a version greater than the one provided. Deletes are not included.
+
+        :return: A dictionary of key -> (version, entry)
+        """
+        if gateway_id not in self._shards:
+            return {}
+        shard = self._shards[gateway_id]
+        return {key: (key_version, shard[key]) for key, key_version in self._versions[gateway_id].items()
+                if key_version > version}
+
+    def subscribe(self, pattern, callback, gateway_id=None):
+        """
+        Subscribe to changes. The callback is called with a list of :py:class:`StoreChange`, at most once
+        per reactor tick.
+
+        :param pattern: Key pattern, '+' matches one level and '#' matches any levels. Levels are split by periods.
+        :param callback: Callable that accepts a list of changes.
+        :param gateway_id: Only receive changes for this gateway. Default is all gateways.
+        :return: A subscription id, for :py:meth:`unsubscribe`.
+        """
+        subscription = Subscription(random_string(length=12), pattern, callback, gateway_id)
+        self._subscriptions[subscription.subscription_id] = subscription
+        if subscription.regex is None:
+            self._exact_subscriptions.setdefault(pattern, []).append(subscription)
+        else:
+            self._pattern_subscriptions.append(subscription)
+        self._matched.clear()
+        return subscription.subscription_id
+
+    def unsubscribe(self, subscription_id):
+        """
+        Remove a subscription.
+
+        :raises KeyError: Raised when the subscription is not found.
+        """
+        subscription = self._subscriptions.pop(subscription_id)
+        if subscription.regex is None:
+            exact = self._exact_subscriptions[subscription.pattern]
+            exact.remove(subscription)
+            if len(exact) == 0:
+                del self._exact_subscriptions[subscription.pattern]
+        else:
+            self._pattern_subscriptions.remove(subscription)
+        self._matched.clear()
+
+    def subscribers(self, gateway_id, key):
+        """
+        Returns the subscriptions that match a key. Results are cached until subscriptions change.
+        """
+        try:
+            return self._matched[(gateway_id, key)]
+        except KeyError:
+            pass
+        found = [subscription for subscription in self._exact_subscriptions.get(key, ())
+                 if subscription.gateway_id is None or subscription.gateway_id == gateway_id]
+        found.extend(subscription for subscription in self._pattern_subscriptions
+                     if subscription.matches(gateway_id, key))
+        self._matched[(gateway_id, key)] = found
+        return found
+
+    def _queue(self, gateway_id, key, entry, deleted):
+        if len(self._subscriptions) == 0:
+            return
+        pending_key = (gateway_id, key)
+        self._pending.pop(pending_key, None)
+        self._pending[pending_key] = StoreChange(gateway_id, key, entry, self.version, deleted)
+        if self._deliver_call is None or not self._deliver_call.active():
+            self._deliver_call = reactor.callLater(0, self.deliver)
+
+    def deliver(self):
+        """
+        Send pending changes to subscribers. Normally called on the next reactor tick after a change.
+        """
+        if len(self._pending) == 0:
+            return
+        pending = self._pending
+        self._pending = OrderedDict()
+        batches = OrderedDict()
+        for change in pending.values():
+            for subscription in self.subscribers(change.gateway_id, change.key):
+                batches.setdefault(subscription.subscription_id, []).append(change)
+
+        for subscription_id, changes in batches.items():
+            subscription = self._subscriptions.get(subscription_id)
+            if subscription is None:
+                continue
+            try:
+                subscription.callback(changes)
+            except Exception as e:
+                logger.warn("Error delivering {store} changes to subscriber '{pattern}': {error}",
+                            store=self.name, pattern=subscription.pattern, error=e)
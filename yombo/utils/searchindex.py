@@ -0,0 +1,405 @@
+#This file was created by Yombo for use with Yombo Python Gateway automation
+#software.  Details can be found at https://yombo.net
+"""
+Indexes used to speed up fuzzy searches done by :py:func:`yombo.utils.do_search_instance` and
+:py:class:`yombo.utils.fuzzysearch.FuzzySearch`.
+
+Searches rank items by difflib's SequenceMatcher ratio. Computing the ratio for every item is slow, so each
+text is indexed by its length and its trigrams (three character substrings). For a search, these give an upper
+limit of the ratio for every item without calling SequenceMatcher:
+
+  * The ratio can't be more than 2 * shortest length / combined length.
+  * Each edit to a string changes at most 3 of its trigrams, so the number of trigrams two strings share gives
+    the least number of edits between them, and the ratio can't be more than 1 - edits / combined length.
+
+Items are checked from the highest limit down, and the search stops once no remaining item can reach the
+cut-off. Before calling SequenceMatcher for an item, the longest common subsequence is found using bit
+operations, which is much faster and gives a closer limit: 2 * common subsequence / combined length. Items are only ever skipped when they can't match, so results and their order are the same as checking
+every item.
+
+Indexes are updated as items are added, edited, or removed.
+
+**Usage**:
+
+.. code-block:: python
+
+   from yombo.utils.searchindex import SearchIndex
+
+   index = SearchIndex()
+   index.update('device1', device)
+   found, key, item, ratio, others = index.search(attributes, limiter=.89, operation='highest')
+
+.. moduleauthor:: Mitch Schwenk <mitch-gw@yombo.net>
+
+:copyright: Copyright 2017 by Yombo.
+:license: LICENSE for details.
+"""
+# Import python libraries
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from heapq import heappush, heapreplace, merge
+from itertools import count
+
+
+def trigrams(text):
+    """
+    Returns a dictionary of trigram -> number of times it's in the text.
+    """
+    found = {}
+    for position in range(len(text) - 2):
+        gram = text[position:position + 3]
+        found[gram] = found.get(gram, 0) + 1
+    return found
+
+
+def ratio_limit(query_length, text_length, shared):
+    """
+    Returns the highest SequenceMatcher ratio possible for two strings, based on their lengths and the number
+    of trigrams they share.
+    """
+    total = query_length + text_length
+    if total == 0:
+        return 1.0
+    longest = max(query_length, text_length)
+    edits = -(-(longest - 2 - shared) // 3)  # Round up.
+    if edits < 0:
+        edits = 0
+    return min(2 * min(query_length, text_length), total - edits) / total
+
+
+def subsequence_masks(query):
+    """
+    Returns a dictionary of character -> bit mask of where the character is in the query, for
+    :py:func:`common_subsequence`.
+    """
+    masks = {}
+    for position, character in enumerate(query):
+        masks[character] = masks.get(character, 0) | (1 << position)
+    return masks
+
+
+def common_subsequence(masks, query_length, text):
+    """
+    Returns the length of the longest common subsequence of the query and the text, using the bit-parallel
+    algorithm from Hyyro (2004).
+
+    :param masks: From :py:func:`subsequence_masks` for the query.
+    :param query_length: Length of the query.
+    :param text: Text to compare with.
+    """
+    all_bits = (1 << query_length) - 1
+    row = all_bits
+    mask = masks.get
+    for character in text:
+        matches = row & mask(character, 0)
+        row = ((row + matches) | (row - matches)) & all_bits
+    return query_length - bin(row).count('1')
+
+
+def subsequence_limit(masks, query_length, text):
+    """
+    Returns the highest SequenceMatcher ratio possible for the query and text. SequenceMatcher's matches are
+    a common subsequence, so there can't be more than the longest one.
+    """
+    total = query_length + len(text)
+    if total == 0:
+        return 1.0
+    return 2 * common_subsequence(masks, query_length, text) / total
+
+
+class TextIndex:
+    """
+    Indexes one text per item, by exact text, length, and trigrams.
+
+    :ivar texts: (dict) item_id -> text
+    :ivar positions: (dict) item_id -> int, order the item was added.
+    """
+    def __init__(self):
+        self.texts = {}
+        self.positions = {}
+        self._exact = {}
+        self._lengths = {}
+        self._grams = {}
+        self._counter = count()
+
+    def __contains__(self, item_id):
+        return item_id in self.texts
+
+    def __len__(self):
+        return len(self.texts)
+
+    def add(self, item_id, text, position=None):
+        """
+        Add or replace the text for an item. Items keep their position when replaced.
+
+        :param item_id: Id of the item.
+        :param text: The text to index.
+        :param position: Order used to break ties, default is the order items were added.
+        """
+        if item_id in self.texts:
+            if self.texts[item_id] == text and (position is None or position == self.positions[item_id]):
+                return
+            if position is None:
+                position = self.positions[item_id]
+            self.remove(item_id)
+        if position is None:
+            position = next(self._counter)
+        self.texts[item_id] = text
+        self.positions[item_id] = position
+        self._exact.setdefault(text, set()).add(item_id)
+        self._lengths.setdefault(len(text), set()).add(item_id)
+        for gram, gram_count in trigrams(text).items():
+            self._grams.setdefault(gram, {})[item_id] = gram_count
+
+    def remove(self, item_id):
+        """
+        Remove an item.
+
+        :raises KeyError: Raised when the item isn't in the index.
+        """
+        text = self.texts.pop(item_id)
+        del self.positions[item_id]
+        self._discard(self._exact, text, item_id)
+        self._discard(self._lengths, len(text), item_id)
+        for gram in trigrams(text):
+            postings = self._grams[gram]
+            del postings[item_id]
+            if len(postings) == 0:
+                del self._grams[gram]
+
+    @staticmethod
+    def _discard(index, key, item_id):
+        found = index[key]
+        found.discard(item_id)
+        if len(found) == 0:
+            del index[key]
+
+    def exact(self, text):
+        """
+        Returns the set of item ids having exactly this text.
+        """
+        return self._exact.get(text, set())
+
+    def candidates(self, query):
+        """
+        Yields (ratio limit, item_id, text) for every item, highest ratio limit first. Items with the exact text
+        come first, with a limit of 1.0.
+        """
+        query_length = len(query)
+        exact = self._exact.get(query, ())
+        for item_id in exact:
+            yield 1.0, item_id, query
+
+        shared = {}
+        for gram, query_count in trigrams(query).items():
+            postings = self._grams.get(gram)
+            if postings is None:
+                continue
+            for item_id, gram_count in postings.items():
+                shared[item_id] = shared.get(item_id, 0) + min(query_count, gram_count)
+
+        texts = self.texts
+        groups = []  # (ratio limit, item_id or None, length)
+        for item_id, shared_count in shared.items():
+            if item_id not in exact:
+                text_length = len(texts[item_id])
+                groups.append((ratio_limit(query_length, text_length, shared_count), item_id, text_length))
+        for length in self._lengths:
+            groups.append((ratio_limit(query_length, length, 0), None, length))
+        groups.sort(key=lambda group: group[0], reverse=True)
+
+        for limit, item_id, length in groups:
+            if item_id is not None:
+                yield limit, item_id, texts[item_id]
+                continue
+            for item_id in self._lengths.get(length, ()):
+                if item_id not in shared and item_id not in exact:
+                    yield limit, item_id, texts[item_id]
+
+
+class SearchIndex:
+    """
+    Search index for a dictionary of objects, such as devices. Attributes are indexed the first time they are
+    searched, and kept up to date as items are updated or removed.
+
+    :ivar items: (OrderedDict) item_id -> item, in the order they were added.
+    :ivar positions: (dict) item_id -> int, order the item was added. Used to break ties the same way as
+        looping over the dictionary being searched.
+    """
+    def __init__(self):
+        self.items = OrderedDict()
+        self.positions = {}
+        self._fields = {}
+        self._counter = count()
+
+    def __contains__(self, item_id):
+        return item_id in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def update(self, item_id, item):
+        """
+        Add an item, or refresh the indexed attributes of an item after it has changed.
+        """
+        self.items[item_id] = item
+        if item_id not in self.positions:
+            self.positions[item_id] = next(self._counter)
+        position = self.positions[item_id]
+        for field, index in self._fields.items():
+            index.add(item_id, str(getattr(item, field)), position)
+
+    def refresh(self, item_id):
+        """
+        Refresh the indexed attributes of an item, if it's in the index.
+        """
+        if item_id in self.items:
+            self.update(item_id, self.items[item_id])
+
+    def remove(self, item_id):
+        """
+        Remove an item, does nothing if the item isn't in the index.
+        """
+        if self.items.pop(item_id, None) is None:
+            return
+        del self.positions[item_id]
+        for index in self._fields.values():
+            index.remove(item_id)
+
+    def clear(self):
+        self.items.clear()
+        self.positions.clear()
+        self._fields.clear()
+
+    def field(self, field):
+        """
+        Returns the TextIndex for an attribute, building it if needed.
+        """
+        try:
+            return self._fields[field]
+        except KeyError:
+            index = self._fields[field] = TextIndex()
+            for item_id, item in self.items.items():
+                index.add(item_id, str(getattr(item, field)), self.positions[item_id])
+            return index
+
+    def get_exact(self, value, fields):
+        """
+        Returns the first item (in the order added) having an attribute exactly matching the value, or None.
+
+        :param value: Value to look for.
+        :param fields: List of attribute names to check.
+        """
+        value = str(value)
+        best = None
+        for field in fields:
+            index = self.field(field)
+            for item_id in index.exact(value):
+                if best is None or self.positions[item_id] < best[0]:
+                    best = (self.positions[item_id], item_id)
+        if best is None:
+            return None
+        return self.items[best[1]]
+
+    def search(self, attributes, limiter, operation, status_field=None, status_value=None):
+        """
+        Same as :py:func:`yombo.utils.do_search_instance`, but using the index. Attributes must already be
+        validated.
+        """
+        if operation == "any":
+            return self._search_any(attributes, status_field, status_value)
+        return self._search_highest(attributes, limiter, status_field, status_value)
+
+    def _matcher(self, status_field, status_value):
+        items = self.items
+        if status_value is None:
+            return items.get
+        def get_item(item_id):
+            item = items.get(item_id)
+            if item is None or getattr(item, status_field) != status_value:
+                return None
+            return item
+        return get_item
+
+    def _search_any(self, attributes, status_field, status_value):
+        get_item = self._matcher(status_field, status_value)
+        positions = self.positions
+        string_diff = SequenceMatcher()
+        key_list = []
+        for attr_number, attr in enumerate(attributes):
+            value = str(attr['value'])
+            cut_off = attr['limiter']
+            index = self.field(attr['field'])
+            string_diff.set_seq1(value)
+            masks = subsequence_masks(value)
+            value_length = len(value)
+            for limit, item_id, text in index.candidates(value):
+                if limit <= cut_off:
+                    break
+                item = get_item(item_id)
+                if item is None:
+                    continue
+                if text == value:
+                    ratio = 1.0
+                else:
+                    if subsequence_limit(masks, value_length, text) <= cut_off:
+                        continue
+                    string_diff.set_seq2(text)
+                    ratio = string_diff.ratio()
+                if ratio > cut_off:
+                    key_list.append((-ratio, positions[item_id], attr_number,
+                                     {'key': item_id, 'value': item, 'ratio': ratio}))
+        key_list.sort(key=lambda entry: entry[:3])
+        return True, None, None, 0, [entry[3] for entry in key_list]
+
+    def _search_highest(self, attributes, limiter, status_field, status_value, keep=10):
+        get_item = self._matcher(status_field, status_value)
+        positions = self.positions
+        string_diff = SequenceMatcher()
+        streams = []
+        values = []
+        for attr_number, attr in enumerate(attributes):
+            value = str(attr['value'])
+            values.append((value, subsequence_masks(value), len(value)))
+            index = self.field(attr['field'])
+            streams.append(((-limit, attr_number, item_id, text)
+                            for limit, item_id, text in index.candidates(value)))
+
+        top = []  # Heap of the best ratios found, lowest first.
+        found = []
+        last_value = None
+        for negative_limit, attr_number, item_id, text in merge(*streams, key=lambda entry: entry[0]):
+            if len(top) >= keep and -negative_limit < top[0]:
+                break
+            item = get_item(item_id)
+            if item is None:
+                continue
+            value, masks, value_length = values[attr_number]
+            if text == value:
+                ratio = 1.0
+            else:
+                if len(top) >= keep and subsequence_limit(masks, value_length, text) < top[0]:
+                    continue
+                if value != last_value:
+                    string_diff.set_seq1(value)
+                    last_value = value
+                string_diff.set_seq2(text)
+                ratio = string_diff.ratio()
+            found.append((-ratio, positions[item_id], attr_number,
+                          {'key': item_id, 'value': item, 'ratio': ratio}))
+            if len(top) < keep:
+                heappush(top, ratio)
+            elif ratio > top[0]:
+                heapreplace(top, ratio)
+
+        found.sort(key=lambda entry: entry[:3])
+        if len(found) == 0 or found[0][0] == 0:
+            raise KeyError("No items found above the cut off limit.")
+        best = found[0]
+        best_ratio = best[3]['ratio']
+        return (
+            best_ratio >= attributes[best[2]]['limiter'],
+            best[3]['key'],
+            best[3]['value'],
+            best_ratio,
+            [entry[3] for entry in found[:keep]])
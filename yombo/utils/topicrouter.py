@@ -0,0 +1,234 @@
+#This file was created by Yombo for use with Yombo Python Gateway automation
+#software.  Details can be found at https://yombo.net
+"""
+Routes MQTT topics to handlers, used by the :doc:`MQTT </lib/mqtt>` library.
+
+Handlers register a topic pattern. Patterns are split on '/', '+' matches one level and '#' matches the rest of
+the topic, including none at all, just like MQTT subscriptions. Patterns are kept in a trie, one node per level,
+so finding the handlers for a topic only walks the levels of that topic, no matter how many patterns there are.
+
+Handlers are called with the values the wildcards matched, so they don't need to split the topic again.
+
+Also includes :py:class:`RecentIds`, a size limited set used to drop duplicate messages.
+
+**Usage**:
+
+.. code-block:: python
+
+   from yombo.utils.topicrouter import TopicRouter
+
+   router = TopicRouter()
+   route_id = router.add('yombo/devices/+/cmd/#', some_callback)
+   for route, wildcards in router.match('yombo/devices/porch_light/cmd/on'):
+       route.handler('yombo/devices/porch_light/cmd/on', payload, wildcards)  # wildcards: ['porch_light', 'on']
+
+.. moduleauthor:: Mitch Schwenk <mitch-gw@yombo.net>
+
+:copyright: Copyright 2017 by Yombo.
+:license: LICENSE for details.
+"""
+# Import python libraries
+from collections import deque
+from itertools import count
+
+# Import Yombo libraries
+from yombo.core.exceptions import YomboWarning
+
+
+class Route:
+    """
+    A pattern and the handler for topics that match it.
+
+    :ivar route_id: (int) Id used to remove the route, routes are matched in the order of their ids.
+    :ivar pattern: (str) Topic pattern, can include '+' and '#'.
+    :ivar handler: (callable) Called for matching topics.
+    """
+    __slots__ = ('route_id', 'pattern', 'handler')
+
+    def __init__(self, route_id, pattern, handler):
+        self.route_id = route_id
+        self.pattern = pattern
+        self.handler = handler
+
+    def __repr__(self):
+        return "Route(%r, %r, %r)" % (self.route_id, self.pattern, self.handler)
+
+
+class TopicNode:
+    """
+    One level of the trie.
+
+    :ivar children: (dict) Level -> TopicNode. A '+' level is stored under '+'.
+    :ivar routes: (list) Routes whose pattern ends at this level.
+    :ivar remainder: (list) Routes whose pattern ends with '#' after this level.
+    """
+    __slots__ = ('children', 'routes', 'remainder')
+
+    def __init__(self):
+        self.children = {}
+        self.routes = []
+        self.remainder = []
+
+    def empty(self):
+        return len(self.children) == 0 and len(self.routes) == 0 and len(self.remainder) == 0
+
+
+def split_pattern(pattern):
+    """
+    Split a pattern into levels, checking that any wildcards are used correctly.
+
+    :raises YomboWarning: Raised when the pattern is invalid.
+    """
+    if not isinstance(pattern, str) or len(pattern) == 0:
+        raise YomboWarning("Topic pattern must be a non-empty string.", 200, 'split_pattern', 'topicrouter')
+    levels = pattern.split('/')
+    for position, level in enumerate(levels):
+        if level == '#':
+            if position != len(levels) - 1:
+                raise YomboWarning("'#' must be the last level of a topic pattern: %s" % pattern,
+                                   201, 'split_pattern', 'topicrouter')
+        elif level != '+' and ('#' in level or '+' in level):
+            raise YomboWarning("Wildcards must be a full level of a topic pattern: %s" % pattern,
+                               202, 'split_pattern', 'topicrouter')
+    return levels
+
+
+class TopicRouter:
+    """
+    Topic patterns and their handlers, in a trie.
+    """
+    def __init__(self):
+        self._root = TopicNode()
+        self._routes = {}
+        self._ids = count(1)
+
+    def __len__(self):
+        return len(self._routes)
+
+    def __contains__(self, route_id):
+        return route_id in self._routes
+
+    def add(self, pattern, handler):
+        """
+        Add a handler for a topic pattern. A pattern can have any number of handlers.
+
+        :param pattern: Topic pattern, such as 'yombo/states/+/set' or 'ybo_gw/#'.
+        :param handler: Callable for matching topics.
+        :return: A route id, for :py:meth:`remove`.
+        """
+        if not callable(handler):
+            raise YomboWarning("Topic route handler must be callable.", 203, 'add', 'topicrouter')
+        levels = split_pattern(pattern)
+        node = self._root
+        for level in levels[:-1]:
+            node = node.children.setdefault(level, TopicNode())
+        if levels[-1] == '#':
+            node = node.remainder
+        else:
+            node = node.children.setdefault(levels[-1], TopicNode()).routes
+
+        route = Route(next(self._ids), pattern, handler)
+        node.append(route)
+        self._routes[route.route_id] = route
+        return route.route_id
+
+    def remove(self, route_id):
+        """
+        Remove a route, and any trie levels no longer used.
+
+        :return: The removed :py:class:`Route`.
+        :raises KeyError: Raised when the route is not found.
+        """
+        route = self._routes.pop(route_id)
+        levels = route.pattern.split('/')
+        path = [self._root]
+        for level in levels[:-1]:
+            path.append(path[-1].children[level])
+        if levels[-1] == '#':
+            path[-1].remainder.remove(route)
+        else:
+            path.append(path[-1].children[levels[-1]])
+            path[-1].routes.remove(route)
+
+        for position in range(len(path) - 1, 0, -1):
+            if not path[position].empty():
+                break
+            del path[position - 1].children[levels[position - 1]]
+        return route
+
+    def routes(self, pattern=None):
+        """
+        Returns the routes, in the order they were added.
+
+        :param pattern: Only routes for this exact pattern.
+        """
+        return [route for route in self._routes.values() if pattern is None or route.pattern == pattern]
+
+    def match(self, topic):
+        """
+        Find the routes for a topic. As in MQTT, wildcards at the first level don't match topics that start
+        with '$'.
+
+        :param topic: A topic, without wildcards.
+        :return: List of (route, wildcards), in the order the routes were added. Wildcards is a list of the
+            levels matched by each '+', followed by the rest of the topic if matched by '#'.
+        """
+        levels = topic.split('/')
+        last = len(levels)
+        found = []
+        # Each entry: node, the level to match next, and the wildcard values so far.
+        pending = [(self._root, 0, ())]
+        while pending:
+            node, position, wildcards = pending.pop()
+            wildcard_allowed = position > 0 or not topic.startswith('$')
+            if wildcard_allowed and node.remainder:
+                rest = wildcards + ('/'.join(levels[position:]),)
+                found.extend((route, rest) for route in node.remainder)
+            if position == last:
+                found.extend((route, wildcards) for route in node.routes)
+                continue
+            level = levels[position]
+            child = node.children.get(level)
+            if child is not None:
+                pending.append((child, position + 1, wildcards))
+            if wildcard_allowed:
+                child = node.children.get('+')
+                if child is not None:
+                    pending.append((child, position + 1, wildcards + (level,)))
+
+        if len(found) > 1:
+            found.sort(key=lambda item: item[0].route_id)
+        return [(route, list(wildcards)) for route, wildcards in found]
+
+
+class RecentIds:
+    """
+    The most recent ids seen, up to a maximum count. Membership checks use a set, the deque only tracks which
+    id to forget next.
+
+    :ivar maxlen: (int) Ids to remember.
+    """
+    def __init__(self, maxlen):
+        self.maxlen = maxlen
+        self._ids = set()
+        self._order = deque()
+
+    def __contains__(self, item):
+        return item in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, item):
+        """
+        Remember an id.
+
+        :return: False if the id was already seen, otherwise True.
+        """
+        if item in self._ids:
+            return False
+        self._ids.add(item)
+        self._order.append(item)
+        if len(self._order) > self.maxlen:
+            self._ids.discard(self._order.popleft())
+        return True